@@ -0,0 +1,1571 @@
+"""
+    bpy_standin.py is part of Cloud Generator Blender Addon.
+
+    Foobar is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+
+In-memory stand-in of the slice of bpy and mathutils used by the addon.
+
+It covers what the cloud construction and the update functions use:
+shader nodes, sockets, links, color ramps, curve mapping, materials,
+meshes, objects, scenes, property groups, addon preferences and the
+operators primitive_cube_add and transform_apply. Nothing is rendered or
+evaluated. Every API call is counted in api_calls so that construction and
+update throughput can be profiled and compared with plain Python.
+
+Usage:
+    import bpy_standin
+    bpy_standin.install()   # Before importing the addon
+    import clouds_generator
+    clouds_generator.register()
+"""
+import copy
+import sys
+import types
+from collections import Counter
+
+api_calls = Counter()
+
+
+def _count(name):
+    api_calls[name] += 1
+
+
+def reset_counts():
+    api_calls.clear()
+
+
+# ---------------------------------------
+# ---------------mathutils---------------
+# ---------------------------------------
+class Vector:
+    """Vector of 2 to 4 float components."""
+
+    __slots__ = ("_values",)
+
+    def __init__(self, values=(0.0, 0.0, 0.0)):
+        self._values = [float(value) for value in values]
+
+    def _get(index):
+        return property(lambda self: self._values[index],
+                        lambda self, value: self._values.__setitem__(index, float(value)))
+
+    x = _get(0)
+    y = _get(1)
+    z = _get(2)
+    w = _get(3)
+    del _get
+
+    def __len__(self):
+        return len(self._values)
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __getitem__(self, index):
+        return self._values[index]
+
+    def __setitem__(self, index, value):
+        self._values[index] = float(value)
+
+    def _other(self, other):
+        if isinstance(other, (int, float)):
+            return [float(other)] * len(self._values)
+        return list(other)
+
+    def __add__(self, other):
+        return Vector(a + b for a, b in zip(self._values, self._other(other)))
+
+    def __sub__(self, other):
+        return Vector(a - b for a, b in zip(self._values, self._other(other)))
+
+    def __mul__(self, other):
+        return Vector(a * b for a, b in zip(self._values, self._other(other)))
+
+    __rmul__ = __mul__
+    __radd__ = __add__
+
+    def __truediv__(self, other):
+        return Vector(a / b for a, b in zip(self._values, self._other(other)))
+
+    def __neg__(self):
+        return Vector(-a for a in self._values)
+
+    def __eq__(self, other):
+        try:
+            return list(self) == list(other)
+        except TypeError:
+            return NotImplemented
+
+    def __hash__(self):
+        return hash(tuple(self._values))
+
+    @property
+    def length(self):
+        return sum(a * a for a in self._values) ** 0.5
+
+    def copy(self):
+        return Vector(self._values)
+
+    def __deepcopy__(self, memo):
+        return Vector(self._values)
+
+    def to_tuple(self):
+        return tuple(self._values)
+
+    def __repr__(self):
+        return "Vector(({}))".format(", ".join("{:.4f}".format(a) for a in self._values))
+
+
+def _vector(value):
+    return value.copy() if isinstance(value, Vector) else Vector(value)
+
+
+class Matrix:
+    """4x4 matrix of rows, enough for the camera and bounding box computations."""
+
+    __slots__ = ("_rows",)
+
+    def __init__(self, rows=((1.0, 0.0, 0.0, 0.0), (0.0, 1.0, 0.0, 0.0),
+                             (0.0, 0.0, 1.0, 0.0), (0.0, 0.0, 0.0, 1.0))):
+        self._rows = [[float(value) for value in row] for row in rows]
+
+    @classmethod
+    def Translation(cls, vector):
+        matrix = cls()
+        for axis, value in enumerate(vector):
+            matrix._rows[axis][3] = float(value)
+        return matrix
+
+    @classmethod
+    def Diagonal(cls, vector):
+        matrix = cls()
+        for axis, value in enumerate(vector):
+            matrix._rows[axis][axis] = float(value)
+        return matrix
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __iter__(self):
+        return iter(Vector(row) for row in self._rows)
+
+    def __getitem__(self, index):
+        return Vector(self._rows[index])
+
+    def __matmul__(self, other):
+        if isinstance(other, Matrix):
+            columns = list(zip(*other._rows))
+            return Matrix([[sum(a * b for a, b in zip(row, column)) for column in columns]
+                           for row in self._rows])
+        values = list(other)
+        if len(values) == 3:
+            # Like mathutils, 3D vectors are points (w = 1) and stay 3D.
+            point = values + [1.0]
+            return Vector(sum(a * b for a, b in zip(row, point)) for row in self._rows[:3])
+        return Vector(sum(a * b for a, b in zip(row, values)) for row in self._rows)
+
+    def inverted(self):
+        import numpy as np
+        return Matrix(np.linalg.inv(np.array(self._rows)).tolist())
+
+    def copy(self):
+        return Matrix(self._rows)
+
+    def __repr__(self):
+        return "Matrix(({}))".format(", ".join(repr(tuple(row)) for row in self._rows))
+
+
+# ---------------------------------------
+# --------------ID properties------------
+# ---------------------------------------
+class IDPropertyArray(list):
+    def to_list(self):
+        return list(self)
+
+
+class IDPropertyGroup(dict):
+    def to_dict(self):
+        return {key: value.to_dict() if isinstance(value, IDPropertyGroup) else value
+                for key, value in self.items()}
+
+
+def _idproperty(value):
+    if isinstance(value, dict):
+        return IDPropertyGroup((key, _idproperty(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple, Vector)):
+        return IDPropertyArray(value)
+    return value
+
+
+class _IDProperties:
+    """Custom properties accessed with obj["name"]."""
+
+    def _idprops(self):
+        props = self.__dict__.get("_custom")
+        if props is None:
+            props = self.__dict__["_custom"] = {}
+        return props
+
+    def __getitem__(self, key):
+        _count("idprop.get")
+        return self._idprops()[key]
+
+    def __setitem__(self, key, value):
+        _count("idprop.set")
+        self._idprops()[key] = _idproperty(value)
+
+    def __delitem__(self, key):
+        del self._idprops()[key]
+
+    def __contains__(self, key):
+        return key in self._idprops()
+
+    def get(self, key, default=None):
+        _count("idprop.get")
+        return self._idprops().get(key, default)
+
+    def keys(self):
+        return self._idprops().keys()
+
+
+# ---------------------------------------
+# ---------------bpy.props---------------
+# ---------------------------------------
+class _Property:
+    """Property definition. Once registered it is a descriptor of the class."""
+
+    rna_type = None
+    is_array = False
+
+    def __init__(self, **options):
+        self.options = options
+        self.identifier = None
+        self.update = options.get("update")
+
+    def default(self):
+        return self.options.get("default")
+
+    def convert(self, value):
+        return value
+
+    @property
+    def key(self):
+        # Properties assigned to a type (bpy.types.Object.name = ...) have no identifier
+        return self.identifier or id(self)
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        values = instance.__dict__.setdefault("_values", {})
+        if self.key not in values:
+            values[self.key] = self.default()
+        return values[self.key]
+
+    def __set__(self, instance, value):
+        _count("property.set")
+        instance.__dict__.setdefault("_values", {})[self.key] = self.convert(value)
+        if self.update is not None:
+            _count("property.update")
+            self.update(instance, context)
+
+
+class _NumberProperty(_Property):
+    cast = float
+
+    def clamp(self, value):
+        value = self.cast(value)
+        if "min" in self.options:
+            value = max(self.options["min"], value)
+        if "max" in self.options:
+            value = min(self.options["max"], value)
+        return value
+
+    def convert(self, value):
+        return self.clamp(value)
+
+
+class BoolProperty(_Property):
+    rna_type = 'BOOLEAN'
+
+    def default(self):
+        return self.options.get("default", False)
+
+    def convert(self, value):
+        return bool(value)
+
+
+class IntProperty(_NumberProperty):
+    rna_type = 'INT'
+    cast = int
+
+    def default(self):
+        return self.options.get("default", 0)
+
+
+class FloatProperty(_NumberProperty):
+    rna_type = 'FLOAT'
+
+    def default(self):
+        return float(self.options.get("default", 0.0))
+
+
+class FloatVectorProperty(_NumberProperty):
+    rna_type = 'FLOAT'
+    is_array = True
+
+    def default(self):
+        size = self.options.get("size", 3)
+        return Vector(self.options.get("default", (0.0,) * size))
+
+    def convert(self, value):
+        return Vector(self.clamp(component) for component in value)
+
+
+class StringProperty(_Property):
+    rna_type = 'STRING'
+
+    def default(self):
+        return self.options.get("default", "")
+
+    def convert(self, value):
+        return str(value)
+
+
+class EnumProperty(_Property):
+    rna_type = 'ENUM'
+
+    def default(self):
+        if "default" in self.options:
+            return self.options["default"]
+        items = self.options.get("items")
+        return items[0][0] if items and not callable(items) else ""
+
+
+class PointerProperty(_Property):
+    rna_type = 'POINTER'
+
+    def default(self):
+        return None
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        pointer_type = self.options["type"]
+        if not (isinstance(pointer_type, type) and issubclass(pointer_type, PropertyGroup)):
+            return _Property.__get__(self, instance, owner)
+        values = instance.__dict__.setdefault("_values", {})
+        group = values.get(self.key)
+        if group is None:
+            group = values[self.key] = pointer_type()
+            group.id_data = instance if isinstance(instance, ID) else getattr(instance, "id_data", None)
+        return group
+
+
+class _Collection(list):
+    """Collection of property groups of a CollectionProperty."""
+
+    def __init__(self, item_type, id_data):
+        super().__init__()
+        self.item_type = item_type
+        self.id_data = id_data
+
+    def add(self):
+        _count("collection.add")
+        item = self.item_type()
+        item.id_data = self.id_data
+        self.append(item)
+        return item
+
+    def remove(self, index):
+        _count("collection.remove")
+        del self[index]
+
+
+class CollectionProperty(_Property):
+    rna_type = 'COLLECTION'
+
+    def default(self):
+        return []
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        values = instance.__dict__.setdefault("_values", {})
+        collection = values.get(self.key)
+        if collection is None:
+            id_data = instance if isinstance(instance, ID) else getattr(instance, "id_data", None)
+            collection = values[self.key] = _Collection(self.options["type"], id_data)
+        return collection
+
+
+class _RNAProperty:
+    def __init__(self, identifier, rna_type, is_array=False):
+        self.identifier = identifier
+        self.type = rna_type
+        self.is_array = is_array
+
+
+class _RNA:
+    def __init__(self, properties):
+        self.properties = properties
+
+
+def _class_properties(cls):
+    """Properties defined as annotations in a class and its bases."""
+
+    properties = {}
+    for base in reversed(cls.__mro__):
+        for name, value in vars(base).get("__annotations__", {}).items():
+            if isinstance(value, _Property):
+                properties[name] = value
+    return properties
+
+
+# ---------------------------------------
+# ---------------bpy.types---------------
+# ---------------------------------------
+class bpy_struct(_IDProperties):
+    bl_rna = _RNA([_RNAProperty("rna_type", 'POINTER')])
+
+
+class PropertyGroup(bpy_struct):
+    name = StringProperty(default="")
+    name.identifier = "name"
+    id_data = None
+
+
+class AddonPreferences(bpy_struct):
+    bl_idname = ""
+
+
+class Operator(bpy_struct):
+    bl_idname = ""
+    bl_label = ""
+    bl_options = set()
+    reports = []
+
+    def report(self, level, message):
+        Operator.reports.append((set(level), message))
+
+
+class Panel(bpy_struct):
+    pass
+
+
+class Menu(bpy_struct):
+    _draw_functions = []
+
+    @classmethod
+    def append(cls, function):
+        cls._draw_functions.append(function)
+
+    @classmethod
+    def prepend(cls, function):
+        cls._draw_functions.insert(0, function)
+
+    @classmethod
+    def remove(cls, function):
+        cls._draw_functions.remove(function)
+
+
+class VIEW3D_MT_volume_add(Menu):
+    _draw_functions = []
+
+
+class VIEW3D_MT_add(Menu):
+    _draw_functions = []
+
+
+class SpaceView3D(bpy_struct):
+    _draw_handlers = []
+
+    @classmethod
+    def draw_handler_add(cls, callback, args, region_type, draw_type):
+        handler = (callback, args, region_type, draw_type)
+        cls._draw_handlers.append(handler)
+        return handler
+
+    @classmethod
+    def draw_handler_remove(cls, handler, region_type):
+        cls._draw_handlers.remove(handler)
+
+
+class ID(bpy_struct):
+    """Datablock. The name is unique in its collection."""
+
+    _collection = None
+
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.users = 0
+        self.use_fake_user = False
+
+    @property
+    def name(self):
+        return self._name
+
+    @name.setter
+    def name(self, value):
+        _count("ID.name")
+        if self._collection is not None:
+            value = self._collection._unique_name(value, self)
+        self.__dict__["_name"] = value
+
+    def copy(self):
+        _count(type(self).__name__ + ".copy")
+        duplicate = self._copy()
+        if self._collection is not None:
+            self._collection._add(duplicate, self._name)
+        return duplicate
+
+    def __deepcopy__(self, memo):
+        return self  # Datablocks are referenced, not copied
+
+    def _copy(self, memo=None):
+        memo = {} if memo is None else memo
+        duplicate = object.__new__(type(self))
+        memo[id(self)] = duplicate
+        state = {key: value for key, value in self.__dict__.items() if key != "_collection"}
+        duplicate.__dict__.update(copy.deepcopy(state, memo))
+        return duplicate
+
+
+class Image(ID):
+    def __init__(self, name, width=0, height=0, **options):
+        super().__init__(name)
+        self.size = (width, height)
+        self.filepath = ""
+        self.pixels = [0.0] * (width * height * 4)
+
+
+class Text(ID):
+    def __init__(self, name):
+        super().__init__(name)
+        self.lines = []
+
+    def clear(self):
+        self.lines = []
+
+    def write(self, text):
+        self.lines.append(text)
+
+    def as_string(self):
+        return "".join(self.lines)
+
+
+# ---------------------------------------
+# -----------------Nodes-----------------
+# ---------------------------------------
+class NodeSocket:
+    def __init__(self, node, name, default_value, is_output, index):
+        self.node = node
+        self.name = name
+        self.identifier = name if index == 0 else "{}_{:03d}".format(name, index)
+        self.is_output = is_output
+        self._default_value = _vector(default_value) if isinstance(default_value, (tuple, list)) else default_value
+        self.enabled = True
+        self.hide = False
+
+    @property
+    def default_value(self):
+        _count("socket.default_value.get")
+        return self._default_value
+
+    @default_value.setter
+    def default_value(self, value):
+        _count("socket.default_value.set")
+        if isinstance(self._default_value, Vector):
+            self._default_value = Vector(value)
+        else:
+            self._default_value = type(self._default_value)(value) if self._default_value is not None else value
+
+    @property
+    def links(self):
+        tree = self.node.id_data
+        if self.is_output:
+            return [link for link in tree.links if link.from_socket is self]
+        return [link for link in tree.links if link.to_socket is self]
+
+    @property
+    def is_linked(self):
+        return bool(self.links)
+
+
+class NodeSockets(list):
+    """Sockets of a node, accessed by index or by name."""
+
+    def __getitem__(self, key):
+        _count("sockets.get")
+        if isinstance(key, str):
+            for socket in self:
+                if socket.name == key or socket.identifier == key:
+                    return socket
+            raise KeyError('bpy_prop_collection[key]: key "{}" not found'.format(key))
+        return list.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+class ColorRampElement:
+    def __init__(self, position, color):
+        self.position = position
+        self.color = Vector(color)
+        self.alpha = self.color[3]
+
+
+class ColorRampElements(list):
+    def new(self, position):
+        _count("color_ramp.elements.new")
+        element = ColorRampElement(position, (0.0, 0.0, 0.0, 1.0))
+        self.append(element)
+        self.sort(key=lambda item: item.position)
+        return element
+
+    def remove(self, element):
+        _count("color_ramp.elements.remove")
+        list.remove(self, element)
+
+
+class ColorRamp:
+    def __init__(self):
+        self.interpolation = 'LINEAR'
+        self.color_mode = 'RGB'
+        self.hue_interpolation = 'NEAR'
+        self.elements = ColorRampElements([ColorRampElement(0.0, (0.0, 0.0, 0.0, 1.0)),
+                                           ColorRampElement(1.0, (1.0, 1.0, 1.0, 1.0))])
+
+
+class CurveMapPoint:
+    def __init__(self, x, y):
+        self._location = Vector((x, y))
+        self.handle_type = 'AUTO'
+        self.select = False
+
+    @property
+    def location(self):
+        return self._location
+
+    @location.setter
+    def location(self, value):
+        _count("curve.point.location.set")
+        self._location = Vector(value)
+
+
+class CurveMapPoints(list):
+    def new(self, x, y):
+        _count("curve.points.new")
+        point = CurveMapPoint(x, y)
+        self.append(point)
+        self.sort(key=lambda item: item.location.x)
+        return point
+
+    def remove(self, point):
+        _count("curve.points.remove")
+        list.remove(self, point)
+
+
+class CurveMap:
+    def __init__(self):
+        self.points = CurveMapPoints([CurveMapPoint(-1.0, -1.0), CurveMapPoint(1.0, 1.0)])
+
+
+class CurveMapping:
+    def __init__(self, curves):
+        self.curves = [CurveMap() for _ in range(curves)]
+        self.use_clip = True
+
+    def update(self):
+        _count("curve_mapping.update")
+
+    def initialize(self):
+        _count("curve_mapping.initialize")
+
+
+# Node type: (type, inputs [(name, default)], outputs [names], attributes {name: default})
+_VECTOR = (0.0, 0.0, 0.0)
+_GREY = (0.5, 0.5, 0.5, 1.0)
+NODE_TYPES = {
+    "ShaderNodeOutputMaterial": ('OUTPUT_MATERIAL',
+                                 [("Surface", None), ("Volume", None), ("Displacement", _VECTOR)], [],
+                                 {"is_active_output": True, "target": 'ALL'}),
+    "ShaderNodeBsdfPrincipled": ('BSDF_PRINCIPLED', [("Base Color", (0.8, 0.8, 0.8, 1.0)), ("Roughness", 0.5)],
+                                 ["BSDF"], {}),
+    "ShaderNodeVolumePrincipled": ('PRINCIPLED_VOLUME',
+                                   [("Color", _GREY), ("Color Attribute", ""), ("Density", 1.0),
+                                    ("Density Attribute", "density"), ("Anisotropy", 0.0),
+                                    ("Absorption Color", (0.0, 0.0, 0.0, 1.0)), ("Emission Strength", 0.0),
+                                    ("Emission Color", (1.0, 1.0, 1.0, 1.0)), ("Blackbody Intensity", 0.0),
+                                    ("Blackbody Tint", (1.0, 1.0, 1.0, 1.0)), ("Temperature", 1000.0),
+                                    ("Temperature Attribute", "temperature")],
+                                   ["Volume"], {}),
+    "ShaderNodeValToRGB": ('VALTORGB', [("Fac", 0.5)], ["Color", "Alpha"], {}),
+    "ShaderNodeMixRGB": ('MIX_RGB', [("Fac", 0.5), ("Color1", _GREY), ("Color2", _GREY)], ["Color"],
+                         {"blend_type": 'MIX', "use_clamp": False, "use_alpha": False}),
+    "ShaderNodeVectorMath": ('VECT_MATH', [("Vector", _VECTOR), ("Vector", _VECTOR), ("Vector", _VECTOR),
+                                           ("Scale", 1.0)], ["Vector", "Value"], {"operation": 'ADD'}),
+    "ShaderNodeMath": ('MATH', [("Value", 0.5), ("Value", 0.5), ("Value", 0.5)], ["Value"],
+                       {"operation": 'ADD', "use_clamp": False}),
+    "ShaderNodeInvert": ('INVERT', [("Fac", 1.0), ("Color", (0.0, 0.0, 0.0, 1.0))], ["Color"], {}),
+    "ShaderNodeMapping": ('MAPPING', [("Vector", _VECTOR), ("Location", _VECTOR), ("Rotation", _VECTOR),
+                                      ("Scale", (1.0, 1.0, 1.0))], ["Vector"], {"vector_type": 'POINT'}),
+    "ShaderNodeTexCoord": ('TEX_COORD', [], ["Generated", "Normal", "UV", "Object", "Camera", "Window",
+                                             "Reflection"], {"object": None}),
+    "ShaderNodeTexGradient": ('TEX_GRADIENT', [("Vector", _VECTOR)], ["Color", "Fac"],
+                              {"gradient_type": 'LINEAR'}),
+    "ShaderNodeTexImage": ('TEX_IMAGE', [("Vector", _VECTOR)], ["Color", "Alpha"],
+                           {"image": None, "interpolation": 'Linear', "projection": 'FLAT',
+                            "extension": 'REPEAT'}),
+    "ShaderNodeTexNoise": ('TEX_NOISE', [("Vector", _VECTOR), ("W", 0.0), ("Scale", 5.0), ("Detail", 2.0),
+                                         ("Roughness", 0.5), ("Distortion", 0.0)], ["Fac", "Color"],
+                           {"noise_dimensions": '3D'}),
+    "ShaderNodeTexWhiteNoise": ('TEX_WHITE_NOISE', [("Vector", _VECTOR), ("W", 0.0)], ["Value", "Color"],
+                                {"noise_dimensions": '3D'}),
+    "ShaderNodeTexVoronoi": ('TEX_VORONOI', [("Vector", _VECTOR), ("W", 0.0), ("Scale", 5.0),
+                                             ("Smoothness", 1.0), ("Exponent", 0.5), ("Randomness", 1.0)],
+                             ["Distance", "Color", "Position", "W", "Radius"],
+                             {"voronoi_dimensions": '3D', "feature": 'F1', "distance": 'EUCLIDEAN'}),
+    "ShaderNodeVectorCurve": ('CURVE_VEC', [("Fac", 1.0), ("Vector", _VECTOR)], ["Vector"], {}),
+    "ShaderNodeEmission": ('EMISSION', [("Color", (1.0, 1.0, 1.0, 1.0)), ("Strength", 1.0)], ["Emission"], {}),
+    "ShaderNodeVolumeAbsorption": ('VOLUME_ABSORPTION', [("Color", _GREY), ("Density", 1.0)], ["Volume"], {}),
+    "ShaderNodeAddShader": ('ADD_SHADER', [("Shader", None), ("Shader", None)], ["Shader"], {}),
+    "ShaderNodeObjectInfo": ('OBJECT_INFO', [], ["Location", "Color", "Alpha", "Object Index",
+                                                 "Material Index", "Random"], {}),
+    "ShaderNodeAttribute": ('ATTRIBUTE', [], ["Color", "Vector", "Fac", "Alpha"],
+                            {"attribute_name": "", "attribute_type": 'GEOMETRY'}),
+    "ShaderNodeTexEnvironment": ('TEX_ENVIRONMENT', [("Vector", _VECTOR)], ["Color", "Alpha"],
+                                 {"image": None, "projection": 'EQUIRECTANGULAR'}),
+    "ShaderNodeBackground": ('BACKGROUND', [("Color", _GREY), ("Strength", 1.0)], ["Background"], {}),
+    "ShaderNodeOutputWorld": ('OUTPUT_WORLD', [("Surface", None), ("Volume", None)], [],
+                              {"is_active_output": True, "target": 'ALL'}),
+    "ShaderNodeBsdfTransparent": ('BSDF_TRANSPARENT', [("Color", (1.0, 1.0, 1.0, 1.0))], ["BSDF"], {}),
+    "ShaderNodeMixShader": ('MIX_SHADER', [("Fac", 0.5), ("Shader", None), ("Shader", None)], ["Shader"], {}),
+    "ShaderNodeSeparateXYZ": ('SEPXYZ', [("Vector", _VECTOR)], ["X", "Y", "Z"], {}),
+    "ShaderNodeCombineXYZ": ('COMBXYZ', [("X", 0.0), ("Y", 0.0), ("Z", 0.0)], ["Vector"], {}),
+    "NodeFrame": ('FRAME', [], [], {"shrink": True, "label_size": 20}),
+    "NodeReroute": ('REROUTE', [("Input", None)], ["Output"], {}),
+}
+
+
+class Node(bpy_struct):
+    """Shader node. Setting any attribute is counted."""
+
+    def __init__(self, tree, bl_idname):
+        node_type, inputs, outputs, attributes = NODE_TYPES[bl_idname]
+        set_attribute = object.__setattr__
+        set_attribute(self, "id_data", tree)
+        set_attribute(self, "bl_idname", bl_idname)
+        set_attribute(self, "type", node_type)
+        set_attribute(self, "name", "")
+        set_attribute(self, "label", "")
+        set_attribute(self, "location", Vector((0.0, 0.0)))
+        set_attribute(self, "width", 140.0)
+        set_attribute(self, "parent", None)
+        set_attribute(self, "mute", False)
+        set_attribute(self, "hide", False)
+        set_attribute(self, "select", True)
+        names = Counter()
+        sockets = NodeSockets()
+        for name, default in inputs:
+            sockets.append(NodeSocket(self, name, default, False, names[name]))
+            names[name] += 1
+        set_attribute(self, "inputs", sockets)
+        set_attribute(self, "outputs", NodeSockets(NodeSocket(self, name, None, True, 0) for name in outputs))
+        for name, default in attributes.items():
+            set_attribute(self, name, default)
+        if node_type == 'VALTORGB':
+            set_attribute(self, "color_ramp", ColorRamp())
+        elif node_type == 'CURVE_VEC':
+            set_attribute(self, "mapping", CurveMapping(3))
+
+    def __setattr__(self, name, value):
+        _count("node." + name)
+        if name == "location":
+            value = Vector(value)
+        object.__setattr__(self, name, value)
+
+    @property
+    def internal_links(self):
+        if not self.inputs or not self.outputs:
+            return []
+        return [NodeLink(self, self.inputs[0], self, self.outputs[0])]
+
+
+class NodeLink:
+    def __init__(self, from_node, from_socket, to_node, to_socket):
+        self.from_node = from_node
+        self.from_socket = from_socket
+        self.to_node = to_node
+        self.to_socket = to_socket
+        self.is_valid = True
+        self.is_muted = False
+
+
+class Nodes:
+    def __init__(self, tree):
+        self._tree = tree
+        self._nodes = []
+
+    def new(self, type):
+        _count("nodes.new")
+        if type not in NODE_TYPES:
+            raise RuntimeError('Error: Node type {} undefined'.format(type))
+        node = Node(self._tree, type)
+        base = type.replace("ShaderNode", "").replace("Node", "") or type
+        object.__setattr__(node, "name", self._unique_name(base))
+        self._nodes.append(node)
+        return node
+
+    def _unique_name(self, name):
+        names = {node.name for node in self._nodes}
+        if name not in names:
+            return name
+        index = 1
+        while "{}.{:03d}".format(name, index) in names:
+            index += 1
+        return "{}.{:03d}".format(name, index)
+
+    def remove(self, node):
+        _count("nodes.remove")
+        self._tree.links._remove_node(node)
+        for other in self._nodes:
+            if other.parent is node:
+                object.__setattr__(other, "parent", None)
+        self._nodes.remove(node)
+
+    def get(self, name, default=None):
+        _count("nodes.get")
+        for node in self._nodes:
+            if node.name == name:
+                return node
+        return default
+
+    def clear(self):
+        for node in list(self._nodes):
+            self.remove(node)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            node = self.get(key)
+            if node is None:
+                raise KeyError('bpy_prop_collection[key]: key "{}" not found'.format(key))
+            return node
+        return self._nodes[key]
+
+    def __iter__(self):
+        return iter(list(self._nodes))
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __contains__(self, key):
+        return self.get(key) is not None if isinstance(key, str) else key in self._nodes
+
+
+class Links:
+    def __init__(self, tree):
+        self._tree = tree
+        self._links = []
+
+    def new(self, input, output, verify_limits=True):
+        _count("links.new")
+        from_socket, to_socket = (input, output) if input.is_output else (output, input)
+        if verify_limits:
+            self._links = [link for link in self._links if link.to_socket is not to_socket]
+        link = NodeLink(from_socket.node, from_socket, to_socket.node, to_socket)
+        self._links.append(link)
+        return link
+
+    def remove(self, link):
+        _count("links.remove")
+        self._links.remove(link)
+
+    def _remove_node(self, node):
+        self._links = [link for link in self._links if link.from_node is not node and link.to_node is not node]
+
+    def clear(self):
+        self._links = []
+
+    def __iter__(self):
+        return iter(list(self._links))
+
+    def __len__(self):
+        return len(self._links)
+
+    def __getitem__(self, index):
+        return self._links[index]
+
+
+class ShaderNodeTree(ID):
+    def __init__(self, name="Shader Nodetree"):
+        super().__init__(name)
+        self.nodes = Nodes(self)
+        self.links = Links(self)
+        self.type = 'SHADER'
+        self.animation_data = None
+
+    def animation_data_clear(self):
+        self.animation_data = None
+
+    def __deepcopy__(self, memo):
+        return self._copy(memo)  # The node tree of a material is copied with it
+
+
+# ---------------------------------------
+# --------------Datablocks---------------
+# ---------------------------------------
+class _Settings:
+    """Namespace of render settings that accepts any attribute."""
+
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+
+def _object_users(block, attribute):
+    """Objects of bpy.data that use a datablock, plus its fake user."""
+
+    return sum(1 for obj in data.objects if getattr(obj, attribute) is block) + int(block.use_fake_user)
+
+
+class Material(ID):
+    def __init__(self, name):
+        super().__init__(name)
+        self.node_tree = None
+        self._use_nodes = False
+        self.cycles = _Settings(volume_step_rate=1.0, volume_sampling='MULTIPLE_IMPORTANCE',
+                                volume_interpolation='LINEAR', homogeneous_volume=False)
+        self.blend_method = 'OPAQUE'
+        self.shadow_method = 'OPAQUE'
+        self.diffuse_color = (0.8, 0.8, 0.8, 1.0)
+
+    @property
+    def users(self):
+        return _object_users(self, "active_material")
+
+    @users.setter
+    def users(self, value):
+        pass
+
+    @property
+    def use_nodes(self):
+        return self._use_nodes
+
+    @use_nodes.setter
+    def use_nodes(self, value):
+        _count("Material.use_nodes")
+        self._use_nodes = bool(value)
+        if self._use_nodes and self.node_tree is None:
+            self.node_tree = ShaderNodeTree()
+            bsdf = self.node_tree.nodes.new("ShaderNodeBsdfPrincipled")
+            output = self.node_tree.nodes.new("ShaderNodeOutputMaterial")
+            self.node_tree.links.new(bsdf.outputs["BSDF"], output.inputs["Surface"])
+
+
+class World(Material):
+    users = 0
+
+
+class _MeshVertices:
+    """Vertices of a box mesh: the corners of its bounding box."""
+
+    def __init__(self, mesh):
+        self._mesh = mesh
+
+    def __len__(self):
+        return 8
+
+    def foreach_get(self, attribute, values):
+        _count("vertices.foreach_get")
+        values[:] = [value for corner in self._mesh.bound_box for value in corner]
+
+    def foreach_set(self, attribute, values):
+        _count("vertices.foreach_set")
+        self._mesh.size = Vector([2 * max(abs(v) for v in values[axis::3]) for axis in range(3)])
+
+
+class Mesh(ID):
+    """Mesh that only keeps the size of its bounding box."""
+
+    def __init__(self, name, size=(0.0, 0.0, 0.0)):
+        super().__init__(name)
+        self.size = Vector(size)
+        self.vertices = _MeshVertices(self)
+
+    @property
+    def users(self):
+        return _object_users(self, "data")
+
+    @users.setter
+    def users(self, value):
+        pass
+
+    def update(self):
+        pass
+
+    @property
+    def bound_box(self):
+        half = self.size * 0.5
+        return [(x, y, z) for x in (-half.x, half.x) for y in (-half.y, half.y) for z in (-half.z, half.z)]
+
+
+class Light(ID):
+    def __init__(self, name, type='POINT'):
+        super().__init__(name)
+        self.type = type
+        self.energy = 10.0
+        self.angle = 0.00918
+
+
+class Camera(ID):
+    def __init__(self, name):
+        super().__init__(name)
+        self.type = 'PERSP'
+        self.lens = 50.0
+        self.sensor_width = 36.0
+        self.clip_start = 0.1
+        self.clip_end = 1000.0
+        self.ortho_scale = 6.0
+
+
+class Collection(ID):
+    def __init__(self, name):
+        super().__init__(name)
+        self.objects = _CollectionObjects()
+        self.children = _CollectionObjects()
+        self.hide_render = False
+        self.hide_viewport = False
+
+
+class _CollectionObjects(list):
+    def link(self, item):
+        _count("collection.link")
+        if item not in self:
+            self.append(item)
+
+    def unlink(self, item):
+        _count("collection.unlink")
+        self.remove(item)
+
+    def get(self, name, default=None):
+        for item in self:
+            if item.name == name:
+                return item
+        return default
+
+
+class MaterialSlot:
+    """The only material slot of an object, the active material."""
+
+    def __init__(self, obj):
+        self._object = obj
+        self.link = 'DATA'
+
+    @property
+    def material(self):
+        return self._object.active_material
+
+    @material.setter
+    def material(self, value):
+        self._object.active_material = value
+
+
+class Object(ID):
+    def __init__(self, name, object_data=None):
+        super().__init__(name)
+        self.data = object_data
+        self.type = 'EMPTY' if object_data is None else type(object_data).__name__.upper()
+        self.location = Vector((0.0, 0.0, 0.0))
+        self.rotation_euler = Vector((0.0, 0.0, 0.0))
+        self._scale = Vector((1.0, 1.0, 1.0))
+        self.active_material = None
+        self.hide_render = False
+        self.hide_viewport = False
+        self.parent = None
+        self.instance_type = 'NONE'
+        self.instance_collection = None
+        self.display_type = 'TEXTURED'
+        self.active_material_index = 0
+        self.material_slots = [MaterialSlot(self)]
+
+    def select_set(self, state):
+        _count("Object.select_set")
+        self.__dict__["_selected"] = bool(state)
+
+    @property
+    def scale(self):
+        return self._scale
+
+    @scale.setter
+    def scale(self, value):
+        _count("Object.scale")
+        self._scale = Vector(value)
+
+    @property
+    def dimensions(self):
+        if isinstance(self.data, Mesh):
+            return self.data.size * self._scale
+        return Vector((0.0, 0.0, 0.0))
+
+    @property
+    def bound_box(self):
+        if isinstance(self.data, Mesh):
+            return self.data.bound_box
+        return [(0.0, 0.0, 0.0)] * 8
+
+
+class Scene(ID):
+    def __init__(self, name):
+        super().__init__(name)
+        self.collection = Collection("Scene Collection")
+        self.camera = None
+        self.world = None
+        self.cursor = _Settings(location=Vector((0.0, 0.0, 0.0)))
+        self.frame_current = 1
+        self.render = _Settings(engine='BLENDER_EEVEE', resolution_x=1920, resolution_y=1080,
+                                resolution_percentage=100, pixel_aspect_x=1.0, pixel_aspect_y=1.0,
+                                filepath="//", preview_pixel_size='AUTO',
+                                image_settings=_Settings(file_format='PNG'))
+        self.cycles = _Settings(device='CPU', samples=128, preview_samples=32, volume_step_rate=1.0,
+                                volume_preview_step_rate=1.0, volume_max_steps=1024, volume_bounces=0,
+                                use_adaptive_sampling=True, adaptive_threshold=0.01,
+                                adaptive_min_samples=0, seed=0)
+        self.eevee = _Settings(volumetric_start=0.1, volumetric_end=100.0, volumetric_tile_size='8',
+                               volumetric_samples=64, use_volumetric_lights=True,
+                               use_volumetric_shadows=False)
+
+    @property
+    def objects(self):
+        objects = list(self.collection.objects)
+        pending = list(self.collection.children)
+        while pending:
+            child = pending.pop()
+            objects.extend(obj for obj in child.objects if obj not in objects)
+            pending.extend(child.children)
+        return objects
+
+
+class BlendDataCollection:
+    """bpy.data collection of datablocks of a type."""
+
+    def __init__(self, id_type):
+        self._id_type = id_type
+        self._items = []
+
+    def _unique_name(self, name, item=None):
+        names = {other.name for other in self._items if other is not item}
+        base = name
+        index = 0
+        while name in names:
+            index += 1
+            name = "{}.{:03d}".format(base, index)
+        return name
+
+    def _add(self, item, name):
+        item.__dict__["_collection"] = self
+        item.__dict__["_name"] = self._unique_name(name, item)
+        self._items.append(item)
+        return item
+
+    def new(self, name, *args, **kwargs):
+        _count(self._id_type.__name__ + ".new")
+        return self._add(self._id_type(name, *args, **kwargs), name)
+
+    def remove(self, item, do_unlink=True):
+        _count(self._id_type.__name__ + ".remove")
+        self._items.remove(item)
+        item.__dict__["_collection"] = None
+        if isinstance(item, Object):
+            for scene in data.scenes:
+                for collection in [scene.collection] + list(data.collections):
+                    if item in collection.objects:
+                        collection.objects.remove(item)
+
+    def get(self, name, default=None):
+        for item in self._items:
+            if item.name == name:
+                return item
+        return default
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            item = self.get(key)
+            if item is None:
+                raise KeyError('bpy_prop_collection[key]: key "{}" not found'.format(key))
+            return item
+        return self._items[key]
+
+    def __iter__(self):
+        return iter(list(self._items))
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return self.get(key) is not None if isinstance(key, str) else key in self._items
+
+
+class BlendData:
+    def __init__(self):
+        self.materials = BlendDataCollection(Material)
+        self.objects = BlendDataCollection(Object)
+        self.meshes = BlendDataCollection(Mesh)
+        self.images = BlendDataCollection(Image)
+        self.texts = BlendDataCollection(Text)
+        self.scenes = BlendDataCollection(Scene)
+        self.cameras = BlendDataCollection(Camera)
+        self.lights = BlendDataCollection(Light)
+        self.worlds = BlendDataCollection(World)
+        self.collections = BlendDataCollection(Collection)
+        self.node_groups = BlendDataCollection(ShaderNodeTree)
+        self.filepath = ""
+
+    def orphans_purge(self, do_local_ids=True, do_linked_ids=True, do_recursive=False):
+        return 0
+
+
+# ---------------------------------------
+# ----------------Context----------------
+# ---------------------------------------
+class _LayerObjects(list):
+    def __init__(self):
+        super().__init__()
+        self.active = None
+
+
+class ViewLayer:
+    def __init__(self):
+        self.objects = _LayerObjects()
+
+    def update(self):
+        _count("view_layer.update")
+
+
+class _Addon:
+    def __init__(self, module, preferences):
+        self.module = module
+        self.preferences = preferences
+
+
+class _Addons(dict):
+    pass
+
+
+class Preferences:
+    def __init__(self):
+        self.addons = _Addons()
+
+
+class WindowManager:
+    windows = []
+
+    def invoke_props_dialog(self, operator, width=300):
+        return {'RUNNING_MODAL'}
+
+    def fileselect_add(self, operator):
+        return {'RUNNING_MODAL'}
+
+
+class Context:
+    def __init__(self):
+        self.scene = None
+        self.view_layer = ViewLayer()
+        self.preferences = Preferences()
+        self.window_manager = WindowManager()
+        self.area = None
+        self.region = None
+        self.region_data = None
+        self.space_data = None
+        self.mode = 'OBJECT'
+
+    @property
+    def active_object(self):
+        _count("context.active_object")
+        return self.view_layer.objects.active
+
+    @property
+    def object(self):
+        return self.view_layer.objects.active
+
+    @property
+    def selected_objects(self):
+        return [obj for obj in self.scene.objects if getattr(obj, "_selected", False)]
+
+    @property
+    def collection(self):
+        return self.scene.collection
+
+    def evaluated_depsgraph_get(self):
+        return None
+
+
+data = BlendData()
+context = Context()
+
+
+def reset_data():
+    """Empties bpy.data and creates a new scene."""
+
+    global data
+    data = BlendData()
+    context.scene = data.scenes.new("Scene")
+    context.view_layer = ViewLayer()
+    _bpy.data = data
+
+
+# ---------------------------------------
+# ------------------Ops------------------
+# ---------------------------------------
+def _primitive_cube_add(size=2.0, location=(0.0, 0.0, 0.0), **kwargs):
+    mesh = data.meshes.new("Cube", (size, size, size))
+    obj = data.objects.new("Cube", mesh)
+    obj.location = Vector(location)
+    context.scene.collection.objects.link(obj)
+    for other in context.scene.objects:
+        other.__dict__["_selected"] = False
+    obj.__dict__["_selected"] = True
+    context.view_layer.objects.active = obj
+    return {'FINISHED'}
+
+
+def _transform_apply(location=False, rotation=False, scale=True, properties=True, **kwargs):
+    for obj in context.selected_objects:
+        if scale and isinstance(obj.data, Mesh):
+            obj.data.size = obj.data.size * obj.scale
+            obj.scale = (1.0, 1.0, 1.0)
+        if location:
+            obj.location = Vector((0.0, 0.0, 0.0))
+    return {'FINISHED'}
+
+
+def _delete(**kwargs):
+    for obj in context.selected_objects:
+        data.objects.remove(obj)
+    return {'FINISHED'}
+
+
+def _select_all(action='TOGGLE', **kwargs):
+    for obj in context.scene.objects:
+        obj.__dict__["_selected"] = action == 'SELECT'
+    return {'FINISHED'}
+
+
+_BUILTIN_OPERATORS = {
+    "mesh.primitive_cube_add": _primitive_cube_add,
+    "object.transform_apply": _transform_apply,
+    "object.delete": _delete,
+    "object.select_all": _select_all,
+}
+
+# Operator classes registered with register_class, by bl_idname.
+_operators = {}
+
+
+class _OperatorCall:
+    def __init__(self, idname):
+        self.idname = idname
+
+    def __call__(self, *args, **kwargs):
+        _count("bpy.ops." + self.idname)
+        execution_context = args[0] if args else 'EXEC_DEFAULT'
+        builtin = _BUILTIN_OPERATORS.get(self.idname)
+        if builtin is not None:
+            return builtin(**kwargs)
+        operator_class = _operators.get(self.idname)
+        if operator_class is None:
+            return {'CANCELLED'}
+        poll = getattr(operator_class, "poll", None)
+        if poll is not None and not poll(context):
+            raise RuntimeError("Operator bpy.ops.{}.poll() failed, context is incorrect".format(self.idname))
+        operator = operator_class()
+        for name, value in kwargs.items():
+            setattr(operator, name, value)
+        if execution_context.startswith('INVOKE') and hasattr(operator, "invoke"):
+            return operator.invoke(context, None)
+        return operator.execute(context)
+
+    def poll(self):
+        operator_class = _operators.get(self.idname)
+        poll = getattr(operator_class, "poll", None)
+        return poll is None or poll(context)
+
+
+class _OpsModule:
+    def __init__(self, module):
+        self._module = module
+
+    def __getattr__(self, name):
+        return _OperatorCall(self._module + "." + name)
+
+
+class _Ops:
+    def __getattr__(self, module):
+        return _OpsModule(module)
+
+
+# ---------------------------------------
+# -----------------Utils-----------------
+# ---------------------------------------
+def register_class(cls):
+    """Turns the annotations of the class into properties."""
+
+    _count("register_class")
+    properties = _class_properties(cls)
+    rna_properties = [_RNAProperty("rna_type", 'POINTER')]
+    if issubclass(cls, PropertyGroup):
+        rna_properties.append(_RNAProperty("name", 'STRING'))
+    for name, prop in properties.items():
+        prop.identifier = name
+        setattr(cls, name, prop)
+        rna_properties.append(_RNAProperty(name, prop.rna_type, prop.is_array))
+    cls.bl_rna = _RNA(rna_properties)
+    if issubclass(cls, Operator) and cls.bl_idname:
+        _operators[cls.bl_idname] = cls
+    if issubclass(cls, AddonPreferences):
+        context.preferences.addons[cls.bl_idname] = _Addon(cls.bl_idname, cls())
+
+
+def unregister_class(cls):
+    _count("unregister_class")
+    if issubclass(cls, Operator):
+        _operators.pop(cls.bl_idname, None)
+    if issubclass(cls, AddonPreferences):
+        context.preferences.addons.pop(cls.bl_idname, None)
+
+
+class _Previews(dict):
+    def load(self, name, filepath, filetype):
+        self[name] = filepath
+
+    def close(self):
+        self.clear()
+
+
+def _previews_new():
+    return _Previews()
+
+
+def _previews_remove(previews):
+    previews.close()
+
+
+class _Timers:
+    def __init__(self):
+        self._functions = {}
+
+    def register(self, function, first_interval=0.0, persistent=False):
+        self._functions[function] = first_interval
+
+    def unregister(self, function):
+        del self._functions[function]
+
+    def is_registered(self, function):
+        return function in self._functions
+
+
+class _Msgbus:
+    def __init__(self):
+        self.subscriptions = []
+
+    def subscribe_rna(self, key, owner, args, notify, options=set()):
+        self.subscriptions.append((key, owner, args, notify))
+
+    def clear_by_owner(self, owner):
+        self.subscriptions = [item for item in self.subscriptions if item[1] is not owner]
+
+    def publish_rna(self, key):
+        for subscribed_key, _, args, notify in list(self.subscriptions):
+            if subscribed_key is key:
+                notify(*args)
+
+
+def persistent(function):
+    return function
+
+
+class ExportHelper:
+    filepath: StringProperty(name="File Path", subtype='FILE_PATH', default="")
+
+    def invoke(self, context, event):
+        return {'RUNNING_MODAL'}
+
+
+class ImportHelper(ExportHelper):
+    pass
+
+
+# ---------------------------------------
+# ----------------Modules----------------
+# ---------------------------------------
+def _module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    return module
+
+
+_bpy = None
+
+
+def install():
+    """Puts the stand-in bpy, mathutils and bpy_extras modules in sys.modules.
+
+    Returns the bpy module.
+    """
+
+    global _bpy
+    handler_names = ("frame_change_pre", "frame_change_post", "load_pre", "load_post", "save_pre",
+                     "save_post", "render_pre", "render_post", "render_init", "render_complete",
+                     "render_cancel", "render_stats", "depsgraph_update_pre", "depsgraph_update_post",
+                     "undo_post", "redo_post")
+    handlers = _module("bpy.app.handlers", persistent=persistent,
+                       **{name: [] for name in handler_names})
+    app = _module("bpy.app", handlers=handlers, timers=_Timers(), version=(3, 6, 0),
+                  version_string="3.6.0 (stand-in)", background=True, binary_path="",
+                  is_job_running=lambda job_type: False)
+    previews = _module("bpy.utils.previews", new=_previews_new, remove=_previews_remove)
+    utils = _module("bpy.utils", register_class=register_class, unregister_class=unregister_class,
+                    previews=previews)
+    props = _module("bpy.props", BoolProperty=BoolProperty, IntProperty=IntProperty,
+                    FloatProperty=FloatProperty, FloatVectorProperty=FloatVectorProperty,
+                    StringProperty=StringProperty, EnumProperty=EnumProperty,
+                    PointerProperty=PointerProperty, CollectionProperty=CollectionProperty)
+    bpy_types = _module("bpy.types", bpy_struct=bpy_struct, ID=ID, PropertyGroup=PropertyGroup,
+                        AddonPreferences=AddonPreferences, Operator=Operator, Panel=Panel, Menu=Menu,
+                        VIEW3D_MT_volume_add=VIEW3D_MT_volume_add, VIEW3D_MT_add=VIEW3D_MT_add,
+                        SpaceView3D=SpaceView3D, Object=Object, Scene=Scene, Material=Material,
+                        World=World, Mesh=Mesh, Image=Image, Text=Text, Camera=Camera, Light=Light,
+                        Collection=Collection, Node=Node, NodeSocket=NodeSocket,
+                        ShaderNodeTree=ShaderNodeTree)
+    _bpy = _module("bpy", app=app, utils=utils, props=props, types=bpy_types, data=data,
+                   context=context, ops=_Ops(), msgbus=_Msgbus())
+    mathutils = _module("mathutils", Vector=Vector, Matrix=Matrix)
+    io_utils = _module("bpy_extras.io_utils", ExportHelper=ExportHelper, ImportHelper=ImportHelper)
+    bpy_extras = _module("bpy_extras", io_utils=io_utils)
+
+    sys.modules.update({
+        "bpy": _bpy,
+        "bpy.app": app,
+        "bpy.app.handlers": handlers,
+        "bpy.utils": utils,
+        "bpy.utils.previews": previews,
+        "bpy.props": props,
+        "bpy.types": bpy_types,
+        "mathutils": mathutils,
+        "bpy_extras": bpy_extras,
+        "bpy_extras.io_utils": io_utils,
+    })
+    reset_data()
+    return _bpy
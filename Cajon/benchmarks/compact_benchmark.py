@@ -0,0 +1,131 @@
+"""
+    compact_benchmark.py is part of Cloud Generator Blender Addon.
+
+    Foobar is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+
+Headless benchmark of the compact save of clouds.
+
+Every case generates a number of clouds with the scenes of
+render_benchmark.py and saves them twice, with their full materials and in
+compact save mode (see compact.py). Both files are loaded again and the
+file size, the load time and, for the compact file, the time to rebuild
+every material are reported.
+
+Usage:
+    blender -b --factory-startup --python Cajon/benchmarks/compact_benchmark.py -- \\
+        --output report.json [--counts 10 100 300] [--types SINGLE_CUMULUS ...]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import addon_utils
+import bpy
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import render_benchmark  # noqa: E402
+
+COUNTS = (10, 100, 300)
+
+
+def save_and_load(filepath, compact_save):
+    """Saves the current file, loads it again and measures it.
+
+    The current file is loaded again afterwards.
+    """
+
+    from clouds_generator import compact
+
+    current = bpy.data.filepath
+    bpy.context.scene.cloud_scene_settings.compact_save = compact_save
+    start = time.perf_counter()
+    bpy.ops.wm.save_as_mainfile(filepath=filepath, copy=True, compress=False)
+    save_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    bpy.ops.wm.open_mainfile(filepath=filepath, load_ui=False)
+    load_time = time.perf_counter() - start
+    pending = len(compact._pending)
+    start = time.perf_counter()
+    compact.rebuild_pending(bpy.context)
+    rebuild_time = time.perf_counter() - start
+
+    measures = {
+        "file_size": os.path.getsize(filepath),
+        "save_time": save_time,
+        "load_time": load_time,
+        "rebuilt_clouds": pending,
+        "rebuild_time": rebuild_time,
+        "nodes": sum(len(material.node_tree.nodes) for material in bpy.data.materials
+                     if material.name.startswith("CloudMaterial_CG") and material.users),
+    }
+    bpy.ops.wm.open_mainfile(filepath=current, load_ui=False)
+    return measures
+
+
+def compact_case(context, cloud_type, count, directory):
+    """Generates count clouds and measures the full and the compact save."""
+
+    render_benchmark.clear_scene()
+    render_benchmark.build_scene(context, cloud_type, count)
+    scene_file = os.path.join(directory, "scene.blend")
+    bpy.ops.wm.save_as_mainfile(filepath=scene_file)
+
+    case = {
+        "full": save_and_load(os.path.join(directory, "full.blend"), False),
+        "compact": save_and_load(os.path.join(directory, "compact.blend"), True),
+    }
+    case["size_ratio"] = case["compact"]["file_size"] / case["full"]["file_size"]
+    case["load_ratio"] = case["compact"]["load_time"] / case["full"]["load_time"]
+    return case
+
+
+def parse_arguments():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    parser = argparse.ArgumentParser(description="Cloud compact save benchmark")
+    parser.add_argument("--output", default="compact_output.json")
+    parser.add_argument("--counts", type=int, nargs="*", default=list(COUNTS))
+    parser.add_argument("--types", nargs="*", default=list(render_benchmark.CLOUD_TYPES))
+    return parser.parse_args(argv)
+
+
+def main():
+    arguments = parse_arguments()
+    addon_utils.enable(render_benchmark.ADDON, default_set=True)
+
+    report = {"blender_version": bpy.app.version_string, "cases": {}}
+    with tempfile.TemporaryDirectory() as directory:
+        for cloud_type in arguments.types:
+            for count in arguments.counts:
+                name = render_benchmark.case_name(cloud_type, count)
+                report["cases"][name] = compact_case(bpy.context, cloud_type, count, directory)
+    for name, case in report["cases"].items():
+        full = case["full"]
+        compact = case["compact"]
+        print("{}: {:.1f} -> {:.1f} MB ({:.0%}), load {:.2f} -> {:.2f} s, rebuild {:.2f} s".format(
+            name, full["file_size"] / 2**20, compact["file_size"] / 2**20, case["size_ratio"],
+            full["load_time"], compact["load_time"], compact["rebuild_time"]))
+
+    with open(arguments.output, "w") as output:
+        json.dump(report, output, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
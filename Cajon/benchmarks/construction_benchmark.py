@@ -0,0 +1,269 @@
+"""
+    construction_benchmark.py is part of Cloud Generator Blender Addon.
+
+    Foobar is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+
+Construction and update throughput of the addon without Blender.
+
+The addon runs on the in-memory stand-in of bpy (bpy_standin.py). For every
+cloud type it measures the clouds generated per second, the API calls, nodes
+and links per cloud, the phases of the generation and the time and API calls
+of every property update function. Changing the type of a cloud and
+regenerating it in place are timed against generating a new cloud. API
+calls are deterministic, so any change in them is reported as a
+regression. Times are compared with a relative threshold.
+
+Usage:
+    python Cajon/benchmarks/construction_benchmark.py --output report.json
+        [--baseline construction_baseline.json] [--write-baseline]
+        [--clouds 50] [--updates 200] [--time-threshold 0.25]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bpy_standin  # noqa: E402
+
+bpy = bpy_standin.install()
+
+import clouds_generator  # noqa: E402
+from clouds_generator import materials, profiling  # noqa: E402
+from clouds_generator.cloud_settings import CloudSettings  # noqa: E402
+
+CLOUD_TYPES = ("SINGLE_CUMULUS", "CLOUDSCAPE_CUMULUS", "CLOUDSCAPE_CIRRUS", "CLOUDSCAPE_LAYERED")
+BASE_SEED = 1000
+DEFAULT_TIME_THRESHOLD = 0.25
+
+
+def updated_properties():
+    """Names of the cloud settings that have an update function."""
+
+    return [prop.identifier for prop in CloudSettings.bl_rna.properties
+            if getattr(getattr(CloudSettings, prop.identifier, None), "update", None) is not None]
+
+
+def construction_case(cloud_type, count):
+    """Generates count clouds of a type and measures the construction."""
+
+    bpy_standin.reset_data()
+    bpy_standin.reset_counts()
+    profiling.reset()
+    profiling.enable()
+    seeds = [BASE_SEED + i for i in range(count)]
+    start = time.perf_counter()
+    clouds = materials.generate_clouds(bpy.context, materials.INITIAL_SHAPES[cloud_type], seeds)
+    elapsed = time.perf_counter() - start
+    profiling.disable()
+
+    material = clouds[0].active_material
+    return {
+        "clouds": count,
+        "time": elapsed,
+        "clouds_per_second": count / elapsed,
+        "nodes": len(material.node_tree.nodes),
+        "links": len(material.node_tree.links),
+        "api_calls": {name: calls / count for name, calls in sorted(bpy_standin.api_calls.items())},
+        "phases": {row["name"]: {"mean_time": row["mean_time"], "mean_nodes": row["mean_nodes"],
+                                 "mean_links": row["mean_links"], "mean_operators": row["mean_operators"]}
+                   for row in profiling.results()},
+    }
+
+
+def update_case(cloud_type, repetitions):
+    """Sets every property with an update function of a cloud and measures it.
+
+    Updates that fail for the cloud type are reported with their error.
+    """
+
+    bpy_standin.reset_data()
+    cloud = materials.generate_clouds(bpy.context, materials.INITIAL_SHAPES[cloud_type], [BASE_SEED])[0]
+    bpy.context.view_layer.objects.active = cloud
+    settings = cloud.cloud_settings
+
+    updates = {}
+    for name in updated_properties():
+        value = getattr(settings, name)
+        bpy_standin.reset_counts()
+        start = time.perf_counter()
+        try:
+            for _ in range(repetitions):
+                setattr(settings, name, value)
+        except Exception as error:
+            updates[name] = {"error": "{}: {}".format(type(error).__name__, error)}
+            continue
+        elapsed = time.perf_counter() - start
+        updates[name] = {
+            "mean_time": elapsed / repetitions,
+            "api_calls": sum(bpy_standin.api_calls.values()) / repetitions,
+        }
+    return updates
+
+
+def regeneration_case(cloud_type, count):
+    """Changes the type of a cloud and regenerates it in place count times.
+
+    The type is changed alternately from the other cloud types to the
+    measured one, and every regeneration draws a new seed.
+    """
+
+    bpy_standin.reset_data()
+    others = [other for other in CLOUD_TYPES if other != cloud_type]
+    cloud = materials.generate_clouds(bpy.context, materials.INITIAL_SHAPES[others[0]], [BASE_SEED])[0]
+
+    change_time = 0.0
+    change_calls = 0
+    bpy_standin.reset_counts()
+    for i in range(count):
+        materials.rebuild_initial_shape(bpy.context, cloud, materials.INITIAL_SHAPES[others[i % len(others)]])
+        bpy_standin.reset_counts()
+        start = time.perf_counter()
+        materials.rebuild_initial_shape(bpy.context, cloud, materials.INITIAL_SHAPES[cloud_type])
+        change_time += time.perf_counter() - start
+        change_calls += sum(bpy_standin.api_calls.values())
+
+    bpy_standin.reset_counts()
+    start = time.perf_counter()
+    for i in range(count):
+        materials.regenerate_cloud(bpy.context, cloud, BASE_SEED + i + 1)
+    regenerate_time = time.perf_counter() - start
+    regenerate_calls = sum(bpy_standin.api_calls.values())
+
+    bpy_standin.reset_counts()
+    start = time.perf_counter()
+    for i in range(count):
+        materials.generate_cloud(bpy.context, -1000, 0, materials.INITIAL_SHAPES[cloud_type], BASE_SEED + i)
+    generate_time = time.perf_counter() - start
+    generate_calls = sum(bpy_standin.api_calls.values())
+
+    return {
+        "nodes": len(cloud.active_material.node_tree.nodes),
+        "change_type_time": change_time / count,
+        "change_type_api_calls": change_calls / count,
+        "regenerate_time": regenerate_time / count,
+        "regenerate_api_calls": regenerate_calls / count,
+        "generate_time": generate_time / count,
+        "generate_api_calls": generate_calls / count,
+    }
+
+
+def compare_reports(report, baseline, time_threshold):
+    """Regressions of a report against a baseline as a list of messages."""
+
+    regressions = []
+    for cloud_type, case in report["construction"].items():
+        reference = baseline.get("construction", {}).get(cloud_type)
+        if reference is None:
+            continue
+        if case["clouds_per_second"] < reference["clouds_per_second"] * (1.0 - time_threshold):
+            regressions.append("{}: {:.1f} clouds/s < {:.1f}".format(
+                cloud_type, case["clouds_per_second"], reference["clouds_per_second"]))
+        for measure in ("nodes", "links"):
+            if case[measure] != reference[measure]:
+                regressions.append("{}: {} {} != {}".format(cloud_type, measure, case[measure], reference[measure]))
+        for name, calls in case["api_calls"].items():
+            if calls > reference["api_calls"].get(name, 0.0) + 1e-9:
+                regressions.append("{}: {} calls per cloud {:.1f} > {:.1f}".format(
+                    cloud_type, name, calls, reference["api_calls"].get(name, 0.0)))
+
+    for cloud_type, updates in report["updates"].items():
+        reference_updates = baseline.get("updates", {}).get(cloud_type, {})
+        for name, update in updates.items():
+            reference = reference_updates.get(name)
+            if "error" in update:
+                if reference is not None and "error" not in reference:
+                    regressions.append("{}: {} update fails: {}".format(cloud_type, name, update["error"]))
+                continue
+            if reference is None or "error" in reference:
+                continue
+            if update["api_calls"] > reference["api_calls"] + 1e-9:
+                regressions.append("{}: {} update calls {:.1f} > {:.1f}".format(
+                    cloud_type, name, update["api_calls"], reference["api_calls"]))
+            if update["mean_time"] > reference["mean_time"] * (1.0 + time_threshold):
+                regressions.append("{}: {} update {:.1f} us > {:.1f} us".format(
+                    cloud_type, name, update["mean_time"] * 1e6, reference["mean_time"] * 1e6))
+
+    for cloud_type, case in report.get("regeneration", {}).items():
+        reference = baseline.get("regeneration", {}).get(cloud_type)
+        if reference is None:
+            continue
+        if case["nodes"] != reference["nodes"]:
+            regressions.append("{}: nodes after regeneration {} != {}".format(
+                cloud_type, case["nodes"], reference["nodes"]))
+        for measure in ("change_type", "regenerate"):
+            if case[measure + "_api_calls"] > reference[measure + "_api_calls"] + 1e-9:
+                regressions.append("{}: {} calls {:.1f} > {:.1f}".format(
+                    cloud_type, measure, case[measure + "_api_calls"], reference[measure + "_api_calls"]))
+            if case[measure + "_time"] > reference[measure + "_time"] * (1.0 + time_threshold):
+                regressions.append("{}: {} {:.2f} ms > {:.2f} ms".format(
+                    cloud_type, measure, case[measure + "_time"] * 1e3, reference[measure + "_time"] * 1e3))
+    return regressions
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Cloud construction benchmark without Blender")
+    parser.add_argument("--output", default="construction_output.json")
+    parser.add_argument("--baseline", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                           "construction_baseline.json"))
+    parser.add_argument("--write-baseline", action="store_true",
+                        help="Store the report as the new baseline")
+    parser.add_argument("--clouds", type=int, default=50, help="Clouds generated per type")
+    parser.add_argument("--updates", type=int, default=200, help="Repetitions of every property update")
+    parser.add_argument("--time-threshold", type=float, default=DEFAULT_TIME_THRESHOLD)
+    return parser.parse_args()
+
+
+def main():
+    arguments = parse_arguments()
+    clouds_generator.register()
+
+    report = {"construction": {}, "updates": {}, "regeneration": {}}
+    for cloud_type in CLOUD_TYPES:
+        case = construction_case(cloud_type, arguments.clouds)
+        report["construction"][cloud_type] = case
+        report["updates"][cloud_type] = update_case(cloud_type, arguments.updates)
+        print("{}: {:.1f} clouds/s, {} nodes, {} links, {:.0f} API calls per cloud".format(
+            cloud_type, case["clouds_per_second"], case["nodes"], case["links"],
+            sum(case["api_calls"].values())))
+        case = regeneration_case(cloud_type, arguments.clouds)
+        report["regeneration"][cloud_type] = case
+        print("{}: change type {:.2f} ms, regenerate {:.2f} ms, generate {:.2f} ms".format(
+            cloud_type, case["change_type_time"] * 1e3, case["regenerate_time"] * 1e3,
+            case["generate_time"] * 1e3))
+
+    with open(arguments.output, "w") as output:
+        json.dump(report, output, indent=2)
+
+    if arguments.write_baseline:
+        with open(arguments.baseline, "w") as output:
+            json.dump(report, output, indent=2)
+        return 0
+
+    if not os.path.exists(arguments.baseline):
+        print("No baseline found in {}".format(arguments.baseline))
+        return 0
+    with open(arguments.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    regressions = compare_reports(report, baseline, arguments.time_threshold)
+    for regression in regressions:
+        print("REGRESSION " + regression)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
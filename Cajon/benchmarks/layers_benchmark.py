@@ -0,0 +1,144 @@
+"""
+    layers_benchmark.py is part of Cloud Generator Blender Addon.
+
+    Foobar is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+
+Headless render benchmark of the layered cloudscape.
+
+Every case renders a number of cloudscapes with CPU Cycles and the settings
+of render_benchmark.py, built in three ways: a cumulus cloudscape and a
+cirrus cloudscape overlapping in the same place, a layered cloudscape with
+a cumulus and a cirrus layer in a single domain and the same layered
+cloudscape with an extra empty layer, which should cost nothing. Besides
+the render measures, the shader cost of the materials (see shader_cost.py)
+is reported.
+
+Usage:
+    blender -b --factory-startup --python Cajon/benchmarks/layers_benchmark.py -- \\
+        --output report.json [--counts 1 4]
+"""
+import argparse
+import json
+import os
+import sys
+
+import addon_utils
+import bpy
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import render_benchmark  # noqa: E402
+import scatter_benchmark  # noqa: E402
+
+COUNTS = (1, 4)
+BASE_SEED = 1000
+
+# Cloudscapes are much bigger than single clouds.
+CLOUDSCAPE_SPACING = 60.0
+
+
+def build_separate(context, count):
+    """Generates count pairs of overlapping cumulus and cirrus cloudscapes."""
+
+    from clouds_generator import materials
+
+    clouds = []
+    positions = render_benchmark.grid_positions(count, CLOUDSCAPE_SPACING)
+    for index, position in enumerate(positions):
+        for initial_shape in (materials.initial_shape_cloudscape_cumulus, materials.initial_shape_cloudscape_cirrus):
+            cloud = materials.generate_cloud(context, -1000, 0, initial_shape, BASE_SEED + index)
+            cloud.location = position
+            clouds.append(cloud)
+    scatter_benchmark.add_sun_and_camera(context.scene, max(max(abs(p.x), abs(p.y)) for p in positions))
+    return {cloud.active_material for cloud in clouds}
+
+
+def build_layered(context, count, empty_layer=False):
+    """Generates count layered cloudscapes with their default layers.
+
+    empty_layer: add a layer without coverage to every cloudscape.
+    """
+
+    from clouds_generator import materials
+
+    clouds = []
+    positions = render_benchmark.grid_positions(count, CLOUDSCAPE_SPACING)
+    for index, position in enumerate(positions):
+        cloud = materials.generate_cloud(context, -1000, 0, materials.initial_shape_cloudscape_layered,
+                                         BASE_SEED + index)
+        cloud.location = position
+        if empty_layer:
+            bpy.ops.object.cloud_add_layer(layer_type="CUMULUS")
+            cloud.cloud_settings.layers[-1].coverage = 0.0
+        clouds.append(cloud)
+    scatter_benchmark.add_sun_and_camera(context.scene, max(max(abs(p.x), abs(p.y)) for p in positions))
+    return {cloud.active_material for cloud in clouds}
+
+
+def layers_case(context, build):
+    """Renders a case built with build(context) and adds the shader cost of its clouds."""
+
+    from clouds_generator import shader_cost
+
+    case = scatter_benchmark.render_case(context, build)
+    clouds = [obj for obj in context.scene.objects if obj.cloud_settings.is_cloud]
+    case["volume_objects"] = len(clouds)
+    case["shader_cost"] = sum(shader_cost.material_cost(cloud.active_material)["cost"] for cloud in clouds)
+    return case
+
+
+def parse_arguments():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    parser = argparse.ArgumentParser(description="Cloud layered cloudscape benchmark")
+    parser.add_argument("--output", default="layers_output.json")
+    parser.add_argument("--counts", type=int, nargs="*", default=list(COUNTS))
+    return parser.parse_args(argv)
+
+
+def main():
+    arguments = parse_arguments()
+    addon_utils.enable(render_benchmark.ADDON, default_set=True)
+    context = bpy.context
+
+    report = {
+        "blender_version": bpy.app.version_string,
+        "resolution": render_benchmark.RESOLUTION,
+        "samples": render_benchmark.SAMPLES,
+        "cases": {},
+    }
+    for count in arguments.counts:
+        report["cases"]["separate_{}".format(count)] = layers_case(
+            context, lambda c: build_separate(c, count))
+        report["cases"]["layered_{}".format(count)] = layers_case(
+            context, lambda c: build_layered(c, count))
+        report["cases"]["layered_empty_layer_{}".format(count)] = layers_case(
+            context, lambda c: build_layered(c, count, empty_layer=True))
+    for name, case in report["cases"].items():
+        print("{}: {:.2f} s, sync {} s, {:.0f} MB, {} objects, {} nodes, shader cost {:.0f}".format(
+            name, case["wall_time"], "{:.2f}".format(case["sync_time"]) if case["sync_time"] else "-",
+            case["peak_memory_mb"], case["volume_objects"], case["node_count"], case["shader_cost"]))
+    for count in arguments.counts:
+        separate = report["cases"]["separate_{}".format(count)]
+        layered = report["cases"]["layered_{}".format(count)]
+        print("{} cloudscapes: layered / separate render time {:.0%}".format(
+            count, layered["wall_time"] / separate["wall_time"]))
+
+    with open(arguments.output, "w") as output:
+        json.dump(report, output, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
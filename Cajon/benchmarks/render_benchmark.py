@@ -0,0 +1,251 @@
+"""
+    render_benchmark.py is part of Cloud Generator Blender Addon.
+
+    Foobar is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+
+Headless render benchmark of the cloud types at several scene scales.
+
+Every case generates clouds of one type with fixed seeds, renders them
+with CPU Cycles at a fixed resolution and number of samples and records
+wall time, synchronization time, peak memory and node count. The report
+is compared against a stored baseline.
+
+Usage:
+    blender -b --factory-startup --python Cajon/benchmarks/render_benchmark.py -- \\
+        --output report.json [--baseline baseline.json] [--write-baseline]
+        [--time-threshold 0.15] [--memory-threshold 0.10] [--cases single_cumulus_1 ...]
+
+The exit code is 1 if any case regresses over the thresholds.
+"""
+import argparse
+import json
+import math
+import os
+import re
+import resource
+import sys
+import time
+
+import addon_utils
+import bpy
+from mathutils import Vector
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ADDON = "clouds_generator"
+
+CLOUD_TYPES = ("SINGLE_CUMULUS", "CLOUDSCAPE_CUMULUS", "CLOUDSCAPE_CIRRUS")
+SCALES = (1, 10, 100)
+
+RESOLUTION = (320, 180)
+SAMPLES = 16
+CLOUD_SPACING = 40.0
+BASE_SEED = 1000
+
+DEFAULT_TIME_THRESHOLD = 0.15
+DEFAULT_MEMORY_THRESHOLD = 0.10
+
+_PEAK_MEMORY = re.compile(r"Peak[: ]+([\d.]+)M")
+
+
+def case_name(cloud_type, count):
+    return "{}_{}".format(cloud_type.lower(), count)
+
+
+def all_cases():
+    return [(case_name(cloud_type, count), cloud_type, count) for cloud_type in CLOUD_TYPES for count in SCALES]
+
+
+def clear_scene():
+    """Removes every object and the datablocks created by previous cases."""
+
+    for obj in list(bpy.data.objects):
+        bpy.data.objects.remove(obj)
+    for collection in (bpy.data.meshes, bpy.data.materials, bpy.data.cameras, bpy.data.lights):
+        for block in list(collection):
+            collection.remove(block)
+
+
+def grid_positions(count, spacing):
+    """Positions of count clouds in a square grid centred in the origin."""
+
+    side = math.ceil(math.sqrt(count))
+    offset = (side - 1) * spacing / 2
+    return [Vector(((i % side) * spacing - offset, (i // side) * spacing - offset, 0.0)) for i in range(count)]
+
+
+def build_scene(context, cloud_type, count):
+    """Generates the clouds, a sun and a camera that frames all of them."""
+
+    from clouds_generator import materials
+
+    scene = context.scene
+    seeds = [BASE_SEED + i for i in range(count)]
+    clouds = materials.generate_clouds(context, materials.INITIAL_SHAPES[cloud_type], seeds)
+    positions = grid_positions(count, CLOUD_SPACING)
+    for cloud, position in zip(clouds, positions):
+        cloud.location = position
+
+    sun = bpy.data.objects.new("Sun", bpy.data.lights.new("Sun", 'SUN'))
+    sun.rotation_euler = (0.8, 0.2, 0.5)
+    scene.collection.objects.link(sun)
+
+    extent = max(max(abs(p.x), abs(p.y)) for p in positions) + CLOUD_SPACING
+    camera = bpy.data.objects.new("Camera", bpy.data.cameras.new("Camera"))
+    camera.data.clip_end = extent * 10
+    camera.location = Vector((0.0, -extent * 2.5, extent))
+    camera.rotation_euler = (-camera.location).to_track_quat('-Z', 'Y').to_euler()
+    scene.collection.objects.link(camera)
+    scene.camera = camera
+    return clouds
+
+
+def configure_render(scene):
+    """Addon render settings with a fixed engine, device, resolution and samples."""
+
+    bpy.ops.render.cloud_render_settings()
+    scene.render.engine = 'CYCLES'
+    scene.cycles.device = 'CPU'
+    scene.cycles.samples = SAMPLES
+    scene.cycles.use_adaptive_sampling = False
+    scene.cycles.seed = 0
+    scene.render.resolution_x, scene.render.resolution_y = RESOLUTION
+    scene.render.resolution_percentage = 100
+
+
+def node_count(clouds):
+    materials = {cloud.active_material for cloud in clouds if cloud.active_material is not None}
+    return sum(len(material.node_tree.nodes) for material in materials)
+
+
+def render_case(context, cloud_type, count):
+    """Builds and renders one case and returns its measures."""
+
+    clear_scene()
+    start = time.perf_counter()
+    clouds = build_scene(context, cloud_type, count)
+    build_time = time.perf_counter() - start
+    configure_render(context.scene)
+
+    stats = {"peak": 0.0, "sync_end": None}
+
+    def stats_handler(text):
+        match = _PEAK_MEMORY.search(text)
+        if match:
+            stats["peak"] = max(stats["peak"], float(match.group(1)))
+        if stats["sync_end"] is None and "Sample" in text:
+            stats["sync_end"] = time.perf_counter()
+
+    bpy.app.handlers.render_stats.append(stats_handler)
+    try:
+        start = time.perf_counter()
+        bpy.ops.render.render()
+        wall_time = time.perf_counter() - start
+    finally:
+        bpy.app.handlers.render_stats.remove(stats_handler)
+
+    sync_time = stats["sync_end"] - start if stats["sync_end"] is not None else None
+    return {
+        "cloud_type": cloud_type,
+        "clouds": count,
+        "build_time": build_time,
+        "wall_time": wall_time,
+        "sync_time": sync_time,
+        "peak_memory_mb": stats["peak"],
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "node_count": node_count(clouds),
+    }
+
+
+def compare_reports(report, baseline, time_threshold, memory_threshold):
+    """Regressions of a report against a baseline.
+
+    Returns a list of messages. Time and memory regress when they grow more
+    than their relative threshold, node count regresses when it grows.
+    """
+
+    regressions = []
+    for name, case in report["cases"].items():
+        reference = baseline.get("cases", {}).get(name)
+        if reference is None:
+            continue
+        checks = (
+            ("wall_time", time_threshold),
+            ("sync_time", time_threshold),
+            ("peak_memory_mb", memory_threshold),
+            ("node_count", 0.0),
+        )
+        for measure, threshold in checks:
+            value = case.get(measure)
+            reference_value = reference.get(measure)
+            if not value or not reference_value:
+                continue
+            if value > reference_value * (1.0 + threshold):
+                regressions.append("{}: {} {:.3f} > {:.3f} (+{:.1f}%)".format(
+                    name, measure, value, reference_value, (value / reference_value - 1.0) * 100))
+    return regressions
+
+
+def parse_arguments():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    parser = argparse.ArgumentParser(description="Cloud render benchmark")
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--baseline", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                           "baseline.json"))
+    parser.add_argument("--write-baseline", action="store_true",
+                        help="Store the report as the new baseline")
+    parser.add_argument("--time-threshold", type=float, default=DEFAULT_TIME_THRESHOLD)
+    parser.add_argument("--memory-threshold", type=float, default=DEFAULT_MEMORY_THRESHOLD)
+    parser.add_argument("--cases", nargs="*", help="Names of the cases to run, all by default")
+    return parser.parse_args(argv)
+
+
+def main():
+    arguments = parse_arguments()
+    addon_utils.enable(ADDON, default_set=True)
+    context = bpy.context
+
+    report = {
+        "blender_version": bpy.app.version_string,
+        "resolution": RESOLUTION,
+        "samples": SAMPLES,
+        "cases": {},
+    }
+    for name, cloud_type, count in all_cases():
+        if arguments.cases and name not in arguments.cases:
+            continue
+        report["cases"][name] = render_case(context, cloud_type, count)
+        print("{}: {:.2f} s".format(name, report["cases"][name]["wall_time"]))
+
+    with open(arguments.output, "w") as output:
+        json.dump(report, output, indent=2)
+
+    if arguments.write_baseline:
+        with open(arguments.baseline, "w") as output:
+            json.dump(report, output, indent=2)
+        return 0
+
+    if not os.path.exists(arguments.baseline):
+        print("No baseline found in {}".format(arguments.baseline))
+        return 0
+    with open(arguments.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    regressions = compare_reports(report, baseline, arguments.time_threshold, arguments.memory_threshold)
+    for regression in regressions:
+        print("REGRESSION " + regression)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
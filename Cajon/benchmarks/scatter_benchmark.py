@@ -0,0 +1,205 @@
+"""
+    scatter_benchmark.py is part of Cloud Generator Blender Addon.
+
+    Foobar is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+
+Headless render benchmark of scattered cumulus instances.
+
+Every case scatters a number of instances of a few cumulus variants (see
+scatter.py) and renders them with CPU Cycles with the settings of
+render_benchmark.py. Memory, node count and synchronization time should
+barely grow with the number of instances. With --objects the same number
+of independent clouds is rendered for comparison, up to 100 of them.
+
+Usage:
+    blender -b --factory-startup --python Cajon/benchmarks/scatter_benchmark.py -- \\
+        --output report.json [--baseline scatter_baseline.json] [--write-baseline]
+        [--counts 10 100 1000 10000] [--variants 4] [--objects]
+
+The exit code is 1 if any case regresses over the thresholds.
+"""
+import argparse
+import json
+import math
+import os
+import resource
+import sys
+import time
+
+import addon_utils
+import bpy
+from mathutils import Vector
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import render_benchmark  # noqa: E402
+
+COUNTS = (10, 100, 1000, 10000)
+VARIANTS = 4
+SEED = 7
+HEIGHT_BAND = (0.0, 100.0)
+
+# Independent clouds are only rendered up to this number.
+MAX_OBJECTS = 100
+
+
+def clear_scene():
+    """Removes the scatter and every datablock created by previous cases."""
+
+    from clouds_generator import scatter
+
+    scatter.remove_scatter()
+    render_benchmark.clear_scene()
+
+
+def scatter_extent(count):
+    """Half size of the scattered area, with the density of render_benchmark."""
+
+    return math.ceil(math.sqrt(count)) * render_benchmark.CLOUD_SPACING / 2
+
+
+def add_sun_and_camera(scene, extent):
+    sun = bpy.data.objects.new("Sun", bpy.data.lights.new("Sun", 'SUN'))
+    sun.rotation_euler = (0.8, 0.2, 0.5)
+    scene.collection.objects.link(sun)
+
+    extent += render_benchmark.CLOUD_SPACING
+    camera = bpy.data.objects.new("Camera", bpy.data.cameras.new("Camera"))
+    camera.data.clip_end = extent * 10
+    camera.location = Vector((0.0, -extent * 2.5, extent))
+    camera.rotation_euler = (-camera.location).to_track_quat('-Z', 'Y').to_euler()
+    scene.collection.objects.link(camera)
+    scene.camera = camera
+
+
+def build_scatter(context, count, variants):
+    """Scatters count instances and returns the materials they render."""
+
+    from clouds_generator import materials, scatter
+
+    extent = scatter_extent(count)
+    instances = scatter.scatter_clouds(context, materials.initial_shape_single_cumulus, count, variants, SEED,
+                                       (-extent, -extent), (extent, extent), *HEIGHT_BAND)
+    add_sun_and_camera(context.scene, extent)
+    return {obj.active_material for instance in instances for obj in instance.instance_collection.objects}
+
+
+def build_objects(context, count):
+    """Generates count independent clouds and returns their materials."""
+
+    clouds = render_benchmark.build_scene(context, "SINGLE_CUMULUS", count)
+    return {cloud.active_material for cloud in clouds}
+
+
+def render_case(context, build):
+    """Builds a case with build(context), renders it and returns its measures."""
+
+    clear_scene()
+    start = time.perf_counter()
+    used_materials = build(context)
+    build_time = time.perf_counter() - start
+    render_benchmark.configure_render(context.scene)
+
+    stats = {"peak": 0.0, "sync_end": None}
+
+    def stats_handler(text):
+        match = render_benchmark._PEAK_MEMORY.search(text)
+        if match:
+            stats["peak"] = max(stats["peak"], float(match.group(1)))
+        if stats["sync_end"] is None and "Sample" in text:
+            stats["sync_end"] = time.perf_counter()
+
+    bpy.app.handlers.render_stats.append(stats_handler)
+    try:
+        start = time.perf_counter()
+        bpy.ops.render.render()
+        wall_time = time.perf_counter() - start
+    finally:
+        bpy.app.handlers.render_stats.remove(stats_handler)
+
+    return {
+        "build_time": build_time,
+        "wall_time": wall_time,
+        "sync_time": stats["sync_end"] - start if stats["sync_end"] is not None else None,
+        "peak_memory_mb": stats["peak"],
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "node_count": sum(len(material.node_tree.nodes) for material in used_materials),
+        "materials": len(used_materials),
+        "meshes": len(bpy.data.meshes),
+    }
+
+
+def parse_arguments():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    parser = argparse.ArgumentParser(description="Cloud scatter benchmark")
+    parser.add_argument("--output", default="scatter_output.json")
+    parser.add_argument("--baseline", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                           "scatter_baseline.json"))
+    parser.add_argument("--write-baseline", action="store_true",
+                        help="Store the report as the new baseline")
+    parser.add_argument("--time-threshold", type=float, default=render_benchmark.DEFAULT_TIME_THRESHOLD)
+    parser.add_argument("--memory-threshold", type=float, default=render_benchmark.DEFAULT_MEMORY_THRESHOLD)
+    parser.add_argument("--counts", type=int, nargs="*", default=list(COUNTS))
+    parser.add_argument("--variants", type=int, default=VARIANTS)
+    parser.add_argument("--objects", action="store_true",
+                        help="Also render independent clouds, up to {}".format(MAX_OBJECTS))
+    return parser.parse_args(argv)
+
+
+def main():
+    arguments = parse_arguments()
+    addon_utils.enable(render_benchmark.ADDON, default_set=True)
+    context = bpy.context
+
+    report = {
+        "blender_version": bpy.app.version_string,
+        "resolution": render_benchmark.RESOLUTION,
+        "samples": render_benchmark.SAMPLES,
+        "variants": arguments.variants,
+        "cases": {},
+    }
+    for count in arguments.counts:
+        name = "scatter_{}".format(count)
+        report["cases"][name] = render_case(context, lambda c: build_scatter(c, count, arguments.variants))
+        if arguments.objects and count <= MAX_OBJECTS:
+            name = "objects_{}".format(count)
+            report["cases"][name] = render_case(context, lambda c: build_objects(c, count))
+    for name, case in report["cases"].items():
+        print("{}: {:.2f} s, sync {} s, {:.0f} MB, {} nodes".format(
+            name, case["wall_time"], "{:.2f}".format(case["sync_time"]) if case["sync_time"] else "-",
+            case["peak_memory_mb"], case["node_count"]))
+
+    with open(arguments.output, "w") as output:
+        json.dump(report, output, indent=2)
+
+    if arguments.write_baseline:
+        with open(arguments.baseline, "w") as output:
+            json.dump(report, output, indent=2)
+        return 0
+
+    if not os.path.exists(arguments.baseline):
+        print("No baseline found in {}".format(arguments.baseline))
+        return 0
+    with open(arguments.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    regressions = render_benchmark.compare_reports(report, baseline, arguments.time_threshold,
+                                                   arguments.memory_threshold)
+    for regression in regressions:
+        print("REGRESSION " + regression)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -17,10 +17,34 @@
 import bpy
 from mathutils import Vector
 import bpy.utils.previews
-
+from bpy_extras.io_utils import ExportHelper
+import os
+import time
+
+from . import compact
+from . import culling
+from . import density
+from . import impostors
+from . import lod
 from . import materials
-from .cloud_settings import CloudSettings
+from . import merge
+from . import migration
+from . import pool
+from . import randomization
+from . import preview
+from . import profiling
+from . import radiance_bake
+from . import render_tuning
+from . import scatter
+from . import shader_cost
+from . import sharing
+from . import shadow_gobo
+from . import sky_bake
+from . import tiles
+from . import volumetrics
+from .cloud_settings import CloudLayerSettings, CloudSettings, CloudSceneSettings
 from .materials import initial_shape_single_cumulus, initial_shape_cloudscape_cumulus, initial_shape_cloudscape_cirrus
+from .materials import initial_shape_cloudscape_layered
 
 bl_info = {
     "name": "Clouds generator",
@@ -36,6 +60,20 @@ bl_info = {
 }
 
 
+def update_profile_generation(self, context):
+    if self.profile_generation:
+        profiling.enable()
+    else:
+        profiling.disable()
+
+
+def update_profile_updates(self, context):
+    if self.profile_updates:
+        profiling.enable_updates(self.slow_update_threshold / 1000)
+    else:
+        profiling.disable_updates()
+
+
 class CloudGeneratorPreferences(bpy.types.AddonPreferences):
     """Addon preferences panel."""
     bl_idname = __name__
@@ -46,12 +84,134 @@ class CloudGeneratorPreferences(bpy.types.AddonPreferences):
         default=False,
     )
 
+    preview_mode: bpy.props.BoolProperty(
+        name="Progressive preview",
+        description="Use coarse preview settings while clouds or the view are changing " +
+                    "and restore them when the edition stops",
+        default=False,
+    )
+
+    preview_idle_time: bpy.props.FloatProperty(
+        name="Idle time",
+        description="Seconds without changes before the full preview settings are restored",
+        default=0.5,
+        min=0.05,
+        soft_max=5.0,
+    )
+
+    preview_step_rate: bpy.props.FloatProperty(
+        name="Step rate",
+        description="Cycles viewport volume step rate while editing",
+        default=4.0,
+        min=0.01,
+        max=100.0,
+    )
+
+    preview_max_steps: bpy.props.IntProperty(
+        name="Max steps",
+        description="Cycles maximum volume steps while editing",
+        default=256,
+        min=2,
+        max=65536,
+    )
+
+    preview_samples: bpy.props.IntProperty(
+        name="Samples",
+        description="Cycles viewport samples while editing",
+        default=8,
+        min=1,
+    )
+
+    preview_pixel_size: bpy.props.EnumProperty(
+        name="Pixel size",
+        description="Viewport resolution scale while editing",
+        items=[
+            ('1', "1x", "Render at full resolution"),
+            ('2', "2x", "Render at 50% resolution"),
+            ('4', "4x", "Render at 25% resolution"),
+            ('8', "8x", "Render at 12.5% resolution"),
+        ],
+        default='4',
+    )
+
+    profile_generation: bpy.props.BoolProperty(
+        name="Profile cloud generation",
+        description="Measure the time, nodes, links and operator calls of every phase of the cloud generation",
+        default=False,
+        update=update_profile_generation,
+    )
+
+    profile_updates: bpy.props.BoolProperty(
+        name="Profile property updates",
+        description="Measure the latency of the update functions of the cloud properties",
+        default=False,
+        update=update_profile_updates,
+    )
+
+    slow_update_threshold: bpy.props.FloatProperty(
+        name="Slow update threshold (ms)",
+        description="Updates slower than this are logged with the name of the cloud",
+        default=50.0,
+        min=0.0,
+        update=update_profile_updates,
+    )
+
     def draw(self, context):
         layout = self.layout
         layout.prop(self, "advanced_settings")
         column = layout.column_flow(columns=2, align=True)
         column.operator("render.cloud_edit_settings", text="Set edition settings")
         column.operator("render.cloud_render_settings", text="Set render settings")
+        layout.operator("render.cloud_tune_render_settings", text="Tune render settings")
+
+        layout.prop(self, "preview_mode")
+        column = layout.column()
+        column.active = self.preview_mode
+        column.prop(self, "preview_idle_time")
+        column.prop(self, "preview_step_rate")
+        column.prop(self, "preview_max_steps")
+        column.prop(self, "preview_samples")
+        column.prop(self, "preview_pixel_size")
+
+        row = layout.row()
+        row.prop(self, "profile_generation")
+        row.operator("object.cloud_profiling_reset", text="Reset")
+        for rebuild, title, count in ((False, "Mean per cloud over {} generations", profiling.generations()),
+                                      (True, "Mean per in-place rebuild over {} rebuilds", profiling.rebuilds())):
+            rows = profiling.results(rebuild)
+            if not rows:
+                continue
+            box = layout.box()
+            box.label(text=title.format(count))
+            grid = box.grid_flow(row_major=True, columns=5, align=True)
+            for label in ("Phase", "Time (ms)", "Nodes", "Links", "Operators"):
+                grid.label(text=label)
+            for row in rows:
+                grid.label(text=row["name"])
+                grid.label(text="{:.2f}".format(row["mean_time"] * 1000))
+                grid.label(text="{:.1f}".format(row["mean_nodes"]))
+                grid.label(text="{:.1f}".format(row["mean_links"]))
+                grid.label(text="{:.1f}".format(row["mean_operators"]))
+
+        row = layout.row()
+        row.prop(self, "profile_updates")
+        row.prop(self, "slow_update_threshold")
+        row = layout.row()
+        row.operator("object.cloud_update_latency_export", text="Export CSV")
+        row.operator("object.cloud_update_latency_reset", text="Reset")
+        rows = profiling.update_latencies()
+        if rows:
+            box = layout.box()
+            box.label(text="{} slow updates logged".format(len(profiling.slow_updates())))
+            grid = box.grid_flow(row_major=True, columns=5, align=True)
+            for label in ("Property", "Count", "p50 (ms)", "p95 (ms)", "Max (ms)"):
+                grid.label(text=label)
+            for row in rows:
+                grid.label(text=row["name"])
+                grid.label(text=str(row["count"]))
+                grid.label(text="{:.2f}".format(row["p50"] * 1000))
+                grid.label(text="{:.2f}".format(row["p95"] * 1000))
+                grid.label(text="{:.2f}".format(row["max"] * 1000))
 
 
 class CloudErrorOperator(bpy.types.Operator):
@@ -124,51 +284,1051 @@ class RENDER_OT_cloud_render_settings(bpy.types.Operator):
         return {'FINISHED'}
 
 
-class OBJECT_OT_cloud_single_cumulus(bpy.types.Operator):
-    """Operator that generates and add a single cumulus cloud to the scene"""
+class RENDER_OT_cloud_tune_render_settings(bpy.types.Operator):
+    """Operator that searches the Cycles volume settings that fit a render time budget"""
 
-    bl_idname = "object.cloud_add_single_cumulus"
-    bl_label = "Generate single cumulus"
+    bl_idname = "render.cloud_tune_render_settings"
+    bl_label = "Tune cloud render settings"
+    bl_options = {"REGISTER", "UNDO"}
+
+    target_time: bpy.props.FloatProperty(
+        name="Target time",
+        description="Render time per frame in seconds",
+        default=60.0,
+        min=0.01
+    )
+
+    quality_floor: bpy.props.FloatProperty(
+        name="Quality floor",
+        description="Minimum similarity with a render done with the render settings. " +
+                    "1 means identical",
+        default=0.95,
+        min=0.0,
+        max=1.0
+    )
+
+    resolution_percentage: bpy.props.IntProperty(
+        name="Test resolution",
+        description="Resolution of the test renders",
+        subtype="PERCENTAGE",
+        default=25,
+        min=1,
+        max=100
+    )
+
+    samples: bpy.props.IntProperty(
+        name="Test samples",
+        description="Samples of the test renders",
+        default=16,
+        min=1
+    )
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
+    def execute(self, context):
+        best, results = render_tuning.tune_render_settings(context, self.target_time, self.quality_floor,
+                                                           self.resolution_percentage, self.samples)
+        message = "{} test renders, {:.2f} s/frame, quality {:.3f}. See the '{}' text.".format(
+            len(results), best["frame_time"], best["quality"], render_tuning.TABLE_NAME)
+        if best["quality"] < self.quality_floor:
+            self.report({'WARNING'}, "The quality floor can not be reached. " + message)
+        elif best["frame_time"] > self.target_time:
+            self.report({'WARNING'}, "The target time can not be reached. " + message)
+        else:
+            self.report({'INFO'}, message)
+        return {'FINISHED'}
+
+
+class RENDER_OT_cloud_fit_volumetrics(bpy.types.Operator):
+    """Operator that fits the EEVEE volumetric range and tile size to the clouds seen by the camera"""
+
+    bl_idname = "render.cloud_fit_volumetrics"
+    bl_label = "Fit EEVEE volumetrics to clouds"
     bl_options = {"REGISTER", "UNDO"}
 
     @classmethod
     def poll(cls, context):
-        return context.area.type == "VIEW_3D"
+        return context.scene.camera is not None
 
     def execute(self, context):
-        materials.generate_cloud(context, -1000, 0, initial_shape_single_cumulus)
+        result = volumetrics.fit_volumetrics(context.scene, context.evaluated_depsgraph_get())
+        if result is None:
+            self.report({'WARNING'}, "There are no clouds in front of the camera.")
+            return {'CANCELLED'}
+        start, end, tile = result
+        self.report({'INFO'}, "EEVEE volumetrics from {:.2f} to {:.2f} with tile size {}.".format(start, end, tile))
         return {'FINISHED'}
 
 
-class OBJECT_OT_cloud_cloudscape_cumulus(bpy.types.Operator):
-    """Operator that generates and add a cumulus cloudscape to the scene"""
+class RENDER_OT_cloud_step_rate(bpy.types.Operator):
+    """Operator that sets the Cycles volume step rate of every cloud material from its detail and distance"""
 
-    bl_idname = "object.cloud_add_cloudscape_cumulus"
-    bl_label = "Generate cumulus cloudscape"
+    bl_idname = "render.cloud_step_rate"
+    bl_label = "Set cloud step rates"
     bl_options = {"REGISTER", "UNDO"}
 
+    def execute(self, context):
+        rates = volumetrics.update_step_rates(context.scene, context.evaluated_depsgraph_get(),
+                                              volumetrics.scene_clouds(context.scene))
+        if not rates:
+            self.report({'WARNING'}, "There are no cloud materials in the scene.")
+            return {'CANCELLED'}
+        self.report({'INFO'}, "Step rate of {} cloud materials set between {:.3f} and {:.3f}.".format(
+            len(rates), min(rates.values()), max(rates.values())))
+        return {'FINISHED'}
+
+
+class RENDER_OT_cloud_cull(bpy.types.Operator):
+    """Operator that hides from the render the clouds outside the frustum of the scene camera"""
+
+    bl_idname = "render.cloud_cull"
+    bl_label = "Cull clouds"
+    bl_options = {"REGISTER", "UNDO"}
+
+    def execute(self, context):
+        result = culling.cull_clouds(context.scene, context.evaluated_depsgraph_get())
+        if result is None:
+            self.report({'WARNING'}, "The scene has no camera.")
+            return {'CANCELLED'}
+        self.report({'INFO'}, "{} clouds rendered, {} culled.".format(*result))
+        return {'FINISHED'}
+
+
+class RENDER_OT_cloud_restore_culled(bpy.types.Operator):
+    """Operator that renders again the clouds hidden by the culling"""
+
+    bl_idname = "render.cloud_restore_culled"
+    bl_label = "Restore culled clouds"
+    bl_options = {"REGISTER", "UNDO"}
+
+    def execute(self, context):
+        culling.restore_culled(context.scene)
+        return {'FINISHED'}
+
+
+class RENDER_OT_cloud_lod(bpy.types.Operator):
+    """Operator that sets the detail level of every cloud from its size on the scene camera"""
+
+    bl_idname = "render.cloud_lod"
+    bl_label = "Set cloud detail levels"
+    bl_options = {"REGISTER", "UNDO"}
+
+    def execute(self, context):
+        scene = context.scene
+        levels = lod.update_levels(scene, context.evaluated_depsgraph_get(),
+                                   volumetrics.scene_clouds(scene), scene.cloud_scene_settings.lod_budget)
+        if not levels:
+            self.report({'WARNING'}, "There are no cloud materials in the scene.")
+            return {'CANCELLED'}
+        counts = [list(levels.values()).count(level) for level in range(len(lod.LOD_LEVELS))]
+        self.report({'INFO'}, "Clouds per detail level: {}.".format(", ".join(str(count) for count in counts)))
+        return {'FINISHED'}
+
+
+class RENDER_OT_cloud_full_detail(bpy.types.Operator):
+    """Operator that gives back the full detail of the cloud settings to every cloud"""
+
+    bl_idname = "render.cloud_full_detail"
+    bl_label = "Restore cloud full detail"
+    bl_options = {"REGISTER", "UNDO"}
+
+    def execute(self, context):
+        lod.restore_full_detail(impostors.scene_clouds(context.scene))
+        return {'FINISHED'}
+
+
+class RENDER_OT_cloud_shader_cost(bpy.types.Operator):
+    """Operator that writes the shader cost per sample of every cloud of the scene"""
+
+    bl_idname = "render.cloud_shader_cost"
+    bl_label = "Cloud shader cost report"
+
+    def execute(self, context):
+        rows = shader_cost.scene_report(context.scene)
+        if not rows:
+            self.report({'WARNING'}, "There are no cloud materials in the scene.")
+            return {'CANCELLED'}
+        self.report({'INFO'}, "Most expensive cloud: {} ({:.1f}). Report in the \"{}\" text.".format(
+            rows[0]["name"], rows[0]["cost"], shader_cost.REPORT_NAME))
+        return {'FINISHED'}
+
+
+class RENDER_OT_cloud_calibrate_shader_cost(bpy.types.Operator):
+    """Operator that calibrates the shader cost with CPU Cycles renders of the clouds of the scene"""
+
+    bl_idname = "render.cloud_calibrate_shader_cost"
+    bl_label = "Calibrate cloud shader cost"
+    bl_options = {"REGISTER", "UNDO"}
+
+    resolution: bpy.props.IntProperty(
+        name="Resolution",
+        description="Width and height in pixels of the calibration renders",
+        default=64,
+        min=8,
+    )
+
+    samples: bpy.props.IntProperty(
+        name="Samples",
+        description="Samples of the calibration renders",
+        default=4,
+        min=1,
+    )
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
+    def execute(self, context):
+        calibration = shader_cost.calibrate(context, volumetrics.scene_clouds(context.scene),
+                                            self.resolution, self.samples)
+        if calibration is None:
+            self.report({'WARNING'}, "There are no cloud materials in the scene.")
+            return {'CANCELLED'}
+        shader_cost.scene_report(context.scene)
+        self.report({'INFO'}, "{:.3g} s per cost unit.".format(calibration[0]))
+        return {'FINISHED'}
+
+
+class RENDER_OT_cloud_bake_impostors(bpy.types.Operator):
+    """Operator that renders the clouds of the scene into a sprite atlas and creates their impostors"""
+
+    bl_idname = "render.cloud_bake_impostors"
+    bl_label = "Bake cloud impostors"
+    bl_options = {"REGISTER", "UNDO"}
+
+    azimuths: bpy.props.IntProperty(
+        name="Azimuths",
+        description="Number of sprites rendered around every cloud",
+        default=8,
+        min=1,
+        max=64,
+    )
+
+    sprite_size: bpy.props.IntProperty(
+        name="Sprite size",
+        description="Width and height in pixels of every sprite",
+        default=128,
+        min=16,
+    )
+
+    samples: bpy.props.IntProperty(
+        name="Samples",
+        description="Samples of the sprite renders",
+        default=32,
+        min=1,
+    )
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
+    def execute(self, context):
+        clouds = impostors.scene_clouds(context.scene)
+        atlas = impostors.bake_impostors(context, clouds, self.azimuths, self.sprite_size, self.samples)
+        if atlas is None:
+            self.report({'WARNING'}, "There are no clouds in the scene.")
+            return {'CANCELLED'}
+        if context.scene.cloud_scene_settings.use_impostors:
+            impostors.update_impostors(context.scene)
+        self.report({'INFO'}, "{} impostors baked in {:.1f} s.".format(len(clouds),
+                                                                     atlas[impostors.ATLAS_BAKE_TIME]))
+        return {'FINISHED'}
+
+
+class RENDER_OT_cloud_remove_impostors(bpy.types.Operator):
+    """Operator that removes the impostors of the clouds of the scene"""
+
+    bl_idname = "render.cloud_remove_impostors"
+    bl_label = "Remove cloud impostors"
+    bl_options = {"REGISTER", "UNDO"}
+
+    def execute(self, context):
+        for obj in impostors.impostor_clouds(context.scene):
+            impostors.remove_impostor(obj)
+        return {'FINISHED'}
+
+
+class RENDER_OT_cloud_impostor_render_time(bpy.types.Operator):
+    """Operator that compares the render time of the frame with and without cloud impostors"""
+
+    bl_idname = "render.cloud_impostor_render_time"
+    bl_label = "Compare impostor render time"
+
+    def execute(self, context):
+        if not impostors.impostor_clouds(context.scene):
+            self.report({'WARNING'}, "There are no cloud impostors in the scene.")
+            return {'CANCELLED'}
+        volumetric_time, impostor_time, _ = impostors.compare_render_times(context)
+        self.report({'INFO'}, "All volumetric {:.2f} s, with impostors {:.2f} s. Report in the \"{}\" text.".format(
+            volumetric_time, impostor_time, impostors.REPORT_NAME))
+        return {'FINISHED'}
+
+
+class RENDER_OT_cloud_bake_sky(bpy.types.Operator):
+    """Operator that bakes the selected distant clouds into an equirectangular image of the world"""
+
+    bl_idname = "render.cloud_bake_sky"
+    bl_label = "Bake clouds into the sky"
+    bl_options = {"REGISTER", "UNDO"}
+
+    width: bpy.props.IntProperty(
+        name="Width",
+        description="Width in pixels of the equirectangular image, the height is half of it",
+        default=2048,
+        min=64,
+    )
+
+    samples: bpy.props.IntProperty(
+        name="Samples",
+        description="Samples of the sky render",
+        default=64,
+        min=1,
+    )
+
+    use_camera_origin: bpy.props.BoolProperty(
+        name="From the camera",
+        description="Render the sky from the location of the scene camera",
+        default=True,
+    )
+
+    origin: bpy.props.FloatVectorProperty(
+        name="Origin",
+        description="Point from where the sky is rendered",
+        subtype="TRANSLATION",
+        default=(0.0, 0.0, 0.0),
+    )
+
+    measure: bpy.props.BoolProperty(
+        name="Measure savings",
+        description="Render the current frame before and after the bake to report the time saved per frame",
+        default=True,
+    )
+
+    @classmethod
+    def poll(cls, context):
+        return any(obj.cloud_settings.is_cloud for obj in context.selected_objects)
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
+    def execute(self, context):
+        clouds = [obj for obj in context.selected_objects if obj.cloud_settings.is_cloud]
+        origin = self.origin
+        if self.use_camera_origin:
+            if context.scene.camera is None:
+                self.report({'WARNING'}, "The scene has no camera.")
+                return {'CANCELLED'}
+            origin = context.scene.camera.matrix_world.translation
+        report = sky_bake.bake_sky(context, clouds, origin, self.width, self.samples, self.measure)
+        if "volume_time" in report:
+            self.report({'INFO'}, "{:.2f} s saved per frame. Report in the \"{}\" text.".format(
+                report["volume_time"] - report["sky_time"], sky_bake.REPORT_NAME))
+        return {'FINISHED'}
+
+
+class RENDER_OT_cloud_unbake_sky(bpy.types.Operator):
+    """Operator that renders again the clouds baked into the sky and removes the image from the world"""
+
+    bl_idname = "render.cloud_unbake_sky"
+    bl_label = "Remove clouds baked into the sky"
+    bl_options = {"REGISTER", "UNDO"}
+
+    def execute(self, context):
+        sky_bake.unbake_sky(context.scene)
+        return {'FINISHED'}
+
+
+class RENDER_OT_cloud_bake_radiance(bpy.types.Operator):
+    """Operator that bakes the sun light of the selected clouds into emission and absorption grids"""
+
+    bl_idname = "render.cloud_bake_radiance"
+    bl_label = "Bake cloud radiance"
+    bl_options = {"REGISTER", "UNDO"}
+
+    resolution: bpy.props.IntProperty(
+        name="Resolution",
+        description="Voxels along the biggest side of every cloud domain",
+        default=64,
+        min=8,
+        max=256,
+    )
+
+    multiple_scattering: bpy.props.BoolProperty(
+        name="Multiple scattering",
+        description="Add an approximation of the light scattered several times inside the cloud",
+        default=True,
+    )
+
+    min_distance: bpy.props.FloatProperty(
+        name="Minimum distance",
+        description="Only bake the selected clouds farther than this from the scene camera. " +
+                    "0 bakes all of them",
+        default=0.0,
+        min=0.0,
+        subtype="DISTANCE",
+    )
+
+    measure: bpy.props.BoolProperty(
+        name="Measure",
+        description="Render the current frame before and after the bake to report " +
+                    "the time saved and the difference in the image",
+        default=True,
+    )
+
+    @classmethod
+    def poll(cls, context):
+        return density.is_supported() and any(obj.cloud_settings.is_cloud for obj in context.selected_objects)
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
+    def execute(self, context):
+        clouds = [obj for obj in context.selected_objects
+                  if obj.cloud_settings.is_cloud and radiance_bake.FULL_MATERIAL_PROPERTY not in obj]
+        camera = context.scene.camera
+        if self.min_distance > 0.0 and camera is not None:
+            camera_location = camera.matrix_world.translation
+            clouds = [obj for obj in clouds
+                      if (impostors.cloud_center(obj) - camera_location).length >= self.min_distance]
+        if not clouds:
+            self.report({'WARNING'}, "There are no clouds to bake.")
+            return {'CANCELLED'}
+        report = radiance_bake.bake_clouds(context, clouds, self.resolution, self.multiple_scattering, self.measure)
+        if "quality" in report:
+            self.report({'INFO'}, "Frame {:.2f} s -> {:.2f} s, quality {:.3f}. Report in the \"{}\" text.".format(
+                report["full_time"], report["baked_time"], report["quality"], radiance_bake.REPORT_NAME))
+        return {'FINISHED'}
+
+
+class RENDER_OT_cloud_restore_radiance(bpy.types.Operator):
+    """Operator that gives back their cloud material to the selected baked clouds"""
+
+    bl_idname = "render.cloud_restore_radiance"
+    bl_label = "Restore cloud materials"
+    bl_options = {"REGISTER", "UNDO"}
+
+    def execute(self, context):
+        for obj in context.selected_objects:
+            radiance_bake.restore_material(obj)
+        return {'FINISHED'}
+
+
+class RENDER_OT_cloud_merge(bpy.types.Operator):
+    """Operator that bakes every group of overlapping clouds of the scene into a single domain"""
+
+    bl_idname = "render.cloud_merge"
+    bl_label = "Merge overlapping clouds"
+    bl_options = {"REGISTER", "UNDO"}
+
+    resolution: bpy.props.IntProperty(
+        name="Resolution",
+        description="Voxels along the biggest side of every merged domain",
+        default=128,
+        min=8,
+        max=512,
+    )
+
+    mode: bpy.props.EnumProperty(
+        name="Mode",
+        description="How the densities of the overlapping clouds are combined",
+        items=[("MAX", "Maximum", "Keep the densest cloud in every voxel"),
+               ("SUM", "Sum", "Add the densities of the clouds")],
+        default="MAX",
+    )
+
+    @classmethod
+    def poll(cls, context):
+        return density.is_supported()
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
+    def execute(self, context):
+        report = merge.merge_scene_clouds(context, self.resolution, self.mode)
+        if report["groups"] == 0:
+            self.report({'WARNING'}, "There are no overlapping clouds.")
+            return {'CANCELLED'}
+        self.report({'INFO'}, "{} clouds merged in {} domains. Report in the \"{}\" text.".format(
+            report["clouds"], report["groups"], merge.REPORT_NAME))
+        return {'FINISHED'}
+
+
+class RENDER_OT_cloud_unmerge(bpy.types.Operator):
+    """Operator that removes the selected merged domains and shows their clouds again"""
+
+    bl_idname = "render.cloud_unmerge"
+    bl_label = "Restore merged clouds"
+    bl_options = {"REGISTER", "UNDO"}
+
+    def execute(self, context):
+        for obj in list(context.selected_objects):
+            merge.restore_clouds(obj)
+        return {'FINISHED'}
+
+
+class RENDER_OT_cloud_bake_shadow_gobo(bpy.types.Operator):
+    """Operator that bakes the shadows of the selected clouds into a texture on the selected terrain"""
+
+    bl_idname = "render.cloud_bake_shadow_gobo"
+    bl_label = "Bake cloud shadow gobo"
+    bl_options = {"REGISTER", "UNDO"}
+
+    ground: bpy.props.FloatProperty(
+        name="Ground height",
+        description="Height of the plane where the shadows of the clouds are projected",
+        default=0.0,
+        subtype="DISTANCE",
+    )
+
+    texture_size: bpy.props.IntProperty(
+        name="Texture size",
+        description="Texels along the biggest side of the gobo texture",
+        default=1024,
+        min=16,
+    )
+
+    grid_resolution: bpy.props.IntProperty(
+        name="Resolution",
+        description="Voxels along the biggest side of every cloud domain",
+        default=64,
+        min=8,
+        max=256,
+    )
+
+    strength: bpy.props.FloatProperty(
+        name="Strength",
+        description="Amount of the gobo multiplied into the terrain color",
+        default=1.0,
+        min=0.0,
+        max=1.0,
+        subtype="FACTOR",
+    )
+
+    disable_cloud_shadows: bpy.props.BoolProperty(
+        name="Disable cloud shadows",
+        description="Stop tracing shadow rays through the clouds, the gobo replaces their shadows",
+        default=True,
+    )
+
+    sequence: bpy.props.BoolProperty(
+        name="Every frame",
+        description="Bake the gobo of every frame of the scene into an image sequence. " +
+                    "Needed to render animated clouds, the gobo can not be baked while rendering",
+        default=False,
+    )
+
+    directory: bpy.props.StringProperty(
+        name="Directory",
+        description="Directory of the image sequence",
+        default=shadow_gobo.SEQUENCE_DIRECTORY,
+        subtype="DIR_PATH",
+    )
+
+    @classmethod
+    def poll(cls, context):
+        return density.is_supported() and any(obj.cloud_settings.is_cloud for obj in context.selected_objects)
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
+    def execute(self, context):
+        clouds = [obj for obj in context.selected_objects if obj.cloud_settings.is_cloud]
+        terrain = [obj for obj in context.selected_objects
+                   if obj.type == 'MESH' and not obj.cloud_settings.is_cloud]
+        sun = context.active_object
+        if sun is None or sun.type != 'LIGHT' or sun.data.type != 'SUN':
+            suns = [obj for obj in context.scene.objects if obj.type == 'LIGHT' and obj.data.type == 'SUN']
+            sun = suns[0] if suns else None
+        if sun is None:
+            self.report({'WARNING'}, "The scene has no sun lamp.")
+            return {'CANCELLED'}
+        if not terrain:
+            self.report({'WARNING'}, "Select the terrain together with the clouds.")
+            return {'CANCELLED'}
+
+        if self.sequence and self.directory.startswith("//") and not bpy.data.filepath:
+            self.report({'WARNING'}, "Save the file or choose an absolute directory for the gobo sequence.")
+            return {'CANCELLED'}
+
+        try:
+            if self.sequence:
+                image = shadow_gobo.bake_gobo_sequence(context.scene, clouds, sun, self.ground, self.texture_size,
+                                                       self.grid_resolution, self.directory)
+            else:
+                image = shadow_gobo.bake_gobo(context.scene, clouds, sun, self.ground,
+                                              self.texture_size, self.grid_resolution)
+        except ValueError as error:
+            self.report({'WARNING'}, str(error))
+            return {'CANCELLED'}
+        materials_without_color = set()
+        for obj in terrain:
+            for material in obj.data.materials:
+                if material is not None and not shadow_gobo.apply_to_material(material, image, self.strength):
+                    materials_without_color.add(material.name)
+        if materials_without_color:
+            self.report({'WARNING'}, "No base color to darken in: {}".format(", ".join(sorted(materials_without_color))))
+        if self.disable_cloud_shadows:
+            shadow_gobo.set_cast_shadows(clouds, False)
+        return {'FINISHED'}
+
+
+class RENDER_OT_cloud_remove_shadow_gobo(bpy.types.Operator):
+    """Operator that removes the cloud shadow gobo from the selected terrain"""
+
+    bl_idname = "render.cloud_remove_shadow_gobo"
+    bl_label = "Remove cloud shadow gobo"
+    bl_options = {"REGISTER", "UNDO"}
+
+    def execute(self, context):
+        for obj in context.selected_objects:
+            if obj.cloud_settings.is_cloud:
+                shadow_gobo.set_cast_shadows([obj], True)
+            elif obj.type == 'MESH':
+                for material in obj.data.materials:
+                    if material is not None and material.use_nodes:
+                        shadow_gobo.remove_from_material(material)
+        return {'FINISHED'}
+
+
+class RENDER_OT_cloud_stream_tiles(bpy.types.Operator):
+    """Operator that streams tiles of the active cloudscape around the camera"""
+
+    bl_idname = "render.cloud_stream_tiles"
+    bl_label = "Stream cloudscape tiles"
+    bl_options = {"REGISTER", "UNDO"}
+
+    @classmethod
+    def poll(cls, context):
+        obj = context.active_object
+        if obj is None or not obj.cloud_settings.is_cloud:
+            return False
+        return obj.cloud_settings.cloud_type == "CLOUDSCAPE_CUMULUS"
+
+    def execute(self, context):
+        stream = tiles.create_stream(context, context.active_object)
+        context.scene.cloud_scene_settings.stream_tiles = True
+        result = tiles.update_tiles(context.scene)
+        if result is None:
+            self.report({'WARNING'}, "The scene has no camera, the tiles are streamed on frame change.")
+        else:
+            self.report({'INFO'}, "{} tiles in use, {} in the pool.".format(result[0], len(stream.objects)))
+        return {'FINISHED'}
+
+
+class RENDER_OT_cloud_remove_tiles(bpy.types.Operator):
+    """Operator that removes the cloudscape tiles and shows their template again"""
+
+    bl_idname = "render.cloud_remove_tiles"
+    bl_label = "Remove cloudscape tiles"
+    bl_options = {"REGISTER", "UNDO"}
+
+    def execute(self, context):
+        tiles.remove_stream()
+        context.scene.cloud_scene_settings.stream_tiles = False
+        return {'FINISHED'}
+
+
+class RENDER_OT_cloud_reclaim(bpy.types.Operator):
+    """Operator that removes the materials and meshes of deleted clouds"""
+
+    bl_idname = "render.cloud_reclaim"
+    bl_label = "Reclaim cloud datablocks"
+    bl_options = {"REGISTER", "UNDO"}
+
+    def execute(self, context):
+        report = pool.reclaim()
+        message = "{} materials ({} nodes) and {} meshes removed".format(
+            report["materials"], report["nodes"], report["meshes"])
+        message += ", about {:.2f} MB reclaimed".format(report["estimated_memory"] / 2**20)
+        self.report({'INFO'}, message + ".")
+        return {'FINISHED'}
+
+
+class RENDER_OT_cloud_share_materials(bpy.types.Operator):
+    """Operator that makes the clouds with identical node graphs share one material"""
+
+    bl_idname = "render.cloud_share_materials"
+    bl_label = "Share identical cloud materials"
+    bl_options = {"REGISTER", "UNDO"}
+
+    def execute(self, context):
+        report = sharing.share_identical(context.scene)
+        self.report({'INFO'}, "{} clouds use {} materials instead of {}, {} removed.".format(
+            report["clouds"], report["shared_materials"], report["materials"], report["removed"]))
+        return {'FINISHED'}
+
+
+class RENDER_OT_cloud_migrate(bpy.types.Operator):
+    """Operator that patches the cloud materials of the scene to the current node graph"""
+
+    bl_idname = "render.cloud_migrate"
+    bl_label = "Migrate cloud materials"
+    bl_options = {"REGISTER", "UNDO"}
+
+    dry_run: bpy.props.BoolProperty(
+        name="Dry run",
+        description="Only write the changes in the report without applying them",
+        default=True
+    )
+
+    def execute(self, context):
+        diffs = migration.migrate_clouds(context, self.dry_run)
+        changed = [name for name, diff in diffs.items() if migration.change_count(diff)]
+        changes = sum(migration.change_count(diff) for diff in diffs.values())
+        self.report({'INFO'}, "{} changes in {} of {} cloud materials{}. See the text \"{}\".".format(
+            changes, len(changed), len(diffs), " (dry run)" if self.dry_run else "", migration.REPORT_NAME))
+        return {'FINISHED'}
+
+
+class OBJECT_OT_cloud_profiling_reset(bpy.types.Operator):
+    """Operator that clears the measures of the cloud generation profiling"""
+
+    bl_idname = "object.cloud_profiling_reset"
+    bl_label = "Reset cloud generation profiling"
+
+    def execute(self, context):
+        profiling.reset()
+        return {'FINISHED'}
+
+
+class OBJECT_OT_cloud_update_latency_reset(bpy.types.Operator):
+    """Operator that clears the latency measures of the cloud property updates"""
+
+    bl_idname = "object.cloud_update_latency_reset"
+    bl_label = "Reset cloud update latencies"
+
+    def execute(self, context):
+        profiling.reset_updates()
+        return {'FINISHED'}
+
+
+class OBJECT_OT_cloud_update_latency_export(bpy.types.Operator, ExportHelper):
+    """Operator that exports the latency histograms of the cloud property updates to CSV.
+
+    The slow update log is written next to it with the "_slow" suffix.
+    """
+
+    bl_idname = "object.cloud_update_latency_export"
+    bl_label = "Export cloud update latencies"
+
+    filename_ext = ".csv"
+
+    filter_glob: bpy.props.StringProperty(
+        default="*.csv",
+        options={'HIDDEN'},
+    )
+
+    def execute(self, context):
+        slow_filepath = os.path.splitext(self.filepath)[0] + "_slow.csv"
+        profiling.write_update_latencies_csv(self.filepath)
+        profiling.write_slow_updates_csv(slow_filepath)
+        self.report({'INFO'}, "Update latencies exported to {} and {}.".format(self.filepath, slow_filepath))
+        return {'FINISHED'}
+
+
+class CloudSeedOperator:
+    """Seed properties of the operators that draw random cloud settings.
+
+    With random_seed a new seed is drawn the first time the operator runs,
+    then the seed is kept so redoing the operator gives the same cloud.
+    """
+
+    seed: bpy.props.IntProperty(
+        name="Seed",
+        description="Seed of the random cloud settings",
+        default=0,
+        min=0
+    )
+
+    random_seed: bpy.props.BoolProperty(
+        name="Random seed",
+        description="Draw a new seed every time the operator is run",
+        default=True,
+        options={'SKIP_SAVE'}
+    )
+
+    def draw_seed(self):
+        """Seed of this run of the operator."""
+
+        if self.random_seed:
+            self.seed = randomization.random_seed()
+            self.random_seed = False
+        return self.seed
+
+
+class CloudAddOperator(CloudSeedOperator):
+    """Base of the operators that generate and add a cloud of a type to the scene.
+
+    initial_shape: function of materials that builds the initial shape of
+        the cloud type.
+    """
+
+    initial_shape = None
+
+    use_template: bpy.props.BoolProperty(
+        name="Reuse material",
+        description="Reuse the material built before for the same seed and cloud type " +
+                    "instead of building it again",
+        default=False
+    )
+
     @classmethod
     def poll(cls, context):
         return context.area.type == "VIEW_3D"
 
     def execute(self, context):
-        materials.generate_cloud(context, -1000, 0, initial_shape_cloudscape_cumulus)
+        materials.generate_cloud(context, -1000, 0, self.initial_shape,
+                                 seed=self.draw_seed(), use_template=self.use_template)
         return {'FINISHED'}
 
 
-class OBJECT_OT_cloud_cloudscape_cirrus(bpy.types.Operator):
+class OBJECT_OT_cloud_single_cumulus(CloudAddOperator, bpy.types.Operator):
+    """Operator that generates and add a single cumulus cloud to the scene"""
+
+    bl_idname = "object.cloud_add_single_cumulus"
+    bl_label = "Generate single cumulus"
+    bl_options = {"REGISTER", "UNDO"}
+
+    initial_shape = staticmethod(initial_shape_single_cumulus)
+
+
+class OBJECT_OT_cloud_cloudscape_cumulus(CloudAddOperator, bpy.types.Operator):
+    """Operator that generates and add a cumulus cloudscape to the scene"""
+
+    bl_idname = "object.cloud_add_cloudscape_cumulus"
+    bl_label = "Generate cumulus cloudscape"
+    bl_options = {"REGISTER", "UNDO"}
+
+    initial_shape = staticmethod(initial_shape_cloudscape_cumulus)
+
+
+class OBJECT_OT_cloud_cloudscape_cirrus(CloudAddOperator, bpy.types.Operator):
     """Operator that generates and add a cirrus cloudscape to the scene"""
 
     bl_idname = "object.cloud_add_cloudscape_cirrus"
     bl_label = "Generate cirrus cloudscape"
     bl_options = {"REGISTER", "UNDO"}
 
+    initial_shape = staticmethod(initial_shape_cloudscape_cirrus)
+
+
+class OBJECT_OT_cloud_cloudscape_layered(CloudAddOperator, bpy.types.Operator):
+    """Operator that generates and add a layered cloudscape to the scene"""
+
+    bl_idname = "object.cloud_add_cloudscape_layered"
+    bl_label = "Generate layered cloudscape"
+    bl_options = {"REGISTER", "UNDO"}
+
+    initial_shape = staticmethod(initial_shape_cloudscape_layered)
+
+
+class OBJECT_OT_cloud_add_layer(bpy.types.Operator):
+    """Operator that adds a layer over the others to the active layered cloudscape"""
+
+    bl_idname = "object.cloud_add_layer"
+    bl_label = "Add cloudscape layer"
+    bl_options = {"REGISTER", "UNDO"}
+
+    layer_type: bpy.props.EnumProperty(
+        name="Layer type",
+        description="Type of the clouds of the new layer",
+        items=[("CUMULUS", "Cumulus", ""),
+               ("CIRRUS", "Cirrus", "")],
+        default="CUMULUS"
+    )
+
+    @classmethod
+    def poll(cls, context):
+        obj = context.active_object
+        return (obj is not None and obj.cloud_settings.is_cloud and obj.active_material is not None
+                and obj.cloud_settings.cloud_type == "CLOUDSCAPE_LAYERED")
+
+    def execute(self, context):
+        obj = context.active_object
+        settings = obj.cloud_settings
+        bottom = max([layer.top for layer in settings.layers], default=0.0)
+        seeds = randomization.layer_seeds(settings.seed, len(settings.layers) + 1)
+
+        settings.update_properties = False
+        layer = settings.layers.add()
+        layer.layer_type = self.layer_type
+        layer.bottom = bottom
+        layer.top = bottom + 0.4
+        layer.coverage = 0.4
+        layer.seed = seeds[-1]
+        settings.update_properties = True
+
+        materials.rebuild_initial_shape(context, obj, initial_shape_cloudscape_layered)
+        return {'FINISHED'}
+
+
+class OBJECT_OT_cloud_remove_layer(bpy.types.Operator):
+    """Operator that removes a layer of the active layered cloudscape"""
+
+    bl_idname = "object.cloud_remove_layer"
+    bl_label = "Remove cloudscape layer"
+    bl_options = {"REGISTER", "UNDO"}
+
+    index: bpy.props.IntProperty(
+        name="Layer",
+        description="Index of the layer to remove",
+        default=0,
+        min=0
+    )
+
+    @classmethod
+    def poll(cls, context):
+        obj = context.active_object
+        return (obj is not None and obj.cloud_settings.is_cloud and obj.active_material is not None
+                and obj.cloud_settings.cloud_type == "CLOUDSCAPE_LAYERED")
+
+    def execute(self, context):
+        obj = context.active_object
+        if self.index >= len(obj.cloud_settings.layers):
+            return {'CANCELLED'}
+        obj.cloud_settings.layers.remove(self.index)
+        materials.rebuild_initial_shape(context, obj, initial_shape_cloudscape_layered)
+        return {'FINISHED'}
+
+
+class OBJECT_OT_cloud_scatter_cumulus(bpy.types.Operator):
+    """Operator that scatters instances of a few cumulus variants around the 3D cursor"""
+
+    bl_idname = "object.cloud_scatter_cumulus"
+    bl_label = "Scatter cumulus clouds"
+    bl_options = {"REGISTER", "UNDO"}
+
+    count: bpy.props.IntProperty(
+        name="Instances",
+        description="Number of clouds scattered",
+        default=100,
+        min=1,
+        soft_max=10000
+    )
+
+    variants: bpy.props.IntProperty(
+        name="Variants",
+        description="Number of different clouds generated and instanced",
+        default=4,
+        min=1,
+        max=32
+    )
+
+    seed: bpy.props.IntProperty(
+        name="Seed",
+        description="Seed of the variants and the placement of the instances",
+        default=0,
+        min=0
+    )
+
+    area: bpy.props.FloatVectorProperty(
+        name="Area",
+        description="Size of the area around the 3D cursor where the clouds are scattered",
+        size=2,
+        default=(2000.0, 2000.0),
+        min=0.0,
+        subtype="XYZ_LENGTH"
+    )
+
+    height_min: bpy.props.FloatProperty(
+        name="Minimum height",
+        description="Lowest height of the clouds over the 3D cursor",
+        default=0.0,
+        subtype="DISTANCE"
+    )
+
+    height_max: bpy.props.FloatProperty(
+        name="Maximum height",
+        description="Highest height of the clouds over the 3D cursor",
+        default=100.0,
+        subtype="DISTANCE"
+    )
+
+    scale_min: bpy.props.FloatProperty(
+        name="Minimum scale",
+        description="Smallest scale of the instances",
+        default=0.7,
+        min=0.01
+    )
+
+    scale_max: bpy.props.FloatProperty(
+        name="Maximum scale",
+        description="Biggest scale of the instances",
+        default=1.3,
+        min=0.01
+    )
+
     @classmethod
     def poll(cls, context):
         return context.area.type == "VIEW_3D"
 
     def execute(self, context):
-        materials.generate_cloud(context, -1000, 0, initial_shape_cloudscape_cirrus)
+        cursor = context.scene.cursor.location
+        area_min = (cursor.x - self.area[0] / 2, cursor.y - self.area[1] / 2)
+        area_max = (cursor.x + self.area[0] / 2, cursor.y + self.area[1] / 2)
+        scatter.scatter_clouds(context, initial_shape_single_cumulus, self.count, self.variants, self.seed,
+                               area_min, area_max, cursor.z + self.height_min, cursor.z + self.height_max,
+                               self.scale_min, max(self.scale_min, self.scale_max))
+        return {'FINISHED'}
+
+
+class OBJECT_OT_cloud_remove_scatter(bpy.types.Operator):
+    """Operator that removes the scattered clouds and their variants"""
+
+    bl_idname = "object.cloud_remove_scatter"
+    bl_label = "Remove scattered clouds"
+    bl_options = {"REGISTER", "UNDO"}
+
+    def execute(self, context):
+        scatter.remove_scatter()
+        return {'FINISHED'}
+
+
+class OBJECT_OT_cloud_change_type(bpy.types.Operator):
+    """Operator that changes the type of the active cloud rebuilding only its initial shape"""
+
+    bl_idname = "object.cloud_change_type"
+    bl_label = "Change cloud type"
+    bl_options = {"REGISTER", "UNDO"}
+
+    cloud_type: bpy.props.EnumProperty(
+        name="Cloud type",
+        description="New type of the cloud",
+        items=[("SINGLE_CUMULUS", "Single cumulus", ""),
+               ("CLOUDSCAPE_CUMULUS", "Cumulus cloudscape", ""),
+               ("CLOUDSCAPE_CIRRUS", "Cirrus cloudscape", ""),
+               ("CLOUDSCAPE_LAYERED", "Layered cloudscape", "")],
+        default="SINGLE_CUMULUS"
+    )
+
+    @classmethod
+    def poll(cls, context):
+        obj = context.active_object
+        return obj is not None and obj.cloud_settings.is_cloud and obj.active_material is not None
+
+    def execute(self, context):
+        start = time.perf_counter()
+        materials.rebuild_initial_shape(context, context.active_object, materials.INITIAL_SHAPES[self.cloud_type])
+        self.report({'INFO'}, "Cloud type changed in {:.1f} ms.".format((time.perf_counter() - start) * 1000))
+        return {'FINISHED'}
+
+
+class OBJECT_OT_cloud_regenerate(CloudSeedOperator, bpy.types.Operator):
+    """Operator that draws new random settings for the active cloud keeping the object"""
+
+    bl_idname = "object.cloud_regenerate"
+    bl_label = "Regenerate cloud"
+    bl_options = {"REGISTER", "UNDO"}
+
+    @classmethod
+    def poll(cls, context):
+        obj = context.active_object
+        return obj is not None and obj.cloud_settings.is_cloud and obj.active_material is not None
+
+    def execute(self, context):
+        seed = self.draw_seed()
+        start = time.perf_counter()
+        materials.regenerate_cloud(context, context.active_object, seed)
+        self.report({'INFO'}, "Cloud regenerated in {:.1f} ms.".format((time.perf_counter() - start) * 1000))
         return {'FINISHED'}
 
 
@@ -198,6 +1358,9 @@ class OBJECT_PT_cloud(bpy.types.Panel):
             column = layout.column()
             column.prop(cloud_settings, "domain", text="Domain")
             column.prop(cloud_settings, "size", text="Size")
+            row = layout.row(align=True)
+            row.operator_menu_enum("object.cloud_change_type", "cloud_type", text="Change type")
+            row.operator("object.cloud_regenerate", text="Regenerate")
 
 
 class OBJECT_PT_cloud_general(bpy.types.Panel):
@@ -221,7 +1384,9 @@ class OBJECT_PT_cloud_general(bpy.types.Panel):
             column = layout.column()
             column.prop(cloud_settings, "density", text="Density")
             column.prop(cloud_settings, "color", text="Color")
-            if cloud_settings.cloud_type in ["CLOUDSCAPE_CUMULUS", "CLOUDSCAPE_CIRRUS"]:
+            if cloud_settings.cloud_type == "CLOUDSCAPE_LAYERED":
+                column.prop(cloud_settings, "cloudscape_cloud_size", text="Coverage gaps size")
+            elif cloud_settings.cloud_type in ["CLOUDSCAPE_CUMULUS", "CLOUDSCAPE_CIRRUS"]:
                 column.prop(cloud_settings, "amount_of_clouds", text="Coverage")
                 column.prop(cloud_settings, "cloudscape_cloud_size", text="Coverage gaps size")
                 if (context.preferences.addons[__name__].preferences.advanced_settings):
@@ -269,6 +1434,26 @@ class OBJECT_PT_cloud_shape(bpy.types.Panel):
                 column.prop(cloud_settings, "use_shape_texture", text="Use shape texture")
                 if cloud_settings.use_shape_texture:
                     column.template_ID(cloud_settings, "shape_texture_image", new="image.new", open="image.open")
+            elif(cloud_settings.cloud_type == "CLOUDSCAPE_LAYERED"):
+                column.prop(cloud_settings, "bottom_softness_cloudscape", text="Bottom softness")
+                column.prop(cloud_settings, "top_softness_cloudscape", text="Top softness")
+                column.prop(cloud_settings, "cloudscape_cirrus_cirrus_amount", text="Amount of cirrus")
+                column.prop(cloud_settings, "cloudscape_cirrus_cirrus_width", text="Cirrus width")
+
+                for index, layer in enumerate(cloud_settings.layers):
+                    box = column.box()
+                    row = box.row()
+                    row.prop(layer, "layer_type", text="Layer {}".format(index + 1))
+                    row.operator("object.cloud_remove_layer", text="", icon="X").index = index
+                    box.prop(layer, "bottom", text="Bottom")
+                    box.prop(layer, "top", text="Top")
+                    box.prop(layer, "coverage", text="Coverage")
+                    box.prop(layer, "seed", text="Seed")
+                column.operator_menu_enum("object.cloud_add_layer", "layer_type", text="Add layer")
+
+                column.prop(cloud_settings, "use_shape_texture", text="Use shape texture")
+                if cloud_settings.use_shape_texture:
+                    column.template_ID(cloud_settings, "shape_texture_image", new="image.new", open="image.open")
 
 
 class OBJECT_PT_cloud_shape_wind(bpy.types.Panel):
@@ -434,6 +1619,101 @@ class OBJECT_PT_cloud_extra(bpy.types.Panel):
             column.prop(cloud_settings, "cleaner_domain_size", text="Clean strengh")
 
 
+class RENDER_PT_cloud(bpy.types.Panel):
+    """Creates a Panel in the render context of the properties editor.
+
+    It groups the scene wide settings and optimizations used to
+    render clouds.
+    """
+
+    bl_label = "Clouds"
+    bl_idname = "RENDER_PT_cloud"
+    bl_space_type = 'PROPERTIES'
+    bl_region_type = 'WINDOW'
+    bl_context = "render"
+    bl_options = {'DEFAULT_CLOSED'}
+
+    def draw(self, context):
+        layout = self.layout
+        layout.use_property_split = True
+        scene_settings = context.scene.cloud_scene_settings
+
+        column = layout.column_flow(columns=2, align=True)
+        column.operator("render.cloud_edit_settings", text="Set edition settings")
+        column.operator("render.cloud_render_settings", text="Set render settings")
+        layout.operator("render.cloud_tune_render_settings", text="Tune render settings")
+
+        column = layout.column()
+        column.operator("render.cloud_fit_volumetrics", text="Fit EEVEE volumetrics")
+        column.prop(scene_settings, "auto_volumetrics", text="Fit on frame change")
+
+        column = layout.column()
+        column.operator("render.cloud_step_rate", text="Set cloud step rates")
+        column.prop(scene_settings, "auto_step_rate", text="Set on frame change")
+
+        column = layout.column()
+        row = column.row(align=True)
+        row.operator("render.cloud_cull", text="Cull clouds")
+        row.operator("render.cloud_restore_culled", text="", icon="LOOP_BACK")
+        column.prop(scene_settings, "use_culling", text="Cull on frame change")
+        column.prop(scene_settings, "culling_shadow_distance", text="Shadow distance")
+
+        column = layout.column()
+        row = column.row(align=True)
+        row.operator("render.cloud_lod", text="Set detail levels")
+        row.operator("render.cloud_full_detail", text="", icon="LOOP_BACK")
+        column.prop(scene_settings, "auto_lod", text="Set on frame change")
+        column.prop(scene_settings, "lod_budget", text="Budget")
+
+        row = layout.row(align=True)
+        row.operator("render.cloud_reclaim", text="Reclaim unused cloud datablocks")
+        row.operator("render.cloud_share_materials", text="Share identical materials")
+        row = layout.row(align=True)
+        row.operator("render.cloud_migrate", text="Check cloud graphs").dry_run = True
+        row.operator("render.cloud_migrate", text="Migrate cloud graphs").dry_run = False
+        layout.prop(scene_settings, "compact_save", text="Save clouds without materials")
+
+        column = layout.column_flow(columns=2, align=True)
+        column.operator("render.cloud_shader_cost", text="Shader cost report")
+        column.operator("render.cloud_calibrate_shader_cost", text="Calibrate")
+
+        column = layout.column()
+        row = column.row(align=True)
+        row.operator("render.cloud_bake_impostors", text="Bake impostors")
+        row.operator("render.cloud_remove_impostors", text="", icon="X")
+        column.prop(scene_settings, "use_impostors", text="Switch on frame change")
+        column.prop(scene_settings, "impostor_distance", text="Distance")
+        column.prop(scene_settings, "impostor_hysteresis", text="Hysteresis")
+        column.operator("render.cloud_impostor_render_time", text="Compare render time")
+
+        row = layout.row(align=True)
+        row.operator("render.cloud_bake_sky", text="Bake selected clouds into the sky")
+        row.operator("render.cloud_unbake_sky", text="", icon="X")
+
+        if not density.is_supported():
+            layout.label(text="Radiance, merge and shadow bakes need Blender 2.92 or later", icon="ERROR")
+        row = layout.row(align=True)
+        row.operator("render.cloud_bake_radiance", text="Bake selected clouds radiance")
+        row.operator("render.cloud_restore_radiance", text="", icon="LOOP_BACK")
+
+        row = layout.row(align=True)
+        row.operator("render.cloud_merge", text="Merge overlapping clouds")
+        row.operator("render.cloud_unmerge", text="", icon="LOOP_BACK")
+
+        column = layout.column()
+        row = column.row(align=True)
+        row.operator("render.cloud_bake_shadow_gobo", text="Bake cloud shadows on terrain")
+        row.operator("render.cloud_remove_shadow_gobo", text="", icon="X")
+        column.prop(scene_settings, "auto_shadow_gobo", text="Update on frame change")
+
+        column = layout.column()
+        row = column.row(align=True)
+        row.operator("render.cloud_stream_tiles", text="Stream active cloudscape tiles")
+        row.operator("render.cloud_remove_tiles", text="", icon="X")
+        column.prop(scene_settings, "stream_tiles", text="Stream on frame change")
+        column.prop(scene_settings, "tile_radius", text="Radius")
+
+
 class VIEW3D_MT_cloud_add(bpy.types.Menu):
     """Add operator buttons in the 'View 3D -> add -> Volume' menu.
 
@@ -449,6 +1729,10 @@ class VIEW3D_MT_cloud_add(bpy.types.Menu):
         layout.operator("object.cloud_add_single_cumulus", text="Simple cumulus", icon="OUTLINER_DATA_VOLUME")
         layout.operator("object.cloud_add_cloudscape_cumulus", text="Cumulus cloudscape", icon="OUTLINER_DATA_VOLUME")
         layout.operator("object.cloud_add_cloudscape_cirrus", text="Cirrus cloudscape", icon="MOD_OCEAN")
+        layout.operator("object.cloud_add_cloudscape_layered", text="Layered cloudscape", icon="MOD_OCEAN")
+        layout.separator()
+        layout.operator("object.cloud_scatter_cumulus", text="Cumulus scatter", icon="OUTLINER_OB_GROUP_INSTANCE")
+        layout.operator("object.cloud_remove_scatter", text="Remove cumulus scatter", icon="X")
 
 
 def add_menu_cloud(self, context):
@@ -465,10 +1749,47 @@ def register():
     bpy.utils.register_class(CloudGeneratorPreferences)
     bpy.utils.register_class(RENDER_OT_cloud_edit_settings)
     bpy.utils.register_class(RENDER_OT_cloud_render_settings)
+    bpy.utils.register_class(RENDER_OT_cloud_tune_render_settings)
+    bpy.utils.register_class(RENDER_OT_cloud_fit_volumetrics)
+    bpy.utils.register_class(RENDER_OT_cloud_step_rate)
+    bpy.utils.register_class(RENDER_OT_cloud_cull)
+    bpy.utils.register_class(RENDER_OT_cloud_restore_culled)
+    bpy.utils.register_class(RENDER_OT_cloud_lod)
+    bpy.utils.register_class(RENDER_OT_cloud_full_detail)
+    bpy.utils.register_class(RENDER_OT_cloud_shader_cost)
+    bpy.utils.register_class(RENDER_OT_cloud_calibrate_shader_cost)
+    bpy.utils.register_class(RENDER_OT_cloud_bake_impostors)
+    bpy.utils.register_class(RENDER_OT_cloud_remove_impostors)
+    bpy.utils.register_class(RENDER_OT_cloud_impostor_render_time)
+    bpy.utils.register_class(RENDER_OT_cloud_bake_sky)
+    bpy.utils.register_class(RENDER_OT_cloud_unbake_sky)
+    bpy.utils.register_class(RENDER_OT_cloud_bake_radiance)
+    bpy.utils.register_class(RENDER_OT_cloud_restore_radiance)
+    bpy.utils.register_class(RENDER_OT_cloud_merge)
+    bpy.utils.register_class(RENDER_OT_cloud_unmerge)
+    bpy.utils.register_class(RENDER_OT_cloud_bake_shadow_gobo)
+    bpy.utils.register_class(RENDER_OT_cloud_remove_shadow_gobo)
+    bpy.utils.register_class(RENDER_OT_cloud_stream_tiles)
+    bpy.utils.register_class(RENDER_OT_cloud_remove_tiles)
+    bpy.utils.register_class(RENDER_OT_cloud_reclaim)
+    bpy.utils.register_class(RENDER_OT_cloud_share_materials)
+    bpy.utils.register_class(RENDER_OT_cloud_migrate)
+    bpy.utils.register_class(OBJECT_OT_cloud_profiling_reset)
+    bpy.utils.register_class(OBJECT_OT_cloud_update_latency_reset)
+    bpy.utils.register_class(OBJECT_OT_cloud_update_latency_export)
+    bpy.utils.register_class(CloudLayerSettings)
     bpy.utils.register_class(CloudSettings)
+    bpy.utils.register_class(CloudSceneSettings)
     bpy.utils.register_class(OBJECT_OT_cloud_single_cumulus)
     bpy.utils.register_class(OBJECT_OT_cloud_cloudscape_cumulus)
     bpy.utils.register_class(OBJECT_OT_cloud_cloudscape_cirrus)
+    bpy.utils.register_class(OBJECT_OT_cloud_cloudscape_layered)
+    bpy.utils.register_class(OBJECT_OT_cloud_add_layer)
+    bpy.utils.register_class(OBJECT_OT_cloud_remove_layer)
+    bpy.utils.register_class(OBJECT_OT_cloud_scatter_cumulus)
+    bpy.utils.register_class(OBJECT_OT_cloud_remove_scatter)
+    bpy.utils.register_class(OBJECT_OT_cloud_change_type)
+    bpy.utils.register_class(OBJECT_OT_cloud_regenerate)
 
     bpy.utils.register_class(OBJECT_PT_cloud)
     bpy.utils.register_class(OBJECT_PT_cloud_general)
@@ -479,11 +1800,36 @@ def register():
     bpy.utils.register_class(OBJECT_PT_cloud_shape_subtract_imperfection)
     bpy.utils.register_class(OBJECT_PT_cloud_detail)
     bpy.utils.register_class(OBJECT_PT_cloud_extra)
+    bpy.utils.register_class(RENDER_PT_cloud)
 
     bpy.utils.register_class(VIEW3D_MT_cloud_add)
     bpy.types.VIEW3D_MT_volume_add.append(add_menu_cloud)
 
     bpy.types.Object.cloud_settings = bpy.props.PointerProperty(type=CloudSettings)
+    bpy.types.Scene.cloud_scene_settings = bpy.props.PointerProperty(type=CloudSceneSettings)
+
+    bpy.app.handlers.frame_change_post.append(tiles.tiles_frame_handler)
+    bpy.app.handlers.frame_change_post.append(impostors.impostor_frame_handler)
+    bpy.app.handlers.frame_change_post.append(culling.culling_handler)
+    bpy.app.handlers.render_pre.append(culling.culling_handler)
+    bpy.app.handlers.frame_change_post.append(lod.lod_frame_handler)
+    bpy.app.handlers.frame_change_post.append(volumetrics.volumetrics_frame_handler)
+    bpy.app.handlers.frame_change_post.append(volumetrics.step_rate_frame_handler)
+    bpy.app.handlers.frame_change_post.append(shadow_gobo.shadow_gobo_frame_handler)
+    bpy.app.handlers.render_pre.append(shadow_gobo.shadow_gobo_render_handler)
+    bpy.app.handlers.render_complete.append(shadow_gobo.shadow_gobo_render_end_handler)
+    bpy.app.handlers.render_cancel.append(shadow_gobo.shadow_gobo_render_end_handler)
+    bpy.app.handlers.save_pre.append(compact.compact_save_handler)
+    bpy.app.handlers.save_post.append(compact.compact_save_post_handler)
+    bpy.app.handlers.load_post.append(compact.compact_load_handler)
+    bpy.app.handlers.render_pre.append(compact.compact_render_handler)
+    preview.register()
+
+    addon = bpy.context.preferences.addons.get(__name__)
+    if addon is not None and addon.preferences.profile_generation:
+        profiling.enable()
+    if addon is not None and addon.preferences.profile_updates:
+        profiling.enable_updates(addon.preferences.slow_update_threshold / 1000)
 
 
     '''
@@ -513,10 +1859,47 @@ def unregister():
     bpy.utils.unregister_class(CloudGeneratorPreferences)
     bpy.utils.unregister_class(RENDER_OT_cloud_edit_settings)
     bpy.utils.unregister_class(RENDER_OT_cloud_render_settings)
+    bpy.utils.unregister_class(RENDER_OT_cloud_tune_render_settings)
+    bpy.utils.unregister_class(RENDER_OT_cloud_fit_volumetrics)
+    bpy.utils.unregister_class(RENDER_OT_cloud_step_rate)
+    bpy.utils.unregister_class(RENDER_OT_cloud_cull)
+    bpy.utils.unregister_class(RENDER_OT_cloud_restore_culled)
+    bpy.utils.unregister_class(RENDER_OT_cloud_lod)
+    bpy.utils.unregister_class(RENDER_OT_cloud_full_detail)
+    bpy.utils.unregister_class(RENDER_OT_cloud_shader_cost)
+    bpy.utils.unregister_class(RENDER_OT_cloud_calibrate_shader_cost)
+    bpy.utils.unregister_class(RENDER_OT_cloud_bake_impostors)
+    bpy.utils.unregister_class(RENDER_OT_cloud_remove_impostors)
+    bpy.utils.unregister_class(RENDER_OT_cloud_impostor_render_time)
+    bpy.utils.unregister_class(RENDER_OT_cloud_bake_sky)
+    bpy.utils.unregister_class(RENDER_OT_cloud_unbake_sky)
+    bpy.utils.unregister_class(RENDER_OT_cloud_bake_radiance)
+    bpy.utils.unregister_class(RENDER_OT_cloud_restore_radiance)
+    bpy.utils.unregister_class(RENDER_OT_cloud_merge)
+    bpy.utils.unregister_class(RENDER_OT_cloud_unmerge)
+    bpy.utils.unregister_class(RENDER_OT_cloud_bake_shadow_gobo)
+    bpy.utils.unregister_class(RENDER_OT_cloud_remove_shadow_gobo)
+    bpy.utils.unregister_class(RENDER_OT_cloud_stream_tiles)
+    bpy.utils.unregister_class(RENDER_OT_cloud_remove_tiles)
+    bpy.utils.unregister_class(RENDER_OT_cloud_reclaim)
+    bpy.utils.unregister_class(RENDER_OT_cloud_share_materials)
+    bpy.utils.unregister_class(RENDER_OT_cloud_migrate)
+    bpy.utils.unregister_class(OBJECT_OT_cloud_profiling_reset)
+    bpy.utils.unregister_class(OBJECT_OT_cloud_update_latency_reset)
+    bpy.utils.unregister_class(OBJECT_OT_cloud_update_latency_export)
     bpy.utils.unregister_class(CloudSettings)
+    bpy.utils.unregister_class(CloudLayerSettings)
+    bpy.utils.unregister_class(CloudSceneSettings)
     bpy.utils.unregister_class(OBJECT_OT_cloud_single_cumulus)
     bpy.utils.unregister_class(OBJECT_OT_cloud_cloudscape_cumulus)
     bpy.utils.unregister_class(OBJECT_OT_cloud_cloudscape_cirrus)
+    bpy.utils.unregister_class(OBJECT_OT_cloud_cloudscape_layered)
+    bpy.utils.unregister_class(OBJECT_OT_cloud_add_layer)
+    bpy.utils.unregister_class(OBJECT_OT_cloud_remove_layer)
+    bpy.utils.unregister_class(OBJECT_OT_cloud_scatter_cumulus)
+    bpy.utils.unregister_class(OBJECT_OT_cloud_remove_scatter)
+    bpy.utils.unregister_class(OBJECT_OT_cloud_change_type)
+    bpy.utils.unregister_class(OBJECT_OT_cloud_regenerate)
 
     bpy.utils.unregister_class(OBJECT_PT_cloud)
     bpy.utils.unregister_class(OBJECT_PT_cloud_general)
@@ -527,8 +1910,31 @@ def unregister():
     bpy.utils.unregister_class(OBJECT_PT_cloud_shape_subtract_imperfection)
     bpy.utils.unregister_class(OBJECT_PT_cloud_detail)
     bpy.utils.unregister_class(OBJECT_PT_cloud_extra)
+    bpy.utils.unregister_class(RENDER_PT_cloud)
 
     bpy.utils.unregister_class(VIEW3D_MT_cloud_add)
     bpy.types.VIEW3D_MT_volume_add.remove(add_menu_cloud)
 
     del bpy.types.Object.cloud_settings
+    del bpy.types.Scene.cloud_scene_settings
+
+    bpy.app.handlers.frame_change_post.remove(tiles.tiles_frame_handler)
+    bpy.app.handlers.frame_change_post.remove(impostors.impostor_frame_handler)
+    bpy.app.handlers.frame_change_post.remove(culling.culling_handler)
+    bpy.app.handlers.render_pre.remove(culling.culling_handler)
+    bpy.app.handlers.frame_change_post.remove(lod.lod_frame_handler)
+    bpy.app.handlers.frame_change_post.remove(volumetrics.volumetrics_frame_handler)
+    bpy.app.handlers.frame_change_post.remove(volumetrics.step_rate_frame_handler)
+    bpy.app.handlers.frame_change_post.remove(shadow_gobo.shadow_gobo_frame_handler)
+    bpy.app.handlers.render_pre.remove(shadow_gobo.shadow_gobo_render_handler)
+    bpy.app.handlers.render_complete.remove(shadow_gobo.shadow_gobo_render_end_handler)
+    bpy.app.handlers.render_cancel.remove(shadow_gobo.shadow_gobo_render_end_handler)
+    bpy.app.handlers.save_pre.remove(compact.compact_save_handler)
+    bpy.app.handlers.save_post.remove(compact.compact_save_post_handler)
+    bpy.app.handlers.load_post.remove(compact.compact_load_handler)
+    bpy.app.handlers.render_pre.remove(compact.compact_render_handler)
+    compact.unregister()
+    shadow_gobo.unregister()
+    preview.unregister()
+    profiling.disable()
+    profiling.disable_updates()
@@ -0,0 +1,129 @@
+"""
+    camera_geometry.py is part of Cloud Generator Blender Addon.
+
+    Foobar is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from mathutils import Vector
+
+
+def domain_corners(matrix_world, bound_box):
+    """World space corners of an object bounding box.
+
+    matrix_world: world matrix of the object.
+    bound_box: the 8 local corners of the object (Object.bound_box).
+    """
+
+    return [matrix_world @ Vector(corner) for corner in bound_box]
+
+
+def camera_depths(view_matrix, points):
+    """Distance of every point in front of the camera along its view axis.
+
+    view_matrix: inverse of the camera world matrix. The camera looks
+        along its local -Z axis, so points behind it have negative depth.
+    """
+
+    return [-(view_matrix @ point).z for point in points]
+
+
+def render_resolution(render):
+    """Final render resolution in pixels (width, height)."""
+
+    scale = render.resolution_percentage / 100
+    return (max(1, int(render.resolution_x * scale)),
+            max(1, int(render.resolution_y * scale)))
+
+
+def camera_matrices(camera, depsgraph, resolution, render):
+    """View and projection matrices of a camera object."""
+
+    view_matrix = camera.matrix_world.inverted()
+    projection_matrix = camera.calc_matrix_camera(depsgraph,
+                                                  x=resolution[0],
+                                                  y=resolution[1],
+                                                  scale_x=render.pixel_aspect_x,
+                                                  scale_y=render.pixel_aspect_y)
+    return view_matrix, projection_matrix
+
+
+def projected_rectangle(view_projection, points, resolution):
+    """Screen rectangle in pixels covered by a set of points.
+
+    Returns (min_x, min_y, max_x, max_y), that can be outside the screen.
+    If any point is behind the camera the whole screen is returned because
+    the projection of the set is unbounded.
+
+    view_projection: projection matrix @ view matrix of the camera.
+    resolution: (width, height) of the render in pixels.
+    """
+
+    xs = []
+    ys = []
+    for point in points:
+        clip = view_projection @ Vector((point.x, point.y, point.z, 1.0))
+        if clip.w <= 0.0:
+            return (0.0, 0.0, float(resolution[0]), float(resolution[1]))
+        xs.append((clip.x / clip.w + 1.0) * 0.5 * resolution[0])
+        ys.append((clip.y / clip.w + 1.0) * 0.5 * resolution[1])
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+def visible_size(rectangle, resolution):
+    """Size in pixels of the biggest side of a rectangle clipped to the screen.
+
+    Returns 0 if the rectangle is outside the screen.
+    """
+
+    min_x = max(rectangle[0], 0.0)
+    min_y = max(rectangle[1], 0.0)
+    max_x = min(rectangle[2], float(resolution[0]))
+    max_y = min(rectangle[3], float(resolution[1]))
+    if max_x <= min_x or max_y <= min_y:
+        return 0.0
+    return max(max_x - min_x, max_y - min_y)
+
+
+def pixel_world_size(projection_matrix, resolution, depth, orthographic=False):
+    """Width in world units covered by a pixel at a distance from the camera.
+
+    projection_matrix: projection matrix of the camera.
+    resolution: (width, height) of the render in pixels.
+    depth: distance along the camera view axis. Ignored for orthographic
+        cameras.
+    """
+
+    size = 2.0 / (projection_matrix[0][0] * resolution[0])
+    if orthographic:
+        return size
+    return size * depth
+
+
+def outside_frustum(view_projection, points):
+    """Whether a set of points is surely outside the view frustum of a camera.
+
+    The set is outside if all its points are beyond the same clipping plane.
+    Points are tested in homogeneous clip space, so points behind the camera
+    are handled without projecting them. Sets that cross several planes
+    can be reported inside (conservative test).
+
+    view_projection: projection matrix @ view matrix of the camera.
+    """
+
+    clip = [view_projection @ Vector((point.x, point.y, point.z, 1.0)) for point in points]
+    for axis in range(3):
+        if all(coords[axis] > coords.w for coords in clip):
+            return True
+        if all(coords[axis] < -coords.w for coords in clip):
+            return True
+    return False
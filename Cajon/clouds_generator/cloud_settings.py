@@ -18,6 +18,32 @@ import bpy
 from mathutils import Vector
 from math import sin, cos, pi
 
+from . import culling
+from . import sharing
+from .profiling import timed_update
+
+
+def cloud_update(property_name, function):
+    """Update function of a cloud setting that changes the cloud material.
+
+    Clouds share a material until one of its settings diverges from the
+    other clouds with the material. Then the active cloud gets its own copy
+    (see sharing.py) before function changes it.
+
+    property_name: name of the setting.
+    function: update function of the setting, called with (self, context).
+    """
+
+    def update(self, context):
+        obj = context.active_object
+        if obj.cloud_settings.update_properties and sharing.diverges(obj, property_name):
+            sharing.own_material(obj)
+        return function(self, context)
+
+    update.__name__ = function.__name__
+    update.__doc__ = function.__doc__
+    return timed_update(property_name, update)
+
 
 def update_cloud_dimensions(self, context):
     """Cloud dimensions update function.
@@ -485,7 +511,7 @@ def update_cloud_amount_of_clouds(self, context):
         elif (cloud_type in ["CLOUDSCAPE_CIRRUS"]):
             length_greater_than_2 = material.node_tree.nodes.get("Greater than - Coverage cirrus")
             length_greater_than_2.inputs[1].default_value = amount_of_clouds * 10
-        else:
+        elif (cloud_type != "CLOUDSCAPE_LAYERED"):
             subtract_gradient_noise = material.node_tree.nodes.get("RGB Subtract - Gradient and Noise")
             subtract_gradient_noise.inputs["Fac"].default_value = 1 - amount_of_clouds
 
@@ -503,6 +529,10 @@ def update_cloud_cloudscape_cloud_size(self, context):
         material = bpy.context.active_object.active_material
         if "CloudMaterial_CG" not in material.name:
             bpy.ops.error.cloud_error("INVOKE_DEFAULT", error_type="MATERIAL_WRONG_NAME")
+        elif (obj.cloud_settings.cloud_type == "CLOUDSCAPE_LAYERED"):
+            for index in built_layers(material):
+                noise_subtract = material.node_tree.nodes.get("Layer {} - Noise Tex".format(index))
+                noise_subtract.inputs["Scale"].default_value = cloudscape_cloud_size
         else:
             noise_subtract = material.node_tree.nodes.get("Noise Tex - Subtract initial")
             noise_subtract.inputs["Scale"].default_value = cloudscape_cloud_size
@@ -580,6 +610,13 @@ def update_cloud_cut_softness_cloudscape(self, context):
             color_ramp_gradient_subtract = material.node_tree.nodes.get("ColorRamp - Gradient Subtract")
             elem = color_ramp_gradient_subtract.color_ramp.elements[1]
             elem.position = top_softness_cloudscape
+        elif cloud_type == "CLOUDSCAPE_LAYERED":
+            for index in built_layers(material):
+                color_ramp_bottom = material.node_tree.nodes.get("Layer {} - ColorRamp Bottom".format(index))
+                color_ramp_bottom.color_ramp.elements[1].position = bottom_softness_cloudscape
+
+                color_ramp_top = material.node_tree.nodes.get("Layer {} - ColorRamp Top".format(index))
+                color_ramp_top.color_ramp.elements[1].position = top_softness_cloudscape
 
 
 def update_cloud_use_shape_texture(self, context):
@@ -595,7 +632,7 @@ def update_cloud_use_shape_texture(self, context):
         material = bpy.context.active_object.active_material
         if "CloudMaterial_CG" not in material.name:
             bpy.ops.error.cloud_error("INVOKE_DEFAULT", error_type="MATERIAL_WRONG_NAME")
-        elif (cloud_type in ["CLOUDSCAPE_CUMULUS", "CLOUDSCAPE_CIRRUS"]):
+        elif (cloud_type in ["CLOUDSCAPE_CUMULUS", "CLOUDSCAPE_CIRRUS", "CLOUDSCAPE_LAYERED"]):
             use_shape_texture = obj.cloud_settings.use_shape_texture
             texture_image_shape_multiply = material.node_tree.nodes.get("RGB Multiply - Texture image shape")
             if use_shape_texture:
@@ -617,7 +654,7 @@ def update_cloud_shape_texture_image(self, context):
         material = bpy.context.active_object.active_material
         if "CloudMaterial_CG" not in material.name:
             bpy.ops.error.cloud_error("INVOKE_DEFAULT", error_type="MATERIAL_WRONG_NAME")
-        elif (cloud_type in ["CLOUDSCAPE_CUMULUS", "CLOUDSCAPE_CIRRUS"]):
+        elif (cloud_type in ["CLOUDSCAPE_CUMULUS", "CLOUDSCAPE_CIRRUS", "CLOUDSCAPE_LAYERED"]):
             shape_texture_image = obj.cloud_settings.shape_texture_image
             image_texture_shape = material.node_tree.nodes.get("Image texture - Shape of cloud")
             image_texture_shape.image = shape_texture_image
@@ -642,6 +679,196 @@ def update_cloud_cirrus(self, context):
             multiply_for_width_operation_cirrus.inputs[1].default_value = (cloudscape_cirrus_cirrus_width,
                                                                            cloudscape_cirrus_cirrus_width,
                                                                            cloudscape_cirrus_cirrus_width)
+        elif (cloud_type == "CLOUDSCAPE_LAYERED"):
+            cloudscape_cirrus_cirrus_amount = obj.cloud_settings.cloudscape_cirrus_cirrus_amount
+            cloudscape_cirrus_cirrus_width = 1 - obj.cloud_settings.cloudscape_cirrus_cirrus_width
+            for index in built_layers(material):
+                mapping_cirrus_shape = material.node_tree.nodes.get("Layer {} - Mapping Cirrus Shape".format(index))
+                if mapping_cirrus_shape is None:
+                    continue
+                mapping_cirrus_shape.inputs["Scale"].default_value = (cloudscape_cirrus_cirrus_amount, 0, 0)
+                multiply_width = material.node_tree.nodes.get("Layer {} - Cirrus width".format(index))
+                multiply_width.inputs[1].default_value = (cloudscape_cirrus_cirrus_width,
+                                                          cloudscape_cirrus_cirrus_width,
+                                                          cloudscape_cirrus_cirrus_width)
+
+
+def is_empty_layer(layer):
+    """Whether a layer of a layered cloudscape has no clouds.
+
+    Layers with an empty height band or without coverage are not built.
+    """
+
+    return layer.top <= layer.bottom or layer.coverage <= 0.0
+
+
+def built_layers(material):
+    """Indices of the layers of a layered cloudscape built in a material."""
+
+    indices = []
+    for node in material.node_tree.nodes:
+        if node.name.startswith("Layer ") and node.name.endswith(" - Band"):
+            indices.append(int(node.name.split(" ")[1]))
+    return sorted(indices)
+
+
+def rebuild_layers(context, obj):
+    """Builds again the initial shape of a layered cloudscape.
+
+    The nodes are changed directly, like the other update functions do,
+    so dragging a layer setting does not push undo steps. materials
+    imports this module, so it is imported here.
+    """
+
+    from . import materials
+    materials.rebuild_initial_shape(context, obj, materials.INITIAL_SHAPES["CLOUDSCAPE_LAYERED"])
+
+
+def update_cloud_layer(self, context):
+    """Layered cloudscape layer update function.
+
+    Change the height band, coverage and seed of a layer of a layered
+    cloudscape. The initial shape is built again if the layer becomes
+    empty or stops being empty, because empty layers are not built.
+    """
+
+    obj = context.active_object
+    if (obj.cloud_settings.update_properties):
+        index = next(i for i, layer in enumerate(obj.cloud_settings.layers) if layer == self)
+        material = bpy.context.active_object.active_material
+        if "CloudMaterial_CG" not in material.name:
+            bpy.ops.error.cloud_error("INVOKE_DEFAULT", error_type="MATERIAL_WRONG_NAME")
+        elif (index in built_layers(material)) == is_empty_layer(self):
+            rebuild_layers(context, obj)
+        elif not is_empty_layer(self):
+            if sharing.diverges(obj, "layers"):
+                material = sharing.own_material(obj)
+            nodes = material.node_tree.nodes
+            mapping_bottom = nodes.get("Layer {} - Mapping Bottom".format(index))
+            mapping_bottom.inputs["Location"].default_value = (-self.bottom, 0.0, 0.0)
+            mapping_top = nodes.get("Layer {} - Mapping Top".format(index))
+            mapping_top.inputs["Location"].default_value = (-self.top, 0.0, 0.0)
+            mapping_noise = nodes.get("Layer {} - Mapping Noise".format(index))
+            mapping_noise.inputs["Location"].default_value = (self.seed, self.seed, self.seed)
+            coverage = nodes.get("Layer {} - Coverage".format(index))
+            if self.layer_type == "CIRRUS":
+                coverage.inputs[1].default_value = self.coverage * 10
+            else:
+                coverage.inputs["Fac"].default_value = 1 - self.coverage
+
+
+def update_cloud_layer_type(self, context):
+    """Layered cloudscape layer type update function.
+
+    The initial shape is built again with the new type of the layer.
+    """
+
+    obj = context.active_object
+    if (obj.cloud_settings.update_properties):
+        material = obj.active_material
+        if "CloudMaterial_CG" not in material.name:
+            bpy.ops.error.cloud_error("INVOKE_DEFAULT", error_type="MATERIAL_WRONG_NAME")
+        else:
+            rebuild_layers(context, obj)
+
+
+def update_scene_use_culling(self, context):
+    """Scene culling update function.
+
+    Renders again the clouds hidden by the culling when it is disabled.
+    """
+
+    if not self.use_culling:
+        culling.restore_culled(self.id_data)
+
+
+def cloud_settings_to_dict(cloud_settings):
+    """Returns the cloud settings as a dict of plain Python values.
+
+    Pointer and collection properties and update_properties are not included.
+    """
+
+    values = {}
+    for prop in cloud_settings.bl_rna.properties:
+        identifier = prop.identifier
+        if identifier in ("rna_type", "update_properties") or prop.type in ('POINTER', 'COLLECTION'):
+            continue
+        value = getattr(cloud_settings, identifier)
+        if getattr(prop, "is_array", False):
+            value = tuple(value)
+        values[identifier] = value
+    return values
+
+
+def cloud_settings_from_dict(cloud_settings, values):
+    """Sets the cloud settings from a dict without running the update functions."""
+
+    update_properties = cloud_settings.update_properties
+    cloud_settings.update_properties = False
+    for identifier, value in values.items():
+        setattr(cloud_settings, identifier, value)
+    cloud_settings.update_properties = update_properties
+
+
+class CloudLayerSettings(bpy.types.PropertyGroup):
+    """Custom properties of a layer of a layered cloudscape
+
+    Attributes:
+        layer_type: Type of the clouds of the layer.
+
+        bottom: Height of the bottom of the layer in the cloudscape.
+
+        top: Height of the top of the layer in the cloudscape.
+
+        coverage: Amount of clouds in the layer. Sky coverage.
+
+        seed: Sets the value of this property as the value of the three
+            mapping coordinates for the noise of the layer.
+    """
+
+    layer_type: bpy.props.EnumProperty(
+        name="Layer type",
+        description="Type of the clouds of the layer",
+        items=[("CUMULUS", "Cumulus", ""),
+               ("CIRRUS", "Cirrus", "")],
+        default="CUMULUS",
+        update=timed_update("layer_type", update_cloud_layer_type)
+    )
+
+    bottom: bpy.props.FloatProperty(
+        name="Layer bottom",
+        description="Height of the bottom of the layer in the cloudscape",
+        default=0.0,
+        min=0.0,
+        soft_max=2.0,
+        update=timed_update("layers", update_cloud_layer)
+    )
+
+    top: bpy.props.FloatProperty(
+        name="Layer top",
+        description="Height of the top of the layer in the cloudscape",
+        default=1.2,
+        min=0.0,
+        soft_max=2.0,
+        update=timed_update("layers", update_cloud_layer)
+    )
+
+    coverage: bpy.props.FloatProperty(
+        name="Layer coverage",
+        description="Amount of clouds in the layer. Sky coverage",
+        default=0.4,
+        min=0.0,
+        max=1.0,
+        update=timed_update("layers", update_cloud_layer)
+    )
+
+    seed: bpy.props.FloatProperty(
+        name="Layer seed",
+        description="Sets the value of this property as the value of the " +
+        "three mapping coordinates for the noise of the layer",
+        default=0.0,
+        update=timed_update("layers", update_cloud_layer)
+    )
 
 
 class CloudSettings(bpy.types.PropertyGroup):
@@ -658,6 +885,8 @@ class CloudSettings(bpy.types.PropertyGroup):
 
         cloud_type: Specific cloud type
 
+        seed: Seed used to draw the random settings of the cloud.
+
         size: Size of the cloud within the domain.
 
         domain: Size of the domain where the cloud is render.
@@ -750,6 +979,12 @@ class CloudSettings(bpy.types.PropertyGroup):
 
         cloudscape_cirrus_cirrus_width: Width of the cirrus in a cloudscape.
 
+        layers: Layers of a layered cloudscape, each one with its own
+            height band, coverage and seed.
+
+        impostor: Billboard that replaces the cloud in renders when it is
+            far from the camera.
+
     """
 
     is_cloud: bpy.props.BoolProperty(
@@ -772,7 +1007,7 @@ class CloudSettings(bpy.types.PropertyGroup):
         subtype="COLOR",
         size=4,
         default=(1.0, 1.0, 1.0, 1.0),
-        update=update_cloud_color
+        update=cloud_update("color", update_cloud_color)
     )
 
     cloud_type: bpy.props.StringProperty(
@@ -781,12 +1016,19 @@ class CloudSettings(bpy.types.PropertyGroup):
         default="NONE"
     )
 
+    seed: bpy.props.IntProperty(
+        name="Cloud seed",
+        description="Seed used to draw the random settings of the cloud",
+        default=0,
+        min=0
+    )
+
     size: bpy.props.FloatProperty(
         name="Cloud size",
         description="Size of the cloud within the domain",
         default=10,
         min=0.01,
-        update=update_cloud_dimensions
+        update=timed_update("size", update_cloud_dimensions)
     )
 
     domain: bpy.props.FloatVectorProperty(
@@ -795,7 +1037,7 @@ class CloudSettings(bpy.types.PropertyGroup):
                     "It corresponds to the size of the object",
         subtype="TRANSLATION",
         default=(30.0, 30.0, 30.0),
-        update=update_cloud_dimensions
+        update=timed_update("domain", update_cloud_dimensions)
     )
 
     domain_cloud_position: bpy.props.FloatVectorProperty(
@@ -803,7 +1045,7 @@ class CloudSettings(bpy.types.PropertyGroup):
         description="Position of the cloud within the domain",
         subtype="XYZ",
         default=(0.0, 0.0, 0.0),
-        update=update_cloud_domain_cloud_position
+        update=cloud_update("domain_cloud_position", update_cloud_domain_cloud_position)
     )
 
     density: bpy.props.FloatProperty(
@@ -812,7 +1054,7 @@ class CloudSettings(bpy.types.PropertyGroup):
         default=1.0,
         min=0.0,
         soft_max=5.0,
-        update=update_cloud_density
+        update=cloud_update("density", update_cloud_density)
     )
 
     wind_strength: bpy.props.FloatProperty(
@@ -821,7 +1063,7 @@ class CloudSettings(bpy.types.PropertyGroup):
         default=1.0,
         min=0.0,
         soft_max=5.0,
-        update=update_cloud_wind
+        update=cloud_update("wind_strength", update_cloud_wind)
     )
 
     wind_big_turbulence: bpy.props.FloatProperty(
@@ -830,7 +1072,7 @@ class CloudSettings(bpy.types.PropertyGroup):
         default=0.0,
         min=0.0,
         max=1.0,
-        update=update_cloud_wind
+        update=cloud_update("wind_big_turbulence", update_cloud_wind)
     )
 
     wind_small_turbulence: bpy.props.FloatProperty(
@@ -839,7 +1081,7 @@ class CloudSettings(bpy.types.PropertyGroup):
         default=0.0,
         min=0.0,
         max=1.0,
-        update=update_cloud_wind
+        update=cloud_update("wind_small_turbulence", update_cloud_wind)
     )
 
     wind_big_turbulence_coords: bpy.props.FloatVectorProperty(
@@ -848,7 +1090,7 @@ class CloudSettings(bpy.types.PropertyGroup):
                     "It is used as a seed.",
         subtype="XYZ",
         default=(0.0, 0.0, 0.0),
-        update=update_cloud_wind_turbulence_coords
+        update=cloud_update("wind_big_turbulence_coords", update_cloud_wind_turbulence_coords)
     )
 
     wind_small_turbulence_coords: bpy.props.FloatVectorProperty(
@@ -857,7 +1099,7 @@ class CloudSettings(bpy.types.PropertyGroup):
                     "It is used as a seed.",
         subtype="XYZ",
         default=(0.0, 0.0, 0.0),
-        update=update_cloud_wind_turbulence_coords
+        update=cloud_update("wind_small_turbulence_coords", update_cloud_wind_turbulence_coords)
     )
 
     wind_turbulence_simple_seed: bpy.props.FloatProperty(
@@ -865,7 +1107,7 @@ class CloudSettings(bpy.types.PropertyGroup):
         description="Sets the value of this property as the value of the " +
         "three mapping coordinates for both wind big and small turbulence coordinates",
         default=0.0,
-        update=update_cloud_wind_turbulence_coords
+        update=cloud_update("wind_turbulence_simple_seed", update_cloud_wind_turbulence_coords)
     )
 
     roundness: bpy.props.FloatProperty(
@@ -875,7 +1117,7 @@ class CloudSettings(bpy.types.PropertyGroup):
         default=0.5,
         min=0.0,
         max=1.0,
-        update=update_cloud_roundness
+        update=cloud_update("roundness", update_cloud_roundness)
     )
 
     roundness_coords: bpy.props.FloatVectorProperty(
@@ -885,7 +1127,7 @@ class CloudSettings(bpy.types.PropertyGroup):
                     "it is used as a seed.",
         subtype="XYZ",
         default=(0.0, 0.0, 0.0),
-        update=update_cloud_roundness_coords
+        update=cloud_update("roundness_coords", update_cloud_roundness_coords)
     )
 
     roundness_simple_seed: bpy.props.FloatProperty(
@@ -893,7 +1135,7 @@ class CloudSettings(bpy.types.PropertyGroup):
         description="Sets the value of this property as the value of the " +
         "three mapping coordinates for roundness coordinates",
         default=0.0,
-        update=update_cloud_roundness_coords
+        update=cloud_update("roundness_simple_seed", update_cloud_roundness_coords)
     )
 
     height_single: bpy.props.FloatProperty(
@@ -902,7 +1144,7 @@ class CloudSettings(bpy.types.PropertyGroup):
         default=0.3,
         min=0,
         max=1,
-        update=update_cloud_height_single
+        update=cloud_update("height_single", update_cloud_height_single)
     )
 
     width_x: bpy.props.FloatProperty(
@@ -911,7 +1153,7 @@ class CloudSettings(bpy.types.PropertyGroup):
         default=0.7,
         min=0.1,
         max=10.0,
-        update=update_cloud_width
+        update=cloud_update("width_x", update_cloud_width)
     )
 
     width_y: bpy.props.FloatProperty(
@@ -920,7 +1162,7 @@ class CloudSettings(bpy.types.PropertyGroup):
         default=0.7,
         min=0.1,
         max=10.0,
-        update=update_cloud_width
+        update=cloud_update("width_y", update_cloud_width)
     )
 
     add_shape_imperfection: bpy.props.FloatProperty(
@@ -930,7 +1172,7 @@ class CloudSettings(bpy.types.PropertyGroup):
         default=0.2,
         min=0.0,
         max=1.0,
-        update=update_cloud_add_shape_imperfection
+        update=cloud_update("add_shape_imperfection", update_cloud_add_shape_imperfection)
     )
 
     add_shape_imperfection_coords: bpy.props.FloatVectorProperty(
@@ -940,7 +1182,7 @@ class CloudSettings(bpy.types.PropertyGroup):
                     "it is used as a seed.",
         subtype="XYZ",
         default=(0.0, 0.0, 0.0),
-        update=update_cloud_add_shape_imperfection_coords
+        update=cloud_update("add_shape_imperfection_coords", update_cloud_add_shape_imperfection_coords)
     )
 
     add_shape_imperfection_simple_seed: bpy.props.FloatProperty(
@@ -948,7 +1190,7 @@ class CloudSettings(bpy.types.PropertyGroup):
         description="Sets the value of this property as the value of the " +
         "three mapping coordinates for add shape imperfection",
         default=0.0,
-        update=update_cloud_add_shape_imperfection_coords
+        update=cloud_update("add_shape_imperfection_simple_seed", update_cloud_add_shape_imperfection_coords)
     )
 
     subtract_shape_imperfection: bpy.props.FloatProperty(
@@ -958,7 +1200,7 @@ class CloudSettings(bpy.types.PropertyGroup):
         default=0.1,
         min=0.0,
         max=1.0,
-        update=update_cloud_subtract_shape_imperfection
+        update=cloud_update("subtract_shape_imperfection", update_cloud_subtract_shape_imperfection)
     )
 
     subtract_shape_imperfection_coords: bpy.props.FloatVectorProperty(
@@ -968,7 +1210,7 @@ class CloudSettings(bpy.types.PropertyGroup):
                     "it is used as a seed.",
         subtype="XYZ",
         default=(5.0, 5.0, 5.0),
-        update=update_cloud_subtract_shape_imperfection_coords
+        update=cloud_update("subtract_shape_imperfection_coords", update_cloud_subtract_shape_imperfection_coords)
     )
 
     subtract_shape_imperfection_simple_seed: bpy.props.FloatProperty(
@@ -976,7 +1218,7 @@ class CloudSettings(bpy.types.PropertyGroup):
         description="Sets the value of this property as the value of the " +
         "three mapping coordinates for subtract shape imperfection",
         default=0.0,
-        update=update_cloud_subtract_shape_imperfection_coords
+        update=cloud_update("subtract_shape_imperfection_simple_seed", update_cloud_subtract_shape_imperfection_coords)
     )
 
     detail_bump_strength: bpy.props.FloatProperty(
@@ -987,7 +1229,7 @@ class CloudSettings(bpy.types.PropertyGroup):
         default=0.2,
         min=0.0,
         max=1.0,
-        update=update_cloud_detail_bump_strength
+        update=cloud_update("detail_bump_strength", update_cloud_detail_bump_strength)
     )
 
     detail_bump_levels: bpy.props.IntProperty(
@@ -996,7 +1238,7 @@ class CloudSettings(bpy.types.PropertyGroup):
         default=3,
         min=1,
         max=3,
-        update=update_cloud_detail_bump_levels
+        update=cloud_update("detail_bump_levels", update_cloud_detail_bump_levels)
     )
 
     detail_wind_strength: bpy.props.FloatProperty(
@@ -1005,7 +1247,7 @@ class CloudSettings(bpy.types.PropertyGroup):
         default=0.5,
         min=0.0,
         max=1.0,
-        update=update_cloud_detail_wind_strength
+        update=cloud_update("detail_wind_strength", update_cloud_detail_wind_strength)
     )
 
     detail_noise: bpy.props.FloatProperty(
@@ -1014,7 +1256,7 @@ class CloudSettings(bpy.types.PropertyGroup):
         default=0.05,
         min=0.0,
         max=1.0,
-        update=update_cloud_detail_noise
+        update=cloud_update("detail_noise", update_cloud_detail_noise)
     )
 
     cleaner_domain_size: bpy.props.FloatProperty(
@@ -1024,7 +1266,7 @@ class CloudSettings(bpy.types.PropertyGroup):
         default=0.06,
         min=0.001,
         max=1.0,
-        update=update_cloud_cleaner_domain_size
+        update=cloud_update("cleaner_domain_size", update_cloud_cleaner_domain_size)
     )
 
     amount_of_clouds: bpy.props.FloatProperty(
@@ -1034,7 +1276,7 @@ class CloudSettings(bpy.types.PropertyGroup):
         default=0.4,
         min=0.0,
         max=1.0,
-        update=update_cloud_amount_of_clouds
+        update=cloud_update("amount_of_clouds", update_cloud_amount_of_clouds)
     )
 
     height_cloudscape: bpy.props.FloatProperty(
@@ -1043,7 +1285,7 @@ class CloudSettings(bpy.types.PropertyGroup):
         default=1.2,
         min=0.0,
         soft_max=10.0,
-        update=update_cloud_height_cloudscape
+        update=cloud_update("height_cloudscape", update_cloud_height_cloudscape)
     )
 
     bottom_softness_cloudscape: bpy.props.FloatProperty(
@@ -1052,7 +1294,7 @@ class CloudSettings(bpy.types.PropertyGroup):
         default=0.2,
         min=0.1,
         max=1.0,
-        update=update_cloud_cut_softness_cloudscape
+        update=cloud_update("bottom_softness_cloudscape", update_cloud_cut_softness_cloudscape)
     )
 
     top_softness_cloudscape: bpy.props.FloatProperty(
@@ -1061,7 +1303,7 @@ class CloudSettings(bpy.types.PropertyGroup):
         default=0.5,
         min=0.1,
         soft_max=1.0,
-        update=update_cloud_cut_softness_cloudscape
+        update=cloud_update("top_softness_cloudscape", update_cloud_cut_softness_cloudscape)
     )
 
     cloudscape_cloud_size: bpy.props.FloatProperty(
@@ -1070,7 +1312,7 @@ class CloudSettings(bpy.types.PropertyGroup):
         default=13.0,
         min=0.0,
         max=15.0,
-        update=update_cloud_cloudscape_cloud_size
+        update=cloud_update("cloudscape_cloud_size", update_cloud_cloudscape_cloud_size)
     )
 
     cloudscape_noise_coords: bpy.props.FloatVectorProperty(
@@ -1079,7 +1321,7 @@ class CloudSettings(bpy.types.PropertyGroup):
                     "Used as a seed for the noise that shapes the cloudscape",
         subtype="XYZ",
         default=(0.0, 0.0, 0.0),
-        update=update_cloud_cloudscape_noise_coords
+        update=cloud_update("cloudscape_noise_coords", update_cloud_cloudscape_noise_coords)
     )
 
     cloudscape_noise_simple_seed: bpy.props.FloatProperty(
@@ -1087,7 +1329,7 @@ class CloudSettings(bpy.types.PropertyGroup):
         description="Sets the value of this property as the value of the " +
         "three mapping coordinates for the cloudscape noise coordinates",
         default=0.0,
-        update=update_cloud_cloudscape_noise_coords
+        update=cloud_update("cloudscape_noise_simple_seed", update_cloud_cloudscape_noise_coords)
     )
 
     use_shape_texture: bpy.props.BoolProperty(
@@ -1095,14 +1337,14 @@ class CloudSettings(bpy.types.PropertyGroup):
         description="Indicates if a image texture is used to shape " +
         "the cloudscape",
         default=False,
-        update=update_cloud_use_shape_texture
+        update=cloud_update("use_shape_texture", update_cloud_use_shape_texture)
     )
 
     shape_texture_image: bpy.props.PointerProperty(
         name="Shape texture image",
         description="Image used to shape a cloud with a Image Texture",
         type=bpy.types.Image,
-        update=update_cloud_shape_texture_image
+        update=cloud_update("shape_texture_image", update_cloud_shape_texture_image)
     )
 
     cloudscape_cirrus_cirrus_amount: bpy.props.FloatProperty(
@@ -1111,7 +1353,7 @@ class CloudSettings(bpy.types.PropertyGroup):
         "density of cirrus clouds in the cloudscape",
         default=10.0,
         min=0.0,
-        update=update_cloud_cirrus
+        update=cloud_update("cloudscape_cirrus_cirrus_amount", update_cloud_cirrus)
     )
 
     cloudscape_cirrus_cirrus_width: bpy.props.FloatProperty(
@@ -1120,5 +1362,167 @@ class CloudSettings(bpy.types.PropertyGroup):
         default=0.5,
         min=0.0,
         max=1.0,
-        update=update_cloud_cirrus
+        update=cloud_update("cloudscape_cirrus_cirrus_width", update_cloud_cirrus)
+    )
+
+    layers: bpy.props.CollectionProperty(
+        name="Layers",
+        description="Layers of a layered cloudscape",
+        type=CloudLayerSettings
+    )
+
+    impostor: bpy.props.PointerProperty(
+        name="Impostor",
+        description="Billboard that replaces the cloud in renders when it is far from the camera",
+        type=bpy.types.Object
+    )
+
+
+class CloudSceneSettings(bpy.types.PropertyGroup):
+    """Custom properties of the scene for clouds
+
+    Attributes:
+        auto_volumetrics: Fit the EEVEE volumetric range and tile size to the
+            clouds seen by the camera on every frame change.
+
+        auto_step_rate: Set the Cycles volume step rate of every cloud material
+            from its detail and its distance to the camera on every frame change.
+
+        use_impostors: Replace the clouds far from the camera with their
+            impostor billboards on every frame change.
+
+        impostor_distance: Camera distance from which a cloud is replaced
+            with its impostor.
+
+        impostor_hysteresis: Relative band around impostor_distance where
+            clouds keep their current representation, so that they do not
+            switch back and forth between frames.
+
+        auto_lod: Set the detail level of every cloud material from its size
+            on screen on every frame change.
+
+        lod_budget: Maximum shader cost of the clouds, in clouds at full
+            detail. The farthest clouds are degraded first. 0 means no budget.
+
+        use_culling: Hide from the render the clouds outside the camera
+            frustum on every frame change and before every render.
+
+        culling_shadow_distance: Length of the shadows cast toward the sun
+            lamps that keep a cloud outside the frustum rendered.
+
+        auto_shadow_gobo: Bake again the cloud shadow gobo after frame
+            changes if its clouds, their settings or the sun changed. It is
+            not updated during playback or renders, animations are rendered
+            with a gobo baked for every frame.
+
+        stream_tiles: Keep only the cloudscape tiles within tile_radius of
+            the camera on every frame change.
+
+        tile_radius: Distance in XY from the camera to the center of the
+            cloudscape tiles that are rendered.
+
+        compact_save: Save the clouds without their materials, which are
+            built again from the cloud settings when the file is loaded.
+    """
+
+    auto_volumetrics: bpy.props.BoolProperty(
+        name="Auto volumetrics",
+        description="Fit the EEVEE volumetric range and tile size to the " +
+                    "clouds seen by the camera on every frame change",
+        default=False
+    )
+
+    auto_step_rate: bpy.props.BoolProperty(
+        name="Auto step rate",
+        description="Set the Cycles volume step rate of every cloud material " +
+                    "from its detail and its distance to the camera on every frame change",
+        default=False
+    )
+
+    use_impostors: bpy.props.BoolProperty(
+        name="Use impostors",
+        description="Replace the clouds far from the camera with their " +
+                    "impostor billboards on every frame change",
+        default=False
+    )
+
+    impostor_distance: bpy.props.FloatProperty(
+        name="Impostor distance",
+        description="Camera distance from which a cloud is replaced with its impostor",
+        default=2000.0,
+        min=0.0,
+        subtype="DISTANCE"
+    )
+
+    impostor_hysteresis: bpy.props.FloatProperty(
+        name="Impostor hysteresis",
+        description="Relative band around the impostor distance where clouds " +
+                    "keep their current representation",
+        default=0.1,
+        min=0.0,
+        max=0.9,
+        subtype="FACTOR"
+    )
+
+    auto_lod: bpy.props.BoolProperty(
+        name="Auto detail level",
+        description="Set the detail level of every cloud material from its " +
+                    "size on screen on every frame change",
+        default=False
+    )
+
+    lod_budget: bpy.props.FloatProperty(
+        name="Detail budget",
+        description="Maximum shader cost of the clouds, in clouds at full detail. " +
+                    "The farthest clouds are degraded first. 0 means no budget",
+        default=0.0,
+        min=0.0
+    )
+
+    use_culling: bpy.props.BoolProperty(
+        name="Cull clouds",
+        description="Hide from the render the clouds outside the camera frustum " +
+                    "on every frame change and before every render",
+        default=False,
+        update=update_scene_use_culling
+    )
+
+    culling_shadow_distance: bpy.props.FloatProperty(
+        name="Shadow distance",
+        description="Length of the shadows cast toward the sun lamps that keep " +
+                    "a cloud outside the camera frustum rendered",
+        default=5000.0,
+        min=0.0,
+        subtype="DISTANCE"
+    )
+
+    auto_shadow_gobo: bpy.props.BoolProperty(
+        name="Auto shadow gobo",
+        description="Bake again the cloud shadow gobo after frame changes if " +
+                    "its clouds, their settings or the sun changed. " +
+                    "Not during playback or renders",
+        default=False
+    )
+
+    stream_tiles: bpy.props.BoolProperty(
+        name="Stream tiles",
+        description="Keep only the cloudscape tiles within the tile radius " +
+                    "of the camera on every frame change",
+        default=False
+    )
+
+    tile_radius: bpy.props.FloatProperty(
+        name="Tile radius",
+        description="Distance from the camera to the center of the cloudscape " +
+                    "tiles that are rendered",
+        default=3000.0,
+        min=0.0,
+        subtype="DISTANCE"
+    )
+
+    compact_save: bpy.props.BoolProperty(
+        name="Compact save",
+        description="Save the clouds without their materials, which are built " +
+                    "again from the cloud settings when the file is loaded",
+        default=False
     )
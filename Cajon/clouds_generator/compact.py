@@ -0,0 +1,221 @@
+"""
+    compact.py is part of Cloud Generator Blender Addon.
+
+    Foobar is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import time
+
+import bpy
+from bpy.app.handlers import persistent
+
+from . import materials
+from . import migration
+from . import pool
+from . import tiles
+
+PLACEHOLDER_NAME = "CloudCompact_CG"
+
+# Custom property of the clouds saved without material, with the name of
+# the material, shared by the clouds that used the same one.
+COMPACT_PROPERTY = "cloud_compact_material"
+
+# Time spent rebuilding materials on every call of the rebuild timer.
+REBUILD_STEP_TIME = 0.05
+
+# (object, material) of the clouds whose material is not being saved.
+_stripped = []
+
+# Names of the clouds loaded without material, in rebuild order.
+_pending = []
+
+# Rebuilt materials by the name of the material they replace.
+_rebuilt = {}
+
+
+def placeholder_material():
+    """Empty volume material used by the clouds while they are saved or rebuilt."""
+
+    mat = bpy.data.materials.get(PLACEHOLDER_NAME)
+    if mat is None:
+        mat = bpy.data.materials.new(PLACEHOLDER_NAME)
+        mat.use_nodes = True
+        nodes = mat.node_tree.nodes
+        for node in list(nodes):
+            nodes.remove(node)
+        volume = nodes.new(type="ShaderNodeVolumePrincipled")
+        volume.inputs["Density"].default_value = 0.0
+        output = nodes.new(type="ShaderNodeOutputMaterial")
+        output.location = (300, 0)
+        mat.node_tree.links.new(volume.outputs["Volume"], output.inputs["Volume"])
+    return mat
+
+
+def compactable_clouds(scene):
+    """Clouds of the scene whose material can be rebuilt from their settings.
+
+    Returns a dict with the clouds of every material. Materials used by
+    anything else, streamed tiles and materials with nodes added by other
+    tools are not included.
+    """
+
+    clouds = {}
+    for obj in scene.objects:
+        mat = obj.active_material
+        if (not obj.cloud_settings.is_cloud or obj.get(tiles.POOL_PROPERTY, False) or mat is None
+                or not mat.name.startswith(pool.MATERIAL_NAME)
+                or obj.cloud_settings.cloud_type not in materials.INITIAL_SHAPES):
+            continue
+        clouds.setdefault(mat, []).append(obj)
+    return {mat: objects for mat, objects in clouds.items()
+            if mat.users == len(objects) and not mat.use_fake_user
+            and not any(migration.is_preserved(node) for node in mat.node_tree.nodes)}
+
+
+def strip_materials(scene):
+    """Replaces the materials of the clouds by the placeholder until restore_materials.
+
+    Without users, the materials are not written in the file.
+    """
+
+    placeholder = placeholder_material()
+    for mat, objects in compactable_clouds(scene).items():
+        for obj in objects:
+            obj[COMPACT_PROPERTY] = mat.name
+            obj.active_material = placeholder
+            _stripped.append((obj, mat))
+
+
+def restore_materials():
+    """Gives back to the clouds the materials removed by strip_materials."""
+
+    for obj, mat in _stripped:
+        obj.active_material = mat
+        del obj[COMPACT_PROPERTY]
+    _stripped.clear()
+
+
+def _rebuild_order(context, names):
+    """Visible clouds first, nearest to the camera first."""
+
+    camera = context.scene.camera
+    clouds = [bpy.data.objects[name] for name in names if name in bpy.data.objects]
+
+    def key(obj):
+        distance = 0.0
+        if camera is not None:
+            distance = (obj.matrix_world.translation - camera.matrix_world.translation).length
+        return (obj.hide_render or obj.hide_viewport, distance)
+
+    return [obj.name for obj in sorted(clouds, key=key)]
+
+
+def rebuild_material(context, obj):
+    """Builds again the material of a cloud saved without it.
+
+    The node graph is built from the cloud settings (see
+    materials.build_material_from_settings). Clouds that shared a material
+    share the rebuilt one.
+    """
+
+    key = obj[COMPACT_PROPERTY]
+    mat = _rebuilt.get(key)
+    if mat is not None:
+        obj.active_material = mat
+        del obj[COMPACT_PROPERTY]
+        return mat
+
+    mat = pool.take_material()
+    if mat is None:
+        mat = bpy.data.materials.new(pool.MATERIAL_NAME)
+        mat.use_nodes = True
+        for node in list(mat.node_tree.nodes):
+            mat.node_tree.nodes.remove(node)
+    mat.name = key
+    materials.build_material_from_settings(context, obj, mat)
+    del obj[COMPACT_PROPERTY]
+    _rebuilt[key] = mat
+    return mat
+
+
+def rebuild_pending(context, time_limit=None):
+    """Rebuilds the materials of the clouds loaded without them.
+
+    time_limit: seconds after which the rest are left for a later call.
+        All of them are rebuilt if it is None.
+
+    Returns the number of clouds still pending.
+    """
+
+    start = time.perf_counter()
+    while _pending:
+        obj = bpy.data.objects.get(_pending.pop(0))
+        if obj is not None and COMPACT_PROPERTY in obj:
+            rebuild_material(context, obj)
+        if time_limit is not None and time.perf_counter() - start >= time_limit:
+            break
+    if not _pending:
+        _rebuilt.clear()
+    return len(_pending)
+
+
+def _rebuild_timer():
+    """Timer that rebuilds the pending materials a few at a time."""
+
+    if rebuild_pending(bpy.context, REBUILD_STEP_TIME):
+        return 0.0
+    return None
+
+
+@persistent
+def compact_save_handler(_scene):
+    """Save handler that strips the cloud materials of the scenes in compact save mode."""
+
+    for scene in bpy.data.scenes:
+        if scene.cloud_scene_settings.compact_save:
+            strip_materials(scene)
+
+
+@persistent
+def compact_save_post_handler(_scene):
+    """Save handler that gives back the stripped materials once the file is written."""
+
+    restore_materials()
+
+
+@persistent
+def compact_load_handler(_scene):
+    """Load handler that queues the clouds saved without material.
+
+    They are rebuilt in the background, or all at once if a render starts
+    before.
+    """
+
+    _rebuilt.clear()
+    names = [obj.name for obj in bpy.data.objects if COMPACT_PROPERTY in obj]
+    _pending[:] = _rebuild_order(bpy.context, names)
+    if _pending and not bpy.app.timers.is_registered(_rebuild_timer):
+        bpy.app.timers.register(_rebuild_timer, first_interval=0.0)
+
+
+@persistent
+def compact_render_handler(scene, depsgraph=None):
+    """Render handler that rebuilds the pending materials before rendering."""
+
+    if _pending:
+        rebuild_pending(bpy.context)
+
+
+def unregister():
+    if bpy.app.timers.is_registered(_rebuild_timer):
+        bpy.app.timers.unregister(_rebuild_timer)
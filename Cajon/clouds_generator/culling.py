@@ -0,0 +1,139 @@
+"""
+    culling.py is part of Cloud Generator Blender Addon.
+
+    Foobar is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import bpy
+from bpy.app.handlers import persistent
+from mathutils import Vector
+
+from . import camera_geometry
+from . import merge
+from . import sky_bake
+
+# Custom property of the clouds hidden by the culling, so that only they
+# are shown again.
+CULLED_PROPERTY = "cloud_culled"
+
+
+def sun_directions(scene):
+    """Direction of the light of every sun lamp rendered in the scene."""
+
+    directions = []
+    for obj in scene.objects:
+        if obj.type == 'LIGHT' and obj.data.type == 'SUN' and not obj.hide_render:
+            # Sun lamps shine along their local -Z axis.
+            directions.append((obj.matrix_world.to_3x3() @ Vector((0.0, 0.0, -1.0))).normalized())
+    return directions
+
+
+def shadow_volume(corners, directions, distance):
+    """Points whose convex hull contains a box and the shadows it casts.
+
+    corners: world space corners of the box.
+    directions: directions of the light of the sun lamps.
+    distance: length of the shadows.
+    """
+
+    points = list(corners)
+    for direction in directions:
+        points.extend(corner + direction * distance for corner in corners)
+    return points
+
+
+def cloud_visible(view_projection, obj, directions, shadow_distance):
+    """Whether a cloud or its shadows can be inside the camera frustum."""
+
+    corners = camera_geometry.domain_corners(obj.matrix_world, obj.bound_box)
+    return not camera_geometry.outside_frustum(view_projection,
+                                               shadow_volume(corners, directions, shadow_distance))
+
+
+def _is_replaced_by_impostor(obj):
+    impostor = obj.cloud_settings.impostor
+    return impostor is not None and not impostor.hide_render
+
+
+def culling_candidates(scene):
+    """Clouds of the scene rendered or hidden by the culling.
+
+    Clouds hidden by the user, replaced by their impostor, merged (see
+    merge.merge_clouds) or baked in the sky are left as they are.
+    """
+
+    return [obj for obj in scene.objects
+            if obj.cloud_settings.is_cloud and not _is_replaced_by_impostor(obj)
+            and merge.MERGED_INTO_PROPERTY not in obj and not obj.get(sky_bake.BAKED_PROPERTY, False)
+            and (not obj.hide_render or obj.get(CULLED_PROPERTY, False))]
+
+
+def set_culled(obj, culled):
+    if obj.hide_render != culled:
+        obj.hide_render = culled
+    if culled:
+        obj[CULLED_PROPERTY] = True
+    elif CULLED_PROPERTY in obj:
+        del obj[CULLED_PROPERTY]
+
+
+def cull_clouds(scene, depsgraph):
+    """Hides from the render the clouds outside the camera frustum.
+
+    A cloud is kept if its domain or the shadow it casts toward the sun
+    lamps, up to the culling shadow distance of the scene, can be inside
+    the frustum of the scene camera.
+
+    Returns (visible, culled) numbers of clouds, or None without a camera.
+    """
+
+    camera = scene.camera
+    if camera is None:
+        return None
+    resolution = camera_geometry.render_resolution(scene.render)
+    view_matrix, projection_matrix = camera_geometry.camera_matrices(camera, depsgraph, resolution, scene.render)
+    view_projection = projection_matrix @ view_matrix
+    directions = sun_directions(scene)
+    shadow_distance = scene.cloud_scene_settings.culling_shadow_distance
+
+    visible = 0
+    culled = 0
+    for obj in culling_candidates(scene):
+        if cloud_visible(view_projection, obj, directions, shadow_distance):
+            set_culled(obj, False)
+            visible += 1
+        else:
+            set_culled(obj, True)
+            culled += 1
+    return visible, culled
+
+
+def restore_culled(scene):
+    """Renders again every cloud hidden by the culling."""
+
+    for obj in scene.objects:
+        if obj.get(CULLED_PROPERTY, False):
+            if _is_replaced_by_impostor(obj):
+                del obj[CULLED_PROPERTY]
+            else:
+                set_culled(obj, False)
+
+
+@persistent
+def culling_handler(scene, depsgraph=None):
+    """Frame change and render handler that culls the clouds if it is enabled in the scene."""
+
+    if scene.cloud_scene_settings.use_culling:
+        if depsgraph is None:
+            depsgraph = bpy.context.evaluated_depsgraph_get()
+        cull_clouds(scene, depsgraph)
@@ -0,0 +1,229 @@
+"""
+    density.py is part of Cloud Generator Blender Addon.
+
+    Foobar is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import math
+import os
+import tempfile
+
+import bpy
+import numpy as np
+from mathutils import Vector
+
+# Mesh attribute with the local coordinates of the cloud sampled by a slice.
+COORDS_ATTRIBUTE = "cloud_coords"
+
+# Generic mesh attributes, read by the Attribute node of the sampling
+# material, were added in Blender 2.92.
+MIN_BLENDER_VERSION = (2, 92, 0)
+UNSUPPORTED_MESSAGE = "Sampling the cloud density needs Blender 2.92 or later"
+
+
+def is_supported():
+    """Whether this version of Blender can sample the density of the clouds (see sample_density)."""
+
+    return bpy.app.version >= MIN_BLENDER_VERSION
+
+
+def local_bounds(obj):
+    """(min corner, max corner) of the local bounding box of an object."""
+
+    corners = [Vector(corner) for corner in obj.bound_box]
+    return (Vector((min(c.x for c in corners), min(c.y for c in corners), min(c.z for c in corners))),
+            Vector((max(c.x for c in corners), max(c.y for c in corners), max(c.z for c in corners))))
+
+
+def grid_shape(dimensions, resolution):
+    """Voxels (nx, ny, nz) of a grid with cubic voxels over a box.
+
+    resolution: voxels along the biggest side of the box.
+    """
+
+    largest = max(dimensions)
+    return tuple(max(1, int(round(resolution * size / largest))) for size in dimensions)
+
+
+def atlas_layout(slices):
+    """(columns, rows) of a 2D atlas that holds the given number of slices."""
+
+    columns = max(1, math.ceil(math.sqrt(slices)))
+    return columns, max(1, math.ceil(slices / columns))
+
+
+def grid_to_atlas(grid, columns, rows):
+    """Lays the Z slices of a (nz, ny, nx, ...) grid side by side, in rows from the bottom."""
+
+    nz, ny, nx = grid.shape[:3]
+    atlas = np.zeros((rows * ny, columns * nx) + grid.shape[3:], dtype=grid.dtype)
+    for z in range(nz):
+        x = (z % columns) * nx
+        y = (z // columns) * ny
+        atlas[y:y + ny, x:x + nx] = grid[z]
+    return atlas
+
+
+def atlas_to_grid(atlas, shape, columns):
+    """Inverse of grid_to_atlas. shape: (nx, ny, nz) of the grid."""
+
+    nx, ny, nz = shape
+    grid = np.empty((nz, ny, nx) + atlas.shape[2:], dtype=atlas.dtype)
+    for z in range(nz):
+        x = (z % columns) * nx
+        y = (z // columns) * ny
+        grid[z] = atlas[y:y + ny, x:x + nx]
+    return grid
+
+
+def slice_mesh(bounds, shape, columns):
+    """Mesh with a quad per Z slice of the grid, laid out as an atlas.
+
+    Every quad covers nx by ny units, one unit per voxel, and its points
+    store the local coordinates of the cloud they sample in COORDS_ATTRIBUTE.
+    """
+
+    minimum, maximum = bounds
+    nx, ny, nz = shape
+    size = maximum - minimum
+    vertices = []
+    faces = []
+    coords = []
+    for z in range(nz):
+        x = (z % columns) * nx
+        y = (z // columns) * ny
+        local_z = minimum.z + (z + 0.5) / nz * size.z
+        first = len(vertices)
+        vertices.extend([(x, y, 0.0), (x + nx, y, 0.0), (x + nx, y + ny, 0.0), (x, y + ny, 0.0)])
+        faces.append((first, first + 1, first + 2, first + 3))
+        coords.extend([(minimum.x, minimum.y, local_z), (maximum.x, minimum.y, local_z),
+                       (maximum.x, maximum.y, local_z), (minimum.x, maximum.y, local_z)])
+
+    mesh = bpy.data.meshes.new("Cloud density slices")
+    mesh.from_pydata(vertices, [], faces)
+    attribute = mesh.attributes.new(COORDS_ATTRIBUTE, 'FLOAT_VECTOR', 'POINT')
+    attribute.data.foreach_set("vector", [value for coord in coords for value in coord])
+    return mesh
+
+
+def density_material(material, bounds):
+    """Copy of a cloud material that emits its density on the slice quads.
+
+    The Object and Generated coordinates of the cloud are replaced with
+    the coordinates stored in the slices, and the density of the volume
+    is emitted by the surface.
+    """
+
+    copy = material.copy()
+    nodes = copy.node_tree.nodes
+    links = copy.node_tree.links
+    minimum, maximum = bounds
+    size = maximum - minimum
+
+    for node in [node for node in nodes if node.type == 'TEX_COORD']:
+        attribute = nodes.new(type="ShaderNodeAttribute")
+        attribute.attribute_name = COORDS_ATTRIBUTE
+        for link in list(node.outputs["Object"].links):
+            links.new(attribute.outputs["Vector"], link.to_socket)
+        if node.outputs["Generated"].is_linked:
+            generated = nodes.new(type="ShaderNodeMapping")
+            generated.vector_type = 'POINT'
+            generated.inputs["Scale"].default_value = (1 / size.x, 1 / size.y, 1 / size.z)
+            generated.inputs["Location"].default_value = (-minimum.x / size.x, -minimum.y / size.y,
+                                                          -minimum.z / size.z)
+            links.new(attribute.outputs["Vector"], generated.inputs["Vector"])
+            for link in list(node.outputs["Generated"].links):
+                links.new(generated.outputs["Vector"], link.to_socket)
+
+    output = nodes["Cloud Output"]
+    for link in list(output.inputs["Volume"].links):
+        links.remove(link)
+    emission = nodes.new(type="ShaderNodeEmission")
+    links.new(nodes["ColorRamp - Cloud Density"].outputs["Color"], emission.inputs["Color"])
+    links.new(emission.outputs["Emission"], output.inputs["Surface"])
+    return copy
+
+
+def sample_density(obj, resolution=64, frame=None):
+    """Density of the volume of a cloud in a grid of cubic voxels over its domain.
+
+    The cloud material is evaluated by Cycles at the center of every voxel:
+    all the Z slices are rendered at once, with one sample per pixel, as
+    the emission of quads laid out as an atlas (see slice_mesh).
+
+    resolution: voxels along the biggest side of the domain.
+    frame: frame where the animation of the material is evaluated.
+
+    Returns a float32 array (nz, ny, nx) with the density of the material.
+    """
+
+    if not is_supported():
+        raise RuntimeError(UNSUPPORTED_MESSAGE)
+
+    material = obj.active_material
+    bounds = local_bounds(obj)
+    shape = grid_shape(obj.dimensions, resolution)
+    columns, rows = atlas_layout(shape[2])
+    width, height = columns * shape[0], rows * shape[1]
+
+    scene = bpy.data.scenes.new("Cloud density sampling")
+    if frame is not None:
+        scene.frame_current = frame
+    mesh = slice_mesh(bounds, shape, columns)
+    slices = bpy.data.objects.new("Cloud density slices", mesh)
+    sampling_material = density_material(material, bounds)
+    mesh.materials.append(sampling_material)
+    scene.collection.objects.link(slices)
+
+    camera_data = bpy.data.cameras.new("Cloud density camera")
+    camera_data.type = 'ORTHO'
+    camera_data.ortho_scale = max(width, height)
+    camera = bpy.data.objects.new("Cloud density camera", camera_data)
+    camera.location = (width / 2, height / 2, 10.0)
+    scene.collection.objects.link(camera)
+    scene.camera = camera
+
+    scene.render.engine = 'CYCLES'
+    scene.render.resolution_x = width
+    scene.render.resolution_y = height
+    scene.render.resolution_percentage = 100
+    scene.render.image_settings.file_format = 'OPEN_EXR'
+    scene.render.image_settings.color_mode = 'RGB'
+    scene.view_settings.view_transform = 'Standard'
+    scene.cycles.device = 'CPU'
+    scene.cycles.samples = 1
+    scene.cycles.use_denoising = False
+    scene.cycles.pixel_filter_type = 'BOX'
+    scene.cycles.filter_width = 0.01
+
+    filepath = os.path.join(tempfile.mkdtemp(prefix="cloud_density_"), "density.exr")
+    scene.render.filepath = filepath
+    try:
+        bpy.ops.render.render(write_still=True, scene=scene.name)
+        image = bpy.data.images.load(filepath)
+        pixels = np.empty(len(image.pixels), dtype=np.float32)
+        image.pixels.foreach_get(pixels)
+        bpy.data.images.remove(image)
+    finally:
+        bpy.data.scenes.remove(scene)
+        bpy.data.objects.remove(slices)
+        bpy.data.meshes.remove(mesh)
+        bpy.data.materials.remove(sampling_material)
+        bpy.data.objects.remove(camera)
+        bpy.data.cameras.remove(camera_data)
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        os.rmdir(os.path.dirname(filepath))
+
+    atlas = pixels.reshape((height, width, 4))[:, :, 0]
+    return atlas_to_grid(atlas, shape, columns)
@@ -0,0 +1,534 @@
+"""
+    impostors.py is part of Cloud Generator Blender Addon.
+
+    Foobar is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import math
+import os
+import tempfile
+import time
+
+import bpy
+import numpy as np
+from bpy.app.handlers import persistent
+from mathutils import Vector
+
+from . import camera_geometry
+from . import merge
+from . import sky_bake
+from .cloud_settings import cloud_settings_to_dict
+
+ATLAS_NAME = "CloudImpostorAtlas_CG"
+MATERIAL_NAME = "CloudImpostorMaterial_CG"
+MESH_NAME = "CloudImpostorPlane_CG"
+COLLECTION_NAME = "Cloud impostors"
+REPORT_NAME = "Cloud impostors"
+
+# Custom properties of the atlas image and of the impostor objects.
+ATLAS_COLUMNS = "impostor_columns"
+ATLAS_ROWS = "impostor_rows"
+ATLAS_BAKE_TIME = "impostor_bake_time"
+ATLAS_SCALE = "impostor_scale"
+AZIMUTHS = "impostor_azimuths"
+FIRST_CELL = "impostor_first_cell"
+
+CELL_MAPPING_NODE = "Impostor cell mapping"
+
+
+def cloud_center(obj):
+    """World space center of the domain of a cloud."""
+
+    corners = camera_geometry.domain_corners(obj.matrix_world, obj.bound_box)
+    return sum(corners, Vector()) / len(corners)
+
+
+def sprite_world_size(dimensions):
+    """Side of the square sprite that contains a domain seen from any azimuth."""
+
+    return max(math.hypot(dimensions[0], dimensions[1]), dimensions[2])
+
+
+def variation_key(obj):
+    """Clouds with the same key look the same and share their sprites."""
+
+    settings = tuple(sorted(cloud_settings_to_dict(obj.cloud_settings).items()))
+    dimensions = tuple(round(value, 3) for value in obj.dimensions)
+    return settings, dimensions
+
+
+def camera_azimuth(center, camera_location):
+    """Azimuth of the camera seen from the center of a cloud.
+
+    Azimuth 0 is a camera on the -Y side looking along +Y, it grows
+    counterclockwise seen from above.
+    """
+
+    direction = camera_location - center
+    return math.atan2(direction.x, -direction.y)
+
+
+def azimuth_index(azimuth, azimuths):
+    """Sprite rendered from the nearest of azimuths angles evenly spaced."""
+
+    return int(round(azimuth / (2 * math.pi / azimuths))) % azimuths
+
+
+def atlas_layout(cells):
+    """(columns, rows) of an atlas that holds the given number of sprites."""
+
+    columns = max(1, math.ceil(math.sqrt(cells)))
+    return columns, max(1, math.ceil(cells / columns))
+
+
+def cell_offset(cell, columns, rows):
+    """UV coordinates of the lower left corner of a cell of the atlas."""
+
+    return (cell % columns) / columns, (cell // columns) / rows
+
+
+def switch_state(distance, threshold, hysteresis, active):
+    """Whether a cloud at distance from the camera is drawn with its impostor.
+
+    Inside the band threshold * (1 +- hysteresis) the current state is kept.
+    """
+
+    if distance > threshold * (1.0 + hysteresis):
+        return True
+    if distance < threshold * (1.0 - hysteresis):
+        return False
+    return active
+
+
+def scene_clouds(scene):
+    """Clouds of the scene, also the ones currently replaced by an impostor."""
+
+    return [obj for obj in scene.objects if obj.cloud_settings.is_cloud]
+
+
+def impostor_clouds(scene):
+    """Clouds of the scene that have an impostor.
+
+    Clouds merged (see merge.merge_clouds) or baked in the sky are left
+    hidden.
+    """
+
+    return [obj for obj in scene_clouds(scene)
+            if obj.cloud_settings.impostor is not None and merge.MERGED_INTO_PROPERTY not in obj
+            and not obj.get(sky_bake.BAKED_PROPERTY, False)]
+
+
+def is_impostor_active(obj):
+    impostor = obj.cloud_settings.impostor
+    return impostor is not None and not impostor.hide_render
+
+
+def set_impostor_active(obj, active):
+    """Renders a cloud with its impostor or with its volume.
+
+    The impostor switching takes over the hide_render of the cloud.
+    """
+
+    impostor = obj.cloud_settings.impostor
+    if impostor is None:
+        return
+    if impostor.hide_render == active:
+        impostor.hide_render = not active
+    if obj.hide_render != active:
+        obj.hide_render = active
+
+
+def _render_sprite(scene, filepath, size):
+    """Renders the scene to filepath and returns its RGBA pixels as (size, size, 4)."""
+
+    bpy.ops.render.render(write_still=True, scene=scene.name)
+    image = bpy.data.images.load(filepath)
+    pixels = np.empty(len(image.pixels), dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    bpy.data.images.remove(image)
+    return pixels.reshape((size, size, 4))
+
+
+def render_sprites(context, clouds, azimuths, sprite_size, samples):
+    """Renders every cloud alone from azimuths angles around it with CPU Cycles.
+
+    The clouds are rendered in a temporary scene with the world and lights
+    of the scene and a transparent film, with an orthographic camera that
+    frames the domain from every side.
+
+    Returns a list with the (sprite_size, sprite_size, 4) sprites of every cloud.
+    """
+
+    scene = bpy.data.scenes.new("Cloud impostor bake")
+    camera_data = bpy.data.cameras.new("Cloud impostor camera")
+    camera_data.type = 'ORTHO'
+    camera = bpy.data.objects.new("Cloud impostor camera", camera_data)
+    scene.collection.objects.link(camera)
+    scene.camera = camera
+    scene.render.engine = 'CYCLES'
+    scene.render.film_transparent = True
+    scene.render.resolution_x = sprite_size
+    scene.render.resolution_y = sprite_size
+    scene.render.resolution_percentage = 100
+    scene.render.image_settings.file_format = 'OPEN_EXR'
+    scene.render.image_settings.color_mode = 'RGBA'
+    scene.cycles.device = 'CPU'
+    scene.cycles.samples = samples
+    scene.cycles.volume_step_rate = context.scene.cycles.volume_step_rate
+    scene.cycles.volume_max_steps = context.scene.cycles.volume_max_steps
+    scene.cycles.volume_bounces = context.scene.cycles.volume_bounces
+    if context.scene.world is not None:
+        scene.world = context.scene.world
+    lights = [obj for obj in context.scene.objects if obj.type == 'LIGHT' and not obj.hide_render]
+    for light in lights:
+        scene.collection.objects.link(light)
+
+    filepath = os.path.join(tempfile.mkdtemp(prefix="cloud_impostors_"), "sprite.exr")
+    scene.render.filepath = filepath
+
+    sprites = []
+    try:
+        for obj in clouds:
+            center = cloud_center(obj)
+            size = sprite_world_size(obj.dimensions)
+            camera_data.ortho_scale = size
+            camera_data.clip_end = size * 4
+            scene.collection.objects.link(obj)
+            try:
+                cloud_sprites = []
+                for index in range(azimuths):
+                    azimuth = 2 * math.pi * index / azimuths
+                    camera.location = center + Vector((math.sin(azimuth), -math.cos(azimuth), 0.0)) * size * 2
+                    camera.rotation_euler = (math.pi / 2, 0.0, azimuth)
+                    cloud_sprites.append(_render_sprite(scene, filepath, sprite_size))
+                sprites.append(cloud_sprites)
+            finally:
+                scene.collection.objects.unlink(obj)
+    finally:
+        bpy.data.scenes.remove(scene)
+        bpy.data.objects.remove(camera)
+        bpy.data.cameras.remove(camera_data)
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        os.rmdir(os.path.dirname(filepath))
+    return sprites
+
+
+def linear_to_srgb(color):
+    return np.where(color <= 0.0031308, color * 12.92, 1.055 * np.power(color, 1 / 2.4) - 0.055)
+
+
+def build_atlas(sprites, sprite_size):
+    """Packs the sprites in an 8 bit RGBA image, in rows from the bottom.
+
+    The premultiplied sprites are stored with straight alpha and sRGB
+    colors, divided by the brightest color of the atlas, which is kept in
+    ATLAS_SCALE to give them back their light.
+
+    Returns the image, packed into the blend file.
+    """
+
+    columns, rows = atlas_layout(len(sprites))
+    pixels = np.zeros((rows * sprite_size, columns * sprite_size, 4), dtype=np.float32)
+    for cell, sprite in enumerate(sprites):
+        x = (cell % columns) * sprite_size
+        y = (cell // columns) * sprite_size
+        pixels[y:y + sprite_size, x:x + sprite_size] = sprite
+
+    alpha = pixels[..., 3:]
+    color = np.where(alpha > 0.0, pixels[..., :3] / np.maximum(alpha, 1e-6), 0.0)
+    scale = max(float(color.max()), 1e-6)
+    pixels[..., :3] = linear_to_srgb(np.clip(color / scale, 0.0, 1.0))
+
+    image = bpy.data.images.new(ATLAS_NAME, columns * sprite_size, rows * sprite_size, alpha=True)
+    image.alpha_mode = 'STRAIGHT'
+    image.pixels.foreach_set(pixels.ravel())
+    image.pack()
+    image[ATLAS_COLUMNS] = columns
+    image[ATLAS_ROWS] = rows
+    image[ATLAS_SCALE] = scale
+    return image
+
+
+def _plane_mesh():
+    """Vertical unit plane facing -Y with UVs, shared by all the impostors."""
+
+    mesh = bpy.data.meshes.get(MESH_NAME)
+    if mesh is not None:
+        return mesh
+    mesh = bpy.data.meshes.new(MESH_NAME)
+    mesh.from_pydata([(-0.5, 0.0, -0.5), (0.5, 0.0, -0.5), (0.5, 0.0, 0.5), (-0.5, 0.0, 0.5)], [], [(0, 1, 2, 3)])
+    uv_layer = mesh.uv_layers.new(name="UVMap")
+    for loop_index, uv in enumerate(((0.0, 0.0), (1.0, 0.0), (1.0, 1.0), (0.0, 1.0))):
+        uv_layer.data[loop_index].uv = uv
+    return mesh
+
+
+def impostor_material(atlas):
+    """Material that shows a cell of the atlas as an unlit sprite.
+
+    The lighting is baked in the sprites, so the color is emitted and the
+    alpha mixes it with a transparent shader.
+    """
+
+    material = bpy.data.materials.new(MATERIAL_NAME)
+    material.use_nodes = True
+    material.blend_method = 'BLEND'
+    material.shadow_method = 'HASHED'
+    nodes = material.node_tree.nodes
+    links = material.node_tree.links
+    nodes.clear()
+
+    columns = atlas[ATLAS_COLUMNS]
+    rows = atlas[ATLAS_ROWS]
+
+    coordinates = nodes.new(type="ShaderNodeTexCoord")
+    coordinates.location = (-800, 0)
+    mapping = nodes.new(type="ShaderNodeMapping")
+    mapping.name = CELL_MAPPING_NODE
+    mapping.label = CELL_MAPPING_NODE
+    mapping.location = (-600, 0)
+    mapping.inputs["Scale"].default_value = (1 / columns, 1 / rows, 1.0)
+    texture = nodes.new(type="ShaderNodeTexImage")
+    texture.location = (-400, 0)
+    texture.image = atlas
+    texture.extension = 'CLIP'
+    emission = nodes.new(type="ShaderNodeEmission")
+    emission.location = (-150, -100)
+    emission.inputs["Strength"].default_value = atlas.get(ATLAS_SCALE, 1.0)
+    transparent = nodes.new(type="ShaderNodeBsdfTransparent")
+    transparent.location = (-150, 100)
+    mix = nodes.new(type="ShaderNodeMixShader")
+    mix.location = (50, 0)
+    output = nodes.new(type="ShaderNodeOutputMaterial")
+    output.location = (250, 0)
+
+    links.new(coordinates.outputs["UV"], mapping.inputs["Vector"])
+    links.new(mapping.outputs["Vector"], texture.inputs["Vector"])
+    links.new(texture.outputs["Color"], emission.inputs["Color"])
+    links.new(texture.outputs["Alpha"], mix.inputs["Fac"])
+    links.new(transparent.outputs["BSDF"], mix.inputs[1])
+    links.new(emission.outputs["Emission"], mix.inputs[2])
+    links.new(mix.outputs["Shader"], output.inputs["Surface"])
+    return material
+
+
+def impostor_atlas(impostor):
+    """Atlas image sampled by an impostor."""
+
+    mapping = impostor.active_material.node_tree.nodes[CELL_MAPPING_NODE]
+    return mapping.outputs["Vector"].links[0].to_node.image
+
+
+def set_impostor_cell(impostor, cell):
+    """Shows a cell of the atlas in an impostor."""
+
+    atlas = impostor_atlas(impostor)
+    offset = cell_offset(cell, atlas[ATLAS_COLUMNS], atlas[ATLAS_ROWS])
+    location = impostor.active_material.node_tree.nodes[CELL_MAPPING_NODE].inputs["Location"]
+    # The node stores float32 values, which are not equal to most offsets.
+    if any(abs(current - value) > 1e-6 for current, value in zip(location.default_value[:2], offset)):
+        location.default_value = (offset[0], offset[1], 0.0)
+
+
+def _impostor_collection(scene):
+    collection = bpy.data.collections.get(COLLECTION_NAME)
+    if collection is None:
+        collection = bpy.data.collections.new(COLLECTION_NAME)
+    if collection.name not in scene.collection.children:
+        scene.collection.children.link(collection)
+    return collection
+
+
+def create_impostor(scene, obj, atlas, first_cell, azimuths):
+    """Creates the billboard of a cloud.
+
+    The plane turns around its Z axis to face the scene camera, with a
+    Locked Track constraint, and it is hidden until the cloud switches.
+    """
+
+    impostor = bpy.data.objects.new(obj.name + " impostor", _plane_mesh())
+    impostor.data.materials.append(None)
+    impostor.material_slots[0].link = 'OBJECT'
+    impostor.material_slots[0].material = impostor_material(atlas)
+    size = sprite_world_size(obj.dimensions)
+    impostor.scale = (size, 1.0, size)
+    impostor.location = cloud_center(obj)
+    impostor[FIRST_CELL] = first_cell
+    impostor[AZIMUTHS] = azimuths
+    impostor.hide_render = True
+
+    constraint = impostor.constraints.new(type='LOCKED_TRACK')
+    constraint.track_axis = 'TRACK_NEGATIVE_Y'
+    constraint.lock_axis = 'LOCK_Z'
+    constraint.target = scene.camera
+
+    _impostor_collection(scene).objects.link(impostor)
+    obj.cloud_settings.impostor = impostor
+    set_impostor_cell(impostor, first_cell)
+    return impostor
+
+
+def remove_impostor(obj):
+    """Removes the impostor of a cloud and renders the cloud with its volume again."""
+
+    impostor = obj.cloud_settings.impostor
+    if impostor is None:
+        return
+    set_impostor_active(obj, False)
+    obj.cloud_settings.impostor = None
+    material = impostor.active_material
+    atlas = impostor_atlas(impostor) if material is not None else None
+    bpy.data.objects.remove(impostor)
+    if material is not None and material.users == 0:
+        bpy.data.materials.remove(material)
+    if atlas is not None and atlas.users == 0:
+        bpy.data.images.remove(atlas)
+
+
+def bake_impostors(context, clouds, azimuths=8, sprite_size=128, samples=32):
+    """Renders the sprites of the clouds into an atlas and creates their impostors.
+
+    Clouds that look the same (see variation_key), like the copies of a
+    seeded cloud, share their sprites. Previous impostors of the clouds are
+    replaced.
+
+    azimuths: number of sprites rendered around every cloud.
+    sprite_size: width and height of the sprites in pixels.
+    samples: Cycles samples of the sprites.
+
+    Returns the atlas image, or None if there are no clouds.
+    """
+
+    if not clouds:
+        return None
+    start = time.perf_counter()
+    for obj in clouds:
+        remove_impostor(obj)
+
+    variations = {}
+    for obj in clouds:
+        variations.setdefault(variation_key(obj), []).append(obj)
+    representatives = [group[0] for group in variations.values()]
+    sprites = render_sprites(context, representatives, azimuths, sprite_size, samples)
+
+    atlas = build_atlas([sprite for cloud_sprites in sprites for sprite in cloud_sprites], sprite_size)
+    for variation, group in enumerate(variations.values()):
+        for obj in group:
+            create_impostor(context.scene, obj, atlas, variation * azimuths, azimuths)
+    atlas[ATLAS_BAKE_TIME] = time.perf_counter() - start
+    return atlas
+
+
+def update_impostors(scene, hysteresis=None):
+    """Switches every cloud between its volume and its impostor from the camera distance.
+
+    The impostors are moved to the center of their clouds, turned to the
+    camera and show the sprite rendered from the nearest azimuth.
+
+    hysteresis: relative band around the switch distance, the one of the
+        scene settings if it is None.
+
+    Returns the number of clouds drawn with their impostor.
+    """
+
+    camera = scene.camera
+    if camera is None:
+        return 0
+    settings = scene.cloud_scene_settings
+    if hysteresis is None:
+        hysteresis = settings.impostor_hysteresis
+    camera_location = camera.matrix_world.translation
+
+    active_count = 0
+    for obj in impostor_clouds(scene):
+        impostor = obj.cloud_settings.impostor
+        center = cloud_center(obj)
+        active = switch_state((center - camera_location).length, settings.impostor_distance,
+                              hysteresis, is_impostor_active(obj))
+        set_impostor_active(obj, active)
+        if not active:
+            continue
+        active_count += 1
+        if (impostor.location - center).length > 1e-4:
+            impostor.location = center
+        constraint = impostor.constraints[0]
+        if constraint.target != camera:
+            constraint.target = camera
+        index = azimuth_index(camera_azimuth(center, camera_location), impostor[AZIMUTHS])
+        set_impostor_cell(impostor, impostor[FIRST_CELL] + index)
+    return active_count
+
+
+def _render_time():
+    start = time.perf_counter()
+    bpy.ops.render.render()
+    return time.perf_counter() - start
+
+
+def compare_render_times(context):
+    """Renders the frame with every cloud volumetric and with the impostors.
+
+    The switch distance of the scene is used without hysteresis. The state
+    of the clouds is restored afterwards and the times are written in the
+    "Cloud impostors" text.
+
+    Returns (volumetric time, impostor time, clouds drawn with impostors).
+    """
+
+    scene = context.scene
+    clouds = impostor_clouds(scene)
+    saved = [(obj, is_impostor_active(obj)) for obj in clouds]
+    try:
+        for obj in clouds:
+            set_impostor_active(obj, False)
+        volumetric_time = _render_time()
+        active_count = update_impostors(scene, hysteresis=0.0)
+        impostor_time = _render_time()
+    finally:
+        for obj, active in saved:
+            set_impostor_active(obj, active)
+
+    write_report(scene, clouds, volumetric_time, impostor_time, active_count)
+    return volumetric_time, impostor_time, active_count
+
+
+def write_report(scene, clouds, volumetric_time, impostor_time, active_count):
+    """Writes the render times with and without impostors in a text datablock."""
+
+    text = bpy.data.texts.get(REPORT_NAME)
+    if text is None:
+        text = bpy.data.texts.new(REPORT_NAME)
+    text.clear()
+    settings = scene.cloud_scene_settings
+    text.write("Frame {} with {} engine\n".format(scene.frame_current, scene.render.engine))
+    text.write("Switch distance: {:.1f}\n".format(settings.impostor_distance))
+    text.write("Clouds with impostor: {}. Drawn with impostor: {}\n\n".format(len(clouds), active_count))
+    text.write("All volumetric:\t{:.2f} s\n".format(volumetric_time))
+    text.write("With impostors:\t{:.2f} s\n".format(impostor_time))
+    if impostor_time > 0.0:
+        text.write("Speedup:\t{:.2f}x\n".format(volumetric_time / impostor_time))
+
+    for atlas in {impostor_atlas(obj.cloud_settings.impostor) for obj in clouds}:
+        if ATLAS_BAKE_TIME in atlas:
+            text.write("\nAtlas {} ({}x{}): baked in {:.1f} s\n".format(
+                atlas.name, atlas.size[0], atlas.size[1], atlas[ATLAS_BAKE_TIME]))
+    return text
+
+
+@persistent
+def impostor_frame_handler(scene, depsgraph=None):
+    """Frame change handler that switches the cloud impostors if it is enabled in the scene."""
+
+    if scene.cloud_scene_settings.use_impostors:
+        update_impostors(scene)
@@ -0,0 +1,193 @@
+"""
+    lod.py is part of Cloud Generator Blender Addon.
+
+    Foobar is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import bpy
+from bpy.app.handlers import persistent
+
+from . import volumetrics
+
+# Detail levels, from full detail to the cheapest one.
+#   bump_levels: maximum Voronoi bump levels, the cloud settings can use less.
+#   noise_octaves: maximum Detail of the detail noise, None keeps the full one.
+#   detail_noise, small_wind, bump: the branch is used or muted.
+LOD_LEVELS = (
+    {"bump_levels": 3, "noise_octaves": None, "detail_noise": True, "small_wind": True, "bump": True},
+    {"bump_levels": 2, "noise_octaves": 2.0, "detail_noise": True, "small_wind": True, "bump": True},
+    {"bump_levels": 1, "noise_octaves": 0.0, "detail_noise": False, "small_wind": False, "bump": True},
+    {"bump_levels": 1, "noise_octaves": 0.0, "detail_noise": False, "small_wind": False, "bump": False},
+)
+
+# Smallest size on screen (in pixels) of a cloud for every level but the last.
+LOD_PIXEL_SIZES = (400, 150, 40)
+
+# Approximate shader cost of every level relative to the full detail,
+# from the shader cost report of the default clouds.
+LOD_COSTS = (1.0, 0.7, 0.45, 0.35)
+
+# Detail of the detail noise before it was lowered, kept in the node.
+FULL_OCTAVES_PROPERTY = "lod_full_detail"
+
+# Inputs written by apply_level, by node name.
+LOD_INPUTS = {
+    "RGB Overlay - Bump level 2": ("Fac",),
+    "RGB Overlay - Bump level 3": ("Fac",),
+    "Noise Tex - Detail noise level 1": ("Detail",),
+}
+
+# Nodes muted by apply_level and the branch of LOD_LEVELS they belong to.
+LOD_MUTED_NODES = {
+    "RGB Overlay - Noise": "detail_noise",
+    "RGB Add - Small wind": "small_wind",
+    "RGB Multiply - Bump": "bump",
+}
+
+
+def screen_level(size):
+    """Detail level of a cloud that covers size pixels on screen."""
+
+    for level, min_size in enumerate(LOD_PIXEL_SIZES):
+        if size >= min_size:
+            return level
+    return len(LOD_LEVELS) - 1
+
+
+def apply_budget(levels, distances, budget):
+    """Degrades the farthest clouds first until the cost fits in the budget.
+
+    levels: detail level of every cloud, changed in place.
+    distances: camera distance of every cloud.
+    budget: maximum total cost, in clouds at full detail. 0 means no budget.
+
+    Returns the total cost of the levels.
+    """
+
+    total = sum(LOD_COSTS[level] for level in levels)
+    if budget <= 0.0:
+        return total
+    order = sorted(range(len(levels)), key=lambda i: distances[i], reverse=True)
+    for i in order:
+        while total > budget and levels[i] < len(LOD_LEVELS) - 1:
+            total += LOD_COSTS[levels[i] + 1] - LOD_COSTS[levels[i]]
+            levels[i] += 1
+        if total <= budget:
+            break
+    return total
+
+
+def _set_value(socket, value):
+    if socket.default_value != value:
+        socket.default_value = value
+
+
+def _set_mute(node, mute):
+    if node.mute != mute:
+        node.mute = mute
+
+
+def apply_level(obj, level):
+    """Sets the material nodes of a cloud to a detail level.
+
+    The cloud settings are not changed, the level only lowers them, so
+    level 0 gives back the detail of the settings. Only the values that
+    differ are written and no node is created or removed.
+
+    Returns False if the cloud has no cloud material.
+    """
+
+    material = obj.active_material
+    if material is None or "CloudMaterial_CG" not in material.name:
+        return False
+    nodes = material.node_tree.nodes
+    settings = LOD_LEVELS[level]
+
+    bump_levels = min(obj.cloud_settings.detail_bump_levels, settings["bump_levels"])
+    _set_value(nodes["RGB Overlay - Bump level 2"].inputs["Fac"], 1.0 if bump_levels >= 2 else 0.0)
+    _set_value(nodes["RGB Overlay - Bump level 3"].inputs["Fac"], 1.0 if bump_levels >= 3 else 0.0)
+
+    detail_noise = nodes["Noise Tex - Detail noise level 1"]
+    octaves = detail_noise.inputs["Detail"]
+    full_octaves = detail_noise.get(FULL_OCTAVES_PROPERTY)
+    if settings["noise_octaves"] is None:
+        if full_octaves is not None:
+            _set_value(octaves, full_octaves)
+            del detail_noise[FULL_OCTAVES_PROPERTY]
+    else:
+        if full_octaves is None:
+            full_octaves = detail_noise[FULL_OCTAVES_PROPERTY] = octaves.default_value
+        _set_value(octaves, min(full_octaves, settings["noise_octaves"]))
+
+    for name, branch in LOD_MUTED_NODES.items():
+        _set_mute(nodes[name], not settings[branch])
+    return True
+
+
+def update_levels(scene, depsgraph, clouds, budget=0.0):
+    """Sets the detail level of every cloud from its size on the scene camera.
+
+    Clouds outside the screen get the cheapest level. Then the budget
+    degrades the farthest clouds first. Without a scene camera every cloud
+    gets the full detail. A material shared by several clouds gets the
+    finest level of them.
+
+    Returns a dict cloud name: level.
+    """
+
+    if scene.camera is None:
+        levels = {obj: 0 for obj in clouds}
+    else:
+        levels = {obj: len(LOD_LEVELS) - 1 for obj in clouds}
+        distances = {obj: float("inf") for obj in clouds}
+        for obj, depths, size in volumetrics.cloud_screen_bounds(scene, depsgraph, clouds):
+            levels[obj] = screen_level(size)
+            distances[obj] = max(0.0, depths[0])
+        ordered = list(levels)
+        values = [levels[obj] for obj in ordered]
+        apply_budget(values, [distances[obj] for obj in ordered], budget)
+        levels = dict(zip(ordered, values))
+
+    material_levels = {}
+    for obj, level in levels.items():
+        material = obj.active_material
+        material_levels[material] = min(level, material_levels.get(material, level))
+
+    result = {}
+    applied = {}
+    for obj in levels:
+        material = obj.active_material
+        level = material_levels[material]
+        if material not in applied:
+            applied[material] = apply_level(obj, level)
+        if applied[material]:
+            result[obj.name] = level
+    return result
+
+
+def restore_full_detail(clouds):
+    """Gives every cloud the detail of its settings."""
+
+    for obj in clouds:
+        apply_level(obj, 0)
+
+
+@persistent
+def lod_frame_handler(scene, depsgraph=None):
+    """Frame change handler that sets the cloud detail levels if it is enabled in the scene."""
+
+    settings = scene.cloud_scene_settings
+    if settings.auto_lod:
+        if depsgraph is None:
+            depsgraph = bpy.context.evaluated_depsgraph_get()
+        update_levels(scene, depsgraph, volumetrics.scene_clouds(scene), settings.lod_budget)
@@ -17,7 +17,12 @@
 import bpy
 from mathutils import Vector
 from math import sin, cos, pi
-import random
+
+from . import pool
+from . import profiling
+from . import randomization
+from . import sharing
+from .cloud_settings import cloud_settings_to_dict, cloud_settings_from_dict, is_empty_layer
 
 
 def initial_shape_single_cumulus(pos_x, pos_y, texture_coordinate, cleaner_out, out_node, in_node, mat, obj):
@@ -770,93 +775,519 @@ def initial_shape_cloudscape_cirrus(pos_x, pos_y, texture_coordinate, cleaner_ou
                             mapping_cirrus_shape.inputs["Vector"])
 
 
-def generate_cloud(context, pos_x, pos_y, initial_shape):
+# Layers of a new layered cloudscape: (type, bottom, top, coverage). The
+# coverage of the cumulus layer is the amount of clouds of the cloud.
+DEFAULT_LAYERS = (
+    ("CUMULUS", 0.0, 1.0, None),
+    ("CIRRUS", 1.6, 1.8, 1.0),
+)
+
+# Vertical distance between the nodes of two layers in the node graph.
+LAYER_NODES_SPACING = 1800
+
+
+def default_layers(cloud_settings):
+    """Sets the layers of a layered cloudscape to a cumulus and a cirrus layer.
+
+    The seed of every layer is drawn from the seed of the cloud.
+    """
+
+    update_properties = cloud_settings.update_properties
+    cloud_settings.update_properties = False
+    cloud_settings.layers.clear()
+    seeds = randomization.layer_seeds(cloud_settings.seed, len(DEFAULT_LAYERS))
+    for (layer_type, bottom, top, coverage), seed in zip(DEFAULT_LAYERS, seeds):
+        layer = cloud_settings.layers.add()
+        layer.layer_type = layer_type
+        layer.bottom = bottom
+        layer.top = top
+        layer.coverage = cloud_settings.amount_of_clouds if coverage is None else coverage
+        layer.seed = seed
+    cloud_settings.update_properties = update_properties
+
+
+def cloudscape_layer(pos_x, pos_y, index, layer, in_node, frame, mat, obj):
+    """Builds the nodes of a layer of a layered cloudscape.
+
+    The height band of the layer is cut like in the cumulus cloudscape and
+    the noise of the layer, shaped like a cumulus or a cirrus cloudscape,
+    is subtracted from it.
+
+    pos_x: relative x position of nodes in the material node graph
+    pos_y: relative y position of nodes in the material node graph
+    index: index of the layer. The nodes are named after it
+    layer: settings of the layer
+    in_node: coordinates used for initial shape
+    frame: frame of the initial shape
+    mat: material. Used to access node_tree and insert connections and nodes
+    obj: cloud object that has the material applied
+
+    Returns the output socket with the shape of the layer.
+    """
+
+    mat_nodes = mat.node_tree.nodes  # Fast access to nodes
+    name = "Layer {} - ".format(index)
+
+    # RGB Subtract - Band
+    band = mat_nodes.new("ShaderNodeMixRGB")
+    band.parent = frame
+    band.name = name + "Band"
+    band.label = name + "Band"
+    band.location = (pos_x + 700, pos_y)
+    band.blend_type = "SUBTRACT"
+    band.inputs["Fac"].default_value = 1.0
+
+    sides = (("Bottom", layer.bottom, obj.cloud_settings.bottom_softness_cloudscape, "Color1", 0),
+             ("Top", layer.top, obj.cloud_settings.top_softness_cloudscape, "Color2", -400))
+    for side, height, softness, socket, offset in sides:
+        # Color Ramp - Band side
+        color_ramp_side = mat_nodes.new("ShaderNodeValToRGB")
+        color_ramp_side.parent = frame
+        color_ramp_side.name = name + "ColorRamp " + side
+        color_ramp_side.label = name + "ColorRamp " + side
+        color_ramp_side.location = (pos_x + 400, pos_y + offset)
+        color_ramp_side.color_ramp.interpolation = 'LINEAR'
+        elem = color_ramp_side.color_ramp.elements[0]
+        elem.position = 0.0
+        elem.color = (0, 0, 0, 1)
+        elem = color_ramp_side.color_ramp.elements[1]
+        elem.position = softness
+        elem.color = (1, 1, 1, 1)
+
+        mat.node_tree.links.new(color_ramp_side.outputs["Color"],
+                                band.inputs[socket])
+
+        # Gradient Texture - Band side
+        gradient_texture_side = mat_nodes.new("ShaderNodeTexGradient")
+        gradient_texture_side.parent = frame
+        gradient_texture_side.name = name + "Gradient Texture " + side
+        gradient_texture_side.location = (pos_x + 200, pos_y + offset)
+        gradient_texture_side.gradient_type = "LINEAR"
+
+        mat.node_tree.links.new(gradient_texture_side.outputs["Color"],
+                                color_ramp_side.inputs["Fac"])
+
+        # Mapping - Band side
+        mapping_side = mat_nodes.new("ShaderNodeMapping")
+        mapping_side.parent = frame
+        mapping_side.name = name + "Mapping " + side
+        mapping_side.label = name + "Mapping " + side
+        mapping_side.location = (pos_x, pos_y + offset)
+        mapping_side.inputs["Location"].default_value = (-height, 0.0, 0.0)
+        mapping_side.inputs["Rotation"].default_value = (0, pi/2, 0)
+        mapping_side.inputs["Scale"].default_value = (1, 1, 1)
+
+        mat.node_tree.links.new(mapping_side.outputs["Vector"],
+                                gradient_texture_side.inputs["Vector"])
+        mat.node_tree.links.new(in_node.outputs["Vector"],
+                                mapping_side.inputs["Vector"])
+
+    # Mapping noise
+    mapping_noise = mat_nodes.new("ShaderNodeMapping")
+    mapping_noise.parent = frame
+    mapping_noise.name = name + "Mapping Noise"
+    mapping_noise.label = name + "Mapping Noise"
+    mapping_noise.location = (pos_x, pos_y - 800)
+    mapping_noise.inputs["Location"].default_value = (layer.seed, layer.seed, layer.seed)
+    mapping_noise.inputs["Rotation"].default_value = (0, 0, 0)
+    mapping_noise.inputs["Scale"].default_value = (1, 1, 1)
+
+    mat.node_tree.links.new(in_node.outputs["Vector"],
+                            mapping_noise.inputs["Vector"])
+
+    # Noise Tex - Layer
+    noise_subtract = mat_nodes.new("ShaderNodeTexNoise")
+    noise_subtract.parent = frame
+    noise_subtract.name = name + "Noise Tex"
+    noise_subtract.label = name + "Noise Tex"
+    noise_subtract.location = (pos_x + 200, pos_y - 800)
+    cloudscape_cloud_size = 15.1 - obj.cloud_settings.cloudscape_cloud_size
+    noise_subtract.inputs["Scale"].default_value = cloudscape_cloud_size
+    noise_subtract.inputs["Detail"].default_value = 0.0
+    noise_subtract.inputs["Roughness"].default_value = 0.0
+    noise_subtract.inputs["Distortion"].default_value = 0.0
+
+    mat.node_tree.links.new(mapping_noise.outputs["Vector"],
+                            noise_subtract.inputs["Vector"])
+
+    # Vector Multiply - Noise subtract
+    multiply_noise = mat_nodes.new("ShaderNodeVectorMath")
+    multiply_noise.parent = frame
+    multiply_noise.location = (pos_x + 400, pos_y - 800)
+    multiply_noise.name = name + "Vector Multiply Noise"
+    multiply_noise.label = name + "Vector Multiply Noise"
+    multiply_noise.operation = "MULTIPLY"
+    multiply_noise.inputs[1].default_value = (5.0, 5.0, 5.0)
+
+    mat.node_tree.links.new(noise_subtract.outputs["Fac"],
+                            multiply_noise.inputs[0])
+
+    if layer.layer_type == "CUMULUS":
+        # RGB Subtract - Coverage
+        subtract_coverage = mat_nodes.new("ShaderNodeMixRGB")
+        subtract_coverage.parent = frame
+        subtract_coverage.name = name + "Coverage"
+        subtract_coverage.label = name + "Coverage"
+        subtract_coverage.location = (pos_x + 900, pos_y - 300)
+        subtract_coverage.blend_type = "SUBTRACT"
+        subtract_coverage.inputs["Fac"].default_value = 1 - layer.coverage
+
+        mat.node_tree.links.new(band.outputs["Color"],
+                                subtract_coverage.inputs["Color1"])
+        mat.node_tree.links.new(multiply_noise.outputs["Vector"],
+                                subtract_coverage.inputs["Color2"])
+        return subtract_coverage.outputs["Color"]
+
+    # Vector Length
+    length_noise = mat_nodes.new("ShaderNodeVectorMath")
+    length_noise.parent = frame
+    length_noise.location = (pos_x + 600, pos_y - 900)
+    length_noise.operation = "LENGTH"
+
+    mat.node_tree.links.new(multiply_noise.outputs["Vector"],
+                            length_noise.inputs[0])
+
+    # Greater Than - Coverage
+    greater_than_coverage = mat_nodes.new("ShaderNodeMath")
+    greater_than_coverage.parent = frame
+    greater_than_coverage.location = (pos_x + 800, pos_y - 900)
+    greater_than_coverage.operation = "GREATER_THAN"
+    greater_than_coverage.name = name + "Coverage"
+    greater_than_coverage.label = name + "Coverage"
+    greater_than_coverage.inputs[1].default_value = layer.coverage * 10
+
+    mat.node_tree.links.new(length_noise.outputs["Value"],
+                            greater_than_coverage.inputs["Value"])
+
+    # Vector Multiply - Cirrus coverage
+    multiply_coverage = mat_nodes.new("ShaderNodeVectorMath")
+    multiply_coverage.parent = frame
+    multiply_coverage.location = (pos_x + 1000, pos_y - 700)
+    multiply_coverage.operation = "MULTIPLY"
+
+    mat.node_tree.links.new(multiply_noise.outputs["Vector"],
+                            multiply_coverage.inputs[0])
+    mat.node_tree.links.new(greater_than_coverage.outputs["Value"],
+                            multiply_coverage.inputs[1])
+
+    # RGB Subtract - Band and Noise
+    subtract_noise = mat_nodes.new("ShaderNodeMixRGB")
+    subtract_noise.parent = frame
+    subtract_noise.location = (pos_x + 900, pos_y - 300)
+    subtract_noise.blend_type = "SUBTRACT"
+    subtract_noise.inputs["Fac"].default_value = 1.0
+
+    mat.node_tree.links.new(band.outputs["Color"],
+                            subtract_noise.inputs["Color1"])
+    mat.node_tree.links.new(multiply_coverage.outputs["Vector"],
+                            subtract_noise.inputs["Color2"])
+
+    # Mapping cirrus shape
+    mapping_cirrus_shape = mat_nodes.new("ShaderNodeMapping")
+    mapping_cirrus_shape.parent = frame
+    mapping_cirrus_shape.name = name + "Mapping Cirrus Shape"
+    mapping_cirrus_shape.label = name + "Mapping Cirrus Shape"
+    mapping_cirrus_shape.location = (pos_x, pos_y - 1200)
+    cloudscape_cirrus_cirrus_amount = obj.cloud_settings.cloudscape_cirrus_cirrus_amount
+    mapping_cirrus_shape.inputs["Scale"].default_value = (cloudscape_cirrus_cirrus_amount, 0, 0)
+
+    mat.node_tree.links.new(in_node.outputs["Vector"],
+                            mapping_cirrus_shape.inputs["Vector"])
+
+    # Vector Sine, Add and Divide - Cirrus shape between 0 and 1
+    previous = mapping_cirrus_shape
+    for offset, operation, value in ((200, "SINE", None), (400, "ADD", 1.0), (600, "DIVIDE", 2.0)):
+        operation_cirrus = mat_nodes.new("ShaderNodeVectorMath")
+        operation_cirrus.parent = frame
+        operation_cirrus.location = (pos_x + offset, pos_y - 1200)
+        operation_cirrus.operation = operation
+        if value is not None:
+            operation_cirrus.inputs[1].default_value = (value, value, value)
+
+        mat.node_tree.links.new(previous.outputs["Vector"],
+                                operation_cirrus.inputs[0])
+        previous = operation_cirrus
+
+    # Vector Multiply - Cirrus width
+    multiply_width = mat_nodes.new("ShaderNodeVectorMath")
+    multiply_width.parent = frame
+    multiply_width.location = (pos_x + 800, pos_y - 1200)
+    multiply_width.name = name + "Cirrus width"
+    multiply_width.label = name + "Cirrus width"
+    multiply_width.operation = "MULTIPLY"
+    cloudscape_cirrus_cirrus_width = 1 - obj.cloud_settings.cloudscape_cirrus_cirrus_width
+    multiply_width.inputs[1].default_value = (cloudscape_cirrus_cirrus_width,
+                                              cloudscape_cirrus_cirrus_width,
+                                              cloudscape_cirrus_cirrus_width)
+
+    mat.node_tree.links.new(previous.outputs["Vector"],
+                            multiply_width.inputs[0])
+
+    # RGB Multiply - Cirrus shape
+    cirrus_shape_multiply = mat_nodes.new("ShaderNodeMixRGB")
+    cirrus_shape_multiply.parent = frame
+    cirrus_shape_multiply.location = (pos_x + 1100, pos_y - 800)
+    cirrus_shape_multiply.blend_type = "MULTIPLY"
+    cirrus_shape_multiply.inputs["Fac"].default_value = 1.0
+
+    mat.node_tree.links.new(subtract_noise.outputs["Color"],
+                            cirrus_shape_multiply.inputs["Color1"])
+    mat.node_tree.links.new(multiply_width.outputs["Vector"],
+                            cirrus_shape_multiply.inputs["Color2"])
+    return cirrus_shape_multiply.outputs["Color"]
+
+
+def initial_shape_cloudscape_layered(pos_x, pos_y, texture_coordinate, cleaner_out, out_node, in_node, mat, obj):
+    """Several cloudscape layers in one domain and one material.
+
+    Every layer has its own height band, coverage and seed (see
+    cloudscape_layer). The layers are combined with their maximum, so a
+    single shader evaluation covers all of them. Empty layers (see
+    cloud_settings.is_empty_layer) are not built. A cloud without layers
+    gets the default ones.
+
+    pos_x: relative x position of nodes in the material node graph
+    pos_y: relative y position of nodes in the material node graph
+    texture_coordinate: texture coordinate in for image shape texture
+    cleaner_out: out for final cleaner
+    out_node: out for the initial shape values
+    in_node: coordinates used for initial shape
+    mat: material. Used to access node_tree and insert connections and nodes
+    obj: cloud object that has the material applied
+    """
+
+    mat_nodes = mat.node_tree.nodes  # Fast access to nodes
+
+    obj.cloud_settings.domain_cloud_position = (0.0, 0.0, 1.0)
+
+    obj.cloud_settings.cloud_type = "CLOUDSCAPE_LAYERED"
+    if not obj.cloud_settings.layers:
+        default_layers(obj.cloud_settings)
+    frame = mat_nodes.new(type='NodeFrame')
+    frame.name = "Initial shape"
+    frame.label = "Initial shape"
+
+    # Este tipo de nube ocupa mas que el resto por lo que para que quepa bien se desplaza
+    pos_y = pos_y + 1400
+    pos_x = pos_x - 700
+
+    # Color Ramp
+    color_ramp_cleaner = mat_nodes.new("ShaderNodeValToRGB")
+    color_ramp_cleaner.name = "Final cleaning range"
+    color_ramp_cleaner.label = "Final cleaning range"
+    color_ramp_cleaner.location = (pos_x + 2500, pos_y - 500)
+    color_ramp_cleaner.color_ramp.interpolation = 'LINEAR'
+    elem = color_ramp_cleaner.color_ramp.elements[0]
+    elem.position = 1.0 - obj.cloud_settings.cleaner_domain_size
+    elem.color = (0, 0, 0, 1)
+    elem = color_ramp_cleaner.color_ramp.elements[1]
+    elem.position = 1.0
+    elem.color = (1.0, 1.0, 1.0, 1)
+
+    mat.node_tree.links.new(color_ramp_cleaner.outputs["Color"],
+                            cleaner_out.inputs[1])
+
+    # Invert color
+    invert_color = mat_nodes.new("ShaderNodeInvert")
+    invert_color.location = (pos_x + 2300, pos_y - 500)
+    mat.node_tree.links.new(invert_color.outputs["Color"],
+                            color_ramp_cleaner.inputs["Fac"])
+
+    # RGB Multiply - Texture image shape
+    texture_image_shape_multiply = mat_nodes.new("ShaderNodeMixRGB")
+    texture_image_shape_multiply.parent = frame
+    texture_image_shape_multiply.name = "RGB Multiply - Texture image shape"
+    texture_image_shape_multiply.label = "RGB Multiply - Texture image shape"
+    texture_image_shape_multiply.location = (pos_x + 1900, pos_y - 500)
+    texture_image_shape_multiply.blend_type = "MULTIPLY"
+    texture_image_shape_multiply.inputs["Fac"].default_value = 0.0
+    # Without layers there are no clouds
+    texture_image_shape_multiply.inputs["Color1"].default_value = (0.0, 0.0, 0.0, 1.0)
+
+    mat.node_tree.links.new(texture_image_shape_multiply.outputs["Color"],
+                            invert_color.inputs["Color"])
+    mat.node_tree.links.new(texture_image_shape_multiply.outputs["Color"],
+                            out_node.inputs["Color1"])
+
+    # Image texture - Shape of cloud
+    image_texture_shape = mat_nodes.new("ShaderNodeTexImage")
+    image_texture_shape.parent = frame
+    image_texture_shape.name = "Image texture - Shape of cloud"
+    image_texture_shape.label = "Image texture - Shape of cloud"
+    image_texture_shape.location = (pos_x + 1600, pos_y - 900)
+    image_texture_shape.image = obj.cloud_settings.shape_texture_image
+
+    mat.node_tree.links.new(image_texture_shape.outputs["Color"],
+                            texture_image_shape_multiply.inputs["Color2"])
+    mat.node_tree.links.new(texture_coordinate.outputs["Generated"],
+                            image_texture_shape.inputs["Vector"])
+
+    # Layers
+    shape = None
+    for index, layer in enumerate(obj.cloud_settings.layers):
+        if is_empty_layer(layer):
+            continue
+        layer_shape = cloudscape_layer(pos_x, pos_y - index * LAYER_NODES_SPACING, index, layer,
+                                       in_node, frame, mat, obj)
+        if shape is not None:
+            # RGB Lighten - Layer combine
+            lighten_layers = mat_nodes.new("ShaderNodeMixRGB")
+            lighten_layers.parent = frame
+            lighten_layers.name = "Layer {} - Combine".format(index)
+            lighten_layers.label = "Layer {} - Combine".format(index)
+            lighten_layers.location = (pos_x + 1400, pos_y - index * LAYER_NODES_SPACING)
+            lighten_layers.blend_type = "LIGHTEN"
+            lighten_layers.inputs["Fac"].default_value = 1.0
+
+            mat.node_tree.links.new(shape, lighten_layers.inputs["Color1"])
+            mat.node_tree.links.new(layer_shape, lighten_layers.inputs["Color2"])
+            layer_shape = lighten_layers.outputs["Color"]
+        shape = layer_shape
+
+    if shape is not None:
+        mat.node_tree.links.new(shape, texture_image_shape_multiply.inputs["Color1"])
+
+
+INITIAL_SHAPES = {
+    "SINGLE_CUMULUS": initial_shape_single_cumulus,
+    "CLOUDSCAPE_CUMULUS": initial_shape_cloudscape_cumulus,
+    "CLOUDSCAPE_CIRRUS": initial_shape_cloudscape_cirrus,
+    "CLOUDSCAPE_LAYERED": initial_shape_cloudscape_layered,
+}
+
+
+def generate_cloud(context, pos_x, pos_y, initial_shape, seed=None, use_template=False, parameters=None):
     """
     pos_x: x position of the material node graph
     pos_y: y position of the material node graph
     initial_shape: function that generates the part of the material
         corresponding to the initial base shape of the clouds
+    seed: seed of the random cloud settings. A new seed is drawn if it is None
+    use_template: reuse the material built before for the same seed and
+        cloud type instead of building the node graph again
+    parameters: random cloud settings already drawn for the seed with
+        randomization.sample_cloud_parameters (see generate_clouds)
     """
     C = context
     D = bpy.data
+    if seed is None:
+        seed = randomization.random_seed()
+    if parameters is None:
+        parameters = randomization.cloud_parameters(randomization.sample_cloud_parameters([seed]), 0)
+    cloud_type = get_cloud_type(initial_shape)
     # ---------------------------------------
     # ------------Initialization-------------
     # ---------------------------------------
     # Create cloud object
-    bpy.ops.mesh.primitive_cube_add()
-    obj = C.active_object
+    profiling.begin_phase("Object creation")
+    mesh = pool.take_mesh()
+    if mesh is None:
+        profiling.operator_call()
+        bpy.ops.mesh.primitive_cube_add()
+        obj = C.active_object
+        obj.data[pool.MESH_PROPERTY] = True
+    else:
+        obj = pool.new_cloud_object(C, mesh)
     obj.name = 'Cloud'
     obj.cloud_settings.is_cloud = True
+    obj.cloud_settings.seed = seed
     domain = obj.cloud_settings.domain
     size = obj.cloud_settings.size
+    profiling.end_phase()
+
+    template = None
+    if use_template and cloud_type is not None:
+        template = find_cloud_template(seed, cloud_type)
+
+    if template is not None:
+        # Same seed and type: the node graph would be identical
+        profiling.begin_phase("Template copy")
+        mat = template.copy()
+        mat.name = "CloudMaterial_CG"
+        del mat["cloud_template_key"]
+        del mat["cloud_settings"]
+        obj.active_material = mat
+        cloud_settings_from_dict(obj.cloud_settings, template["cloud_settings"].to_dict())
+        if cloud_type == "CLOUDSCAPE_LAYERED":
+            default_layers(obj.cloud_settings)
+        profiling.end_phase()
+    else:
+        # Create cloud material, reusing one of a deleted cloud if possible
+        profiling.begin_phase("Material creation")
+        mat = pool.take_material()
+        if mat is None:
+            mat = D.materials.new("CloudMaterial_CG")
+            mat.use_nodes = True
+
+            # Cleaning material
+            mat_nodes = mat.node_tree.nodes
+            for node in mat_nodes:
+                mat.node_tree.nodes.remove(node)
+
+        # Assign
+        obj.active_material = mat
+        profiling.end_phase()
+
+        # Initialization
+        profiling.begin_phase("Random initialization")
+        obj.cloud_settings.update_properties = False  # Set to false because the nodes do not exist yet
+        for name, value in parameters.items():
+            setattr(obj.cloud_settings, name, value)
+        obj.cloud_settings.update_properties = True
+        profiling.end_phase()
+
+        build_cloud_material(pos_x, pos_y, initial_shape, mat, obj)
+
+        if use_template and cloud_type is not None:
+            profiling.begin_phase("Template store")
+            store_cloud_template(seed, cloud_type, mat, obj)
+            profiling.end_phase()
 
-    # Create cloud material
-    mat = D.materials.new("CloudMaterial_CG")
-    mat.use_nodes = True
+    # ---------------------------------------
+    # --------Domain and size config---------
+    # ---------------------------------------
+    profiling.begin_phase("Domain and size")
+    obj.scale = (0.5, 0.5, 0.5)  # Default cube is 2 meters
+    C.view_layer.objects.active = obj
+    profiling.operator_call()
+    bpy.ops.object.transform_apply(location=False,
+                                   rotation=False,
+                                   scale=True,
+                                   properties=True)
 
-    # Cleaning material
-    mat_nodes = mat.node_tree.nodes
-    for node in mat_nodes:
-        mat.node_tree.nodes.remove(node)
+    adapted_size = Vector((domain.x/size, domain.y/size, domain.z/size))
+    obj.scale = (adapted_size.x, adapted_size.y, adapted_size.z)
+    profiling.operator_call()
+    bpy.ops.object.transform_apply(location=False, rotation=False,
+                                   scale=True, properties=True)
+    obj.cloud_settings["auxiliar_size_vector"] = adapted_size
 
-    # Assign
-    obj.active_material = mat
+    cube_size = Vector((domain.x / adapted_size.x,
+                        domain.y / adapted_size.y,
+                        domain.z / adapted_size.z))
+    obj.scale = cube_size
+    profiling.end_phase()
 
-    # Initialization
-    obj.cloud_settings.update_properties = False  # Set to false because the nodes do not exist yet
-
-    obj.cloud_settings.wind_big_turbulence = random.uniform(0.2, 1.0)
-    obj.cloud_settings.wind_small_turbulence = random.uniform(0.2, 0.5)
-    obj.cloud_settings.detail_wind_strength = random.uniform(0.0, 1.0)
-    obj.cloud_settings.amount_of_clouds = random.uniform(0.2, 0.6)
-    obj.cloud_settings.detail_bump_strength = random.uniform(0.1, 0.5)
-    obj.cloud_settings.subtract_shape_imperfection = random.uniform(0, 1)
-    obj.cloud_settings.add_shape_imperfection = random.uniform(0, 0.6)
-    obj.cloud_settings.roundness = random.uniform(0, 1)
-    obj.cloud_settings.roundness_coords = (
-                                            random.uniform(0, 200),
-                                            random.uniform(0, 200),
-                                            random.uniform(0, 200)
-                                        )
-    obj.cloud_settings.roundness_simple_seed = obj.cloud_settings.roundness_coords.x
-
-    obj.cloud_settings.add_shape_imperfection_coords = (
-                                                        random.uniform(0, 200),
-                                                        random.uniform(0, 200),
-                                                        random.uniform(0, 200)
-                                                        )
-    obj.cloud_settings.add_shape_imperfection_simple_seed = obj.cloud_settings.add_shape_imperfection_coords.x
-    obj.cloud_settings.subtract_shape_imperfection_coords = (
-                                                                random.uniform(0, 200),
-                                                                random.uniform(0, 200),
-                                                                random.uniform(0, 200)
-                                                            )
-    obj.cloud_settings.subtract_shape_imperfection_simple_seed = obj.cloud_settings.subtract_shape_imperfection_coords.x
-    obj.cloud_settings.cloudscape_noise_coords = (
-                                                    random.uniform(0, 200),
-                                                    random.uniform(0, 200),
-                                                    random.uniform(0, 200)
-                                                )
-    obj.cloud_settings.cloudscape_noise_simple_seed = obj.cloud_settings.cloudscape_noise_coords.x
-
-    obj.cloud_settings.wind_big_turbulence_coords = (
-                                                    random.uniform(0, 200),
-                                                    random.uniform(0, 200),
-                                                    random.uniform(0, 200)
-                                                )
-    obj.cloud_settings.wind_turbulence_simple_seed = obj.cloud_settings.wind_big_turbulence_coords.x
-
-    obj.cloud_settings.wind_small_turbulence_coords = (
-                                                    random.uniform(0, 200),
-                                                    random.uniform(0, 200),
-                                                    random.uniform(0, 200)
-                                                )
+    profiling.generation_done()
+    return obj
+
+
+def build_cloud_material(pos_x, pos_y, initial_shape, mat, obj):
+    """
+    pos_x: x position of the material node graph
+    pos_y: y position of the material node graph
+    initial_shape: function that generates the part of the material
+        corresponding to the initial base shape of the clouds
+    mat: empty material where the node graph is built
+    obj: cloud object that has the material applied
+    """
+    mat_nodes = mat.node_tree.nodes  # Fast access to nodes
 
-    obj.cloud_settings.update_properties = True
     # -----------------------------------------------
     # -------------Material construction-------------
     # -----------------------------------------------
     # From final node to beginning
+    profiling.begin_phase("Main branch", mat.node_tree)
 
     # Reroutes
     reroute_1 = mat_nodes.new(type='NodeReroute')
@@ -1015,7 +1446,10 @@ def generate_cloud(context, pos_x, pos_y, initial_shape):
     # Following the order here, the initial_shape function should be here
     # but it is called after "Texture Coordinate" because this is needed.
 
+    profiling.end_phase()
+
     # BEGINNING WIND FRAME
+    profiling.begin_phase("Wind", mat.node_tree)
     frame = mat_nodes.new(type='NodeFrame')
     frame.name = "Wind"
     frame.label = "Wind"
@@ -1172,7 +1606,9 @@ def generate_cloud(context, pos_x, pos_y, initial_shape):
     mat.node_tree.links.new(add_coords_wind_big.outputs["Vector"],
                             noise_shape_wind_big.inputs["Vector"])
 
+    profiling.end_phase()
     # END WIND FRAME
+    profiling.begin_phase("Main branch", mat.node_tree)
 
     # Initial mapping
     initial_mapping = mat_nodes.new("ShaderNodeMapping")
@@ -1196,7 +1632,11 @@ def generate_cloud(context, pos_x, pos_y, initial_shape):
     mat.node_tree.links.new(texture_coordinate.outputs["Object"],
                             initial_mapping.inputs["Vector"])
 
+    profiling.end_phase()
+
+    profiling.begin_phase("Initial shape", mat.node_tree)
     initial_shape(pos_x + 2000, pos_y, texture_coordinate, subtract_final_cleaner, overlay_roundness, add_shape_wind, mat, obj)
+    profiling.end_phase()
 
     # ----------------END MAIN BRANCH----------------
 
@@ -1208,6 +1648,7 @@ def generate_cloud(context, pos_x, pos_y, initial_shape):
                             reroute_3.inputs[0])
 
     # -------------BEGINNING BUMP BRANCH-------------
+    profiling.begin_phase("Bump", mat.node_tree)
     frame = mat_nodes.new(type='NodeFrame')
     frame.name = "Bump"
     frame.label = "Bump"
@@ -1342,9 +1783,11 @@ def generate_cloud(context, pos_x, pos_y, initial_shape):
                             add_coords_bump.inputs[0])
     mat.node_tree.links.new(reroute_3.outputs[0],
                             noise_small_wind.inputs[0])
+    profiling.end_phase()
     # ---------------END BUMP BRANCH-----------------
 
     # --------BEGINNING DETAIL NOISE BRANCH----------
+    profiling.begin_phase("Detail noise", mat.node_tree)
     frame = mat_nodes.new(type='NodeFrame')
     frame.name = "Detail noise"
     frame.label = "Detail noise"
@@ -1365,9 +1808,11 @@ def generate_cloud(context, pos_x, pos_y, initial_shape):
 
     mat.node_tree.links.new(reroute_3.outputs[0],
                             detetail_noise.inputs["Vector"])
+    profiling.end_phase()
     # -----------END DETAIL NOISE BRANCH-------------
 
     # ----------BEGINNING ROUNDNESS BRANCH-----------
+    profiling.begin_phase("Roundness", mat.node_tree)
     frame = mat_nodes.new(type='NodeFrame')
     frame.name = "Roundness"
     frame.label = "Roundness"
@@ -1405,9 +1850,11 @@ def generate_cloud(context, pos_x, pos_y, initial_shape):
 
     mat.node_tree.links.new(reroute_1.outputs[0],
                             add_coords_roundness.inputs[0])
+    profiling.end_phase()
     # -------------END ROUNDNESS BRANCH--------------
 
     # -----BEGINNING ADD BIG IMPERFECTION BRANCH-----
+    profiling.begin_phase("Add shape imperfection", mat.node_tree)
     frame = mat_nodes.new(type='NodeFrame')
     frame.name = "Add shape imperfection"
     frame.label = "Add shape imperfection"
@@ -1479,9 +1926,11 @@ def generate_cloud(context, pos_x, pos_y, initial_shape):
                             noise_add_shape_imperfection_2.inputs["Vector"])
     mat.node_tree.links.new(reroute_1.outputs[0],
                             coords_add_shape_imperfection_2.inputs["Vector"])
+    profiling.end_phase()
     # --------END ADD BIG IMPERFECTION BRANCH--------
 
     # --BEGINNING SUBTRACT BIG IMPERFECTION BRANCH---
+    profiling.begin_phase("Subtract shape imperfection", mat.node_tree)
     frame = mat_nodes.new(type='NodeFrame')
     frame.name = "Subtract shape imperfection"
     frame.label = "Subtract shape imperfection"
@@ -1553,25 +2002,215 @@ def generate_cloud(context, pos_x, pos_y, initial_shape):
                             noise_subtract_shape_imperfection_2.inputs["Vector"])
     mat.node_tree.links.new(reroute_1.outputs[0],
                             coords_subtract_shape_imperfection_2.inputs["Vector"])
+    profiling.end_phase()
     # -----END SUBTRACT BIG IMPERFECTION BRANCH------
 
-    # ---------------------------------------
-    # --------Domain and size config---------
-    # ---------------------------------------
-    obj.scale = (0.5, 0.5, 0.5)  # Default cube is 2 meters
-    C.view_layer.objects.active = obj
-    bpy.ops.object.transform_apply(location=False,
-                                   rotation=False,
-                                   scale=True,
-                                   properties=True)
 
-    adapted_size = Vector((domain.x/size, domain.y/size, domain.z/size))
-    obj.scale = (adapted_size.x, adapted_size.y, adapted_size.z)
-    bpy.ops.object.transform_apply(location=False, rotation=False,
-                                   scale=True, properties=True)
-    obj.cloud_settings["auxiliar_size_vector"] = adapted_size
+def generate_clouds(context, initial_shape, seeds, pos_x=-1000, pos_y=0, use_template=False):
+    """Generates one cloud for every seed.
 
-    cube_size = Vector((domain.x / adapted_size.x,
-                        domain.y / adapted_size.y,
-                        domain.z / adapted_size.z))
-    obj.scale = cube_size
+    The random settings of all the clouds are drawn at once.
+    Returns the list of new cloud objects.
+
+    initial_shape: function that generates the part of the material
+        corresponding to the initial base shape of the clouds
+    seeds: sequence of integer seeds
+    use_template: reuse materials built before for the same seed and type
+    """
+    parameters = randomization.sample_cloud_parameters(seeds)
+    clouds = []
+    for index, seed in enumerate(seeds):
+        clouds.append(generate_cloud(context, pos_x, pos_y, initial_shape, seed=seed,
+                                     use_template=use_template,
+                                     parameters=randomization.cloud_parameters(parameters, index)))
+    return clouds
+
+
+def build_material_from_settings(context, obj, mat):
+    """Builds the node graph of a cloud in mat from the cloud settings.
+
+    The material is assigned to the cloud and the graph is built like
+    generate_cloud does with the cloud active, because the update functions
+    act on the active object. The settings changed by the initial shape are
+    set back with their update functions.
+    """
+
+    settings = obj.cloud_settings
+    values = cloud_settings_to_dict(settings)
+    active = context.view_layer.objects.active
+    obj.active_material = mat
+    context.view_layer.objects.active = obj
+    try:
+        build_cloud_material(-1000, 0, INITIAL_SHAPES[settings.cloud_type], mat, obj)
+        changed = cloud_settings_to_dict(settings)
+        for name, value in values.items():
+            if changed[name] != value:
+                setattr(settings, name, value)
+    finally:
+        context.view_layer.objects.active = active
+    return mat
+
+
+def get_cloud_type(initial_shape):
+    """Cloud type built by an initial_shape function or None if it is unknown."""
+
+    for cloud_type, function in INITIAL_SHAPES.items():
+        if function is initial_shape:
+            return cloud_type
+    return None
+
+
+def find_cloud_template(seed, cloud_type):
+    """Template material stored for a seed and a cloud type or None."""
+
+    key = randomization.template_key(seed, cloud_type)
+    for mat in bpy.data.materials:
+        if mat.get("cloud_template_key") == key:
+            return mat
+    return None
+
+
+def store_cloud_template(seed, cloud_type, mat, obj):
+    """Keeps an unmodified copy of a new cloud material to reuse it later.
+
+    The copy has no users so it is not saved with the file.
+    """
+
+    template = mat.copy()
+    template.name = "CloudTemplate_CG"
+    template["cloud_template_key"] = randomization.template_key(seed, cloud_type)
+    template["cloud_settings"] = cloud_settings_to_dict(obj.cloud_settings)
+    return template
+
+
+# Nodes of the shared branches connected to the initial shape subgraph.
+SHAPE_INPUT_NODE = "Vector Add - Add shape wind"
+SHAPE_OUTPUT_NODE = "RGB Overlay - Roundness"
+SHAPE_CLEANER_NODE = "Vector Subtract - Final Cleaner"
+
+# Inputs of the shared branches that initial_shape_cloudscape_cirrus
+# changes: (node, input, value for the other cloud types).
+CIRRUS_SOCKETS = (
+    ("Vector Multiply - Wind application direction big", 1, (1.0, 1.0, 0.5)),
+    ("Vector Multiply - Wind application direction small", 1, (1.0, 1.0, 0.5)),
+    ("Noise Tex - Shape wind big turbulence", "Scale", 0.2),
+)
+
+# Random settings only used by the initial shape subgraph.
+SHAPE_PARAMETERS = ("amount_of_clouds", "cloudscape_noise_coords", "cloudscape_noise_simple_seed")
+
+
+def initial_shape_nodes(mat):
+    """Nodes built by the initial_shape function of a cloud material.
+
+    They are the nodes connected to the initial shape values and the final
+    cleaner without going through the shared wind branch or the texture
+    coordinate, the "Initial shape" frame with its nodes and the reroutes
+    left without links by the initial shape of the cumulus cloudscape.
+    """
+
+    nodes = mat.node_tree.nodes
+    boundary = {nodes[SHAPE_INPUT_NODE], nodes[SHAPE_OUTPUT_NODE], nodes[SHAPE_CLEANER_NODE]}
+    boundary.update(node for node in nodes if node.type == 'TEX_COORD')
+    shape = set()
+    pending = [link.from_node for link in nodes[SHAPE_OUTPUT_NODE].inputs["Color1"].links]
+    pending.extend(link.from_node for link in nodes[SHAPE_CLEANER_NODE].inputs[1].links)
+    while pending:
+        node = pending.pop()
+        if node in boundary or node in shape:
+            continue
+        shape.add(node)
+        for socket in node.inputs:
+            pending.extend(link.from_node for link in socket.links)
+        for socket in node.outputs:
+            pending.extend(link.to_node for link in socket.links)
+    frame = nodes.get("Initial shape")
+    if frame is not None:
+        shape.add(frame)
+        shape.update(node for node in nodes if node.parent == frame)
+    for node in nodes:
+        if node.type == 'REROUTE' and not node.inputs[0].links and not node.outputs[0].links:
+            shape.add(node)
+    return shape
+
+
+def rebuild_initial_shape(context, obj, initial_shape):
+    """Changes the cloud type of a cloud keeping its object and shared branches.
+
+    Only the initial shape subgraph is removed and built again, and the
+    inputs of the wind branch changed by the cirrus are set back. The
+    settings of the shared branches are kept. A material shared with other
+    clouds is copied first.
+
+    initial_shape: function that generates the part of the material
+        corresponding to the initial base shape of the clouds
+    """
+
+    profiling.begin_rebuild()
+    if len(sharing.cloud_users(obj.active_material)) > 1:
+        sharing.own_material(obj)
+    mat = obj.active_material
+    nodes = mat.node_tree.nodes
+    settings = obj.cloud_settings
+    previous_type = settings.cloud_type
+    cloud_type = get_cloud_type(initial_shape)
+    context.view_layer.objects.active = obj
+
+    profiling.begin_phase("Initial shape removal", mat.node_tree)
+    for node in initial_shape_nodes(mat):
+        nodes.remove(node)
+    for name, socket, value in CIRRUS_SOCKETS:
+        nodes[name].inputs[socket].default_value = value
+    profiling.end_phase()
+
+    if previous_type == "CLOUDSCAPE_CIRRUS" and cloud_type != previous_type:
+        # The cirrus covers the whole sky with thin clouds, the coverage is
+        # drawn again from the seed and the height is the default one
+        parameters = randomization.cloud_parameters(randomization.sample_cloud_parameters([settings.seed]), 0)
+        settings.update_properties = False
+        settings.amount_of_clouds = parameters["amount_of_clouds"]
+        settings.height_cloudscape = 1.2
+        settings.update_properties = True
+    if cloud_type == "SINGLE_CUMULUS" and previous_type != cloud_type:
+        settings.domain_cloud_position = (0.0, 0.0, 0.0)
+
+    texture_coordinate = next(node for node in nodes if node.type == 'TEX_COORD')
+    pos_x, pos_y = texture_coordinate.location
+    profiling.begin_phase("Initial shape", mat.node_tree)
+    initial_shape(pos_x + 2000, pos_y, texture_coordinate, nodes[SHAPE_CLEANER_NODE],
+                  nodes[SHAPE_OUTPUT_NODE], nodes[SHAPE_INPUT_NODE], mat, obj)
+    profiling.end_phase()
+    profiling.rebuild_done()
+
+
+def regenerate_cloud(context, obj, seed=None):
+    """Draws new random settings for a cloud in place.
+
+    The initial shape subgraph is built again with the new settings and the
+    shared branches are updated with the update functions of their settings.
+    The layers of a layered cloudscape get new seeds.
+
+    seed: seed of the random cloud settings. A new seed is drawn if it is None
+    """
+
+    if seed is None:
+        seed = randomization.random_seed()
+    profiling.begin_rebuild()
+    settings = obj.cloud_settings
+    parameters = randomization.cloud_parameters(randomization.sample_cloud_parameters([seed]), 0)
+    settings.update_properties = False
+    settings.seed = seed
+    for name, value in parameters.items():
+        setattr(settings, name, value)
+    for layer, layer_seed in zip(settings.layers, randomization.layer_seeds(seed, len(settings.layers))):
+        layer.seed = layer_seed
+    settings.update_properties = True
+
+    rebuild_initial_shape(context, obj, INITIAL_SHAPES[settings.cloud_type])
+
+    profiling.begin_phase("Shared settings update", obj.active_material.node_tree)
+    for name, _, _, _ in randomization.RANDOM_PARAMETERS:
+        if name not in SHAPE_PARAMETERS:
+            setattr(settings, name, getattr(settings, name))
+    profiling.end_phase()
+    profiling.rebuild_done()
@@ -0,0 +1,262 @@
+"""
+    merge.py is part of Cloud Generator Blender Addon.
+
+    Foobar is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import time
+
+import bpy
+import numpy as np
+from mathutils import Vector
+
+from . import density
+from . import radiance_bake
+from . import tiles
+
+OBJECT_NAME = "Merged clouds"
+MATERIAL_NAME = "CloudMergedMaterial_CG"
+IMAGE_NAME = "CloudMergedGrid_CG"
+REPORT_NAME = "Cloud merge"
+
+# Custom property of the merged domains.
+MERGED_PROPERTY = "cloud_merged"
+# Custom property of the hidden source clouds with their merged domain.
+MERGED_INTO_PROPERTY = "cloud_merged_into"
+
+# Faces of a box whose corners are numbered 4 * x + 2 * y + z.
+BOX_FACES = ((0, 1, 3, 2), (4, 6, 7, 5), (0, 4, 5, 1), (2, 3, 7, 6), (0, 2, 6, 4), (1, 5, 7, 3))
+
+
+def world_bounds(obj):
+    """(min corner, max corner) of the world axis aligned box around the domain of an object."""
+
+    corners = np.array([(obj.matrix_world @ Vector(corner))[:] for corner in obj.bound_box])
+    return corners.min(axis=0), corners.max(axis=0)
+
+
+def boxes_overlap(bounds_a, bounds_b):
+    return bool(np.all(bounds_a[0] < bounds_b[1]) and np.all(bounds_b[0] < bounds_a[1]))
+
+
+def mergeable_clouds(scene):
+    """Rendered clouds of the scene that keep their cloud material."""
+
+    return [obj for obj in scene.objects
+            if obj.cloud_settings.is_cloud and not obj.hide_render
+            and not obj.get(tiles.POOL_PROPERTY, False)
+            and radiance_bake.FULL_MATERIAL_PROPERTY not in obj
+            and obj.active_material is not None and "CloudMaterial_CG" in obj.active_material.name]
+
+
+def overlapping_groups(clouds):
+    """Groups of clouds whose domains overlap, directly or through other clouds of the group.
+
+    Clouds that do not overlap any other are left out.
+    """
+
+    bounds = [world_bounds(obj) for obj in clouds]
+    parent = list(range(len(clouds)))
+
+    def root(index):
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    for i in range(len(clouds)):
+        for j in range(i + 1, len(clouds)):
+            if boxes_overlap(bounds[i], bounds[j]):
+                parent[root(j)] = root(i)
+
+    groups = {}
+    for index, obj in enumerate(clouds):
+        groups.setdefault(root(index), []).append(obj)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def resample(grid, bounds, matrix, points):
+    """Values of the nearest voxels of a grid at world points, 0 out of the grid.
+
+    grid: (nz, ny, nx) grid over the local bounds of an object.
+    matrix: 4x4 array from world to the local axes of the object.
+    points: (..., 3) world points.
+    """
+
+    nz, ny, nx = grid.shape
+    minimum, maximum = (np.array(corner[:]) for corner in bounds)
+    local = points @ matrix[:3, :3].T + matrix[:3, 3]
+    index = np.floor((local - minimum) / (maximum - minimum) * (nx, ny, nz)).astype(np.int32)
+    inside = np.all((index >= 0) & (index < (nx, ny, nz)), axis=-1)
+    values = np.zeros(points.shape[:-1], dtype=np.float32)
+    values[inside] = grid[index[inside, 2], index[inside, 1], index[inside, 0]]
+    return values
+
+
+def merged_grid(clouds, bounds, resolution=64, mode='MAX'):
+    """Combined density and color of the clouds in a world axis aligned grid.
+
+    Every cloud is sampled (see density.sample_density) with voxels of
+    the same size as the ones of the merged grid.
+
+    bounds: (min corner, max corner) of the grid in world coordinates.
+    mode: 'MAX' keeps the densest cloud of every voxel and its color.
+        'SUM' adds the densities and mixes the colors by density.
+
+    Returns the (nz, ny, nx) density and the (nz, ny, nx, 3) color.
+    """
+
+    minimum, maximum = bounds
+    size = maximum - minimum
+    nx, ny, nz = density.grid_shape(size, resolution)
+    z, y, x = np.meshgrid(np.arange(nz) + 0.5, np.arange(ny) + 0.5, np.arange(nx) + 0.5, indexing="ij")
+    points = minimum + np.stack((x, y, z), axis=-1) / (nx, ny, nz) * size
+
+    grid = np.zeros((nz, ny, nx), dtype=np.float32)
+    color = np.zeros((nz, ny, nx, 3), dtype=np.float32)
+    for obj in clouds:
+        cloud_resolution = max(1, int(round(resolution * max(obj.dimensions) / max(size))))
+        values = resample(density.sample_density(obj, cloud_resolution), density.local_bounds(obj),
+                          np.array(obj.matrix_world.inverted()), points)
+        tint = np.array(obj.cloud_settings.color[:3])
+        if mode == 'MAX':
+            denser = values > grid
+            grid[denser] = values[denser]
+            color[denser] = tint
+        else:
+            grid += values
+            color += values[..., np.newaxis] * tint
+    if mode != 'MAX':
+        color /= np.maximum(grid, 1e-6)[..., np.newaxis]
+    return grid, color
+
+
+def merged_material(image):
+    """Volume material that scatters and absorbs with the color and density of a grid image."""
+
+    material = bpy.data.materials.new(MATERIAL_NAME)
+    material.use_nodes = True
+    nodes = material.node_tree.nodes
+    links = material.node_tree.links
+    nodes.clear()
+    texture = radiance_bake.grid_texture(material, image)
+
+    volume = nodes.new(type="ShaderNodeVolumePrincipled")
+    volume.location = (700, 0)
+    links.new(texture.outputs["Color"], volume.inputs["Color"])
+    links.new(texture.outputs["Alpha"], volume.inputs["Density"])
+
+    output = nodes.new(type="ShaderNodeOutputMaterial")
+    output.location = (1000, 0)
+    links.new(volume.outputs["Volume"], output.inputs["Volume"])
+    return material
+
+
+def merge_clouds(clouds, resolution=64, mode='MAX'):
+    """Replaces a group of clouds with a box domain that renders their baked density.
+
+    The density is baked in the current frame. The clouds are hidden and
+    keep their settings and materials, restore_clouds brings them back.
+
+    The domain is a mesh box whose volume material reads the grid from an
+    atlas image (see radiance_bake.grid_texture), not a Volume object: a
+    Volume needs an OpenVDB file and Python can only write one with
+    pyopenvdb, which is not available in every Blender build. The atlas is
+    packed in the blend file like the radiance bakes and renders the same
+    in Cycles and EEVEE, with a single volume per ray as a Volume would.
+
+    resolution: voxels along the biggest side of the merged domain.
+
+    Returns the merged domain.
+    """
+
+    bounds = [world_bounds(obj) for obj in clouds]
+    minimum = np.min([corner for corner, _ in bounds], axis=0)
+    maximum = np.max([corner for _, corner in bounds], axis=0)
+    grid, color = merged_grid(clouds, (minimum, maximum), resolution, mode)
+
+    half = (maximum - minimum) / 2
+    mesh = bpy.data.meshes.new(OBJECT_NAME)
+    mesh.from_pydata([(x, y, z) for x in (-half[0], half[0]) for y in (-half[1], half[1])
+                      for z in (-half[2], half[2])], [], BOX_FACES)
+    mesh.materials.append(merged_material(radiance_bake.grid_image(grid, color, IMAGE_NAME)))
+    merged = bpy.data.objects.new(OBJECT_NAME, mesh)
+    merged.location = Vector((minimum + half).tolist())
+    merged[MERGED_PROPERTY] = True
+    for collection in clouds[0].users_collection:
+        collection.objects.link(merged)
+
+    for obj in clouds:
+        obj[MERGED_INTO_PROPERTY] = merged
+        # The impostor switching skips merged clouds, their impostors are
+        # hidden with them.
+        if obj.cloud_settings.impostor is not None:
+            obj.cloud_settings.impostor.hide_render = True
+        obj.hide_viewport = True
+        obj.hide_render = True
+    return merged
+
+
+def restore_clouds(merged):
+    """Shows again the clouds of a merged domain and removes it."""
+
+    if not merged.get(MERGED_PROPERTY, False):
+        return
+    for obj in bpy.data.objects:
+        if obj.get(MERGED_INTO_PROPERTY) == merged:
+            del obj[MERGED_INTO_PROPERTY]
+            obj.hide_viewport = False
+            obj.hide_render = False
+
+    mesh = merged.data
+    bpy.data.objects.remove(merged)
+    for material in list(mesh.materials):
+        for node in material.node_tree.nodes:
+            if node.type == 'TEX_IMAGE' and node.image is not None:
+                bpy.data.images.remove(node.image)
+        bpy.data.materials.remove(material)
+    bpy.data.meshes.remove(mesh)
+
+
+def merge_scene_clouds(context, resolution=64, mode='MAX'):
+    """Merges every group of overlapping clouds of the scene and writes a report.
+
+    Returns a dict with the number of groups, clouds and voxels and the bake time.
+    """
+
+    groups = overlapping_groups(mergeable_clouds(context.scene))
+    report = {"groups": len(groups), "clouds": sum(len(group) for group in groups),
+              "resolution": resolution, "mode": mode, "voxels": 0}
+    start = time.perf_counter()
+    for group in groups:
+        merged = merge_clouds(group, resolution, mode)
+        image = next(node.image for node in merged.data.materials[0].node_tree.nodes if node.type == 'TEX_IMAGE')
+        nx, ny, nz = image[radiance_bake.GRID_SHAPE]
+        report["voxels"] += nx * ny * nz
+    report["bake_time"] = time.perf_counter() - start
+    write_report(report)
+    return report
+
+
+def write_report(report):
+    """Writes the merged groups, the voxels and the bake time in a text datablock."""
+
+    text = bpy.data.texts.get(REPORT_NAME)
+    if text is None:
+        text = bpy.data.texts.new(REPORT_NAME)
+    text.clear()
+    text.write("Clouds merged: {} in {} domains. Resolution: {}. Mode: {}\n".format(
+        report["clouds"], report["groups"], report["resolution"], report["mode"].lower()))
+    text.write("Voxels:\t{}\n".format(report["voxels"]))
+    text.write("Bake time:\t{:.2f} s\n".format(report["bake_time"]))
+    return text
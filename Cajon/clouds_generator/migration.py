@@ -0,0 +1,351 @@
+"""
+    migration.py is part of Cloud Generator Blender Addon.
+
+    Foobar is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import bpy
+
+from . import lod
+from . import materials
+from . import pool
+from . import scatter
+from . import tiles
+
+REPORT_NAME = "Cloud graph migration"
+
+# Node properties compared besides the name, label, parent and inputs.
+NODE_PROPERTIES = ("operation", "blend_type", "gradient_type", "vector_type", "noise_dimensions",
+                   "use_clamp", "image", "mute")
+
+# Nodes added to cloud materials by other tools, kept with their links.
+PRESERVED_PREFIXES = (scatter.OBJECT_INFO_NODE, scatter.RANDOM_VECTOR_NODE, scatter.OFFSET_NODE,
+                      scatter.OFFSET_ADD_PREFIX)
+
+TOLERANCE = 1e-6
+
+
+def is_preserved(node):
+    """Whether a node was added by another tool and is not migrated."""
+
+    return node.name.startswith(PRESERVED_PREFIXES)
+
+
+def _plain(value):
+    if hasattr(value, "__len__") and not isinstance(value, str):
+        return tuple(value)
+    return value
+
+
+def _same(a, b):
+    a = _plain(a)
+    b = _plain(b)
+    if isinstance(a, tuple) and isinstance(b, tuple):
+        return len(a) == len(b) and all(_same(x, y) for x, y in zip(a, b))
+    if isinstance(a, float) or isinstance(b, float):
+        try:
+            return abs(a - b) <= TOLERANCE
+        except TypeError:
+            return False
+    return a == b
+
+
+def _index(sockets, socket):
+    return list(sockets).index(socket)
+
+
+def link_key(link):
+    """(from node, output index, to node, input index) of a link."""
+
+    return (link.from_node.name, _index(link.from_node.outputs, link.from_socket),
+            link.to_node.name, _index(link.to_node.inputs, link.to_socket))
+
+
+def _ramp(node):
+    ramp = node.color_ramp
+    return (ramp.interpolation, [(element.position, tuple(element.color)) for element in ramp.elements])
+
+
+def _curves(node):
+    return [[tuple(point.location) for point in curve.points] for curve in node.mapping.curves]
+
+
+def node_changes(node, expected):
+    """Properties of a node that differ from the expected node."""
+
+    changes = []
+    if node.label != expected.label:
+        changes.append("label")
+    if (node.parent and node.parent.name) != (expected.parent and expected.parent.name):
+        changes.append("parent")
+    for name in NODE_PROPERTIES:
+        if name == "mute" and node.name in lod.LOD_MUTED_NODES:
+            continue
+        if hasattr(expected, name) and not _same(getattr(node, name), getattr(expected, name)):
+            changes.append(name)
+    if expected.type == 'VALTORGB' and not _same(_ramp(node), _ramp(expected)):
+        changes.append("color_ramp")
+    if expected.type == 'CURVE_VEC' and not _same(_curves(node), _curves(expected)):
+        changes.append("mapping")
+    return changes
+
+
+def value_changes(node, expected):
+    """Unlinked inputs of a node whose value differs from the expected node.
+
+    The inputs set by the levels of detail (see lod.apply_level) are not
+    compared.
+    """
+
+    changes = []
+    lod_inputs = lod.LOD_INPUTS.get(node.name, ())
+    for index, socket in enumerate(expected.inputs):
+        if socket.is_linked or getattr(socket, "default_value", None) is None:
+            continue
+        if socket.name in lod_inputs:
+            continue
+        value = node.inputs[index].default_value
+        if not _same(value, socket.default_value):
+            changes.append((index, _plain(value), _plain(socket.default_value)))
+    return changes
+
+
+def diff_material(mat, expected):
+    """Changes that turn the node tree of mat into the expected one.
+
+    Nodes are matched by name. Returns a dict with the nodes to add and
+    remove, the properties and input values to change of the nodes kept
+    and the links to add and remove.
+    """
+
+    nodes = {node.name: node for node in mat.node_tree.nodes if not is_preserved(node)}
+    expected_nodes = {node.name: node for node in expected.node_tree.nodes}
+    same_type = {name for name, node in nodes.items()
+                 if name in expected_nodes and expected_nodes[name].bl_idname == node.bl_idname}
+
+    diff = {
+        "add_nodes": [name for name in expected_nodes if name not in same_type],
+        "remove_nodes": [name for name in nodes if name not in same_type],
+        "node_changes": {},
+        "values": {},
+        "add_links": [],
+        "remove_links": [],
+    }
+    for name in same_type:
+        changes = node_changes(nodes[name], expected_nodes[name])
+        if changes:
+            diff["node_changes"][name] = changes
+        changes = value_changes(nodes[name], expected_nodes[name])
+        if changes:
+            diff["values"][name] = changes
+
+    links = set()
+    preserved_inputs = set()
+    for link in mat.node_tree.links:
+        if is_preserved(link.from_node) or is_preserved(link.to_node):
+            if not is_preserved(link.to_node):
+                preserved_inputs.add(link_key(link)[2:])
+            continue
+        links.add(link_key(link))
+    expected_links = {link_key(link) for link in expected.node_tree.links}
+    diff["add_links"] = sorted(key for key in expected_links - links if key[2:] not in preserved_inputs)
+    diff["remove_links"] = sorted(links - expected_links)
+    return diff
+
+
+def change_count(diff):
+    """Total number of changes of a diff."""
+
+    return (len(diff["add_nodes"]) + len(diff["remove_nodes"]) + len(diff["add_links"]) +
+            len(diff["remove_links"]) + sum(len(changes) for changes in diff["node_changes"].values()) +
+            sum(len(changes) for changes in diff["values"].values()))
+
+
+def _copy_node_property(node, expected, name):
+    if name == "label":
+        node.label = expected.label
+    elif name == "parent":
+        node.parent = node.id_data.nodes.get(expected.parent.name) if expected.parent else None
+        node.location = expected.location
+    elif name == "color_ramp":
+        elements = node.color_ramp.elements
+        expected_elements = expected.color_ramp.elements
+        while len(elements) > len(expected_elements):
+            elements.remove(elements[-1])
+        while len(elements) < len(expected_elements):
+            elements.new(1.0)
+        node.color_ramp.interpolation = expected.color_ramp.interpolation
+        for element, expected_element in zip(elements, expected_elements):
+            element.position = expected_element.position
+            element.color = expected_element.color
+    elif name == "mapping":
+        for curve, expected_curve in zip(node.mapping.curves, expected.mapping.curves):
+            points = curve.points
+            while len(points) > len(expected_curve.points):
+                points.remove(points[-1])
+            while len(points) < len(expected_curve.points):
+                points.new(1.0, 1.0)
+            for point, expected_point in zip(points, expected_curve.points):
+                point.location = expected_point.location
+        node.mapping.update()
+    else:
+        setattr(node, name, getattr(expected, name))
+
+
+def patch_material(mat, expected, diff):
+    """Applies the changes of diff_material to the node tree of mat."""
+
+    tree = mat.node_tree
+    expected_nodes = expected.node_tree.nodes
+    for key in diff["remove_links"]:
+        from_node, from_index, to_node, to_index = key
+        for link in tree.nodes[to_node].inputs[to_index].links:
+            if link.from_node.name == from_node and _index(link.from_node.outputs, link.from_socket) == from_index:
+                tree.links.remove(link)
+    for name in diff["remove_nodes"]:
+        tree.nodes.remove(tree.nodes[name])
+
+    for name in diff["add_nodes"]:
+        expected_node = expected_nodes[name]
+        node = tree.nodes.new(expected_node.bl_idname)
+        node.name = name
+        node.label = expected_node.label
+        node.location = expected_node.location
+        for property_name in NODE_PROPERTIES:
+            if hasattr(expected_node, property_name):
+                setattr(node, property_name, getattr(expected_node, property_name))
+        if expected_node.type == 'VALTORGB':
+            _copy_node_property(node, expected_node, "color_ramp")
+        if expected_node.type == 'CURVE_VEC':
+            _copy_node_property(node, expected_node, "mapping")
+        for socket, expected_socket in zip(node.inputs, expected_node.inputs):
+            if getattr(expected_socket, "default_value", None) is not None:
+                socket.default_value = expected_socket.default_value
+    for name in diff["add_nodes"]:
+        if expected_nodes[name].parent is not None:
+            _copy_node_property(tree.nodes[name], expected_nodes[name], "parent")
+
+    for name, changes in diff["node_changes"].items():
+        for property_name in changes:
+            _copy_node_property(tree.nodes[name], expected_nodes[name], property_name)
+    for name, changes in diff["values"].items():
+        node = tree.nodes[name]
+        for index, _, value in changes:
+            node.inputs[index].default_value = value
+
+    for from_node, from_index, to_node, to_index in diff["add_links"]:
+        tree.links.new(tree.nodes[from_node].outputs[from_index], tree.nodes[to_node].inputs[to_index])
+
+
+def expected_material(context, obj):
+    """New material with the node tree the current addon builds for a cloud.
+
+    It is built from the settings of the cloud (see
+    materials.build_material_from_settings) and named like cloud materials
+    so the update functions change it. The material of the cloud is
+    restored afterwards. The caller removes the new material.
+    """
+
+    material = obj.active_material
+    expected = bpy.data.materials.new(pool.MATERIAL_NAME + " migration")
+    expected.use_nodes = True
+    for node in list(expected.node_tree.nodes):
+        expected.node_tree.nodes.remove(node)
+    try:
+        materials.build_material_from_settings(context, obj, expected)
+    finally:
+        obj.active_material = material
+    return expected
+
+
+def migratable_clouds(scene):
+    """Clouds of the scene whose material can be migrated, one per material.
+
+    Streamed tiles are skipped, they are copies of their template.
+    """
+
+    clouds = {}
+    for obj in scene.objects:
+        mat = obj.active_material
+        if (not obj.cloud_settings.is_cloud or obj.get(tiles.POOL_PROPERTY, False) or mat is None
+                or not mat.name.startswith(pool.MATERIAL_NAME)
+                or obj.cloud_settings.cloud_type not in materials.INITIAL_SHAPES):
+            continue
+        clouds.setdefault(mat.name, obj)
+    return list(clouds.values())
+
+
+def migrate_cloud(context, obj, dry_run=False):
+    """Patches the material of a cloud to the current node graph.
+
+    dry_run: only compute the changes.
+
+    Returns the diff of the material (see diff_material).
+    """
+
+    expected = expected_material(context, obj)
+    try:
+        diff = diff_material(obj.active_material, expected)
+        if not dry_run:
+            patch_material(obj.active_material, expected, diff)
+    finally:
+        bpy.data.materials.remove(expected)
+    return diff
+
+
+def migrate_clouds(context, dry_run=False):
+    """Migrates the materials of every cloud of the scene and writes a report.
+
+    Returns a dict with the diff of every material by name.
+    """
+
+    diffs = {}
+    for obj in migratable_clouds(context.scene):
+        diffs[obj.active_material.name] = migrate_cloud(context, obj, dry_run)
+    write_report(diffs, dry_run)
+    return diffs
+
+
+def write_report(diffs, dry_run):
+    """Writes the changes of every material in a text datablock."""
+
+    text = bpy.data.texts.get(REPORT_NAME)
+    if text is None:
+        text = bpy.data.texts.new(REPORT_NAME)
+    text.clear()
+    text.write("Dry run, nothing was changed\n" if dry_run else "Changes applied\n")
+    text.write("Material\tChanges\tNodes added\tNodes removed\tNodes changed\tValues\t" +
+               "Links added\tLinks removed\n")
+    for name, diff in sorted(diffs.items()):
+        text.write("{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\n".format(
+            name, change_count(diff), len(diff["add_nodes"]), len(diff["remove_nodes"]),
+            len(diff["node_changes"]), sum(len(changes) for changes in diff["values"].values()),
+            len(diff["add_links"]), len(diff["remove_links"])))
+    for name, diff in sorted(diffs.items()):
+        if not change_count(diff):
+            continue
+        text.write("\n{}\n".format(name))
+        for node in diff["add_nodes"]:
+            text.write("+ node {}\n".format(node))
+        for node in diff["remove_nodes"]:
+            text.write("- node {}\n".format(node))
+        for node, changes in sorted(diff["node_changes"].items()):
+            text.write("~ node {}: {}\n".format(node, ", ".join(changes)))
+        for node, changes in sorted(diff["values"].items()):
+            for index, old, new in changes:
+                text.write("~ value {}[{}]: {} -> {}\n".format(node, index, old, new))
+        for link in diff["add_links"]:
+            text.write("+ link {}[{}] -> {}[{}]\n".format(*link))
+        for link in diff["remove_links"]:
+            text.write("- link {}[{}] -> {}[{}]\n".format(*link))
+    return text
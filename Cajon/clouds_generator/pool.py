@@ -0,0 +1,171 @@
+"""
+    pool.py is part of Cloud Generator Blender Addon.
+
+    Foobar is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import os
+
+import bpy
+
+MATERIAL_NAME = "CloudMaterial_CG"
+REPORT_NAME = "Cloud datablock reclaim"
+
+# Custom property of the meshes created for clouds.
+MESH_PROPERTY = "cloud_mesh"
+
+# Custom property of the template materials (see materials.store_cloud_template).
+TEMPLATE_KEY = "cloud_template_key"
+
+# Rough sizes in bytes of the removed data, for the estimate of the memory
+# reclaimed: a material with its node tree, a node without its sockets, a
+# socket with its default value, a link, a mesh and every mesh vertex with
+# its loops and faces.
+MATERIAL_BYTES = 4096
+NODE_BYTES = 1024
+SOCKET_BYTES = 512
+LINK_BYTES = 64
+MESH_BYTES = 4096
+VERTEX_BYTES = 128
+
+
+def is_free_material(material):
+    """Whether a cloud material is not used anymore.
+
+    Template materials have no users on purpose and are not free.
+    """
+
+    return (material.users == 0 and material.name.startswith(MATERIAL_NAME)
+            and TEMPLATE_KEY not in material)
+
+
+def is_free_mesh(mesh):
+    """Whether a cloud mesh is not used anymore."""
+
+    return mesh.users == 0 and mesh.get(MESH_PROPERTY, False)
+
+
+def take_material():
+    """Free cloud material ready to build a new node graph or None.
+
+    Its nodes, custom properties and animation are removed.
+    """
+
+    for material in bpy.data.materials:
+        if is_free_material(material):
+            material.name = MATERIAL_NAME
+            for key in list(material.keys()):
+                del material[key]
+            material.use_nodes = True
+            material.node_tree.animation_data_clear()
+            material.node_tree.nodes.clear()
+            return material
+    return None
+
+
+def take_mesh():
+    """Free cloud mesh reset to the cube of primitive_cube_add or None.
+
+    Cloud meshes are cubes only scaled by transform_apply, so every vertex
+    is moved back to the corner of the cube of size 2 on its side.
+    """
+
+    for mesh in bpy.data.meshes:
+        if is_free_mesh(mesh):
+            coords = [0.0] * (len(mesh.vertices) * 3)
+            mesh.vertices.foreach_get("co", coords)
+            mesh.vertices.foreach_set("co", [1.0 if value >= 0.0 else -1.0 for value in coords])
+            mesh.update()
+            return mesh
+    return None
+
+
+def new_cloud_object(context, mesh):
+    """Object with a pooled mesh added like primitive_cube_add does.
+
+    It is linked to the active collection at the 3D cursor, selected alone
+    and made active.
+    """
+
+    obj = bpy.data.objects.new("Cube", mesh)
+    context.collection.objects.link(obj)
+    obj.location = context.scene.cursor.location
+    for other in context.selected_objects:
+        other.select_set(False)
+    obj.select_set(True)
+    context.view_layer.objects.active = obj
+    return obj
+
+
+def _process_memory():
+    """Resident memory of Blender in bytes or None if it cannot be read.
+
+    The allocator rarely gives freed datablocks back to the system, so its
+    change after a reclaim is not the memory reclaimed.
+    """
+
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def reclaim():
+    """Removes the cloud materials and meshes without users.
+
+    Returns a dict with the number of materials, meshes, nodes and links
+    removed, an estimate of the memory they used and, if it can be read,
+    the change of the resident memory of the process.
+    """
+
+    report = {"materials": 0, "meshes": 0, "nodes": 0, "links": 0, "estimated_memory": 0}
+    memory_before = _process_memory()
+    for material in [material for material in bpy.data.materials if is_free_material(material)]:
+        report["estimated_memory"] += MATERIAL_BYTES
+        if material.node_tree is not None:
+            nodes = material.node_tree.nodes
+            report["nodes"] += len(nodes)
+            report["links"] += len(material.node_tree.links)
+            sockets = sum(len(node.inputs) + len(node.outputs) for node in nodes)
+            report["estimated_memory"] += (len(nodes) * NODE_BYTES + sockets * SOCKET_BYTES
+                                           + len(material.node_tree.links) * LINK_BYTES)
+        bpy.data.materials.remove(material)
+        report["materials"] += 1
+    for mesh in [mesh for mesh in bpy.data.meshes if is_free_mesh(mesh)]:
+        report["estimated_memory"] += MESH_BYTES + len(mesh.vertices) * VERTEX_BYTES
+        bpy.data.meshes.remove(mesh)
+        report["meshes"] += 1
+    memory_after = _process_memory()
+    if memory_before is not None and memory_after is not None:
+        report["process_memory_change"] = memory_after - memory_before
+    write_report(report)
+    return report
+
+
+def write_report(report):
+    """Writes the reclaimed datablocks in a text datablock."""
+
+    text = bpy.data.texts.get(REPORT_NAME)
+    if text is None:
+        text = bpy.data.texts.new(REPORT_NAME)
+    text.clear()
+    text.write("Materials removed:\t{}\n".format(report["materials"]))
+    text.write("Meshes removed:\t{}\n".format(report["meshes"]))
+    text.write("Nodes removed:\t{}\n".format(report["nodes"]))
+    text.write("Links removed:\t{}\n".format(report["links"]))
+    text.write("Estimated memory reclaimed:\t{:.2f} MB\n".format(report["estimated_memory"] / 2**20))
+    if "process_memory_change" in report:
+        text.write("Process resident memory change:\t{:+.2f} MB\n".format(
+            report["process_memory_change"] / 2**20))
+    return text
@@ -0,0 +1,225 @@
+"""
+    preview.py is part of Cloud Generator Blender Addon.
+
+    Foobar is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import time
+
+import bpy
+from bpy.app.handlers import persistent
+
+from .cloud_settings import CloudSettings
+
+# EEVEE settings of the coarse profile. The Cycles ones are addon preferences.
+# Some of them are used by final renders too, so the full profile is
+# restored before rendering or saving (see preview_restore_handler).
+EEVEE_COARSE_PROFILE = (
+    ("volumetric_samples", 16),
+    ("volumetric_tile_size", '16'),
+)
+
+# Full profile values of the scenes that are in the coarse profile.
+# {scene name: {(struct, property): (full value, coarse value)}}
+_saved_profiles = {}
+
+_last_change = [0.0]
+# Whether a render job runs, for Blender versions without bpy.app.is_job_running.
+_rendering = [False]
+_view_matrices = {}
+_changed_scenes = set()
+_draw_handler = [None]
+_msgbus_owner = object()
+
+
+def _preferences():
+    return bpy.context.preferences.addons[__package__].preferences
+
+
+def coarse_profile(preferences):
+    """Settings of the coarse profile as a list of (struct, property, value)."""
+
+    profile = [
+        ("cycles", "volume_preview_step_rate", preferences.preview_step_rate),
+        ("cycles", "volume_max_steps", preferences.preview_max_steps),
+        ("cycles", "preview_samples", preferences.preview_samples),
+        ("render", "preview_pixel_size", preferences.preview_pixel_size),
+    ]
+    profile.extend(("eevee", name, value) for name, value in EEVEE_COARSE_PROFILE)
+    return profile
+
+
+def apply_coarse_profile(scene, preferences):
+    """Saves the current preview settings of the scene and sets the coarse ones.
+
+    Does nothing if the scene is already in the coarse profile.
+    """
+
+    if scene.name in _saved_profiles:
+        return False
+    saved = {}
+    for struct, name, value in coarse_profile(preferences):
+        owner = getattr(scene, struct)
+        saved[(struct, name)] = (getattr(owner, name), value)
+        setattr(owner, name, value)
+    _saved_profiles[scene.name] = saved
+    return True
+
+
+def restore_full_profile(scene):
+    """Restores the preview settings saved by apply_coarse_profile.
+
+    Settings changed by the user while in the coarse profile are kept.
+    """
+
+    saved = _saved_profiles.pop(scene.name, None)
+    if saved is None:
+        return False
+    for (struct, name), (full, coarse) in saved.items():
+        owner = getattr(scene, struct)
+        if getattr(owner, name) == coarse:
+            setattr(owner, name, full)
+    return True
+
+
+def render_running():
+    """Whether a render job is running.
+
+    bpy.app.is_job_running was added in Blender 3.3. Older versions use
+    the state kept by the render handlers of this module.
+    """
+
+    is_job_running = getattr(bpy.app, "is_job_running", None)
+    if is_job_running is not None:
+        return is_job_running('RENDER')
+    return _rendering[0]
+
+
+def notify_change(scene):
+    """Switches the scene to the coarse profile until it has been idle for a while."""
+
+    preferences = _preferences()
+    if not preferences.preview_mode or render_running():
+        return
+    _last_change[0] = time.monotonic()
+    apply_coarse_profile(scene, preferences)
+    if not bpy.app.timers.is_registered(_refine_timer):
+        bpy.app.timers.register(_refine_timer, first_interval=preferences.preview_idle_time)
+
+
+def _refine_timer():
+    """Timer that restores the full profile once the idle time has passed."""
+
+    remaining = _preferences().preview_idle_time - (time.monotonic() - _last_change[0])
+    if remaining > 0.0:
+        return remaining
+    for scene in bpy.data.scenes:
+        restore_full_profile(scene)
+    _saved_profiles.clear()
+    return None
+
+
+def _view_change_timer():
+    """Switches the scenes whose view changed in a draw callback."""
+
+    for name in _changed_scenes:
+        scene = bpy.data.scenes.get(name)
+        if scene is not None:
+            notify_change(scene)
+    _changed_scenes.clear()
+    return None
+
+
+def _view_draw_callback():
+    """3D view draw callback that detects view changes in rendered viewports.
+
+    Data can not be changed while drawing so the switch is done in a timer.
+    """
+
+    context = bpy.context
+    region_data = context.region_data
+    if region_data is None or context.space_data.shading.type != 'RENDERED':
+        return
+    key = region_data.as_pointer()
+    view_matrix = region_data.view_matrix.copy()
+    previous = _view_matrices.get(key)
+    _view_matrices[key] = view_matrix
+    if previous is not None and previous != view_matrix and _preferences().preview_mode:
+        _changed_scenes.add(context.scene.name)
+        if not bpy.app.timers.is_registered(_view_change_timer):
+            bpy.app.timers.register(_view_change_timer, first_interval=0.0)
+
+
+def _cloud_settings_changed():
+    notify_change(bpy.context.scene)
+
+
+def subscribe():
+    """Subscribes to the changes of any cloud settings."""
+
+    bpy.msgbus.subscribe_rna(key=CloudSettings, owner=_msgbus_owner, args=(), notify=_cloud_settings_changed)
+
+
+@persistent
+def preview_load_handler(_scene):
+    """Subscriptions are cleared when a file is loaded."""
+
+    _saved_profiles.clear()
+    _view_matrices.clear()
+    subscribe()
+
+
+@persistent
+def preview_restore_handler(_scene, _depsgraph=None):
+    """Final renders and saved files never get the coarse profile."""
+
+    for scene in bpy.data.scenes:
+        restore_full_profile(scene)
+
+
+@persistent
+def preview_render_init_handler(_scene, _depsgraph=None):
+    _rendering[0] = True
+
+
+@persistent
+def preview_render_end_handler(_scene, _depsgraph=None):
+    _rendering[0] = False
+
+
+def register():
+    subscribe()
+    bpy.app.handlers.load_post.append(preview_load_handler)
+    bpy.app.handlers.save_pre.append(preview_restore_handler)
+    bpy.app.handlers.render_pre.append(preview_restore_handler)
+    bpy.app.handlers.render_init.append(preview_render_init_handler)
+    bpy.app.handlers.render_complete.append(preview_render_end_handler)
+    bpy.app.handlers.render_cancel.append(preview_render_end_handler)
+    _draw_handler[0] = bpy.types.SpaceView3D.draw_handler_add(_view_draw_callback, (), 'WINDOW', 'POST_PIXEL')
+
+
+def unregister():
+    if bpy.app.timers.is_registered(_refine_timer):
+        bpy.app.timers.unregister(_refine_timer)
+    for scene in bpy.data.scenes:
+        restore_full_profile(scene)
+    bpy.msgbus.clear_by_owner(_msgbus_owner)
+    bpy.app.handlers.load_post.remove(preview_load_handler)
+    bpy.app.handlers.save_pre.remove(preview_restore_handler)
+    bpy.app.handlers.render_pre.remove(preview_restore_handler)
+    bpy.app.handlers.render_init.remove(preview_render_init_handler)
+    bpy.app.handlers.render_complete.remove(preview_render_end_handler)
+    bpy.app.handlers.render_cancel.remove(preview_render_end_handler)
+    _rendering[0] = False
+    bpy.types.SpaceView3D.draw_handler_remove(_draw_handler[0], 'WINDOW')
+    _draw_handler[0] = None
@@ -0,0 +1,324 @@
+"""
+    profiling.py is part of Cloud Generator Blender Addon.
+
+    Foobar is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import csv
+import math
+import time
+from collections import deque
+
+_enabled = [False]
+
+# Total bpy.ops calls done by the instrumented code while profiling.
+_operator_calls = [0]
+
+# Number of profiled cloud generations.
+_generations = [0]
+
+# {phase name: {"calls", "time", "max_time", "nodes", "links", "operators"}}
+_phases = {}
+
+# Number of profiled in-place rebuilds (cloud type changes and regenerations)
+# and their phases, kept apart from the generations.
+_rebuilds = [0]
+_rebuild_phases = {}
+
+# Depth of the rebuilds being profiled, a regeneration contains a rebuild.
+_rebuild_depth = [0]
+
+# Phases that have begun and not ended yet.
+_open_phases = []
+
+
+_updates_enabled = [False]
+
+# Updates slower than this (in seconds) are logged.
+_slow_update_threshold = [0.05]
+
+# Latencies kept per property to compute the percentiles.
+MAX_UPDATE_SAMPLES = 2048
+
+# Slow updates kept in the log.
+MAX_SLOW_UPDATES = 1000
+
+# {property name: {"count", "max", "samples"}}
+_updates = {}
+
+# (time.time(), property name, cloud name, seconds)
+_slow_updates = deque(maxlen=MAX_SLOW_UPDATES)
+
+
+class _Phase:
+    """Measures of a phase taken when it begins."""
+
+    __slots__ = ("name", "node_tree", "phases", "start", "nodes", "links", "operators")
+
+    def __init__(self, name, node_tree, phases):
+        self.name = name
+        self.node_tree = node_tree
+        self.phases = phases
+        self.nodes, self.links = _counts(node_tree)
+        self.operators = _operator_calls[0]
+        self.start = time.perf_counter()
+
+
+def _counts(node_tree):
+    if node_tree is None:
+        return 0, 0
+    return len(node_tree.nodes), len(node_tree.links)
+
+
+def begin_phase(name, node_tree=None):
+    """Begins to measure a phase of the cloud generation.
+
+    name: name of the phase. Phases with the same name are added together.
+        Phases of in-place rebuilds (see begin_rebuild) are added apart.
+    node_tree: node tree whose new nodes and links are counted, if any.
+    """
+
+    if _enabled[0]:
+        _open_phases.append(_Phase(name, node_tree, _rebuild_phases if _rebuild_depth[0] else _phases))
+
+
+def end_phase():
+    """Ends the last phase that began and adds its measures to the totals."""
+
+    if not _enabled[0] or not _open_phases:
+        return
+    current = _open_phases.pop()
+    elapsed = time.perf_counter() - current.start
+    nodes, links = _counts(current.node_tree)
+    totals = current.phases.get(current.name)
+    if totals is None:
+        totals = current.phases[current.name] = {"calls": 0, "time": 0.0, "max_time": 0.0,
+                                          "nodes": 0, "links": 0, "operators": 0}
+    totals["calls"] += 1
+    totals["time"] += elapsed
+    totals["max_time"] = max(totals["max_time"], elapsed)
+    totals["nodes"] += nodes - current.nodes
+    totals["links"] += links - current.links
+    totals["operators"] += _operator_calls[0] - current.operators
+
+
+def operator_call():
+    """Counts a bpy.ops call. Called before every operator of the generation."""
+
+    if _enabled[0]:
+        _operator_calls[0] += 1
+
+
+def generation_done():
+    """Counts a finished cloud generation."""
+
+    if _enabled[0]:
+        _generations[0] += 1
+
+
+def begin_rebuild():
+    """Begins an in-place rebuild of a cloud. Its phases are measured apart."""
+
+    if _enabled[0]:
+        _rebuild_depth[0] += 1
+
+
+def rebuild_done():
+    """Counts a finished in-place rebuild, nested rebuilds are counted once."""
+
+    if not _enabled[0] or not _rebuild_depth[0]:
+        return
+    _rebuild_depth[0] -= 1
+    if not _rebuild_depth[0]:
+        _rebuilds[0] += 1
+
+
+def enable():
+    _enabled[0] = True
+
+
+def disable():
+    _enabled[0] = False
+    _open_phases.clear()
+    _rebuild_depth[0] = 0
+
+
+def is_enabled():
+    return _enabled[0]
+
+
+def reset():
+    """Clears all the measures."""
+
+    _phases.clear()
+    _rebuild_phases.clear()
+    _open_phases.clear()
+    _operator_calls[0] = 0
+    _generations[0] = 0
+    _rebuilds[0] = 0
+    _rebuild_depth[0] = 0
+
+
+def generations():
+    return _generations[0]
+
+
+def rebuilds():
+    return _rebuilds[0]
+
+
+def results(rebuild=False):
+    """Measures of every phase aggregated over the profiled generations.
+
+    Returns a list of dicts sorted by total time, slowest first. Besides
+    the totals, every dict has the mean time, nodes, links and operators
+    per generation.
+
+    rebuild: aggregate the phases of the in-place rebuilds over the
+        profiled rebuilds instead.
+    """
+
+    if rebuild:
+        count, phases = max(1, _rebuilds[0]), _rebuild_phases
+    else:
+        count, phases = max(1, _generations[0]), _phases
+    rows = []
+    for name, totals in phases.items():
+        row = dict(totals)
+        row["name"] = name
+        row["mean_time"] = totals["time"] / count
+        row["mean_nodes"] = totals["nodes"] / count
+        row["mean_links"] = totals["links"] / count
+        row["mean_operators"] = totals["operators"] / count
+        rows.append(row)
+    rows.sort(key=lambda row: row["time"], reverse=True)
+    return rows
+
+
+def timed_update(property_name, function):
+    """Update function of a property that measures the latency of function.
+
+    property_name: name of the property, measures are grouped by it.
+    function: update function of the property, called with (self, context).
+    """
+
+    def update(self, context):
+        if not _updates_enabled[0]:
+            return function(self, context)
+        start = time.perf_counter()
+        try:
+            return function(self, context)
+        finally:
+            _record_update(property_name, self.id_data.name, time.perf_counter() - start)
+
+    update.__name__ = function.__name__
+    update.__doc__ = function.__doc__
+    return update
+
+
+def _record_update(property_name, cloud_name, elapsed):
+    totals = _updates.get(property_name)
+    if totals is None:
+        totals = _updates[property_name] = {"count": 0, "max": 0.0,
+                                            "samples": deque(maxlen=MAX_UPDATE_SAMPLES)}
+    totals["count"] += 1
+    totals["max"] = max(totals["max"], elapsed)
+    totals["samples"].append(elapsed)
+    if elapsed >= _slow_update_threshold[0]:
+        _slow_updates.append((time.time(), property_name, cloud_name, elapsed))
+
+
+def enable_updates(slow_threshold=None):
+    """Starts to measure the update functions.
+
+    slow_threshold: seconds from which an update is logged as slow.
+    """
+
+    if slow_threshold is not None:
+        _slow_update_threshold[0] = slow_threshold
+    _updates_enabled[0] = True
+
+
+def disable_updates():
+    _updates_enabled[0] = False
+
+
+def updates_enabled():
+    return _updates_enabled[0]
+
+
+def reset_updates():
+    """Clears the latency measures and the slow update log."""
+
+    _updates.clear()
+    _slow_updates.clear()
+
+
+def percentile(sorted_values, fraction):
+    """Value below which the given fraction of a sorted list falls (nearest rank)."""
+
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+
+def update_latencies():
+    """Latency histogram of every property, slowest p95 first.
+
+    Returns a list of dicts with name, count, p50, p95 and max in seconds.
+    The percentiles are computed over the last MAX_UPDATE_SAMPLES updates.
+    """
+
+    rows = []
+    for name, totals in _updates.items():
+        samples = sorted(totals["samples"])
+        rows.append({
+            "name": name,
+            "count": totals["count"],
+            "p50": percentile(samples, 0.5),
+            "p95": percentile(samples, 0.95),
+            "max": totals["max"],
+        })
+    rows.sort(key=lambda row: row["p95"], reverse=True)
+    return rows
+
+
+def slow_updates():
+    """Log of the slow updates as a list of (timestamp, property name, cloud name, seconds)."""
+
+    return list(_slow_updates)
+
+
+def write_update_latencies_csv(filepath):
+    """Writes the latency histograms to a CSV file, times in milliseconds."""
+
+    with open(filepath, "w", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["property", "count", "p50_ms", "p95_ms", "max_ms"])
+        for row in update_latencies():
+            writer.writerow([row["name"], row["count"],
+                             "{:.3f}".format(row["p50"] * 1000),
+                             "{:.3f}".format(row["p95"] * 1000),
+                             "{:.3f}".format(row["max"] * 1000)])
+
+
+def write_slow_updates_csv(filepath):
+    """Writes the slow update log to a CSV file, times in milliseconds."""
+
+    with open(filepath, "w", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["time", "property", "cloud", "ms"])
+        for timestamp, name, cloud_name, elapsed in _slow_updates:
+            writer.writerow([time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp)),
+                             name, cloud_name, "{:.3f}".format(elapsed * 1000)])
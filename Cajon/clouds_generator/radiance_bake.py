@@ -0,0 +1,342 @@
+"""
+    radiance_bake.py is part of Cloud Generator Blender Addon.
+
+    Foobar is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import math
+import os
+import tempfile
+import time
+
+import bpy
+import numpy as np
+from mathutils import Vector
+
+from . import density
+from . import render_tuning
+
+MATERIAL_NAME = "CloudRadianceMaterial_CG"
+IMAGE_NAME = "CloudRadianceGrid_CG"
+REPORT_NAME = "Cloud radiance bake"
+
+# Custom property of the baked clouds with their cloud material.
+FULL_MATERIAL_PROPERTY = "cloud_full_material"
+
+# Custom properties of the grid image.
+GRID_SHAPE = "radiance_grid_shape"
+GRID_COLUMNS = "radiance_grid_columns"
+
+# Multiple scattering approximation: every octave scatters a times the
+# light of the previous one with the extinction multiplied by b.
+SCATTERING_OCTAVES = 4
+SCATTERING_A = 0.5
+SCATTERING_B = 0.5
+
+ISOTROPIC_PHASE = 1 / (4 * math.pi)
+
+
+def sun_lamps(scene):
+    """(direction of the light, color * strength) of every sun lamp rendered in the scene."""
+
+    suns = []
+    for obj in scene.objects:
+        if obj.type == 'LIGHT' and obj.data.type == 'SUN' and not obj.hide_render:
+            direction = (obj.matrix_world.to_3x3() @ Vector((0.0, 0.0, -1.0))).normalized()
+            suns.append((direction, np.array(obj.data.color[:3]) * obj.data.energy))
+    return suns
+
+
+def world_ambient(world):
+    """Approximate color of the sky light, from the Background node of the world."""
+
+    if world is None:
+        return np.zeros(3)
+    if world.use_nodes:
+        for node in world.node_tree.nodes:
+            if node.type == 'BACKGROUND' and not node.inputs["Color"].is_linked:
+                return np.array(node.inputs["Color"].default_value[:3]) * node.inputs["Strength"].default_value
+    return np.array(world.color[:3])
+
+
+def optical_depth(grid, direction, voxel_size):
+    """Optical depth from the center of every voxel to the light, out of the grid.
+
+    grid: (nz, ny, nx) extinction per world unit.
+    direction: direction of the light in the local axes of the grid.
+    voxel_size: (x, y, z) size of a voxel in world units.
+    """
+
+    nz, ny, nx = grid.shape
+    step = min(voxel_size)
+    toward_light = -np.array(direction[:]) * step / np.array(voxel_size)
+    z, y, x = np.meshgrid(np.arange(nz) + 0.5, np.arange(ny) + 0.5, np.arange(nx) + 0.5, indexing="ij")
+    position = np.stack((x, y, z), axis=-1) + toward_light
+
+    # Half of the voxel itself, then whole steps toward the light.
+    depth = grid.astype(np.float32) * step * 0.5
+    limits = np.array((nx, ny, nz))
+    max_steps = int(math.ceil(math.sqrt(nx * nx + ny * ny + nz * nz) / max(1e-6, np.abs(toward_light).max())))
+    for _ in range(max_steps):
+        index = np.floor(position).astype(np.int32)
+        inside = np.all((index >= 0) & (index < limits), axis=-1)
+        if not inside.any():
+            break
+        depth[inside] += grid[index[inside, 2], index[inside, 1], index[inside, 0]] * step
+        position += toward_light
+    return depth
+
+
+def scattered_radiance(grid, voxel_size, lights, multiple_scattering=True):
+    """Light scattered toward any direction by every voxel, per world unit.
+
+    Single scattering of directional lights with an isotropic phase and
+    white albedo. The multiple scattering approximation adds
+    SCATTERING_OCTAVES octaves with less light and less extinction.
+
+    lights: (direction in the local axes of the grid, irradiance RGB).
+
+    Returns a (nz, ny, nx, 3) array to use as volume emission.
+    """
+
+    octaves = SCATTERING_OCTAVES if multiple_scattering else 1
+    radiance = np.zeros(grid.shape + (3,), dtype=np.float32)
+    for direction, irradiance in lights:
+        depth = optical_depth(grid, direction, voxel_size)
+        for octave in range(octaves):
+            transmittance = np.exp(-depth * SCATTERING_B ** octave)
+            radiance += (SCATTERING_A ** octave * ISOTROPIC_PHASE
+                         * transmittance * grid)[..., np.newaxis] * irradiance
+    return radiance
+
+
+def grid_image(grid, radiance, name=IMAGE_NAME):
+    """Packs the radiance (RGB) and the density (A) of a grid in an atlas image."""
+
+    nz, ny, nx = grid.shape
+    columns, rows = density.atlas_layout(nz)
+    atlas = density.grid_to_atlas(np.concatenate((radiance, grid[..., np.newaxis]), axis=-1), columns, rows)
+    image = bpy.data.images.new(name, atlas.shape[1], atlas.shape[0], alpha=True, float_buffer=True)
+    image.alpha_mode = 'CHANNEL_PACKED'
+    image.pixels.foreach_set(atlas.astype(np.float32).ravel())
+    image.pack()
+    image[GRID_SHAPE] = (nx, ny, nz)
+    image[GRID_COLUMNS] = columns
+    return image
+
+
+def _math(nodes, operation, location, value=None):
+    node = nodes.new(type="ShaderNodeMath")
+    node.operation = operation
+    node.location = location
+    if value is not None:
+        node.inputs[1].default_value = value
+    return node
+
+
+def grid_texture(material, image):
+    """Adds to a material the nodes that read a grid image in the domain.
+
+    The Generated coordinates of the domain select the slice of the atlas
+    and the point inside it.
+
+    Returns the Image Texture node, with the RGB in Color and the density
+    in Alpha.
+    """
+
+    nx, ny, nz = image[GRID_SHAPE]
+    columns = image[GRID_COLUMNS]
+    rows = image.size[1] // ny
+    nodes = material.node_tree.nodes
+    links = material.node_tree.links
+
+    coordinates = nodes.new(type="ShaderNodeTexCoord")
+    coordinates.location = (-1400, 0)
+    separate = nodes.new(type="ShaderNodeSeparateXYZ")
+    separate.location = (-1200, 0)
+    links.new(coordinates.outputs["Generated"], separate.inputs["Vector"])
+
+    # Slice = clamp(floor(z * nz), 0, nz - 1)
+    slice_z = _math(nodes, 'MULTIPLY', (-1000, -200), nz)
+    links.new(separate.outputs["Z"], slice_z.inputs[0])
+    slice_floor = _math(nodes, 'FLOOR', (-850, -200))
+    links.new(slice_z.outputs["Value"], slice_floor.inputs[0])
+    slice_min = _math(nodes, 'MINIMUM', (-700, -200), nz - 1)
+    links.new(slice_floor.outputs["Value"], slice_min.inputs[0])
+    slice_index = _math(nodes, 'MAXIMUM', (-550, -200), 0.0)
+    links.new(slice_min.outputs["Value"], slice_index.inputs[0])
+
+    # u = (slice mod columns + x) / columns, v = (floor(slice / columns) + y) / rows
+    column = _math(nodes, 'MODULO', (-400, 0), columns)
+    links.new(slice_index.outputs["Value"], column.inputs[0])
+    u_add = _math(nodes, 'ADD', (-250, 100))
+    links.new(column.outputs["Value"], u_add.inputs[0])
+    links.new(separate.outputs["X"], u_add.inputs[1])
+    u = _math(nodes, 'DIVIDE', (-100, 100), columns)
+    links.new(u_add.outputs["Value"], u.inputs[0])
+
+    row_divide = _math(nodes, 'DIVIDE', (-400, -300), columns)
+    links.new(slice_index.outputs["Value"], row_divide.inputs[0])
+    row = _math(nodes, 'FLOOR', (-250, -300))
+    links.new(row_divide.outputs["Value"], row.inputs[0])
+    v_add = _math(nodes, 'ADD', (-100, -300))
+    links.new(row.outputs["Value"], v_add.inputs[0])
+    links.new(separate.outputs["Y"], v_add.inputs[1])
+    v = _math(nodes, 'DIVIDE', (50, -300), rows)
+    links.new(v_add.outputs["Value"], v.inputs[0])
+
+    combine = nodes.new(type="ShaderNodeCombineXYZ")
+    combine.location = (200, 0)
+    links.new(u.outputs["Value"], combine.inputs["X"])
+    links.new(v.outputs["Value"], combine.inputs["Y"])
+
+    texture = nodes.new(type="ShaderNodeTexImage")
+    texture.location = (400, 0)
+    texture.image = image
+    texture.interpolation = 'Closest'
+    texture.extension = 'EXTEND'
+    links.new(combine.outputs["Vector"], texture.inputs["Vector"])
+    return texture
+
+
+def radiance_material(image):
+    """Volume material that emits and absorbs from a grid image, with no scattering."""
+
+    material = bpy.data.materials.new(MATERIAL_NAME)
+    material.use_nodes = True
+    nodes = material.node_tree.nodes
+    links = material.node_tree.links
+    nodes.clear()
+    texture = grid_texture(material, image)
+
+    # Black scattering color: the volume only absorbs and emits.
+    volume = nodes.new(type="ShaderNodeVolumePrincipled")
+    volume.location = (700, 0)
+    volume.inputs["Color"].default_value = (0.0, 0.0, 0.0, 1.0)
+    volume.inputs["Emission Strength"].default_value = 1.0
+    links.new(texture.outputs["Alpha"], volume.inputs["Density"])
+    links.new(texture.outputs["Color"], volume.inputs["Emission Color"])
+
+    output = nodes.new(type="ShaderNodeOutputMaterial")
+    output.location = (1000, 0)
+    links.new(volume.outputs["Volume"], output.inputs["Volume"])
+    return material
+
+
+def bake_radiance(scene, obj, resolution=64, multiple_scattering=True):
+    """Bakes the density and the light of a cloud and renders it with them.
+
+    The cloud material is kept in the object and given back by
+    restore_material. Moving the cloud or the sun lamps after the bake
+    does not change its light.
+
+    resolution: voxels along the biggest side of the domain.
+
+    Returns the baked material.
+    """
+
+    grid = density.sample_density(obj, resolution)
+    nz, ny, nx = grid.shape
+    dimensions = obj.dimensions
+    voxel_size = (dimensions.x / nx, dimensions.y / ny, dimensions.z / nz)
+    rotation = obj.matrix_world.to_quaternion().inverted()
+    lights = [(rotation @ direction, irradiance) for direction, irradiance in sun_lamps(scene)]
+    # The sky light comes from the upper hemisphere: 2 pi times its color
+    # scatters as much as a light from above.
+    lights.append((rotation @ Vector((0.0, 0.0, -1.0)), world_ambient(scene.world) * 2 * math.pi))
+    radiance = scattered_radiance(grid, voxel_size, lights, multiple_scattering)
+
+    material = radiance_material(grid_image(grid, radiance))
+    if FULL_MATERIAL_PROPERTY not in obj:
+        obj[FULL_MATERIAL_PROPERTY] = obj.active_material
+    else:
+        remove_baked_material(obj.active_material)
+    obj.active_material = material
+    return material
+
+
+def remove_baked_material(material):
+    if material is None or MATERIAL_NAME not in material.name or material.users > 0:
+        return
+    for node in material.node_tree.nodes:
+        if node.type == 'TEX_IMAGE' and node.image is not None and node.image.users <= 1:
+            bpy.data.images.remove(node.image)
+    bpy.data.materials.remove(material)
+
+
+def restore_material(obj):
+    """Gives back its cloud material to a baked cloud."""
+
+    full_material = obj.get(FULL_MATERIAL_PROPERTY)
+    if full_material is None:
+        return
+    baked = obj.active_material
+    obj.active_material = full_material
+    del obj[FULL_MATERIAL_PROPERTY]
+    remove_baked_material(baked)
+
+
+def bake_clouds(context, clouds, resolution=64, multiple_scattering=True, measure=True):
+    """Bakes the radiance of the clouds and reports the render time and image difference.
+
+    measure: render the current frame with the cloud materials and with
+        the baked ones, and write the times and the quality of the baked
+        render (see render_tuning.image_quality) in the report text.
+
+    Returns a dict with the bake time and, if measured, the frame times
+    and the quality.
+    """
+
+    scene = context.scene
+    report = {"clouds": len(clouds), "resolution": resolution, "multiple_scattering": multiple_scattering}
+    render = scene.render
+    saved = (render.filepath, render.image_settings.file_format)
+    filepath = os.path.join(tempfile.mkdtemp(prefix="cloud_radiance_"), "frame.exr")
+    render.filepath = filepath
+    render.image_settings.file_format = 'OPEN_EXR'
+    try:
+        if measure:
+            report["full_time"], reference = render_tuning.render_pixels(scene, filepath)
+        start = time.perf_counter()
+        for obj in clouds:
+            bake_radiance(scene, obj, resolution, multiple_scattering)
+        report["bake_time"] = time.perf_counter() - start
+        if measure:
+            report["baked_time"], pixels = render_tuning.render_pixels(scene, filepath)
+            report["quality"] = render_tuning.image_quality(pixels, reference)
+    finally:
+        render.filepath, render.image_settings.file_format = saved
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        os.rmdir(os.path.dirname(filepath))
+    write_report(report)
+    return report
+
+
+def write_report(report):
+    """Writes the bake time, the frame times and the quality in a text datablock."""
+
+    text = bpy.data.texts.get(REPORT_NAME)
+    if text is None:
+        text = bpy.data.texts.new(REPORT_NAME)
+    text.clear()
+    text.write("Clouds baked: {}. Resolution: {}. Multiple scattering: {}\n".format(
+        report["clouds"], report["resolution"], "yes" if report["multiple_scattering"] else "no"))
+    text.write("Bake time:\t{:.2f} s\n".format(report["bake_time"]))
+    if "full_time" in report:
+        text.write("Frame with cloud materials:\t{:.2f} s\n".format(report["full_time"]))
+        text.write("Frame with baked radiance:\t{:.2f} s\n".format(report["baked_time"]))
+        if report["baked_time"] > 0.0:
+            text.write("Speedup:\t{:.2f}x\n".format(report["full_time"] / report["baked_time"]))
+        text.write("Quality (1 is identical):\t{:.4f}\n".format(report["quality"]))
+    return text
@@ -0,0 +1,135 @@
+"""
+    randomization.py is part of Cloud Generator Blender Addon.
+
+    Foobar is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import random
+
+import numpy as np
+
+# Cloud settings randomized when a cloud is generated.
+# (property name, number of components, minimum, maximum)
+RANDOM_PARAMETERS = (
+    ("wind_big_turbulence", 1, 0.2, 1.0),
+    ("wind_small_turbulence", 1, 0.2, 0.5),
+    ("detail_wind_strength", 1, 0.0, 1.0),
+    ("amount_of_clouds", 1, 0.2, 0.6),
+    ("detail_bump_strength", 1, 0.1, 0.5),
+    ("subtract_shape_imperfection", 1, 0.0, 1.0),
+    ("add_shape_imperfection", 1, 0.0, 0.6),
+    ("roundness", 1, 0.0, 1.0),
+    ("roundness_coords", 3, 0.0, 200.0),
+    ("add_shape_imperfection_coords", 3, 0.0, 200.0),
+    ("subtract_shape_imperfection_coords", 3, 0.0, 200.0),
+    ("cloudscape_noise_coords", 3, 0.0, 200.0),
+    ("wind_big_turbulence_coords", 3, 0.0, 200.0),
+    ("wind_small_turbulence_coords", 3, 0.0, 200.0),
+)
+
+# Simple seeds are the first component of their advanced coordinates.
+SIMPLE_SEEDS = (
+    ("roundness_simple_seed", "roundness_coords"),
+    ("add_shape_imperfection_simple_seed", "add_shape_imperfection_coords"),
+    ("subtract_shape_imperfection_simple_seed", "subtract_shape_imperfection_coords"),
+    ("cloudscape_noise_simple_seed", "cloudscape_noise_coords"),
+    ("wind_turbulence_simple_seed", "wind_big_turbulence_coords"),
+)
+
+SEED_MAX = 2**31 - 1
+
+_GOLDEN_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _mix(x):
+    """SplitMix64 finalizer applied element-wise to an uint64 array."""
+
+    x = x + _GOLDEN_GAMMA
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def random_seed():
+    """Returns a new seed drawn from the global random module."""
+
+    return random.randint(0, SEED_MAX)
+
+
+def uniform_streams(seeds, streams):
+    """Uniform values in [0, 1) for every seed and stream.
+
+    The value for a given seed and stream index does not depend on the
+    rest of seeds, so a cloud can be regenerated alone or as part of a
+    batch with identical results.
+
+    seeds: sequence of integer seeds.
+    streams: number of values to draw for each seed.
+    """
+
+    seeds = np.atleast_1d(np.asarray(seeds, dtype=np.int64)).astype(np.uint64)
+    counters = np.arange(streams, dtype=np.uint64)
+    keys = _mix(seeds)[:, np.newaxis]
+    bits = _mix(keys ^ (counters * _GOLDEN_GAMMA))
+    return (bits >> np.uint64(11)).astype(np.float64) * (1.0 / 2**53)
+
+
+def sample_cloud_parameters(seeds):
+    """Draws the random cloud settings of several clouds at once.
+
+    Returns a dict that maps every property of RANDOM_PARAMETERS and
+    SIMPLE_SEEDS to an array with one row per seed.
+    """
+
+    streams = sum(components for _, components, _, _ in RANDOM_PARAMETERS)
+    uniforms = uniform_streams(seeds, streams)
+
+    parameters = {}
+    column = 0
+    for name, components, minimum, maximum in RANDOM_PARAMETERS:
+        values = minimum + uniforms[:, column:column + components] * (maximum - minimum)
+        parameters[name] = values if components > 1 else values[:, 0]
+        column += components
+
+    for simple_seed, coords in SIMPLE_SEEDS:
+        parameters[simple_seed] = parameters[coords][:, 0]
+
+    return parameters
+
+
+def cloud_parameters(parameters, index):
+    """Settings of a single cloud from the result of sample_cloud_parameters."""
+
+    values = {}
+    for name, column in parameters.items():
+        value = column[index]
+        values[name] = tuple(float(v) for v in value) if np.ndim(value) else float(value)
+    return values
+
+
+def layer_seeds(seed, count):
+    """Seeds of the noise of the layers of a layered cloudscape.
+
+    They are drawn from the streams of the seed that follow the random
+    cloud settings, between 0 and 200 like the cloudscape noise coordinates.
+    """
+
+    streams = sum(components for _, components, _, _ in RANDOM_PARAMETERS)
+    uniforms = uniform_streams([seed], streams + count)[0, streams:]
+    return [float(value) * 200.0 for value in uniforms]
+
+
+def template_key(seed, cloud_type):
+    """Key that identifies the material built for a seed and a cloud type."""
+
+    return "{}:{}".format(cloud_type, seed)
@@ -0,0 +1,201 @@
+"""
+    render_tuning.py is part of Cloud Generator Blender Addon.
+
+    Foobar is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import os
+import tempfile
+import time
+
+import bpy
+import numpy as np
+
+# Values tried for every Cycles setting, from cheapest to most expensive.
+SEARCH_SPACE = (
+    ("volume_step_rate", (1.0, 0.7, 0.4, 0.25, 0.15, 0.1)),
+    ("volume_max_steps", (256, 512, 1024, 2048)),
+    ("volume_bounces", (0, 1, 2, 4, 10)),
+    ("adaptive_threshold", (0.05, 0.02, 0.01, 0.005)),
+)
+
+# Settings of the reference render. Same as RENDER_OT_cloud_render_settings.
+REFERENCE_SETTINGS = {
+    "volume_step_rate": 0.15,
+    "volume_max_steps": 2048,
+    "volume_bounces": 10,
+    "adaptive_threshold": 0.01,
+}
+
+TABLE_NAME = "Cloud render tuning"
+
+
+def image_quality(pixels, reference):
+    """Similarity between a test render and the reference render.
+
+    It is 1 minus the RMS error relative to the RMS of the reference, clamped
+    to [0, 1]. 1 means identical images.
+    """
+
+    reference_rms = np.sqrt(np.mean(np.square(reference)))
+    if reference_rms == 0.0:
+        return 1.0 if not np.any(pixels) else 0.0
+    error_rms = np.sqrt(np.mean(np.square(pixels - reference)))
+    return float(min(1.0, max(0.0, 1.0 - error_rms / reference_rms)))
+
+
+def estimate_frame_time(test_time, test_pixels, frame_pixels, test_samples, frame_samples):
+    """Full frame render time extrapolated from a low resolution test render."""
+
+    return test_time * (frame_pixels / test_pixels) * (frame_samples / test_samples)
+
+
+def select_best(results, target_time, quality_floor):
+    """Chooses the best result of the search.
+
+    Among the results that reach the quality floor and the time budget
+    the one with the best quality is chosen. If none reaches both, the
+    fastest one that reaches the quality floor. If none reaches the quality
+    floor, the one with the best quality.
+    """
+
+    good = [r for r in results if r["quality"] >= quality_floor]
+    in_budget = [r for r in good if r["frame_time"] <= target_time]
+    if in_budget:
+        return max(in_budget, key=lambda r: (r["quality"], -r["frame_time"]))
+    if good:
+        return min(good, key=lambda r: r["frame_time"])
+    return max(results, key=lambda r: r["quality"])
+
+
+def render_pixels(scene, filepath):
+    """Renders the scene to filepath and returns the time and the pixels."""
+
+    start = time.perf_counter()
+    bpy.ops.render.render(write_still=True)
+    render_time = time.perf_counter() - start
+
+    image = bpy.data.images.load(filepath)
+    pixels = np.empty(len(image.pixels), dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    bpy.data.images.remove(image)
+    return render_time, pixels
+
+
+def _apply_settings(scene, settings):
+    for name, value in settings.items():
+        setattr(scene.cycles, name, value)
+
+
+def write_table(results, best, target_time, quality_floor):
+    """Writes the time and quality of every tested configuration in a text datablock."""
+
+    text = bpy.data.texts.get(TABLE_NAME)
+    if text is None:
+        text = bpy.data.texts.new(TABLE_NAME)
+    text.clear()
+    text.write("Target time: {:.2f} s/frame. Quality floor: {:.3f}\n\n".format(target_time, quality_floor))
+    names = [name for name, _ in SEARCH_SPACE]
+    text.write("\t".join(names + ["test time", "frame time", "quality", ""]) + "\n")
+    for result in sorted(results, key=lambda r: r["frame_time"]):
+        row = [str(result["settings"][name]) for name in names]
+        row.append("{:.3f}".format(result["test_time"]))
+        row.append("{:.2f}".format(result["frame_time"]))
+        row.append("{:.4f}".format(result["quality"]))
+        row.append("*" if result is best else "")
+        text.write("\t".join(row) + "\n")
+    return text
+
+
+def tune_render_settings(context, target_time, quality_floor, resolution_percentage=25, samples=16):
+    """Searches the Cycles volume settings that fit a render time budget.
+
+    Short CPU test renders of the scene are done at a low resolution. Every
+    setting of SEARCH_SPACE is searched in turn while the others keep their
+    best value so far. The best settings are applied to the scene and the
+    table of tested settings is written in the "Cloud render tuning" text.
+
+    target_time: seconds per full resolution frame.
+    quality_floor: minimum quality accepted, see image_quality.
+    resolution_percentage: resolution of the test renders.
+    samples: samples of the test renders.
+
+    Returns the best result and the list of results.
+    """
+
+    scene = context.scene
+    render = scene.render
+    saved = {
+        "engine": render.engine,
+        "resolution_percentage": render.resolution_percentage,
+        "filepath": render.filepath,
+        "file_format": render.image_settings.file_format,
+        "device": scene.cycles.device,
+        "samples": scene.cycles.samples,
+        "use_adaptive_sampling": scene.cycles.use_adaptive_sampling,
+    }
+    saved_settings = {name: getattr(scene.cycles, name) for name, _ in SEARCH_SPACE}
+    frame_samples = scene.cycles.samples
+    frame_pixels = render.resolution_x * render.resolution_y * (render.resolution_percentage / 100) ** 2
+    test_pixels = render.resolution_x * render.resolution_y * (resolution_percentage / 100) ** 2
+
+    filepath = os.path.join(tempfile.mkdtemp(prefix="cloud_tuning_"), "test.exr")
+    render.engine = 'CYCLES'
+    scene.cycles.device = 'CPU'
+    scene.cycles.samples = samples
+    scene.cycles.use_adaptive_sampling = True
+    render.resolution_percentage = resolution_percentage
+    render.filepath = filepath
+    render.image_settings.file_format = 'OPEN_EXR'
+
+    results = []
+    try:
+        _apply_settings(scene, REFERENCE_SETTINGS)
+        _, reference = render_pixels(scene, filepath)
+
+        tested = {}
+        current = dict(REFERENCE_SETTINGS)
+        for name, values in SEARCH_SPACE:
+            for value in values:
+                settings = dict(current)
+                settings[name] = value
+                key = tuple(sorted(settings.items()))
+                if key not in tested:
+                    _apply_settings(scene, settings)
+                    test_time, pixels = render_pixels(scene, filepath)
+                    tested[key] = {
+                        "settings": settings,
+                        "test_time": test_time,
+                        "frame_time": estimate_frame_time(test_time, test_pixels, frame_pixels,
+                                                          samples, frame_samples),
+                        "quality": image_quality(pixels, reference),
+                    }
+                    results.append(tested[key])
+            current = dict(select_best(results, target_time, quality_floor)["settings"])
+    finally:
+        render.engine = saved["engine"]
+        render.resolution_percentage = saved["resolution_percentage"]
+        render.filepath = saved["filepath"]
+        render.image_settings.file_format = saved["file_format"]
+        scene.cycles.device = saved["device"]
+        scene.cycles.samples = saved["samples"]
+        scene.cycles.use_adaptive_sampling = saved["use_adaptive_sampling"]
+        _apply_settings(scene, saved_settings)
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        os.rmdir(os.path.dirname(filepath))
+
+    best = select_best(results, target_time, quality_floor)
+    _apply_settings(scene, best["settings"])
+    write_table(results, best, target_time, quality_floor)
+    return best, results
@@ -0,0 +1,235 @@
+"""
+    scatter.py is part of Cloud Generator Blender Addon.
+
+    Foobar is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from math import pi
+
+import bpy
+import numpy as np
+
+from . import materials
+from . import randomization
+
+SCATTER_COLLECTION = "Cloud scatter"
+VARIANTS_COLLECTION = "Cloud scatter variants"
+
+# Custom property of the scatter collection with the seed of the variants.
+SCATTER_SEED = "cloud_scatter_seed"
+
+# Nodes that add the seed coordinates to the noise textures. The random
+# value of every instance is added to their coordinates.
+SEEDED_NODES = (
+    "Vector Add - Wind small turbulence coords",
+    "Vector Add - Wind big turbulence coords",
+    "Vector Add - Roundness coord",
+    "Vector Add - Coords add shape imperfection 1",
+    "Vector Add - Coords add shape imperfection 2",
+    "Vector Add - Coords subtract shape imperfection 1",
+    "Vector Add - Coords subtract shape imperfection 2",
+)
+
+OBJECT_INFO_NODE = "Instance - Object Info"
+RANDOM_VECTOR_NODE = "Instance - Random vector"
+OFFSET_NODE = "Instance - Random offset"
+OFFSET_ADD_PREFIX = "Instance - Add random offset - "
+
+# Scale of the offset of the noise coordinates. Every axis gets its own
+# value from a 1D White Noise of the Random output, so the offsets of the
+# instances are not on a line.
+INSTANCE_OFFSET = (173.0, 131.0, 97.0)
+
+# Uniform values drawn for every instance: x, y, z, rotation, scale, variant.
+_INSTANCE_STREAMS = 6
+
+
+def add_instance_randomization(mat):
+    """Varies the noise of a cloud material on every instance of the object.
+
+    The Random output of Object Info, different for every instance, is
+    turned into a random vector by a White Noise texture that offsets the
+    coordinates of the seeded noise textures, so every instance has the
+    same base shape with different wind, roundness and imperfections.
+    Adding it again does nothing.
+    """
+
+    nodes = mat.node_tree.nodes
+    links = mat.node_tree.links
+    if nodes.get(OBJECT_INFO_NODE) is not None:
+        return
+
+    object_info = nodes.new("ShaderNodeObjectInfo")
+    object_info.name = OBJECT_INFO_NODE
+    object_info.label = OBJECT_INFO_NODE
+    random_vector = nodes.new("ShaderNodeTexWhiteNoise")
+    random_vector.name = RANDOM_VECTOR_NODE
+    random_vector.label = RANDOM_VECTOR_NODE
+    random_vector.noise_dimensions = '1D'
+    links.new(object_info.outputs["Random"], random_vector.inputs["W"])
+    offset = nodes.new("ShaderNodeVectorMath")
+    offset.name = OFFSET_NODE
+    offset.label = OFFSET_NODE
+    offset.operation = "MULTIPLY"
+    offset.inputs[1].default_value = INSTANCE_OFFSET
+    links.new(random_vector.outputs["Color"], offset.inputs[0])
+
+    for name in SEEDED_NODES:
+        seeded = nodes.get(name)
+        if seeded is None or not seeded.inputs[0].is_linked:
+            continue
+        add_offset = nodes.new("ShaderNodeVectorMath")
+        add_offset.name = OFFSET_ADD_PREFIX + name
+        add_offset.label = add_offset.name
+        add_offset.operation = "ADD"
+        add_offset.location = (seeded.location.x - 200, seeded.location.y - 150)
+        links.new(seeded.inputs[0].links[0].from_socket, add_offset.inputs[0])
+        links.new(offset.outputs["Vector"], add_offset.inputs[1])
+        links.new(add_offset.outputs["Vector"], seeded.inputs[0])
+
+    object_info.location = (min(node.location.x for node in nodes) - 400, 0)
+    random_vector.location = (object_info.location.x + 200, 0)
+    offset.location = (object_info.location.x + 400, 0)
+
+
+def _variants_collection():
+    collection = bpy.data.collections.get(VARIANTS_COLLECTION)
+    if collection is None:
+        collection = bpy.data.collections.new(VARIANTS_COLLECTION)
+        # Not linked to any scene: the variants are only rendered by the
+        # instances and the frame handlers of the addon do not touch them.
+        collection.use_fake_user = True
+    return collection
+
+
+def create_variants(context, initial_shape, seeds):
+    """Generates a cloud for every seed to be instanced by the scatter.
+
+    Every cloud is moved to the origin of its own collection, child of the
+    variants collection, which is not linked to the scene.
+
+    Returns the list of collections, one per seed.
+    """
+
+    clouds = materials.generate_clouds(context, initial_shape, seeds)
+    parent = _variants_collection()
+    collections = []
+    for seed, obj in zip(seeds, clouds):
+        add_instance_randomization(obj.active_material)
+        obj.location = (0.0, 0.0, 0.0)
+        collection = bpy.data.collections.new("Cloud variant {}".format(seed))
+        for users_collection in list(obj.users_collection):
+            users_collection.objects.unlink(obj)
+        collection.objects.link(obj)
+        parent.children.link(collection)
+        collections.append(collection)
+    return collections
+
+
+def scatter_transforms(count, seed, area_min, area_max, height_min, height_max,
+                       scale_min, scale_max, variants):
+    """Random transforms of count instances.
+
+    The transform of an instance only depends on the seed and its index, so
+    scattering more instances keeps the ones scattered before.
+
+    area_min, area_max: (x, y) corners of the scattered area.
+    height_min, height_max: height band of the instances.
+    scale_min, scale_max: range of the uniform scale of the instances.
+    variants: number of variants instanced.
+
+    Returns (locations (count, 3), rotations around Z (count,), scales
+    (count,), variant indices (count,)) arrays.
+    """
+
+    uniforms = randomization.uniform_streams([seed], count * _INSTANCE_STREAMS)
+    uniforms = uniforms.reshape((count, _INSTANCE_STREAMS))
+    minimum = np.array((area_min[0], area_min[1], height_min))
+    maximum = np.array((area_max[0], area_max[1], height_max))
+    locations = minimum + uniforms[:, :3] * (maximum - minimum)
+    rotations = uniforms[:, 3] * 2 * pi
+    scales = scale_min + uniforms[:, 4] * (scale_max - scale_min)
+    indices = np.minimum((uniforms[:, 5] * variants).astype(np.int64), variants - 1)
+    return locations, rotations, scales, indices
+
+
+def scatter_collection(context):
+    """Collection of the scene with the instances, created if needed."""
+
+    collection = bpy.data.collections.get(SCATTER_COLLECTION)
+    if collection is None:
+        collection = bpy.data.collections.new(SCATTER_COLLECTION)
+    if collection.name not in context.scene.collection.children:
+        context.scene.collection.children.link(collection)
+    return collection
+
+
+def scatter_clouds(context, initial_shape, count, variants=4, seed=0,
+                   area_min=(-1000.0, -1000.0), area_max=(1000.0, 1000.0),
+                   height_min=0.0, height_max=100.0, scale_min=0.7, scale_max=1.3):
+    """Scatters count instances of a few cloud variants.
+
+    The instances are empties that instance the collection of a variant,
+    so all of them share its mesh and material. Memory, node count and
+    synchronization time barely grow with the number of instances.
+
+    initial_shape: function that generates the part of the material
+        corresponding to the initial base shape of the clouds
+    variants: number of different clouds generated.
+    seed: seed of the variants and the transforms of the instances.
+
+    Returns the list of new instance objects.
+    """
+
+    variant_seeds = [seed * variants + i for i in range(variants)]
+    variant_collections = create_variants(context, initial_shape, variant_seeds)
+    locations, rotations, scales, indices = scatter_transforms(
+        count, seed, area_min, area_max, height_min, height_max, scale_min, scale_max, variants)
+
+    collection = scatter_collection(context)
+    collection[SCATTER_SEED] = seed
+    instances = []
+    for location, rotation, scale, index in zip(locations, rotations, scales, indices):
+        instance = bpy.data.objects.new("Cloud instance", None)
+        instance.instance_type = 'COLLECTION'
+        instance.instance_collection = variant_collections[index]
+        instance.location = location
+        instance.rotation_euler = (0.0, 0.0, rotation)
+        instance.scale = (scale, scale, scale)
+        collection.objects.link(instance)
+        instances.append(instance)
+    return instances
+
+
+def remove_scatter():
+    """Removes the instances and the variants of the scatter."""
+
+    collection = bpy.data.collections.get(SCATTER_COLLECTION)
+    if collection is not None:
+        for obj in list(collection.objects):
+            bpy.data.objects.remove(obj)
+        bpy.data.collections.remove(collection)
+
+    variants = bpy.data.collections.get(VARIANTS_COLLECTION)
+    if variants is not None:
+        for child in list(variants.children):
+            for obj in list(child.objects):
+                mesh = obj.data
+                mat = obj.active_material
+                bpy.data.objects.remove(obj)
+                if mesh is not None and mesh.users == 0:
+                    bpy.data.meshes.remove(mesh)
+                if mat is not None and mat.users == 0:
+                    bpy.data.materials.remove(mat)
+            bpy.data.collections.remove(child)
+        bpy.data.collections.remove(variants)
@@ -0,0 +1,355 @@
+"""
+    shader_cost.py is part of Cloud Generator Blender Addon.
+
+    Foobar is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import time
+from math import pi
+
+import bpy
+import numpy as np
+from mathutils import Vector
+
+from . import camera_geometry
+from . import volumetrics
+
+# Relative cost of an evaluation of every kind, in units of a simple node
+# (math, mix, mapping...). Calibration only fits the time of a unit.
+COST_WEIGHTS = {
+    "node": 1.0,
+    "noise_octave": 8.0,
+    "voronoi": 30.0,
+    "gradient": 1.0,
+    "image": 6.0,
+    "volume_shader": 10.0,
+}
+
+# Cost of the textures by dimensions relative to 3D.
+NOISE_DIMENSIONS_FACTOR = {"1D": 0.3, "2D": 0.6, "3D": 1.0, "4D": 1.8}
+VORONOI_DIMENSIONS_FACTOR = {"1D": 3 / 27, "2D": 9 / 27, "3D": 1.0, "4D": 3.0}
+
+# Cost of the Voronoi features relative to F1.
+VORONOI_FEATURE_FACTOR = {"F1": 1.0, "F2": 1.0, "SMOOTH_F1": 125 / 27, "DISTANCE_TO_EDGE": 2.0,
+                          "N_SPHERE_RADIUS": 2.0}
+
+# Nodes that cost nothing in the render.
+FREE_NODES = {"FRAME", "REROUTE", "OUTPUT_MATERIAL"}
+
+REPORT_NAME = "Cloud shader cost"
+CALIBRATION_PROPERTY = "cloud_shader_cost_calibration"
+
+
+def _ignored_inputs(node):
+    """Inputs of a node that do not affect its output because of a constant Fac.
+
+    A Mix RGB node with an unlinked Fac of 0 returns Color1, so its Color2
+    branch is not evaluated. With a Fac of 1 and Mix blending it returns
+    Color2.
+    """
+
+    if node.type != 'MIX_RGB':
+        return ()
+    fac = node.inputs[0]
+    if fac.is_linked:
+        return ()
+    if fac.default_value <= 0.0:
+        return (node.inputs[2],)
+    if fac.default_value >= 1.0 and node.blend_type == 'MIX':
+        return (node.inputs[1],)
+    return ()
+
+
+def _followed_inputs(node):
+    if node.mute:
+        return [link.from_socket for link in node.internal_links]
+    ignored = _ignored_inputs(node)
+    return [socket for socket in node.inputs if socket.is_linked and socket not in ignored]
+
+
+def active_nodes(node_tree):
+    """Nodes that are evaluated by the volume of the active material output.
+
+    Branches fed through a zero Fac, muted nodes and muted links are not
+    followed.
+    """
+
+    outputs = [node for node in node_tree.nodes if node.type == 'OUTPUT_MATERIAL' and node.is_active_output]
+    if not outputs:
+        return set()
+    active = {outputs[0]}
+    pending = [outputs[0].inputs["Volume"]] if outputs[0].inputs["Volume"].is_linked else []
+    while pending:
+        socket = pending.pop()
+        for link in socket.links:
+            if getattr(link, "is_muted", False) or not link.is_valid:
+                continue
+            node = link.from_node
+            if node in active:
+                continue
+            active.add(node)
+            pending.extend(_followed_inputs(node))
+    return active
+
+
+def noise_octaves(node):
+    """Number of noise evaluations of a Noise Texture, one per octave of Detail."""
+
+    detail = node.inputs["Detail"].default_value
+    octaves = int(detail) + 1
+    if detail > int(detail):
+        octaves += 1  # The fraction of the last octave is blended with another evaluation
+    return octaves
+
+
+def texture_evaluations(nodes):
+    """Weighted evaluations of every kind for a set of active nodes.
+
+    Returns a dict with the keys of COST_WEIGHTS and the raw count of
+    noise octaves and Voronoi textures.
+    """
+
+    evaluations = dict.fromkeys(COST_WEIGHTS, 0.0)
+    evaluations["noise_octaves"] = 0
+    evaluations["voronoi_textures"] = 0
+    for node in nodes:
+        if node.type in FREE_NODES or node.mute:
+            continue
+        if node.type == 'TEX_NOISE':
+            octaves = noise_octaves(node)
+            evaluations["noise_octaves"] += octaves
+            evaluations["noise_octave"] += octaves * NOISE_DIMENSIONS_FACTOR.get(node.noise_dimensions, 1.0)
+        elif node.type == 'TEX_VORONOI':
+            evaluations["voronoi_textures"] += 1
+            evaluations["voronoi"] += (VORONOI_DIMENSIONS_FACTOR.get(node.voronoi_dimensions, 1.0) *
+                                       VORONOI_FEATURE_FACTOR.get(node.feature, 1.0))
+        elif node.type == 'TEX_GRADIENT':
+            evaluations["gradient"] += 1
+        elif node.type == 'TEX_IMAGE':
+            evaluations["image"] += 1
+        elif node.type in ('PRINCIPLED_VOLUME', 'VOLUME_ABSORPTION', 'VOLUME_SCATTER', 'EMISSION'):
+            evaluations["volume_shader"] += 1
+        else:
+            evaluations["node"] += 1
+    return evaluations
+
+
+def material_cost(material):
+    """Cost analysis of a cloud material.
+
+    Returns a dict with the number of active and disabled nodes, the
+    evaluations (see texture_evaluations) and the relative cost per sample.
+    """
+
+    node_tree = material.node_tree
+    active = active_nodes(node_tree)
+    nodes = [node for node in node_tree.nodes if node.type != 'FRAME']
+    evaluations = texture_evaluations(active)
+    cost = sum(COST_WEIGHTS[name] * evaluations[name] for name in COST_WEIGHTS)
+    return {
+        "active": len(active),
+        "disabled": len(nodes) - len(active),
+        "evaluations": evaluations,
+        "cost": cost,
+    }
+
+
+def get_calibration(scene):
+    """(seconds per cost unit, overhead seconds) of the scene or None if not calibrated."""
+
+    calibration = scene.get(CALIBRATION_PROPERTY)
+    if calibration is None:
+        return None
+    return tuple(calibration)
+
+
+def fit_calibration(costs, times):
+    """Fits time = seconds_per_unit * cost + overhead by least squares.
+
+    With a single measure the overhead is 0. Returns (seconds per unit, overhead).
+    """
+
+    costs = np.asarray(costs, dtype=np.float64)
+    times = np.asarray(times, dtype=np.float64)
+    if len(costs) == 1 or np.ptp(costs) == 0.0:
+        return float(np.sum(times) / max(np.sum(costs), 1e-9)), 0.0
+    matrix = np.stack([costs, np.ones_like(costs)], axis=1)
+    (seconds_per_unit, overhead), *_ = np.linalg.lstsq(matrix, times, rcond=None)
+    if seconds_per_unit <= 0.0:
+        return float(np.sum(times) / max(np.sum(costs), 1e-9)), 0.0
+    return float(seconds_per_unit), float(max(0.0, overhead))
+
+
+def _render_time(scene):
+    start = time.perf_counter()
+    bpy.ops.render.render(scene=scene.name)
+    return time.perf_counter() - start
+
+
+def measure_render_times(context, clouds, resolution=64, samples=4):
+    """CPU Cycles render time of every cloud alone, minus the time of an empty render.
+
+    Every cloud is rendered in a temporary scene with an orthographic camera
+    that frames its domain, so that the times only depend on the material.
+    """
+
+    scene = bpy.data.scenes.new("Cloud shader cost calibration")
+    camera_data = bpy.data.cameras.new("Cloud shader cost camera")
+    camera_data.type = 'ORTHO'
+    camera = bpy.data.objects.new("Cloud shader cost camera", camera_data)
+    scene.collection.objects.link(camera)
+    scene.camera = camera
+    scene.render.engine = 'CYCLES'
+    scene.cycles.device = 'CPU'
+    scene.cycles.samples = samples
+    scene.cycles.use_adaptive_sampling = False
+    scene.cycles.volume_step_rate = context.scene.cycles.volume_step_rate
+    scene.cycles.volume_max_steps = context.scene.cycles.volume_max_steps
+    scene.cycles.volume_bounces = context.scene.cycles.volume_bounces
+    scene.render.resolution_x = resolution
+    scene.render.resolution_y = resolution
+    scene.render.resolution_percentage = 100
+    if context.scene.world is not None:
+        scene.world = context.scene.world
+
+    times = []
+    try:
+        empty_time = _render_time(scene)
+        for obj in clouds:
+            corners = camera_geometry.domain_corners(obj.matrix_world, obj.bound_box)
+            center = sum(corners, Vector()) / len(corners)
+            camera.location = (center.x, center.y - max(obj.dimensions) * 2, center.z)
+            camera.rotation_euler = (pi / 2, 0.0, 0.0)
+            camera_data.ortho_scale = max(obj.dimensions.x, obj.dimensions.z)
+            camera_data.clip_end = max(obj.dimensions) * 4
+            scene.collection.objects.link(obj)
+            try:
+                times.append(max(0.0, _render_time(scene) - empty_time))
+            finally:
+                scene.collection.objects.unlink(obj)
+    finally:
+        bpy.data.scenes.remove(scene)
+        bpy.data.objects.remove(camera)
+        bpy.data.cameras.remove(camera_data)
+    return times
+
+
+def calibrate(context, clouds, resolution=64, samples=4):
+    """Calibrates the time of a cost unit with CPU Cycles renders of the clouds.
+
+    The result is stored in the scene and returned as (seconds per unit, overhead).
+    """
+
+    clouds = [obj for obj in clouds if _is_cloud_material(obj.active_material)]
+    if not clouds:
+        return None
+    costs = [material_cost(obj.active_material)["cost"] for obj in clouds]
+    times = measure_render_times(context, clouds, resolution, samples)
+    calibration = fit_calibration(costs, times)
+    context.scene[CALIBRATION_PROPERTY] = calibration
+    return calibration
+
+
+def _is_cloud_material(material):
+    return material is not None and material.use_nodes and "CloudMaterial_CG" in material.name
+
+
+def cloud_costs(clouds, calibration=None):
+    """Cost of every cloud, most expensive first.
+
+    Clouds that share a material are analyzed once. Returns a list of dicts
+    with the name, cloud type, material and the material_cost values, plus
+    the estimated render time if there is a calibration.
+    """
+
+    analyzed = {}
+    rows = []
+    for obj in clouds:
+        material = obj.active_material
+        if not _is_cloud_material(material):
+            continue
+        if material.name not in analyzed:
+            analyzed[material.name] = material_cost(material)
+        row = dict(analyzed[material.name])
+        row["name"] = obj.name
+        row["cloud_type"] = obj.cloud_settings.cloud_type
+        row["material"] = material.name
+        if calibration is not None:
+            row["time"] = calibration[0] * row["cost"] + calibration[1]
+        rows.append(row)
+    rows.sort(key=lambda row: row["cost"], reverse=True)
+    return rows
+
+
+def type_reports(rows):
+    """Mean and maximum cost of every cloud type.
+
+    Returns a dict cloud type: {"clouds", "mean_cost", "max_cost", "mean_active", "mean_disabled"}.
+    """
+
+    reports = {}
+    for row in rows:
+        report = reports.setdefault(row["cloud_type"], {"clouds": 0, "total_cost": 0.0, "max_cost": 0.0,
+                                                        "total_active": 0, "total_disabled": 0})
+        report["clouds"] += 1
+        report["total_cost"] += row["cost"]
+        report["max_cost"] = max(report["max_cost"], row["cost"])
+        report["total_active"] += row["active"]
+        report["total_disabled"] += row["disabled"]
+    for report in reports.values():
+        count = report["clouds"]
+        report["mean_cost"] = report.pop("total_cost") / count
+        report["mean_active"] = report.pop("total_active") / count
+        report["mean_disabled"] = report.pop("total_disabled") / count
+    return reports
+
+
+def write_report(rows, calibration=None):
+    """Writes the cost by cloud type and the ranked list of clouds in a text datablock."""
+
+    text = bpy.data.texts.get(REPORT_NAME)
+    if text is None:
+        text = bpy.data.texts.new(REPORT_NAME)
+    text.clear()
+    if calibration is None:
+        text.write("Not calibrated. Costs are relative to a simple node.\n\n")
+    else:
+        text.write("Calibrated: {:.3g} s per cost unit + {:.3g} s.\n\n".format(*calibration))
+
+    text.write("cloud type\tclouds\tmean cost\tmax cost\tactive nodes\tdisabled nodes\n")
+    for cloud_type, report in sorted(type_reports(rows).items(), key=lambda item: -item[1]["mean_cost"]):
+        text.write("{}\t{}\t{:.1f}\t{:.1f}\t{:.1f}\t{:.1f}\n".format(
+            cloud_type, report["clouds"], report["mean_cost"], report["max_cost"],
+            report["mean_active"], report["mean_disabled"]))
+
+    columns = ["cloud", "type", "cost", "active", "disabled", "noise octaves", "voronoi"]
+    if calibration is not None:
+        columns.append("time (s)")
+    text.write("\n" + "\t".join(columns) + "\n")
+    for row in rows:
+        values = [row["name"], row["cloud_type"], "{:.1f}".format(row["cost"]), str(row["active"]),
+                  str(row["disabled"]), str(row["evaluations"]["noise_octaves"]),
+                  str(row["evaluations"]["voronoi_textures"])]
+        if calibration is not None:
+            values.append("{:.3f}".format(row["time"]))
+        text.write("\t".join(values) + "\n")
+    return text
+
+
+def scene_report(scene):
+    """Analyzes the clouds of the scene and writes the report. Returns the rows."""
+
+    calibration = get_calibration(scene)
+    rows = cloud_costs(volumetrics.scene_clouds(scene), calibration)
+    write_report(rows, calibration)
+    return rows
@@ -0,0 +1,622 @@
+"""
+    shadow_gobo.py is part of Cloud Generator Blender Addon.
+
+    Foobar is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import hashlib
+import os
+
+import bpy
+import numpy as np
+from bpy.app.handlers import persistent
+from mathutils import Vector
+
+from . import camera_geometry
+from . import density
+from . import preview
+from . import radiance_bake
+from .cloud_settings import cloud_settings_to_dict
+
+IMAGE_NAME = "CloudShadowGobo_CG"
+
+# Custom properties of the gobo image, needed to update it.
+GOBO_CLOUDS = "cloud_gobo_clouds"
+GOBO_SUN = "cloud_gobo_sun"
+GOBO_BOUNDS = "cloud_gobo_bounds"
+GOBO_GROUND = "cloud_gobo_ground"
+GOBO_GRID_RESOLUTION = "cloud_gobo_grid_resolution"
+GOBO_SIGNATURE = "cloud_gobo_signature"
+
+# Custom properties of a gobo baked as an image sequence: (first, last) frame,
+# directory of the files and {frame: signature} of every baked frame.
+GOBO_FRAME_RANGE = "cloud_gobo_frame_range"
+GOBO_DIRECTORY = "cloud_gobo_directory"
+GOBO_FRAME_SIGNATURES = "cloud_gobo_frame_signatures"
+
+# Default directory and file names of the gobo sequences.
+SEQUENCE_DIRECTORY = "//cloud_shadow_gobo/"
+SEQUENCE_FILE = "gobo_{:04d}.exr"
+
+REPORT_NAME = "Cloud shadow gobo"
+
+# Names of the nodes added to the terrain materials.
+POSITION_NODE = "Cloud shadow - Position"
+MAPPING_NODE = "Cloud shadow - Mapping"
+TEXTURE_NODE = "Cloud shadow - Gobo"
+MULTIPLY_NODE = "Cloud shadow - Multiply"
+
+# Relative margin added around the shadows of the clouds on the ground.
+BOUNDS_MARGIN = 0.02
+
+# Seconds without frame changes before the gobo is baked again.
+UPDATE_DELAY = 0.5
+
+# Names of the scenes whose gobo has to be checked by the update timer.
+_pending_scenes = set()
+
+# Frames rendered with an outdated gobo, reported after the render.
+_stale_frames = []
+
+# Whether a gobo sequence is being baked, its frame changes are not updates.
+_baking = [False]
+
+
+def sun_direction(sun):
+    """Direction of the light of a sun lamp."""
+
+    return (sun.matrix_world.to_3x3() @ Vector((0.0, 0.0, -1.0))).normalized()
+
+
+def cloud_density_grid(obj, resolution, frame=None):
+    """Density grid (nz, ny, nx) of a cloud.
+
+    The grid of a cloud baked with radiance_bake is reused, otherwise the
+    material is sampled (see density.sample_density).
+    """
+
+    if radiance_bake.FULL_MATERIAL_PROPERTY in obj:
+        for node in obj.active_material.node_tree.nodes:
+            image = getattr(node, "image", None)
+            if image is not None and radiance_bake.GRID_SHAPE in image:
+                pixels = np.empty(len(image.pixels), dtype=np.float32)
+                image.pixels.foreach_get(pixels)
+                atlas = pixels.reshape((image.size[1], image.size[0], 4))[:, :, 3]
+                return density.atlas_to_grid(atlas, tuple(image[radiance_bake.GRID_SHAPE]),
+                                             image[radiance_bake.GRID_COLUMNS])
+    return density.sample_density(obj, resolution, frame)
+
+
+def ground_bounds(clouds, direction, ground):
+    """(min x, min y, size x, size y) of the shadows of the clouds on the ground plane.
+
+    direction: direction of the sun light, pointing down.
+    ground: height of the ground plane.
+    """
+
+    xs = []
+    ys = []
+    for obj in clouds:
+        for corner in camera_geometry.domain_corners(obj.matrix_world, obj.bound_box):
+            distance = (ground - corner.z) / direction.z
+            xs.append(corner.x + direction.x * distance)
+            ys.append(corner.y + direction.y * distance)
+    margin = max(max(xs) - min(xs), max(ys) - min(ys)) * BOUNDS_MARGIN
+    return (min(xs) - margin, min(ys) - margin,
+            max(xs) - min(xs) + 2 * margin, max(ys) - min(ys) + 2 * margin)
+
+
+def optical_depth_to_sun(points, direction, obj, grid):
+    """Optical depth through a cloud from every point toward the sun.
+
+    points: (n, 3) world positions.
+    direction: direction of the sun light.
+    grid: (nz, ny, nx) density of the cloud over its domain.
+    """
+
+    inverse = np.array(obj.matrix_world.inverted())
+    local_points = points @ inverse[:3, :3].T + inverse[:3, 3]
+    local_direction = inverse[:3, :3] @ -np.array(direction[:])
+    local_direction = np.where(np.abs(local_direction) < 1e-9, 1e-9, local_direction)
+    minimum, maximum = (np.array(corner[:]) for corner in density.local_bounds(obj))
+
+    # Distances along the ray where it enters and leaves the domain.
+    t_a = (minimum - local_points) / local_direction
+    t_b = (maximum - local_points) / local_direction
+    t_near = np.maximum(np.minimum(t_a, t_b).max(axis=1), 0.0)
+    t_far = np.maximum(t_a, t_b).min(axis=1)
+    hit = t_far > t_near
+
+    depth = np.zeros(len(points), dtype=np.float32)
+    if not hit.any():
+        return depth
+    shape = np.array(grid.shape[::-1])
+    voxels_per_unit = shape / (maximum - minimum)
+    voxel_world = np.linalg.norm(obj.matrix_world.to_3x3(), axis=0) / voxels_per_unit
+    step = float(voxel_world.min())
+    steps = int(np.ceil((t_far[hit] - t_near[hit]).max() / step))
+
+    origins = local_points[hit]
+    t = t_near[hit] + step * 0.5
+    t_end = t_far[hit]
+    hit_depth = np.zeros(len(origins), dtype=np.float32)
+    for _ in range(steps):
+        inside = t < t_end
+        if not inside.any():
+            break
+        position = (origins[inside] + t[inside, np.newaxis] * local_direction - minimum) * voxels_per_unit
+        index = np.clip(np.floor(position).astype(np.int32), 0, shape - 1)
+        hit_depth[inside] += grid[index[:, 2], index[:, 1], index[:, 0]] * step
+        t += step
+    depth[hit] = hit_depth
+    return depth
+
+
+def transmittance_map(clouds, grids, direction, bounds, ground, size):
+    """Transmittance of the sun light through the clouds on the ground plane.
+
+    size: (width, height) of the map in texels.
+
+    Returns a float32 array (height, width).
+    """
+
+    width, height = size
+    min_x, min_y, size_x, size_y = bounds
+    x = min_x + (np.arange(width) + 0.5) / width * size_x
+    y = min_y + (np.arange(height) + 0.5) / height * size_y
+    grid_x, grid_y = np.meshgrid(x, y)
+    points = np.stack((grid_x.ravel(), grid_y.ravel(), np.full(grid_x.size, ground)), axis=-1)
+
+    depth = np.zeros(len(points), dtype=np.float32)
+    for obj, grid in zip(clouds, grids):
+        depth += optical_depth_to_sun(points, direction, obj, grid)
+    return np.exp(-depth).reshape((height, width)).astype(np.float32)
+
+
+def gobo_signature(clouds, sun, frame):
+    """Hash of everything that changes the gobo: cloud settings, transforms and sun.
+
+    Clouds whose material is animated also change on every frame.
+    """
+
+    values = [tuple(sun.matrix_world.col[2])]
+    for obj in clouds:
+        values.append(obj.name)
+        values.append(sorted(cloud_settings_to_dict(obj.cloud_settings).items()))
+        values.append([tuple(row) for row in obj.matrix_world])
+        node_tree = obj.active_material.node_tree if obj.active_material is not None else None
+        if node_tree is not None and node_tree.animation_data is not None and node_tree.animation_data.action:
+            values.append(frame)
+    return hashlib.sha1(repr(values).encode()).hexdigest()
+
+
+def gobo_pixels(clouds, sun, bounds, ground, size, grid_resolution, frame):
+    """RGBA pixels (height, width, 4) of the gobo of the clouds in a frame.
+
+    bounds: (min x, min y, size x, size y) covered by the gobo on the ground.
+    size: (width, height) of the gobo in texels.
+    """
+
+    grids = [cloud_density_grid(obj, grid_resolution, frame) for obj in clouds]
+    transmittance = transmittance_map(clouds, grids, sun_direction(sun), bounds, ground, size)
+    pixels = np.ones((size[1], size[0], 4), dtype=np.float32)
+    pixels[:, :, :3] = transmittance[:, :, np.newaxis]
+    return pixels
+
+
+def _fill_image(image, clouds, sun, frame):
+    pixels = gobo_pixels(clouds, sun, tuple(image[GOBO_BOUNDS]), image[GOBO_GROUND], tuple(image.size),
+                         image[GOBO_GRID_RESOLUTION], frame)
+    image.pixels.foreach_set(pixels.ravel())
+    image.pack()
+    image[GOBO_SIGNATURE] = gobo_signature(clouds, sun, frame)
+
+
+def _lit_ground_bounds(clouds, sun, ground):
+    direction = sun_direction(sun)
+    if direction.z >= 0.0:
+        raise ValueError("The sun lamp does not light the ground")
+    return ground_bounds(clouds, direction, ground)
+
+
+def gobo_size(bounds, texture_size):
+    """(width, height) in texels of a gobo with texture_size texels along its biggest side."""
+
+    scale = texture_size / max(bounds[2], bounds[3])
+    return max(1, int(round(bounds[2] * scale))), max(1, int(round(bounds[3] * scale)))
+
+
+def _set_properties(image, clouds, sun, bounds, ground, grid_resolution):
+    image[GOBO_CLOUDS] = [obj.name for obj in clouds]
+    image[GOBO_SUN] = sun.name
+    image[GOBO_BOUNDS] = bounds
+    image[GOBO_GROUND] = ground
+    image[GOBO_GRID_RESOLUTION] = grid_resolution
+
+
+def bake_gobo(scene, clouds, sun, ground=0.0, texture_size=1024, grid_resolution=64):
+    """Integrates the optical depth of the clouds toward a sun lamp into a texture.
+
+    The texture covers the shadows of the clouds on a horizontal ground
+    plane at the ground height, in world XY. It is only valid in the
+    current frame, see bake_gobo_sequence to render animations.
+
+    texture_size: texels along the biggest side of the texture.
+    grid_resolution: voxels along the biggest side of every cloud domain.
+
+    Returns the gobo image.
+    """
+
+    bounds = _lit_ground_bounds(clouds, sun, ground)
+    width, height = gobo_size(bounds, texture_size)
+
+    image = bpy.data.images.get(IMAGE_NAME)
+    if image is not None and GOBO_FRAME_RANGE in image:
+        bpy.data.images.remove(image)
+        image = None
+    if image is not None and tuple(image.size) != (width, height):
+        image.scale(width, height)
+    if image is None:
+        image = bpy.data.images.new(IMAGE_NAME, width, height, float_buffer=True)
+    _set_properties(image, clouds, sun, bounds, ground, grid_resolution)
+    _fill_image(image, clouds, sun, scene.frame_current)
+    update_materials(image)
+    return image
+
+
+def sequence_path(directory, frame):
+    """Absolute path of the file of a frame of a gobo sequence."""
+
+    return os.path.join(bpy.path.abspath(directory), SEQUENCE_FILE.format(frame))
+
+
+def _write_frame(filepath, pixels):
+    """Saves the pixels of a gobo frame in an EXR file."""
+
+    height, width = pixels.shape[:2]
+    scratch = bpy.data.images.new(IMAGE_NAME + " frame", width, height, float_buffer=True)
+    try:
+        scratch.pixels.foreach_set(pixels.ravel())
+        scratch.filepath_raw = filepath
+        scratch.file_format = 'OPEN_EXR'
+        scratch.save()
+    finally:
+        bpy.data.images.remove(scratch)
+
+
+def bake_gobo_sequence(scene, clouds, sun, ground=0.0, texture_size=1024, grid_resolution=64,
+                       directory=SEQUENCE_DIRECTORY):
+    """Bakes the gobo of every frame of the scene into an image sequence.
+
+    The clouds can not be sampled while rendering, so animations need the
+    gobo of every frame before the render. The texture covers the shadows
+    of all the frames. Frames where nothing that changes the gobo changed
+    (see gobo_signature) reuse the previous frame without sampling the
+    clouds again.
+
+    directory: where the EXR files are written, relative paths start in
+        the folder of the blend file.
+
+    Returns the gobo image, an image sequence that starts in the first frame.
+    """
+
+    frames = range(scene.frame_start, scene.frame_end + 1)
+    current = scene.frame_current
+    os.makedirs(bpy.path.abspath(directory), exist_ok=True)
+    signatures = {}
+    _baking[0] = True
+    try:
+        bounds = None
+        for frame in frames:
+            scene.frame_set(frame)
+            min_x, min_y, size_x, size_y = _lit_ground_bounds(clouds, sun, ground)
+            if bounds is None:
+                bounds = (min_x, min_y, size_x, size_y)
+            else:
+                max_x = max(bounds[0] + bounds[2], min_x + size_x)
+                max_y = max(bounds[1] + bounds[3], min_y + size_y)
+                min_x, min_y = min(bounds[0], min_x), min(bounds[1], min_y)
+                bounds = (min_x, min_y, max_x - min_x, max_y - min_y)
+        size = gobo_size(bounds, texture_size)
+
+        previous = None
+        for frame in frames:
+            scene.frame_set(frame)
+            signature = gobo_signature(clouds, sun, frame)
+            if signature != previous:
+                pixels = gobo_pixels(clouds, sun, bounds, ground, size, grid_resolution, frame)
+                previous = signature
+            _write_frame(sequence_path(directory, frame), pixels)
+            signatures[str(frame)] = signature
+    finally:
+        scene.frame_set(current)
+        _baking[0] = False
+
+    image = bpy.data.images.get(IMAGE_NAME)
+    if image is not None:
+        bpy.data.images.remove(image)
+    image = bpy.data.images.load(sequence_path(directory, frames[0]), check_existing=False)
+    image.name = IMAGE_NAME
+    image.source = 'SEQUENCE'
+    _set_properties(image, clouds, sun, bounds, ground, grid_resolution)
+    image[GOBO_FRAME_RANGE] = (frames[0], frames[-1])
+    image[GOBO_DIRECTORY] = directory
+    image[GOBO_FRAME_SIGNATURES] = signatures
+    update_materials(image)
+    return image
+
+
+def _shading_socket(material):
+    for node in material.node_tree.nodes:
+        if node.type == 'BSDF_PRINCIPLED':
+            return node.inputs["Base Color"]
+        if node.type == 'BSDF_DIFFUSE':
+            return node.inputs["Color"]
+    return None
+
+
+def apply_to_material(material, image, strength=1.0):
+    """Multiplies the base color of a terrain material by the gobo.
+
+    The gobo is looked up with the world XY position of the shading point.
+    Applying it again only updates the mapping and the strength.
+
+    Returns False if the material has no Principled or Diffuse BSDF.
+    """
+
+    material.use_nodes = True
+    nodes = material.node_tree.nodes
+    links = material.node_tree.links
+    min_x, min_y, size_x, size_y = image[GOBO_BOUNDS]
+
+    multiply = nodes.get(MULTIPLY_NODE)
+    if multiply is None:
+        socket = _shading_socket(material)
+        if socket is None:
+            return False
+        position = nodes.new(type="ShaderNodeNewGeometry")
+        position.name = POSITION_NODE
+        position.label = POSITION_NODE
+        mapping = nodes.new(type="ShaderNodeMapping")
+        mapping.name = MAPPING_NODE
+        mapping.label = MAPPING_NODE
+        texture = nodes.new(type="ShaderNodeTexImage")
+        texture.name = TEXTURE_NODE
+        texture.label = TEXTURE_NODE
+        texture.extension = 'EXTEND'
+        multiply = nodes.new(type="ShaderNodeMixRGB")
+        multiply.name = MULTIPLY_NODE
+        multiply.label = MULTIPLY_NODE
+        multiply.blend_type = "MULTIPLY"
+
+        location = socket.node.location
+        position.location = (location.x - 1000, location.y - 300)
+        mapping.location = (location.x - 800, location.y - 300)
+        texture.location = (location.x - 550, location.y - 300)
+        multiply.location = (location.x - 250, location.y - 100)
+
+        if socket.is_linked:
+            links.new(socket.links[0].from_socket, multiply.inputs["Color1"])
+        else:
+            multiply.inputs["Color1"].default_value = socket.default_value
+        links.new(position.outputs["Position"], mapping.inputs["Vector"])
+        links.new(mapping.outputs["Vector"], texture.inputs["Vector"])
+        links.new(texture.outputs["Color"], multiply.inputs["Color2"])
+        links.new(multiply.outputs["Color"], socket)
+
+    mapping = nodes[MAPPING_NODE]
+    mapping.inputs["Scale"].default_value = (1 / size_x, 1 / size_y, 1.0)
+    mapping.inputs["Location"].default_value = (-min_x / size_x, -min_y / size_y, 0.0)
+    texture = nodes[TEXTURE_NODE]
+    texture.image = image
+    if GOBO_FRAME_RANGE in image:
+        # The files are numbered with the frame they belong to.
+        start, end = image[GOBO_FRAME_RANGE]
+        texture.image_user.frame_start = start
+        texture.image_user.frame_offset = start - 1
+        texture.image_user.frame_duration = end - start + 1
+        texture.image_user.use_cyclic = False
+        texture.image_user.use_auto_refresh = True
+    multiply.inputs["Fac"].default_value = strength
+    return True
+
+
+def update_materials(image):
+    """Applies the gobo again to every terrain material that has one, keeping its strength."""
+
+    for material in bpy.data.materials:
+        if material.node_tree is None:
+            continue
+        multiply = material.node_tree.nodes.get(MULTIPLY_NODE)
+        if multiply is not None:
+            apply_to_material(material, image, multiply.inputs["Fac"].default_value)
+
+
+def remove_from_material(material):
+    """Removes the gobo from a terrain material."""
+
+    nodes = material.node_tree.nodes
+    multiply = nodes.get(MULTIPLY_NODE)
+    if multiply is None:
+        return
+    color = multiply.inputs["Color1"]
+    source = color.links[0].from_socket if color.is_linked else None
+    targets = [link.to_socket for link in multiply.outputs["Color"].links]
+    for name in (MULTIPLY_NODE, TEXTURE_NODE, MAPPING_NODE, POSITION_NODE):
+        node = nodes.get(name)
+        if node is not None:
+            nodes.remove(node)
+    for socket in targets:
+        if source is not None:
+            material.node_tree.links.new(source, socket)
+        else:
+            socket.default_value = color.default_value
+
+
+def set_cast_shadows(clouds, cast):
+    """Enables or disables the shadow rays of the clouds in Cycles."""
+
+    for obj in clouds:
+        if hasattr(obj, "visible_shadow"):
+            obj.visible_shadow = cast
+        else:
+            obj.cycles_visibility.shadow = cast
+
+
+def _gobo_sources(image):
+    clouds = [bpy.data.objects[name] for name in image[GOBO_CLOUDS] if name in bpy.data.objects]
+    return clouds, bpy.data.objects.get(image[GOBO_SUN])
+
+
+def _baked_signature(image, frame):
+    """Signature of the gobo baked for a frame, None if the frame is not baked."""
+
+    if GOBO_FRAME_RANGE in image:
+        return image[GOBO_FRAME_SIGNATURES].get(str(frame))
+    return image.get(GOBO_SIGNATURE)
+
+
+def gobo_is_current(scene, image):
+    """Whether the gobo baked for the current frame matches its clouds and sun."""
+
+    clouds, sun = _gobo_sources(image)
+    if not clouds or sun is None:
+        return True
+    return _baked_signature(image, scene.frame_current) == gobo_signature(clouds, sun, scene.frame_current)
+
+
+def update_gobo(scene, image=None):
+    """Bakes the gobo again if its clouds, their settings or the sun changed.
+
+    Only the current frame of a gobo sequence is baked again, frames out
+    of the sequence are left as they are.
+
+    Returns True if the gobo was baked again.
+    """
+
+    if image is None:
+        image = bpy.data.images.get(IMAGE_NAME)
+    if image is None or GOBO_CLOUDS not in image:
+        return False
+    clouds, sun = _gobo_sources(image)
+    if not clouds or sun is None:
+        return False
+    frame = scene.frame_current
+    signature = gobo_signature(clouds, sun, frame)
+    if _baked_signature(image, frame) == signature:
+        return False
+    if GOBO_FRAME_RANGE not in image:
+        _fill_image(image, clouds, sun, frame)
+        return True
+    start, end = image[GOBO_FRAME_RANGE]
+    if not start <= frame <= end:
+        return False
+    pixels = gobo_pixels(clouds, sun, tuple(image[GOBO_BOUNDS]), image[GOBO_GROUND], tuple(image.size),
+                         image[GOBO_GRID_RESOLUTION], frame)
+    _write_frame(sequence_path(image[GOBO_DIRECTORY], frame), pixels)
+    image[GOBO_FRAME_SIGNATURES][str(frame)] = signature
+    image.reload()
+    return True
+
+
+def _busy():
+    """True while a render job runs or an animation is played."""
+
+    if preview.render_running():
+        return True
+    return any(window.screen.is_animation_playing for window in bpy.context.window_manager.windows)
+
+
+def _update_timer():
+    """Timer that bakes again the gobos of the pending scenes once Blender is not busy."""
+
+    if _busy():
+        return UPDATE_DELAY
+    for name in _pending_scenes:
+        scene = bpy.data.scenes.get(name)
+        if scene is not None:
+            update_gobo(scene)
+    _pending_scenes.clear()
+    return None
+
+
+@persistent
+def shadow_gobo_frame_handler(scene, depsgraph=None):
+    """Frame change handler that schedules the update of the cloud shadow gobo if it is enabled in the scene.
+
+    Baking renders the clouds, so it is never done in the handler: it
+    would stop the playback on every frame and a render can not be started
+    while another one runs. The gobo is checked by a timer when the frames
+    stop changing, and not at all during renders (see
+    shadow_gobo_render_handler and bake_gobo_sequence).
+    """
+
+    if (not scene.cloud_scene_settings.auto_shadow_gobo or preview.render_running()
+            or _baking[0] or not density.is_supported()):
+        return
+    _pending_scenes.add(scene.name)
+    if bpy.app.timers.is_registered(_update_timer):
+        bpy.app.timers.unregister(_update_timer)
+    bpy.app.timers.register(_update_timer, first_interval=UPDATE_DELAY)
+
+
+@persistent
+def shadow_gobo_render_handler(scene, depsgraph=None):
+    """Render handler that reports the frames rendered with an outdated gobo.
+
+    The gobo can not be baked while rendering. The frames are printed
+    when they are rendered and written in a text after the render.
+    """
+
+    image = bpy.data.images.get(IMAGE_NAME)
+    if image is None or GOBO_CLOUDS not in image or gobo_is_current(scene, image):
+        return
+    _stale_frames.append(scene.frame_current)
+    print("Cloud shadow gobo outdated in frame {}: bake the gobo of every frame before rendering".format(
+        scene.frame_current))
+
+
+@persistent
+def shadow_gobo_render_end_handler(_scene, _depsgraph=None):
+    # Data can not be written from the render thread.
+    if _stale_frames and not bpy.app.timers.is_registered(_report_timer):
+        bpy.app.timers.register(_report_timer, first_interval=0.0)
+
+
+def _report_timer():
+    if _stale_frames:
+        write_report(_stale_frames)
+    _stale_frames.clear()
+    return None
+
+
+def write_report(frames):
+    """Writes the frames rendered with an outdated gobo in a text datablock."""
+
+    text = bpy.data.texts.get(REPORT_NAME)
+    if text is None:
+        text = bpy.data.texts.new(REPORT_NAME)
+    text.clear()
+    text.write("Frames rendered with an outdated cloud shadow gobo: {}\n".format(
+        ", ".join(str(frame) for frame in frames)))
+    text.write("Bake the gobo of every frame (Bake cloud shadows on terrain > Every frame) before rendering.\n")
+    return text
+
+
+def unregister():
+    _pending_scenes.clear()
+    _stale_frames.clear()
+    if bpy.app.timers.is_registered(_update_timer):
+        bpy.app.timers.unregister(_update_timer)
+    if bpy.app.timers.is_registered(_report_timer):
+        bpy.app.timers.unregister(_report_timer)
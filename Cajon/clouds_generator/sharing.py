@@ -0,0 +1,161 @@
+"""
+    sharing.py is part of Cloud Generator Blender Addon.
+
+    Foobar is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import bpy
+
+from . import pool
+from . import tiles
+
+REPORT_NAME = "Cloud material sharing"
+
+# Node properties that are part of the signature of a graph.
+SIGNATURE_PROPERTIES = ("operation", "blend_type", "gradient_type", "vector_type", "noise_dimensions",
+                        "use_clamp", "mute")
+
+# Decimals of the values compared in the signature of a graph.
+SIGNATURE_DIGITS = 6
+
+# Settings of the layers of a layered cloudscape compared between clouds.
+LAYER_PROPERTIES = ("layer_type", "bottom", "top", "coverage", "seed")
+
+
+def cloud_users(mat):
+    """Clouds whose active material is mat."""
+
+    return [obj for obj in bpy.data.objects if obj.active_material == mat and obj.cloud_settings.is_cloud]
+
+
+def _value(value):
+    if isinstance(value, str) or value is None:
+        return value
+    if hasattr(value, "__len__"):
+        return tuple(_value(item) for item in value)
+    if isinstance(value, float):
+        return round(value, SIGNATURE_DIGITS)
+    if hasattr(value, "name"):
+        return value.name
+    return value
+
+
+def _setting(obj, property_name):
+    if property_name == "layers":
+        return tuple(tuple(_value(getattr(layer, name)) for name in LAYER_PROPERTIES)
+                     for layer in obj.cloud_settings.layers)
+    return _value(getattr(obj.cloud_settings, property_name))
+
+
+def diverges(obj, property_name):
+    """Whether a setting of a cloud differs from the other clouds with its material."""
+
+    mat = obj.active_material
+    if mat is None or mat.users < 2:
+        return False
+    value = _setting(obj, property_name)
+    return any(_setting(other, property_name) != value for other in cloud_users(mat) if other != obj)
+
+
+def own_material(obj):
+    """Gives a cloud its own copy of its material.
+
+    If the mesh is shared too, the material is linked to the object.
+    """
+
+    copy = obj.active_material.copy()
+    copy.name = pool.MATERIAL_NAME
+    if obj.data.users > 1:
+        obj.material_slots[obj.active_material_index].link = 'OBJECT'
+    obj.active_material = copy
+    return copy
+
+
+def graph_signature(mat):
+    """Hashable description of the node graph of a material, without its name."""
+
+    nodes = []
+    for node in mat.node_tree.nodes:
+        description = [node.name, node.bl_idname, node.label, node.parent.name if node.parent else None]
+        description.extend(_value(getattr(node, name, None)) for name in SIGNATURE_PROPERTIES)
+        description.append(_value(getattr(node, "image", None)))
+        if node.type == 'VALTORGB':
+            description.append((node.color_ramp.interpolation,
+                                _value([(element.position, element.color) for element in node.color_ramp.elements])))
+        if node.type == 'CURVE_VEC':
+            description.append(_value([[point.location for point in curve.points]
+                                       for curve in node.mapping.curves]))
+        description.append(tuple(_value(getattr(socket, "default_value", None)) for socket in node.inputs))
+        nodes.append(tuple(description))
+    links = [(link.from_node.name, link.from_socket.identifier, link.to_node.name, link.to_socket.identifier)
+             for link in mat.node_tree.links]
+    return tuple(sorted(nodes, key=repr)), tuple(sorted(links))
+
+
+def shareable_clouds(scene):
+    """Clouds of the scene that can share their material with identical clouds.
+
+    Streamed tiles are skipped, every tile has its own mapping.
+    """
+
+    return [obj for obj in scene.objects
+            if obj.cloud_settings.is_cloud and not obj.get(tiles.POOL_PROPERTY, False)
+            and obj.active_material is not None and obj.active_material.name.startswith(pool.MATERIAL_NAME)]
+
+
+def share_identical(scene):
+    """Makes the clouds of the scene with identical node graphs share one material.
+
+    The materials left without users are removed. Returns a dict with the
+    number of clouds, materials before and after and materials removed.
+    """
+
+    groups = {}
+    signatures = {}
+    clouds = shareable_clouds(scene)
+    for obj in clouds:
+        mat = obj.active_material
+        if mat.name not in signatures:
+            signatures[mat.name] = graph_signature(mat)
+        groups.setdefault(signatures[mat.name], []).append(obj)
+
+    removed = 0
+    for objects in groups.values():
+        shared = objects[0].active_material
+        for obj in objects[1:]:
+            mat = obj.active_material
+            if mat == shared:
+                continue
+            obj.active_material = shared
+            if mat.users == 0:
+                bpy.data.materials.remove(mat)
+                removed += 1
+
+    report = {"clouds": len(clouds), "materials": len(signatures), "shared_materials": len(groups),
+              "removed": removed}
+    write_report(report)
+    return report
+
+
+def write_report(report):
+    """Writes the result of share_identical in a text datablock."""
+
+    text = bpy.data.texts.get(REPORT_NAME)
+    if text is None:
+        text = bpy.data.texts.new(REPORT_NAME)
+    text.clear()
+    text.write("Clouds:\t{}\n".format(report["clouds"]))
+    text.write("Materials before:\t{}\n".format(report["materials"]))
+    text.write("Materials after:\t{}\n".format(report["shared_materials"]))
+    text.write("Materials removed:\t{}\n".format(report["removed"]))
+    return text
@@ -0,0 +1,273 @@
+"""
+    sky_bake.py is part of Cloud Generator Blender Addon.
+
+    Foobar is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import os
+import tempfile
+import time
+from math import pi
+
+import bpy
+
+from . import camera_geometry
+
+IMAGE_NAME = "CloudSky_CG"
+REPORT_NAME = "Cloud sky bake"
+
+# Custom property of the clouds hidden because they are in the baked sky.
+BAKED_PROPERTY = "cloud_sky_baked"
+
+# Names of the nodes added to the world.
+ENVIRONMENT_NODE = "Cloud sky - Environment"
+BACKGROUND_NODE = "Cloud sky - Background"
+MIX_NODE = "Cloud sky - Mix"
+
+# Rotation of an equirectangular camera whose render lines up with the
+# Environment Texture mapping, where the center of the image is +X.
+EQUIRECTANGULAR_ROTATION = (pi / 2, 0.0, -pi / 2)
+
+
+def _set_equirectangular(camera_data):
+    camera_data.type = 'PANO'
+    if hasattr(camera_data, "panorama_type"):
+        camera_data.panorama_type = 'EQUIRECTANGULAR'
+    else:
+        camera_data.cycles.panorama_type = 'EQUIRECTANGULAR'
+
+
+def render_sky(context, clouds, origin, width, samples):
+    """Renders the clouds from origin to an equirectangular image with CPU Cycles.
+
+    The clouds are rendered alone, with the world and sun lamps of the
+    scene as lighting and a transparent film, so the image is the clouds
+    over a transparent sky.
+
+    width: width of the image in pixels, the height is half of it.
+
+    Returns the image, packed into the blend file.
+    """
+
+    scene = bpy.data.scenes.new("Cloud sky bake")
+    camera_data = bpy.data.cameras.new("Cloud sky camera")
+    _set_equirectangular(camera_data)
+    camera = bpy.data.objects.new("Cloud sky camera", camera_data)
+    camera.location = origin
+    camera.rotation_euler = EQUIRECTANGULAR_ROTATION
+    scene.collection.objects.link(camera)
+    scene.camera = camera
+
+    farthest = 0.0
+    for obj in clouds:
+        for corner in camera_geometry.domain_corners(obj.matrix_world, obj.bound_box):
+            farthest = max(farthest, (corner - camera.location).length)
+    camera_data.clip_start = 0.1
+    camera_data.clip_end = max(farthest * 1.1, 1.0)
+
+    scene.render.engine = 'CYCLES'
+    scene.render.film_transparent = True
+    scene.render.resolution_x = width
+    scene.render.resolution_y = max(1, width // 2)
+    scene.render.resolution_percentage = 100
+    scene.render.image_settings.file_format = 'OPEN_EXR'
+    scene.render.image_settings.color_mode = 'RGBA'
+    scene.cycles.device = 'CPU'
+    scene.cycles.samples = samples
+    scene.cycles.volume_step_rate = context.scene.cycles.volume_step_rate
+    scene.cycles.volume_max_steps = context.scene.cycles.volume_max_steps
+    scene.cycles.volume_bounces = context.scene.cycles.volume_bounces
+    if context.scene.world is not None:
+        scene.world = context.scene.world
+    for obj in context.scene.objects:
+        if obj.type == 'LIGHT' and obj.data.type == 'SUN' and not obj.hide_render:
+            scene.collection.objects.link(obj)
+    for obj in clouds:
+        scene.collection.objects.link(obj)
+
+    filepath = os.path.join(tempfile.mkdtemp(prefix="cloud_sky_"), "sky.exr")
+    scene.render.filepath = filepath
+    try:
+        bpy.ops.render.render(write_still=True, scene=scene.name)
+        image = bpy.data.images.load(filepath)
+        image.pack()
+        image.name = IMAGE_NAME
+        image.alpha_mode = 'PREMUL'
+    finally:
+        bpy.data.scenes.remove(scene)
+        bpy.data.objects.remove(camera)
+        bpy.data.cameras.remove(camera_data)
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        os.rmdir(os.path.dirname(filepath))
+    return image
+
+
+def _world_output(world):
+    nodes = world.node_tree.nodes
+    outputs = [node for node in nodes if node.type == 'OUTPUT_WORLD']
+    for node in outputs:
+        if node.is_active_output:
+            return node
+    if outputs:
+        return outputs[0]
+    return nodes.new(type="ShaderNodeOutputWorld")
+
+
+def wire_sky(world, image):
+    """Puts the baked clouds over the background of the world.
+
+    An Environment Texture with the image is mixed by its alpha over the
+    shader that was connected to the world output. Baking again only
+    replaces the image.
+    """
+
+    world.use_nodes = True
+    nodes = world.node_tree.nodes
+    links = world.node_tree.links
+
+    environment = nodes.get(ENVIRONMENT_NODE)
+    if environment is not None:
+        previous = environment.image
+        environment.image = image
+        if previous is not None and previous != image and previous.users == 0:
+            bpy.data.images.remove(previous)
+        return
+
+    output = _world_output(world)
+    surface = output.inputs["Surface"]
+    background_link = surface.links[0].from_socket if surface.is_linked else None
+
+    environment = nodes.new(type="ShaderNodeTexEnvironment")
+    environment.name = ENVIRONMENT_NODE
+    environment.label = ENVIRONMENT_NODE
+    environment.image = image
+    environment.location = (output.location.x - 600, output.location.y - 300)
+    background = nodes.new(type="ShaderNodeBackground")
+    background.name = BACKGROUND_NODE
+    background.label = BACKGROUND_NODE
+    background.location = (output.location.x - 350, output.location.y - 300)
+    mix = nodes.new(type="ShaderNodeMixShader")
+    mix.name = MIX_NODE
+    mix.label = MIX_NODE
+    mix.location = (output.location.x - 180, output.location.y)
+
+    links.new(environment.outputs["Color"], background.inputs["Color"])
+    links.new(environment.outputs["Alpha"], mix.inputs["Fac"])
+    if background_link is not None:
+        links.new(background_link, mix.inputs[1])
+    links.new(background.outputs["Background"], mix.inputs[2])
+    links.new(mix.outputs["Shader"], surface)
+
+
+def unwire_sky(world):
+    """Removes the baked clouds from the world and connects its background again."""
+
+    nodes = world.node_tree.nodes
+    mix = nodes.get(MIX_NODE)
+    if mix is None:
+        return
+    background_input = mix.inputs[1]
+    background_link = background_input.links[0].from_socket if background_input.is_linked else None
+    output_links = [link.to_socket for link in mix.outputs["Shader"].links]
+    environment = nodes.get(ENVIRONMENT_NODE)
+    image = environment.image if environment is not None else None
+
+    for name in (MIX_NODE, BACKGROUND_NODE, ENVIRONMENT_NODE):
+        node = nodes.get(name)
+        if node is not None:
+            nodes.remove(node)
+    if background_link is not None:
+        for socket in output_links:
+            world.node_tree.links.new(background_link, socket)
+    if image is not None and image.users == 0:
+        bpy.data.images.remove(image)
+
+
+def _render_time():
+    start = time.perf_counter()
+    bpy.ops.render.render()
+    return time.perf_counter() - start
+
+
+def bake_sky(context, clouds, origin, width=2048, samples=64, measure=True):
+    """Bakes distant clouds into the world and hides them from the render.
+
+    The clouds are rendered once from origin (see render_sky) and the image
+    is wired in the world of the scene (see wire_sky). Only the parallax of
+    the clouds is lost, so the camera should stay close to origin.
+
+    measure: render the current frame before and after the bake to
+        report the time saved per frame.
+
+    Returns a dict with the bake time and, if measured, the frame times.
+    """
+
+    scene = context.scene
+    if scene.world is None:
+        scene.world = bpy.data.worlds.new("World")
+    for obj in clouds:
+        # The impostor switching skips baked clouds, their impostors are
+        # hidden with them.
+        if obj.cloud_settings.impostor is not None:
+            obj.cloud_settings.impostor.hide_render = True
+        obj.hide_render = False
+
+    report = {"clouds": len(clouds), "origin": tuple(origin)}
+    if measure:
+        report["volume_time"] = _render_time()
+
+    start = time.perf_counter()
+    image = render_sky(context, clouds, origin, width, samples)
+    wire_sky(scene.world, image)
+    for obj in clouds:
+        obj.hide_render = True
+        obj[BAKED_PROPERTY] = True
+    report["bake_time"] = time.perf_counter() - start
+    report["image"] = image.name
+
+    if measure:
+        report["sky_time"] = _render_time()
+    write_report(report)
+    return report
+
+
+def unbake_sky(scene):
+    """Renders again the clouds baked in the sky and removes the image from the world."""
+
+    for obj in scene.objects:
+        if obj.get(BAKED_PROPERTY, False):
+            obj.hide_render = False
+            del obj[BAKED_PROPERTY]
+    if scene.world is not None and scene.world.use_nodes:
+        unwire_sky(scene.world)
+
+
+def write_report(report):
+    """Writes the bake time and the time saved per frame in a text datablock."""
+
+    text = bpy.data.texts.get(REPORT_NAME)
+    if text is None:
+        text = bpy.data.texts.new(REPORT_NAME)
+    text.clear()
+    text.write("Clouds baked: {}. Origin: ({:.1f}, {:.1f}, {:.1f})\n".format(report["clouds"], *report["origin"]))
+    text.write("Image: {}\n".format(report["image"]))
+    text.write("Bake time:\t{:.2f} s\n".format(report["bake_time"]))
+    if "volume_time" in report:
+        saving = report["volume_time"] - report["sky_time"]
+        text.write("Frame with volumes:\t{:.2f} s\n".format(report["volume_time"]))
+        text.write("Frame with baked sky:\t{:.2f} s\n".format(report["sky_time"]))
+        text.write("Saving per frame:\t{:.2f} s\n".format(saving))
+        if saving > 0.0:
+            text.write("The bake pays off after {:.0f} frames\n".format(report["bake_time"] / saving))
+    return text
@@ -0,0 +1,235 @@
+"""
+    tiles.py is part of Cloud Generator Blender Addon.
+
+    Foobar is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import math
+
+import bpy
+from bpy.app.handlers import persistent
+from mathutils import Vector
+
+from . import culling
+
+COLLECTION_NAME = "Cloud tiles"
+
+# Custom properties of the tiles collection.
+TEMPLATE_PROPERTY = "cloud_tile_template"
+TILE_SIZE_PROPERTY = "cloud_tile_size"
+ORIGIN_PROPERTY = "cloud_tile_origin"
+MAPPING_PROPERTY = "cloud_tile_mapping"
+
+# Custom property of the tiles in use with their (column, row) in the grid.
+TILE_KEY = "cloud_tile"
+
+# Custom property of the objects of the pool, used or not.
+POOL_PROPERTY = "cloud_tile_pool"
+
+
+def tile_keys(center, origin, tile_size, radius):
+    """(column, row) of the tiles whose center is within radius of center in XY.
+
+    origin: center of the tile (0, 0).
+    tile_size: (x, y) size of the tiles.
+    """
+
+    columns = int(math.ceil(radius / tile_size[0]))
+    rows = int(math.ceil(radius / tile_size[1]))
+    center_column = int(round((center[0] - origin[0]) / tile_size[0]))
+    center_row = int(round((center[1] - origin[1]) / tile_size[1]))
+    keys = set()
+    for column in range(center_column - columns, center_column + columns + 1):
+        for row in range(center_row - rows, center_row + rows + 1):
+            x = origin[0] + column * tile_size[0] - center[0]
+            y = origin[1] + row * tile_size[1] - center[1]
+            if x * x + y * y <= radius * radius:
+                keys.add((column, row))
+    return keys
+
+
+def pool_size(tile_size, radius):
+    """Most tiles within radius of any point, the number of objects preallocated."""
+
+    half = (tile_size[0] / 2, tile_size[1] / 2)
+    corners = [(0.0, 0.0), (half[0], 0.0), (0.0, half[1]), half]
+    return max(len(tile_keys(corner, (0.0, 0.0), tile_size, radius)) for corner in corners)
+
+
+def tile_mapping(key, stream):
+    """Location of the Initial mapping of a tile.
+
+    Object coordinates are offset by the position of the tile in the grid,
+    in the local units of the cloud, so all the noise textures of adjacent
+    tiles are continuous across their seams.
+    """
+
+    tile_size = stream[TILE_SIZE_PROPERTY]
+    template = bpy.data.objects[stream[TEMPLATE_PROPERTY]]
+    mapping = Vector(stream[MAPPING_PROPERTY])
+    mapping.x += key[0] * tile_size[0] / template.scale.x
+    mapping.y += key[1] * tile_size[1] / template.scale.y
+    return mapping
+
+
+def stream_collection():
+    """Collection of the tiles or None if there is no stream."""
+
+    collection = bpy.data.collections.get(COLLECTION_NAME)
+    if collection is None or TEMPLATE_PROPERTY not in collection:
+        return None
+    if collection[TEMPLATE_PROPERTY] not in bpy.data.objects:
+        return None
+    return collection
+
+
+def _new_pool_object(stream):
+    template = bpy.data.objects[stream[TEMPLATE_PROPERTY]]
+    obj = template.copy()
+    # The mesh is shared, the material is linked to the object instead.
+    obj.material_slots[0].link = 'OBJECT'
+    obj.material_slots[0].material = template.active_material.copy()
+    obj.name = "Cloud tile"
+    obj[POOL_PROPERTY] = True
+    stream.objects.link(obj)
+    release_tile(obj)
+    return obj
+
+
+def assign_tile(obj, key, stream):
+    """Moves a pool object to a tile of the grid and renders it."""
+
+    origin = Vector(stream[ORIGIN_PROPERTY])
+    tile_size = stream[TILE_SIZE_PROPERTY]
+    obj.location = (origin.x + key[0] * tile_size[0], origin.y + key[1] * tile_size[1], origin.z)
+    mapping = obj.active_material.node_tree.nodes.get("Initial mapping")
+    mapping.inputs["Location"].default_value = tile_mapping(key, stream)
+    obj[TILE_KEY] = key
+    obj.hide_viewport = False
+    obj.hide_render = False
+
+
+def release_tile(obj):
+    """Hides a tile and gives it back to the pool.
+
+    The culling flag is cleared too, otherwise the culling would render the
+    hidden tile again at its old position.
+    """
+
+    if TILE_KEY in obj:
+        del obj[TILE_KEY]
+    if culling.CULLED_PROPERTY in obj:
+        del obj[culling.CULLED_PROPERTY]
+    obj.hide_viewport = True
+    obj.hide_render = True
+
+
+def create_stream(context, template):
+    """Streams tiles of a cloudscape around the camera.
+
+    The template cloud is hidden and becomes the tile (0, 0) of an endless
+    grid of tiles with its domain. A pool with the most tiles that can be
+    within the tile radius of the scene is allocated at once: every tile
+    has its own object, sharing the mesh of the template, and material.
+
+    Returns the tiles collection.
+    """
+
+    remove_stream()
+    stream = bpy.data.collections.new(COLLECTION_NAME)
+    context.scene.collection.children.link(stream)
+    tile_size = (template.dimensions.x, template.dimensions.y)
+    stream[TEMPLATE_PROPERTY] = template.name
+    stream[TILE_SIZE_PROPERTY] = tile_size
+    stream[ORIGIN_PROPERTY] = template.location
+    mapping = template.active_material.node_tree.nodes["Initial mapping"]
+    stream[MAPPING_PROPERTY] = mapping.inputs["Location"].default_value
+    template.hide_viewport = True
+    template.hide_render = True
+
+    for _ in range(pool_size(tile_size, context.scene.cloud_scene_settings.tile_radius)):
+        _new_pool_object(stream)
+    return stream
+
+
+def update_tiles(scene, center=None):
+    """Keeps in use only the tiles within the tile radius of the camera.
+
+    Tiles that leave the radius are released to the pool and the pool
+    objects are assigned to the tiles that enter it. The pool only grows
+    if the tile radius of the scene grew.
+
+    center: point around which the tiles are kept, the camera by default.
+
+    Returns (tiles in use, tiles reassigned) or None without a stream or
+    a camera.
+    """
+
+    stream = stream_collection()
+    if stream is None:
+        return None
+    if center is None:
+        if scene.camera is None:
+            return None
+        center = scene.camera.matrix_world.translation
+
+    tile_size = stream[TILE_SIZE_PROPERTY]
+    wanted = tile_keys(center, stream[ORIGIN_PROPERTY], tile_size, scene.cloud_scene_settings.tile_radius)
+    used = {}
+    free = []
+    for obj in stream.objects:
+        if not obj.get(POOL_PROPERTY, False):
+            continue
+        key = tuple(obj[TILE_KEY]) if TILE_KEY in obj else None
+        if key in wanted and key not in used:
+            used[key] = obj
+        else:
+            if key is not None:
+                release_tile(obj)
+            free.append(obj)
+
+    assigned = 0
+    for key in wanted:
+        if key in used:
+            continue
+        obj = free.pop() if free else _new_pool_object(stream)
+        assign_tile(obj, key, stream)
+        assigned += 1
+    return len(wanted), assigned
+
+
+def remove_stream():
+    """Removes the tiles and their materials and shows the template again."""
+
+    stream = bpy.data.collections.get(COLLECTION_NAME)
+    if stream is None:
+        return
+    template = bpy.data.objects.get(stream.get(TEMPLATE_PROPERTY, ""))
+    for obj in list(stream.objects):
+        if obj.get(POOL_PROPERTY, False):
+            material = obj.active_material
+            bpy.data.objects.remove(obj)
+            if material is not None and material.users == 0:
+                bpy.data.materials.remove(material)
+    bpy.data.collections.remove(stream)
+    if template is not None:
+        template.hide_viewport = False
+        template.hide_render = False
+
+
+@persistent
+def tiles_frame_handler(scene, depsgraph=None):
+    """Frame change handler that streams the cloudscape tiles if it is enabled in the scene."""
+
+    if scene.cloud_scene_settings.stream_tiles:
+        update_tiles(scene)
@@ -0,0 +1,252 @@
+"""
+    volumetrics.py is part of Cloud Generator Blender Addon.
+
+    Foobar is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import bpy
+from bpy.app.handlers import persistent
+
+from . import camera_geometry
+
+# EEVEE volumetric tile sizes in pixels, from coarsest to finest.
+TILE_SIZES = (16, 8, 4, 2)
+
+# Minimum number of froxels across the smallest cloud on screen.
+MIN_FROXELS_ACROSS = 24
+
+# Clouds smaller than this on screen (in pixels) do not decide the tile size.
+MIN_CLOUD_PIXELS = 16
+
+# Relative margin added to the volumetric range around the clouds.
+RANGE_MARGIN = 0.05
+
+# Limits of the material volume step rate.
+MIN_STEP_RATE = 0.01
+MAX_STEP_RATE = 100.0
+
+# Cycles steps through procedural volumes with this fraction of the average
+# size of the object bounds, multiplied by the material and scene step rates.
+PROCEDURAL_STEP_FRACTION = 0.1
+
+
+def scene_clouds(scene):
+    """Clouds of the scene that are rendered."""
+
+    return [obj for obj in scene.objects if obj.cloud_settings.is_cloud and not obj.hide_render]
+
+
+def volumetric_range(depth_bounds, clip_start, clip_end, margin=RANGE_MARGIN):
+    """EEVEE volumetric start and end distances that contain the clouds.
+
+    depth_bounds: (nearest, farthest) camera depth of every visible cloud.
+    clip_start, clip_end: clipping distances of the camera.
+
+    Returns None if no cloud is in front of the camera.
+    """
+
+    bounds = [(near, far) for near, far in depth_bounds if far > clip_start]
+    if not bounds:
+        return None
+    start = max(clip_start, min(near for near, _ in bounds) * (1.0 - margin))
+    end = min(clip_end, max(far for _, far in bounds) * (1.0 + margin))
+    return start, max(end, start * (1.0 + margin))
+
+
+def tile_size(cloud_sizes):
+    """EEVEE volumetric tile size for clouds of the given sizes on screen.
+
+    The coarsest tile that still gives MIN_FROXELS_ACROSS froxels to the
+    smallest cloud is chosen.
+
+    cloud_sizes: size in pixels of every visible cloud.
+    """
+
+    sizes = [size for size in cloud_sizes if size >= MIN_CLOUD_PIXELS]
+    if not sizes:
+        return TILE_SIZES[0]
+    smallest = min(sizes)
+    for tile in TILE_SIZES:
+        if smallest / tile >= MIN_FROXELS_ACROSS:
+            return tile
+    return TILE_SIZES[-1]
+
+
+def cloud_screen_bounds(scene, depsgraph, clouds):
+    """Depth bounds and size on screen of the clouds seen by the scene camera.
+
+    Returns a list of (cloud, (nearest, farthest), size in pixels) with
+    only the clouds that are inside the screen.
+    """
+
+    camera = scene.camera
+    resolution = camera_geometry.render_resolution(scene.render)
+    view_matrix, projection_matrix = camera_geometry.camera_matrices(camera, depsgraph, resolution, scene.render)
+    view_projection = projection_matrix @ view_matrix
+
+    bounds = []
+    for obj in clouds:
+        corners = camera_geometry.domain_corners(obj.matrix_world, obj.bound_box)
+        rectangle = camera_geometry.projected_rectangle(view_projection, corners, resolution)
+        size = camera_geometry.visible_size(rectangle, resolution)
+        if size > 0.0:
+            depths = camera_geometry.camera_depths(view_matrix, corners)
+            bounds.append((obj, (min(depths), max(depths)), size))
+    return bounds
+
+
+def fit_volumetrics(scene, depsgraph):
+    """Sets the EEVEE volumetric range and tile size from the clouds seen by the camera.
+
+    Returns (start, end, tile size) or None if there is no camera or no
+    cloud in front of it.
+    """
+
+    if scene.camera is None:
+        return None
+    bounds = cloud_screen_bounds(scene, depsgraph, scene_clouds(scene))
+    camera_data = scene.camera.data
+    volume_range = volumetric_range([depths for _, depths, _ in bounds],
+                                    camera_data.clip_start, camera_data.clip_end)
+    if volume_range is None:
+        return None
+
+    tile = str(tile_size([size for _, _, size in bounds]))
+    eevee = scene.eevee
+    eevee.volumetric_start, eevee.volumetric_end = volume_range
+    if eevee.volumetric_tile_size != tile:
+        eevee.volumetric_tile_size = tile
+    return volume_range[0], volume_range[1], tile
+
+
+def active_texture_frequencies(material, cloud_settings):
+    """Highest frequencies of the textures that shape the cloud.
+
+    Textures whose branch is disabled by the cloud settings are skipped.
+    Noise textures add one octave (double frequency) per level of Detail.
+    Returns the frequencies in texture space, where 1 unit is the cloud size.
+    """
+
+    names = []
+    if cloud_settings.detail_noise > 0.0:
+        names.append("Noise Tex - Detail noise level 1")
+    if cloud_settings.detail_bump_strength > 0.0:
+        names.extend(["Voronoi tex - Bump level 1",
+                      "Voronoi tex - Bump level 2",
+                      "Voronoi tex - Bump level 3"][:cloud_settings.detail_bump_levels])
+    if cloud_settings.roundness > 0.0:
+        names.append("Voronoi tex - Roundness")
+    if cloud_settings.add_shape_imperfection > 0.0:
+        names.extend(["Noise Tex - Add shape imperfection 1", "Noise Tex - Add shape imperfection 2"])
+    if cloud_settings.subtract_shape_imperfection > 0.0:
+        names.extend(["Noise Tex - Subtract shape imperfection 1", "Noise Tex - Subtract shape imperfection 2"])
+    names.append("Noise Tex - Subtract initial")
+
+    frequencies = []
+    nodes = material.node_tree.nodes
+    for name in names:
+        node = nodes.get(name)
+        if node is None:
+            continue
+        frequency = node.inputs["Scale"].default_value
+        if node.type == 'TEX_NOISE':
+            frequency *= 2 ** int(node.inputs["Detail"].default_value)
+        frequencies.append(frequency)
+    return frequencies
+
+
+def smallest_feature_size(obj):
+    """Size in world units of the smallest detail of a cloud."""
+
+    frequencies = active_texture_frequencies(obj.active_material, obj.cloud_settings)
+    texture_scale = min(obj.matrix_world.to_scale())  # World units per texture unit
+    if not frequencies:
+        return texture_scale
+    return texture_scale / max(frequencies)
+
+
+def cloud_step_rate(feature_size, pixel_size, object_size, scene_step_rate=1.0):
+    """Material volume step rate for a cloud.
+
+    The step samples the smallest feature twice (Nyquist) unless it is
+    smaller than a pixel, in which case one step per pixel is enough.
+
+    feature_size: size of the smallest feature in world units.
+    pixel_size: world size of a pixel at the cloud distance.
+    object_size: average size of the cloud bounds in world units.
+    scene_step_rate: step rate of the scene, it multiplies the material one.
+    """
+
+    step = max(feature_size * 0.5, pixel_size)
+    base_step = PROCEDURAL_STEP_FRACTION * object_size * scene_step_rate
+    return min(MAX_STEP_RATE, max(MIN_STEP_RATE, step / base_step))
+
+
+def update_step_rates(scene, depsgraph, clouds):
+    """Sets the volume step rate of the materials of the clouds.
+
+    Without a scene camera only the feature size is taken into account.
+    A material shared by several clouds gets the finest step rate.
+    Materials have a volume step rate since Blender 2.92, in older
+    versions nothing is changed.
+    Returns a dict material name: step rate.
+    """
+
+    camera = scene.camera
+    if camera is not None:
+        resolution = camera_geometry.render_resolution(scene.render)
+        view_matrix, projection_matrix = camera_geometry.camera_matrices(camera, depsgraph, resolution, scene.render)
+        orthographic = camera.data.type == 'ORTHO'
+        clip_start = camera.data.clip_start
+
+    rates = {}
+    for obj in clouds:
+        material = obj.active_material
+        if material is None or "CloudMaterial_CG" not in material.name:
+            continue
+        if not hasattr(material.cycles, "volume_step_rate"):
+            continue
+        pixel_size = 0.0
+        if camera is not None:
+            corners = camera_geometry.domain_corners(obj.matrix_world, obj.bound_box)
+            depth = max(clip_start, min(camera_geometry.camera_depths(view_matrix, corners)))
+            pixel_size = camera_geometry.pixel_world_size(projection_matrix, resolution, depth, orthographic)
+        object_size = sum(obj.dimensions) / 3
+        rate = cloud_step_rate(smallest_feature_size(obj), pixel_size, object_size,
+                               scene.cycles.volume_step_rate)
+        rates[material] = min(rate, rates.get(material, MAX_STEP_RATE))
+
+    for material, rate in rates.items():
+        if abs(material.cycles.volume_step_rate - rate) > 1e-4:
+            material.cycles.volume_step_rate = rate
+    return {material.name: rate for material, rate in rates.items()}
+
+
+@persistent
+def volumetrics_frame_handler(scene, depsgraph=None):
+    """Frame change handler that fits the EEVEE volumetrics if it is enabled in the scene."""
+
+    if scene.cloud_scene_settings.auto_volumetrics:
+        if depsgraph is None:
+            depsgraph = bpy.context.evaluated_depsgraph_get()
+        fit_volumetrics(scene, depsgraph)
+
+
+@persistent
+def step_rate_frame_handler(scene, depsgraph=None):
+    """Frame change handler that sets the cloud step rates if it is enabled in the scene."""
+
+    if scene.cloud_scene_settings.auto_step_rate:
+        if depsgraph is None:
+            depsgraph = bpy.context.evaluated_depsgraph_get()
+        update_step_rates(scene, depsgraph, scene_clouds(scene))
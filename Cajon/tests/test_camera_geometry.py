@@ -0,0 +1,188 @@
+"""
+    test_camera_geometry.py is part of Cloud Generator Blender Addon.
+
+    Foobar is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+
+Tests of the camera frustum and the EEVEE volumetrics fit on known boxes.
+
+The camera is at the origin looking along -Z with a 90 degrees field of
+view and a square render, so a point at depth d is on the border of the
+screen when |x| = d or |y| = d. Outside Blender the stand-in bpy and
+mathutils of the benchmarks are used.
+
+Usage:
+    python -m pytest Cajon/tests
+    python -m unittest discover -s Cajon/tests
+"""
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+
+CAJON = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CAJON)
+
+try:
+    import bpy  # noqa: F401
+except ImportError:
+    sys.path.insert(0, os.path.join(CAJON, "benchmarks"))
+    import bpy_standin
+    bpy_standin.install()
+
+from mathutils import Matrix  # noqa: E402
+
+from clouds_generator import camera_geometry  # noqa: E402
+from clouds_generator import volumetrics  # noqa: E402
+
+CLIP_START = 0.1
+CLIP_END = 100.0
+RESOLUTION = (1000, 1000)
+
+# Corners of the default cube, from -1 to 1 in every axis.
+UNIT_BOX = [(x, y, z) for x in (-1.0, 1.0) for y in (-1.0, 1.0) for z in (-1.0, 1.0)]
+
+
+def perspective(near=CLIP_START, far=CLIP_END):
+    """Projection matrix of a camera with a 90 degrees field of view and a square render."""
+
+    return Matrix(((1.0, 0.0, 0.0, 0.0),
+                   (0.0, 1.0, 0.0, 0.0),
+                   (0.0, 0.0, -(far + near) / (far - near), -2.0 * far * near / (far - near)),
+                   (0.0, 0.0, -1.0, 0.0)))
+
+
+def box(location, scale=1.0):
+    """World corners of a unit box moved to a location and scaled."""
+
+    matrix = Matrix.Translation(location) @ Matrix.Diagonal((scale, scale, scale, 1.0))
+    return camera_geometry.domain_corners(matrix, UNIT_BOX)
+
+
+def cloud(location, scale=1.0):
+    return SimpleNamespace(cloud_settings=SimpleNamespace(is_cloud=True), hide_render=False,
+                           matrix_world=Matrix.Translation(location) @ Matrix.Diagonal((scale, scale, scale, 1.0)),
+                           bound_box=UNIT_BOX)
+
+
+def scene(clouds, tile_size="8"):
+    camera = SimpleNamespace(matrix_world=Matrix(),
+                             data=SimpleNamespace(clip_start=CLIP_START, clip_end=CLIP_END),
+                             calc_matrix_camera=lambda depsgraph, **kwargs: perspective())
+    render = SimpleNamespace(resolution_x=RESOLUTION[0], resolution_y=RESOLUTION[1],
+                             resolution_percentage=100, pixel_aspect_x=1.0, pixel_aspect_y=1.0)
+    eevee = SimpleNamespace(volumetric_start=0.1, volumetric_end=100.0, volumetric_tile_size=tile_size)
+    return SimpleNamespace(camera=camera, render=render, eevee=eevee, objects=clouds)
+
+
+class DomainCornersTest(unittest.TestCase):
+
+    def test_moved_and_scaled_box(self):
+        corners = box((1.0, 2.0, -10.0), scale=2.0)
+        self.assertEqual(len(corners), 8)
+        self.assertEqual(tuple(corners[0]), (-1.0, 0.0, -12.0))
+        self.assertEqual(tuple(corners[-1]), (3.0, 4.0, -8.0))
+
+    def test_camera_depths(self):
+        depths = camera_geometry.camera_depths(Matrix(), box((0.0, 0.0, -10.0)))
+        self.assertAlmostEqual(min(depths), 9.0)
+        self.assertAlmostEqual(max(depths), 11.0)
+
+
+class OutsideFrustumTest(unittest.TestCase):
+
+    def setUp(self):
+        self.view_projection = perspective() @ Matrix()
+
+    def assertOutside(self, location, outside):
+        self.assertEqual(camera_geometry.outside_frustum(self.view_projection, box(location)), outside)
+
+    def test_in_front(self):
+        self.assertOutside((0.0, 0.0, -10.0), False)
+
+    def test_crossing_a_side(self):
+        # From x = 9 to x = 11 at depth 10: partly on screen.
+        self.assertOutside((10.0, 0.0, -10.0), False)
+
+    def test_beside(self):
+        self.assertOutside((15.0, 0.0, -10.0), True)
+        self.assertOutside((0.0, -15.0, -10.0), True)
+
+    def test_behind(self):
+        self.assertOutside((0.0, 0.0, 10.0), True)
+
+    def test_beyond_clip_end(self):
+        self.assertOutside((0.0, 0.0, -CLIP_END - 5.0), True)
+
+    def test_around_the_camera(self):
+        self.assertEqual(camera_geometry.outside_frustum(self.view_projection, box((0.0, 0.0, 0.0), 5.0)),
+                         False)
+
+
+class FitVolumetricsTest(unittest.TestCase):
+
+    def test_single_cloud(self):
+        # Depths from 9 to 11 and 2 / 9 of the screen wide: 111 pixels.
+        test_scene = scene([cloud((0.0, 0.0, -10.0))])
+        start, end, tile = volumetrics.fit_volumetrics(test_scene, None)
+        margin = volumetrics.RANGE_MARGIN
+        self.assertAlmostEqual(start, 9.0 * (1.0 - margin))
+        self.assertAlmostEqual(end, 11.0 * (1.0 + margin))
+        self.assertEqual(tile, "4")
+        self.assertEqual(test_scene.eevee.volumetric_tile_size, "4")
+        self.assertAlmostEqual(test_scene.eevee.volumetric_start, start)
+        self.assertAlmostEqual(test_scene.eevee.volumetric_end, end)
+
+    def test_clouds_behind_and_beside_are_ignored(self):
+        clouds = [cloud((0.0, 0.0, -10.0)), cloud((0.0, 0.0, 30.0)), cloud((60.0, 0.0, -10.0))]
+        start, end, tile = volumetrics.fit_volumetrics(scene(clouds), None)
+        self.assertAlmostEqual(start, 9.0 * (1.0 - volumetrics.RANGE_MARGIN))
+        self.assertAlmostEqual(end, 11.0 * (1.0 + volumetrics.RANGE_MARGIN))
+        self.assertEqual(tile, "4")
+
+    def test_range_clamped_to_clip_end(self):
+        start, end, _ = volumetrics.fit_volumetrics(scene([cloud((0.0, 0.0, -90.0), scale=20.0)]), None)
+        self.assertAlmostEqual(start, 70.0 * (1.0 - volumetrics.RANGE_MARGIN))
+        self.assertEqual(end, CLIP_END)
+
+    def test_big_cloud_uses_coarse_tiles(self):
+        # The nearest face is at depth 6 and 8 wide: 667 pixels, 41 tiles of 16 pixels.
+        _, _, tile = volumetrics.fit_volumetrics(scene([cloud((0.0, 0.0, -10.0), scale=4.0)]), None)
+        self.assertEqual(tile, "16")
+
+    def test_no_cloud_in_front(self):
+        test_scene = scene([cloud((0.0, 0.0, 30.0))])
+        self.assertIsNone(volumetrics.fit_volumetrics(test_scene, None))
+        self.assertEqual(test_scene.eevee.volumetric_tile_size, "8")
+
+    def test_no_camera(self):
+        test_scene = scene([cloud((0.0, 0.0, -10.0))])
+        test_scene.camera = None
+        self.assertIsNone(volumetrics.fit_volumetrics(test_scene, None))
+
+
+class TileSizeTest(unittest.TestCase):
+
+    def test_known_sizes(self):
+        self.assertEqual(volumetrics.tile_size([]), volumetrics.TILE_SIZES[0])
+        self.assertEqual(volumetrics.tile_size([384.0]), 16)
+        self.assertEqual(volumetrics.tile_size([200.0]), 8)
+        self.assertEqual(volumetrics.tile_size([100.0]), 4)
+        self.assertEqual(volumetrics.tile_size([10.0, 30.0]), 2)
+
+    def test_tiny_clouds_are_ignored(self):
+        self.assertEqual(volumetrics.tile_size([volumetrics.MIN_CLOUD_PIXELS - 1, 400.0]), 16)
+
+
+if __name__ == "__main__":
+    unittest.main()